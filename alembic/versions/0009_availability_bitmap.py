@@ -0,0 +1,123 @@
+"""Bitmap de disponibilidad por miembro y grupo
+
+Revision ID: 0009_availability_bitmap
+Revises: 0008_availability_start_minutes
+Create Date: 2026-10-18
+
+Cada bloque marcado es una fila de `user_availability` unida a una de
+`availability`, y todas las lecturas (la grilla del grupo, el resumen de
+horarios, la matriz de compatibilidad del divisor) volvían a juntar y agregar
+esas filas. Con bloques de 5 minutos son 2016 celdas por miembro y hay grupos
+de miles de miembros.
+
+`availability_bitmap` guarda lo mismo en compacto: una fila por (grupo,
+miembro) con un bit por celda de la grilla (`weekday * bloques_por_día +
+índice_de_bloque`, los siete días). Las marcas siguen siendo la fuente de
+verdad; el bitmap es un derivado que la app mantiene al día al guardar.
+
+El backfill arma los bitmaps desde las marcas activas, con la misma cuenta que
+hace la app y sin importarla: la migración tiene que poder correr igual aunque
+el código cambie después. Lo que no cae en la grilla actual del grupo (fuera de
+rango o con otro formato de bloque) no tiene celda y queda fuera del bitmap,
+igual que en la app.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0009_availability_bitmap"
+down_revision = "0008_availability_start_minutes"
+branch_labels = None
+depends_on = None
+
+WEEKDAYS = 7
+
+
+def _block_starts(start_minutes, end_minutes, block_minutes):
+    if block_minutes <= 0 or end_minutes <= start_minutes:
+        return []
+    return list(range(start_minutes, end_minutes - block_minutes + 1, block_minutes))
+
+
+def _backfill(connection):
+    grupos = connection.execute(
+        sa.text('SELECT id, start_minutes, end_minutes, block_minutes FROM "group"')
+    ).fetchall()
+
+    tabla = sa.table(
+        "availability_bitmap",
+        sa.column("group_id", sa.Integer),
+        sa.column("user_id", sa.Integer),
+        sa.column("layout", sa.String),
+        sa.column("bits", sa.LargeBinary),
+    )
+
+    for group_id, start_minutes, end_minutes, block_minutes in grupos:
+        starts = _block_starts(start_minutes, end_minutes, block_minutes)
+        indice = {start: i for i, start in enumerate(starts)}
+        por_dia = len(starts)
+
+        bits = {}
+        marcas = connection.execute(
+            sa.text(
+                "SELECT ua.user_id, a.weekday, a.start_minutes "
+                "FROM user_availability ua "
+                "JOIN availability a ON a.id = ua.availability_id "
+                "WHERE a.group_id = :group_id AND ua.deleted_at IS NULL"
+            ),
+            {"group_id": group_id},
+        )
+        for user_id, weekday, minutos in marcas:
+            bloque = indice.get(minutos)
+            if bloque is None or not 0 <= weekday < WEEKDAYS:
+                continue
+            bits[user_id] = bits.get(user_id, 0) | (1 << (weekday * por_dia + bloque))
+
+        if not bits:
+            continue
+        tamano = (WEEKDAYS * por_dia + 7) // 8
+        layout = f"{start_minutes}:{end_minutes}:{block_minutes}"
+        connection.execute(
+            tabla.insert(),
+            [
+                {
+                    "group_id": group_id,
+                    "user_id": user_id,
+                    "layout": layout,
+                    "bits": valor.to_bytes(tamano, "little"),
+                }
+                for user_id, valor in bits.items()
+            ],
+        )
+
+
+def upgrade():
+    op.create_table(
+        "availability_bitmap",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "group_id",
+            sa.Integer(),
+            sa.ForeignKey("group.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            sa.ForeignKey("user.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("layout", sa.String(length=32), nullable=False),
+        sa.Column("bits", sa.LargeBinary(), nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()
+        ),
+        sa.Column(
+            "updated_at", sa.DateTime(), nullable=False, server_default=sa.func.now()
+        ),
+        sa.UniqueConstraint("group_id", "user_id", name="uq_availability_bitmap_member"),
+    )
+    _backfill(op.get_bind())
+
+
+def downgrade():
+    op.drop_table("availability_bitmap")
@@ -0,0 +1,35 @@
+"""Versión de la grilla de cada miembro, para el autosave por diferencias
+
+Revision ID: 0010_availability_bitmap_version
+Revises: 0009_availability_bitmap
+Create Date: 2026-10-18
+
+El autosave mandaba la semana completa cada 600 ms y el servidor la
+reescribía entera: tocar una celda limpiaba y volvía a marcar toda la grilla.
+El modo delta manda solo las celdas agregadas y quitadas, y para no aplicarlas
+sobre un estado que otra pestaña ya cambió necesita saber sobre qué versión se
+hicieron.
+
+`availability_bitmap.version` es esa versión. La lleva el ORM
+(`version_id_col`): cada UPDATE la incrementa y exige que la fila siga en la
+versión leída. Las filas existentes arrancan en 1. Es un `ADD COLUMN` con
+default constante, que SQLite acepta sin recrear la tabla.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0010_availability_bitmap_version"
+down_revision = "0009_availability_bitmap"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "availability_bitmap",
+        sa.Column("version", sa.Integer(), nullable=False, server_default="1"),
+    )
+
+
+def downgrade():
+    op.drop_column("availability_bitmap", "version")
@@ -0,0 +1,49 @@
+"""Contador de asistentes por bloque en `availability`
+
+Revision ID: 0011_availability_attendee_count
+Revises: 0010_availability_bitmap_version
+Create Date: 2026-10-18
+
+El resumen "horarios más concurridos" de `groups.show` corría en cada render
+un GROUP BY sobre todas las marcas activas del grupo. `attendee_count` guarda
+ese número en el bloque —marcas activas de miembros activos— y el índice
+`(group_id, attendee_count)` deja el resumen en un ORDER BY … LIMIT.
+
+La app lo mantiene en la misma transacción que cada marca y cada cambio de
+membresía (app/slot_counts.py). El backfill es la misma subconsulta
+correlacionada que usa `python -m app.db.rebuild_slot_counts`, escrita en SQL
+para no depender del código de la app. `ADD COLUMN` con default constante:
+SQLite lo acepta sin recrear la tabla.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0011_availability_attendee_count"
+down_revision = "0010_availability_bitmap_version"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "availability",
+        sa.Column("attendee_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.execute(
+        sa.text(
+            "UPDATE availability SET attendee_count = ("
+            " SELECT COUNT(*) FROM user_availability ua"
+            " JOIN group_member gm ON gm.user_id = ua.user_id AND gm.deleted_at IS NULL"
+            " WHERE ua.availability_id = availability.id"
+            " AND ua.deleted_at IS NULL"
+            " AND gm.group_id = availability.group_id)"
+        )
+    )
+    op.create_index(
+        "ix_availability_group_attendees", "availability", ["group_id", "attendee_count"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_availability_group_attendees", table_name="availability")
+    op.drop_column("availability", "attendee_count")
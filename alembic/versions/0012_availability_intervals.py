@@ -0,0 +1,74 @@
+"""Disponibilidad guardada como tramos (`availability_interval`)
+
+Revision ID: 0012_availability_intervals
+Revises: 0011_availability_attendee_count
+Create Date: 2026-10-18
+
+Desde 0008 la grilla admite bloques de 5 minutos, y con marcas por bloque
+alguien libre de 08:00 a 18:00 de lunes a viernes son 600 filas de
+`user_availability`. `availability_interval` guarda lo mismo como tramos
+seguidos `(weekday, start_minutes, end_minutes)` por miembro: 5 filas.
+
+Es un modo por grupo (`group.availability_storage`, "marks" o "intervals"),
+no un reemplazo: todos los grupos quedan en "marks" y nada cambia hasta que
+se convierten con `python -m app.db.convert_availability_storage`. Por eso no
+hay backfill.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0012_availability_intervals"
+down_revision = "0011_availability_attendee_count"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "group",
+        sa.Column(
+            "availability_storage",
+            sa.String(length=16),
+            nullable=False,
+            server_default="marks",
+        ),
+    )
+    op.create_table(
+        "availability_interval",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "group_id",
+            sa.Integer(),
+            sa.ForeignKey("group.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            sa.ForeignKey("user.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("weekday", sa.Integer(), nullable=False),
+        sa.Column("start_minutes", sa.Integer(), nullable=False),
+        sa.Column("end_minutes", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()
+        ),
+        sa.Column(
+            "updated_at", sa.DateTime(), nullable=False, server_default=sa.func.now()
+        ),
+        sa.CheckConstraint(
+            "start_minutes < end_minutes", name="ck_availability_interval_span"
+        ),
+    )
+    op.create_index(
+        "ix_availability_interval_member",
+        "availability_interval",
+        ["group_id", "user_id", "weekday"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_availability_interval_member", table_name="availability_interval")
+    op.drop_table("availability_interval")
+    op.drop_column("group", "availability_storage")
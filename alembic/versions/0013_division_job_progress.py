@@ -0,0 +1,37 @@
+"""Progreso y error de `division_jobs` para el solver en segundo plano
+
+Revision ID: 0013_division_job_progress
+Revises: 0012_availability_intervals
+Create Date: 2026-10-18
+
+`subgroups.generate` ya no resuelve dentro de la request: deja el job en
+"queued" y un hilo del proceso lo corre (app/services/division_jobs.py). El
+navegador sondea el job, así que este guarda cuánto lleva (`progress`, 0-100),
+cuándo arrancó (`started_at`) y por qué falló (`error`). El mejor preview
+hasta el momento va en `result_json`, que ya existía.
+
+Los jobs existentes son previews terminados: quedan con `progress = 0`, que
+para ellos no se lee. No hay backfill.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0013_division_job_progress"
+down_revision = "0012_availability_intervals"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "division_jobs",
+        sa.Column("progress", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column("division_jobs", sa.Column("error", sa.String(length=255), nullable=True))
+    op.add_column("division_jobs", sa.Column("started_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("division_jobs", "started_at")
+    op.drop_column("division_jobs", "error")
+    op.drop_column("division_jobs", "progress")
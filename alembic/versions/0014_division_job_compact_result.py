@@ -0,0 +1,174 @@
+"""`division_jobs.result_json` compacto: ids y métricas, sin datos personales
+
+Revision ID: 0014_division_job_compact_result
+Revises: 0013_division_job_progress
+Create Date: 2026-10-18
+
+Cada job guardaba el preview completo: nombre, correo y categorías de cada
+integrante y el `rules_status` armado de cada subgrupo, diez jobs por grupo.
+Ahora guarda la asignación como listas de ids, el conteo de cada condición y
+las métricas (`compact_division_result`); lo demás se lee al mostrarlo.
+
+La migración reescribe los jobs existentes con esa forma. Está escrita sin
+importar la app, igual que las demás. El downgrade vuelve a armar el preview
+completo con los nombres, correos y categorías de hoy.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0014_division_job_compact_result"
+down_revision = "0013_division_job_progress"
+branch_labels = None
+depends_on = None
+
+RESULT_FORMAT = 2
+
+division_jobs = sa.table(
+    "division_jobs",
+    sa.column("id", sa.Integer()),
+    sa.column("parent_group_id", sa.Integer()),
+    sa.column("config_json", sa.JSON()),
+    sa.column("result_json", sa.JSON()),
+)
+
+
+def _jobs(bind):
+    return bind.execute(
+        sa.select(
+            division_jobs.c.id,
+            division_jobs.c.parent_group_id,
+            division_jobs.c.config_json,
+            division_jobs.c.result_json,
+        )
+    ).all()
+
+
+def _save(bind, job_id, result):
+    bind.execute(
+        division_jobs.update().where(division_jobs.c.id == job_id).values(result_json=result)
+    )
+
+
+def _compact(result):
+    compact = {
+        "format": RESULT_FORMAT,
+        "groups": [
+            {
+                "id": group["id"],
+                "name": group["name"],
+                "member_ids": [member["id"] for member in group.get("members", [])],
+                "compatibility_avg": group.get("compatibility_avg", 0),
+                "rule_counts": [status["count"] for status in group.get("rules_status", [])],
+            }
+            for group in result["groups"]
+        ],
+        "unfulfilled_rules": result.get("unfulfilled_rules", []),
+        "total_members_available": result.get("total_members_available", 0),
+        "together_groups": [group["member_ids"] for group in result.get("together_groups", [])],
+    }
+    if "created_subgroup_ids" in result:
+        compact["created_subgroup_ids"] = result["created_subgroup_ids"]
+    return compact
+
+
+def upgrade():
+    bind = op.get_bind()
+    for job_id, _, _, result in _jobs(bind):
+        if result and "groups" in result and result.get("format") != RESULT_FORMAT:
+            _save(bind, job_id, _compact(result))
+
+
+def _people(bind, group_id, user_ids):
+    people = {
+        user_id: {"id": user_id, "name": name, "email": email, "categories": []}
+        for user_id, name, email in bind.execute(
+            sa.text('SELECT id, name, email FROM "user" WHERE id IN :ids').bindparams(
+                sa.bindparam("ids", expanding=True)
+            ),
+            {"ids": list(user_ids)},
+        )
+    }
+    categories = bind.execute(
+        sa.text(
+            "SELECT gm.user_id, c.name FROM group_member gm"
+            " JOIN group_member_category gmc ON gmc.group_member_id = gm.id"
+            " AND gmc.deleted_at IS NULL"
+            " JOIN category c ON c.id = gmc.category_id AND c.deleted_at IS NULL"
+            " WHERE gm.group_id = :group_id AND gm.deleted_at IS NULL AND gm.user_id IN :ids"
+            " ORDER BY c.name"
+        ).bindparams(sa.bindparam("ids", expanding=True)),
+        {"group_id": group_id, "ids": list(user_ids)},
+    )
+    for user_id, category_name in categories:
+        if user_id in people:
+            people[user_id]["categories"].append(category_name)
+    return people
+
+
+def _rules_status(config, counts):
+    conditions = [
+        condition
+        for rule in (config or {}).get("category_rules", [])
+        for condition in rule.get("conditions", [])
+    ]
+    statuses = []
+    for index, (condition, count) in enumerate(zip(conditions, counts), start=1):
+        min_required = condition.get("min", 0)
+        max_allowed = condition.get("max")
+        statuses.append(
+            {
+                "rule": index,
+                "fulfilled": min_required <= count
+                and (max_allowed is None or count <= max_allowed),
+                "count": count,
+                "min": min_required,
+                "max": max_allowed,
+                "categories": condition.get("categories", []),
+                "operator": condition.get("operator", "AND"),
+            }
+        )
+    return statuses
+
+
+def downgrade():
+    bind = op.get_bind()
+    for job_id, group_id, config, result in _jobs(bind):
+        if not result or result.get("format") != RESULT_FORMAT:
+            continue
+        user_ids = {user_id for group in result["groups"] for user_id in group["member_ids"]}
+        user_ids.update(uid for member_ids in result["together_groups"] for uid in member_ids)
+        people = _people(bind, group_id, user_ids) if user_ids else {}
+
+        def person(user_id, people=people):
+            return people.get(user_id) or {
+                "id": user_id,
+                "name": "Usuario desconocido",
+                "email": "",
+                "categories": [],
+            }
+
+        full = {
+            "groups": [
+                {
+                    "id": group["id"],
+                    "name": group["name"],
+                    "members": [person(user_id) for user_id in group["member_ids"]],
+                    "compatibility_avg": group["compatibility_avg"],
+                    "rules_status": _rules_status(config, group["rule_counts"]),
+                }
+                for group in result["groups"]
+            ],
+            "unfulfilled_rules": result["unfulfilled_rules"],
+            "total_members_assigned": sum(len(group["member_ids"]) for group in result["groups"]),
+            "total_members_available": result["total_members_available"],
+            "together_groups": [
+                {
+                    "member_ids": member_ids,
+                    "member_names": [person(user_id)["name"] for user_id in member_ids],
+                }
+                for member_ids in result["together_groups"]
+            ],
+        }
+        if "created_subgroup_ids" in result:
+            full["created_subgroup_ids"] = result["created_subgroup_ids"]
+        _save(bind, job_id, full)
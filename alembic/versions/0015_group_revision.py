@@ -0,0 +1,32 @@
+"""`group.revision`: contador que sube con cada cambio visible del grupo
+
+Revision ID: 0015_group_revision
+Revises: 0014_division_job_compact_result
+Create Date: 2026-10-18
+
+Sube en la misma transacción que cualquier escritura sobre lo que muestran las
+páginas del grupo (app/group_revision.py): marcas, miembros, categorías,
+permisos, subgrupos y ajustes. Es la clave de los ETag y de los cachés por
+grupo.
+
+Los grupos existentes arrancan en 0. No hace falta backfill: ningún cliente
+tiene todavía un ETag armado con la revisión.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0015_group_revision"
+down_revision = "0014_division_job_compact_result"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "group",
+        sa.Column("revision", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade():
+    op.drop_column("group", "revision")
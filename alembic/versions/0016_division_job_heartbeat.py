@@ -0,0 +1,29 @@
+"""`division_jobs.owner` y `heartbeat_at`: quién corre el job y su último aviso
+
+Revision ID: 0016_division_job_heartbeat
+Revises: 0015_group_revision
+Create Date: 2026-10-18
+
+Con más de un proceso web, el que arranca no puede dar por muerto a todo job
+en "running": solo retoma los que llevan más de DIVISION_JOB_STALE_SECONDS
+sin aviso (app/services/division_jobs.py).
+
+Los jobs existentes quedan sin dueño ni aviso, y se retoman como antes.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0016_division_job_heartbeat"
+down_revision = "0015_group_revision"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("division_jobs", sa.Column("owner", sa.String(length=64), nullable=True))
+    op.add_column("division_jobs", sa.Column("heartbeat_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("division_jobs", "heartbeat_at")
+    op.drop_column("division_jobs", "owner")
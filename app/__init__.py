@@ -20,9 +20,13 @@ from flask_login import current_user
 from flask_wtf.csrf import CSRFError, CSRFProtect
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from app.cache import install_cache_tracking
 from app.extensions import login_manager, scheduler_db
+from app.group_revision import install_group_revisions
 from app.models.user import User
+from app.request_memo import install_request_memo
 from app.routes import blueprints
+from app.slot_counts import install_slot_counters
 from app.soft_delete import install_soft_delete_filter
 from config import Config
 
@@ -129,9 +133,13 @@ def _register_security_headers(app):
 
     @app.after_request
     def set_security_headers(response):
-        response.headers["Content-Security-Policy"] = _content_security_policy(
-            _csp_nonce(), debug=app.config["DEBUG"]
-        )
+        # Un 304 no lleva CSP: el navegador pisaría con este header el de la
+        # página que tiene guardada, y el nonce nuevo no coincidiría con el de
+        # sus `<script>` (ver app/http_cache.py).
+        if response.status_code != 304:
+            response.headers["Content-Security-Policy"] = _content_security_policy(
+                _csp_nonce(), debug=app.config["DEBUG"]
+            )
         # Sin esto el navegador puede adivinar el tipo de un archivo subido o de
         # una respuesta y ejecutarlo como HTML/JS.
         response.headers["X-Content-Type-Options"] = "nosniff"
@@ -172,6 +180,13 @@ def create_app():
     # `csrf_token` de los forms o en el header `X-CSRFToken` de los fetch.
     csrf.init_app(app)
     install_soft_delete_filter()
+    # Los listeners de flush corren en el orden en que se registran: primero
+    # se sube la revisión (fila del grupo) y después se recuentan los bloques,
+    # el mismo orden de bloqueos que el resto de la app (app/slot_counts.py).
+    install_group_revisions()
+    install_slot_counters()
+    install_cache_tracking()
+    install_request_memo(app)
     login_manager.init_app(app)
     login_manager.login_view = "auth.login"
 
@@ -19,6 +19,7 @@ from app.permissions import (
     PERM_VIEW_OWN,
     effective_permissions,
 )
+from app.request_memo import request_memo
 from app.soft_delete import active_or_404
 
 
@@ -28,7 +29,12 @@ def get_group_or_404(group_id: int) -> Group:
 
 
 def get_membership(group_id: int, user_id: int):
-    return GroupMember.query.filter_by(group_id=group_id, user_id=user_id).first()
+    # Memorizada: la piden la autorización y después la vista en la misma request.
+    return request_memo(
+        "membership",
+        (group_id, user_id),
+        lambda: GroupMember.query.filter_by(group_id=group_id, user_id=user_id).first(),
+    )
 
 
 def require_group_member(group_id: int) -> tuple[Group, GroupMember]:
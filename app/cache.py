@@ -0,0 +1,446 @@
+"""Caché de lecturas caras de un grupo, con la revisión del grupo en la clave.
+
+Las vistas de un grupo se repiten mucho más de lo que el grupo cambia, y cada
+una vuelve a calcular los mismos agregados (los bloques más concurridos, el
+mapa de subgrupos, las concesiones de permisos). `group_cached` guarda el
+resultado de una función de servicio bajo (función, grupo, revisión,
+argumentos): como `Group.revision` sube en la misma transacción que cualquier
+cambio visible del grupo (app/group_revision.py), una entrada nunca queda
+vieja; simplemente deja de pedirse y se va por TTL o por LRU.
+
+Hay dos backends, según `CACHE_BACKEND`:
+
+- "memory" (default): un `cachetools.TTLCache` por proceso, acotado en
+  entradas. Alcanza con `--workers 1`, que es como corre hoy.
+- "sqlite": un archivo SQLite (`CACHE_PATH`, por defecto en la carpeta
+  instance de la app) que comparten todos los procesos de la máquina, para
+  cuando haya más de un worker de gunicorn.
+- "none": apagado; todo se calcula siempre.
+
+Los valores se guardan serializados con pickle en los dos backends: quien lee
+recibe su propia copia y puede modificarla sin tocar la del caché (JSON no
+alcanza: hay agregados con filas del ORM y conjuntos). Como pickle ejecuta
+lo que lee, el archivo de "sqlite" es de la app y de nadie más: se crea con
+permisos 0600 y uno ajeno o escribible por otros se rechaza (`_own_file`).
+
+Cuando un link se comparte en un chat, decenas de personas abren el mismo
+grupo a la vez y todas fallan en el caché juntas. Los pedidos simultáneos de
+una misma clave esperan un único cálculo (`_single_flight`): entre los threads
+del proceso siempre, y entre procesos con el backend "sqlite", que lleva una
+fila por cálculo en curso.
+
+No se usa el caché (ni para leer ni para guardar) mientras la sesión tenga
+escrituras sin commitear: dentro de esa transacción la revisión ya subió, pero
+si termina en rollback el número se vuelve a usar para otros datos.
+
+`cache_stats()` devuelve los aciertos, fallos, esperas compartidas y saltos
+de cada función, por proceso; `/health/cache` los publica.
+"""
+
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from cachetools import TTLCache
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from app.extensions import scheduler_db
+from app.group_revision import get_group_revision
+from app.request_memo import request_memo
+
+BACKEND_MEMORY = "memory"
+BACKEND_SQLITE = "sqlite"
+BACKEND_NONE = "none"
+
+# Marca en `session.info` de que la transacción en curso ya escribió algo.
+_WRITES = "cache_pending_writes"
+
+# Cuánto espera quien llega mientras otro calcula la misma clave antes de
+# calcularla por su cuenta, y cada cuánto mira si ya está (entre procesos).
+FLIGHT_WAIT_SECONDS = 10
+FLIGHT_POLL_SECONDS = 0.05
+
+_LOCK = threading.Lock()
+_backend = None
+_backend_settings = None
+_stats = {}
+# Cálculos en curso en este proceso: clave -> _Flight.
+_flights = {}
+
+
+class MemoryBackend:
+    """TTL + LRU en memoria del proceso, compartido por sus threads."""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self._entries = TTLCache(maxsize=max_entries, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def set(self, key, payload):
+        with self._lock:
+            self._entries[key] = payload
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def acquire(self, key, lease_seconds):  # pylint: disable=unused-argument
+        # Un solo proceso: los threads ya se coordinan en `_single_flight`.
+        return True
+
+    def release(self, key):
+        pass
+
+
+def _own_file(path):
+    """Crea `path` con permisos 0600, o verifica que el existente sea solo nuestro.
+
+    Lo mismo para los `-wal` y `-shm` de SQLite si ya existen: quien pueda
+    escribir cualquiera de los tres elige lo que pickle ejecuta en este
+    proceso. Un archivo ajeno o escribible por otros es RuntimeError.
+    """
+    for candidate, create in ((path, True), (f"{path}-wal", False), (f"{path}-shm", False)):
+        flags = os.O_RDWR | getattr(os, "O_NOFOLLOW", 0) | (os.O_CREAT if create else 0)
+        try:
+            fd = os.open(candidate, flags, 0o600)
+        except FileNotFoundError:
+            continue
+        try:
+            info = os.fstat(fd)
+            foreign = hasattr(os, "getuid") and info.st_uid != os.getuid()
+            if foreign or info.st_mode & 0o022:
+                raise RuntimeError(
+                    f"El caché {candidate!r} es de otro usuario o lo pueden escribir otros; "
+                    "usa un CACHE_PATH propio de la app."
+                )
+            os.chmod(fd, 0o600)
+        finally:
+            os.close(fd)
+
+
+class SQLiteBackend:
+    """Tabla en un archivo SQLite, compartida entre procesos.
+
+    Cada thread abre su propia conexión (sqlite3 no las comparte entre
+    threads) en modo WAL, que deja leer mientras otro proceso escribe. Las
+    entradas vencidas y las que pasan de `max_entries` (las que vencen antes)
+    se barren cada tanto al escribir, no en cada lectura.
+    """
+
+    _PRUNE_EVERY = 64
+
+    def __init__(self, path, max_entries, ttl_seconds):
+        _own_file(path)
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        # Las conexiones son por thread, pero el contador de escrituras es del backend.
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS app_cache ("
+                " key TEXT PRIMARY KEY, payload BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_app_cache_expires ON app_cache (expires_at)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS app_cache_flights ("
+                " key TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = (
+            self._connect()
+            .execute(
+                "SELECT payload FROM app_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def set(self, key, payload):
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO app_cache (key, payload, expires_at) VALUES (?, ?, ?)",
+                (key, payload, now + self.ttl_seconds),
+            )
+            with self._lock:
+                self._writes += 1
+                prune = self._writes % self._PRUNE_EVERY == 0
+            if prune:
+                self._prune(connection, now)
+
+    def _prune(self, connection, now):
+        connection.execute("DELETE FROM app_cache WHERE expires_at <= ?", (now,))
+        connection.execute(
+            "DELETE FROM app_cache WHERE key IN ("
+            " SELECT key FROM app_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM app_cache")
+            connection.execute("DELETE FROM app_cache_flights")
+
+    def acquire(self, key, lease_seconds):
+        """True si este proceso queda a cargo de calcular `key`.
+
+        La fila vence sola a los `lease_seconds`: si el proceso que la tomó
+        muere a mitad del cálculo, otro la retoma en vez de esperar siempre.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM app_cache_flights WHERE key = ? AND expires_at <= ?", (key, now)
+            )
+            inserted = connection.execute(
+                "INSERT OR IGNORE INTO app_cache_flights (key, expires_at) VALUES (?, ?)",
+                (key, now + lease_seconds),
+            ).rowcount
+        return inserted == 1
+
+    def release(self, key):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM app_cache_flights WHERE key = ?", (key,))
+
+
+def _cache_path():
+    """`CACHE_PATH`, o el archivo por defecto en la carpeta instance de la app."""
+    path = current_app.config["CACHE_PATH"]
+    if path:
+        return path
+    os.makedirs(current_app.instance_path, mode=0o700, exist_ok=True)
+    return os.path.join(current_app.instance_path, "scheduler-cache.sqlite")
+
+
+def _settings():
+    config = current_app.config
+    return (
+        config["CACHE_BACKEND"],
+        _cache_path() if config["CACHE_BACKEND"] == BACKEND_SQLITE else None,
+        config["CACHE_MAX_ENTRIES"],
+        config["CACHE_TTL_SECONDS"],
+    )
+
+
+def get_backend():
+    """Backend configurado para este proceso, o None si el caché está apagado."""
+    global _backend, _backend_settings  # pylint: disable=global-statement
+    settings = _settings()
+    with _LOCK:
+        if settings != _backend_settings:
+            name, path, max_entries, ttl_seconds = settings
+            if name == BACKEND_SQLITE:
+                _backend = SQLiteBackend(path, max_entries, ttl_seconds)
+            elif name == BACKEND_MEMORY:
+                _backend = MemoryBackend(max_entries, ttl_seconds)
+            elif name == BACKEND_NONE:
+                _backend = None
+            else:
+                raise ValueError(f"CACHE_BACKEND desconocido: {name!r}")
+            _backend_settings = settings
+        return _backend
+
+
+def _count(namespace, outcome):
+    with _LOCK:
+        counters = _stats.setdefault(
+            namespace, {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0}
+        )
+        counters[outcome] += 1
+
+
+def cache_stats():
+    """{función: {"hits", "misses", "coalesced", "bypassed"}} de este proceso."""
+    with _LOCK:
+        return {namespace: dict(counters) for namespace, counters in _stats.items()}
+
+
+def reset():
+    """Vacía el caché y los contadores. Para los tests: la BD se vacía entre uno y otro."""
+    with _LOCK:
+        backend = _backend
+        _stats.clear()
+    if backend is not None:
+        backend.clear()
+
+
+def _mark_writes(session, *_args):
+    session.info[_WRITES] = True
+
+
+def _mark_orm_writes(execute_state):
+    if not execute_state.is_select:
+        execute_state.session.info[_WRITES] = True
+
+
+def _forget_writes(session, *_args):
+    session.info.pop(_WRITES, None)
+
+
+def install_cache_tracking():
+    """Registra los listeners que anotan si la transacción escribió. Idempotente."""
+    for name, listener in (
+        ("after_flush", _mark_writes),
+        ("do_orm_execute", _mark_orm_writes),
+        ("after_commit", _forget_writes),
+        ("after_rollback", _forget_writes),
+    ):
+        if not event.contains(scheduler_db.session, name, listener):
+            event.listen(scheduler_db.session, name, listener)
+
+
+def _has_pending_writes():
+    session = scheduler_db.session
+    return bool(session.info.get(_WRITES) or session.new or session.dirty or session.deleted)
+
+
+def _revision(group_id):
+    # Se lee antes de calcular: lo que se guarda es, como mínimo, de esa revisión.
+    return request_memo("group_revision", group_id, lambda: get_group_revision(group_id))
+
+
+def _key_part(value):
+    """Forma estable y hasheable de un argumento; los conjuntos se ordenan."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (set, frozenset)):
+        return ("set", tuple(sorted(value)))
+    if isinstance(value, (list, tuple)):
+        return tuple(_key_part(item) for item in value)
+    raise TypeError(f"argumento no cacheable: {type(value).__name__}")
+
+
+def _key(namespace, group_id, revision, args, kwargs):
+    arguments = repr((_key_part(args), _key_part(sorted(kwargs.items()))))
+    digest = hashlib.sha256(arguments.encode()).hexdigest()[:32]
+    return f"{namespace}:{group_id}:{revision}:{digest}"
+
+
+class _Flight:  # pylint: disable=too-few-public-methods
+    """Un cálculo en curso: los que llegan después esperan `done` y leen `payload`."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.payload = None
+
+
+def _wait_for_payload(backend, key):
+    """El valor que otro proceso está calculando, o None si no llega a tiempo."""
+    deadline = time.monotonic() + FLIGHT_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(FLIGHT_POLL_SECONDS)
+        payload = backend.get(key)
+        if payload is not None:
+            return payload
+    return None
+
+
+def _lead(backend, key, compute):
+    """Calcula y guarda `key`, salvo que otro proceso ya lo esté haciendo.
+
+    Devuelve (payload, calculado_acá).
+    """
+    acquired = backend.acquire(key, FLIGHT_WAIT_SECONDS)
+    if not acquired:
+        payload = _wait_for_payload(backend, key)
+        if payload is not None:
+            return payload, False
+    try:
+        payload = pickle.dumps(compute(), protocol=pickle.HIGHEST_PROTOCOL)
+        backend.set(key, payload)
+        return payload, True
+    finally:
+        if acquired:
+            backend.release(key)
+
+
+def _single_flight(namespace, backend, key, compute):
+    """`compute()` una sola vez por clave aunque la pidan varios a la vez.
+
+    El primer thread del proceso que llega calcula (o espera al proceso que ya
+    lo hace, con el backend "sqlite"); los demás threads esperan su resultado.
+    Si quien calcula falla o tarda más de FLIGHT_WAIT_SECONDS, cada uno
+    calcula por su cuenta: la espera nunca es peor que no haber esperado.
+    """
+    with _LOCK:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        if flight.done.wait(FLIGHT_WAIT_SECONDS) and flight.payload is not None:
+            _count(namespace, "coalesced")
+            return pickle.loads(flight.payload)
+        _count(namespace, "misses")
+        return compute()
+
+    try:
+        flight.payload, computed = _lead(backend, key, compute)
+    finally:
+        with _LOCK:
+            _flights.pop(key, None)
+        flight.done.set()
+    _count(namespace, "misses" if computed else "coalesced")
+    return pickle.loads(flight.payload)
+
+
+def group_cached(namespace):
+    """Cachea una función de servicio cuyo primer argumento es el grupo o su id.
+
+    El resto de los argumentos entra en la clave: tienen que ser None,
+    números, strings, o listas y conjuntos de eso. Lo que devuelve la función
+    tiene que poder serializarse con pickle.
+
+    Ante un fallo, los pedidos simultáneos de la misma clave (mismo grupo,
+    revisión y alcance) esperan un único cálculo (`_single_flight`).
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(group, *args, **kwargs):
+            group_id = getattr(group, "id", group)
+            backend = get_backend() if has_app_context() and group_id else None
+            if backend is None:
+                return function(group, *args, **kwargs)
+            if _has_pending_writes():
+                _count(namespace, "bypassed")
+                return function(group, *args, **kwargs)
+
+            revision = _revision(group_id)
+            if revision is None:
+                return function(group, *args, **kwargs)
+            key = _key(namespace, group_id, revision, args, kwargs)
+            payload = backend.get(key)
+            if payload is not None:
+                _count(namespace, "hits")
+                return pickle.loads(payload)
+
+            return _single_flight(namespace, backend, key, lambda: function(group, *args, **kwargs))
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,178 @@
+"""Borra de verdad las marcas de disponibilidad ocultas hace tiempo.
+
+Cada autosave oculta y restaura filas de `user_availability` en vez de
+borrarlas, así que la tabla y sus índices (`ix_user_availability_user_avail_deleted`,
+`uq_user_availability_active`) acumulan lápidas: marcas que el usuario sacó y
+nunca volvió a poner. Pasado un tiempo no las necesita nadie; volver a marcar
+el bloque inserta una fila nueva, igual que si nunca hubiera existido.
+
+Solo se borra lo que cumple todo esto:
+
+- oculta (`deleted_at`) hace más de `--older-than-days` días
+  (`TOMBSTONE_MAX_AGE_DAYS`, 30 por defecto);
+- de un grupo que no está en la papelera;
+- de un usuario que no figura como miembro retirado del grupo sin haber
+  vuelto: si el grupo o la membresía se restauran con `restore_batch`, su
+  historia vuelve tal cual estaba.
+
+Se borra por lotes de `--batch-size` filas con un commit por lote, así que
+ningún lock dura más que un lote y se puede correr con la app andando.
+
+    python -m app.db.compact_tombstones [--older-than-days N] [--batch-size N]
+"""
+
+import argparse
+from datetime import timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import and_, delete, func, or_, select, text
+
+# `scheduler_app` lo fabrica el __getattr__ (PEP 562) de app/__init__.py, que
+# pylint no puede inferir estaticamente.
+from app import scheduler_app  # pylint: disable=no-name-in-module
+from app.extensions import scheduler_db
+from app.models import Availability, Group, GroupMember, UserAvailability
+from app.models.mixins import _utcnow
+
+DEFAULT_BATCH_SIZE = 1000
+
+_marks = UserAvailability.__table__
+_availability = Availability.__table__
+_groups = Group.__table__
+_members = GroupMember.__table__
+
+MARK_INDEXES = ("ix_user_availability_user_avail_deleted", "uq_user_availability_active")
+
+
+def compactable_marks(cutoff):
+    """Condición de las lápidas que se pueden borrar (ver el docstring del módulo)."""
+
+    def membership(*criteria):
+        # Correlación explícita: dos niveles adentro, la automática ya no
+        # encuentra a `user_availability` y la agregaría al FROM.
+        return (
+            select(_members.c.id)
+            .where(
+                _members.c.group_id == _availability.c.group_id,
+                _members.c.user_id == _marks.c.user_id,
+                *criteria,
+            )
+            .correlate_except(_members)
+            .exists()
+        )
+
+    left_member = and_(
+        membership(_members.c.deleted_at.isnot(None)),
+        ~membership(_members.c.deleted_at.is_(None)),
+    )
+    group_in_trash = (
+        select(_groups.c.id)
+        .where(_groups.c.id == _availability.c.group_id, _groups.c.deleted_at.isnot(None))
+        .correlate_except(_groups)
+        .exists()
+    )
+    slot_is_restorable = (
+        select(_availability.c.id)
+        .where(_availability.c.id == _marks.c.availability_id)
+        .where(or_(group_in_trash, left_member))
+        .exists()
+    )
+    return and_(
+        _marks.c.deleted_at.isnot(None),
+        _marks.c.deleted_at < cutoff,
+        ~slot_is_restorable,
+    )
+
+
+def index_bytes():
+    """Bytes que ocupan hoy los índices de `user_availability`, o None si el motor no lo dice."""
+    session = scheduler_db.session
+    dialect = session.get_bind().dialect.name
+    try:
+        if dialect == "postgresql":
+            return sum(
+                session.execute(
+                    text("SELECT pg_relation_size(CAST(:name AS regclass))"), {"name": name}
+                ).scalar_one()
+                for name in MARK_INDEXES
+            )
+        if dialect == "sqlite":
+            # `dbstat` es opcional en SQLite: sin él no hay medida.
+            return session.execute(
+                text("SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name IN (:a, :b)"),
+                {"a": MARK_INDEXES[0], "b": MARK_INDEXES[1]},
+            ).scalar_one()
+    except Exception:  # pylint: disable=broad-except
+        session.rollback()
+    return None
+
+
+def compact_tombstones(older_than_days=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Borra las lápidas viejas por lotes. Devuelve (filas, bytes_de_índice, lotes).
+
+    `index_bytes` es una estimación de lo liberado: la parte proporcional de
+    los índices que ocupaban las filas borradas. El espacio vuelve al motor
+    cuando pasa el VACUUM (automático en Postgres), no al momento del DELETE.
+    None si el motor no informa el tamaño de los índices.
+    """
+    if older_than_days is None:
+        older_than_days = scheduler_app.config["TOMBSTONE_MAX_AGE_DAYS"]
+    cutoff = _utcnow() - timedelta(days=older_than_days)
+    where = compactable_marks(cutoff)
+    session = scheduler_db.session
+
+    total_rows = session.execute(select(func.count()).select_from(_marks)).scalar_one()
+    size_before = index_bytes()
+
+    deleted = batches = 0
+    while True:
+        ids = (
+            session.execute(
+                select(_marks.c.id).where(where).order_by(_marks.c.id).limit(batch_size)
+            )
+            .scalars()
+            .all()
+        )
+        if not ids:
+            break
+        # La condición se repite en el DELETE: si entre la lectura y el borrado
+        # alguien restauró una de estas filas, ya no cumple y no se toca.
+        deleted += session.execute(delete(_marks).where(_marks.c.id.in_(ids), where)).rowcount
+        session.commit()
+        batches += 1
+        if len(ids) < batch_size:
+            break
+
+    reclaimed = None
+    if size_before is not None and total_rows:
+        reclaimed = size_before * deleted // total_rows
+    return SimpleNamespace(rows=deleted, index_bytes=reclaimed, batches=batches)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--older-than-days",
+        type=int,
+        default=None,
+        help="antigüedad mínima de la marca oculta (por defecto TOMBSTONE_MAX_AGE_DAYS)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"filas por lote y commit (por defecto {DEFAULT_BATCH_SIZE})",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    with scheduler_app.app_context():
+        print("Compactando marcas de disponibilidad ocultas...")
+        result = compact_tombstones(args.older_than_days, args.batch_size)
+        freed = "n/d" if result.index_bytes is None else f"~{result.index_bytes} bytes"
+        print(
+            f"Listo: {result.rows} filas borradas en {result.batches} lotes; "
+            f"índices liberables: {freed}.\n"
+        )
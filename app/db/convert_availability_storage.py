@@ -0,0 +1,152 @@
+"""Cambia cómo guarda un grupo su disponibilidad: marcas por bloque o tramos.
+
+Con bloques de 5 minutos, alguien libre de 08:00 a 18:00 de lunes a viernes
+son 600 filas de `user_availability`; como tramos (`availability_interval`)
+son 5. Este comando pasa un grupo de un modo al otro moviendo sus datos en una
+sola transacción:
+
+- `intervals`: las marcas activas de cada usuario se funden en tramos de la
+  duración del bloque actual, y las marcas se ocultan (no se borran: la
+  compactación de lápidas se encarga después). Incluye las que la grilla no
+  muestra y las de quienes dejaron el grupo, para que vuelvan si corresponde.
+- `marks`: los tramos se expanden a los bloques de la grilla actual que pisan
+  y se guardan como marcas. Lo que no pisa ninguna celda de la grilla actual
+  no tiene bloque donde caer y se pierde: el comando lo informa.
+
+Los bitmaps del grupo se rehacen al final desde la fuente nueva.
+
+    python -m app.db.convert_availability_storage <group_id> {intervals,marks}
+"""
+
+import argparse
+from types import SimpleNamespace
+
+from sqlalchemy import delete, insert, select, update
+
+# `scheduler_app` lo fabrica el __getattr__ (PEP 562) de app/__init__.py, que
+# pylint no puede inferir estaticamente.
+from app import scheduler_app  # pylint: disable=no-name-in-module
+from app.extensions import scheduler_db
+from app.models import Availability, AvailabilityInterval, Group, UserAvailability
+from app.models.group import AVAILABILITY_STORAGE_MODES, STORAGE_INTERVALS, STORAGE_MARKS
+from app.models.mixins import _utcnow
+from app.services.availability_bitmap import rebuild_group_bitmaps
+from app.services.availability_intervals import (
+    intervals_to_cells,
+    member_intervals,
+    merge_intervals,
+)
+from app.services.availability_service import save_member_availability
+from app.slot_counts import recount_group_slots
+
+
+def _marks_to_intervals(group):
+    """Pasa las marcas activas del grupo a tramos. Devuelve (marcas, tramos)."""
+    marks = (
+        scheduler_db.session.query(
+            UserAvailability.user_id, Availability.weekday, Availability.start_minutes
+        )
+        .join(Availability, UserAvailability.availability_id == Availability.id)
+        .filter(Availability.group_id == group.id)
+        .all()
+    )
+    by_user = {}
+    for user_id, weekday, minutes in marks:
+        by_user.setdefault(user_id, []).append((weekday, minutes, minutes + group.block_minutes))
+
+    rows = [
+        {
+            "group_id": group.id,
+            "user_id": user_id,
+            "weekday": weekday,
+            "start_minutes": start,
+            "end_minutes": end,
+        }
+        for user_id, intervals in sorted(by_user.items())
+        for weekday, start, end in merge_intervals(intervals)
+    ]
+    scheduler_db.session.execute(
+        delete(AvailabilityInterval).where(AvailabilityInterval.group_id == group.id)
+    )
+    if rows:
+        scheduler_db.session.execute(insert(AvailabilityInterval), rows)
+    scheduler_db.session.execute(
+        update(UserAvailability)
+        .where(
+            UserAvailability.availability_id.in_(
+                select(Availability.id).where(Availability.group_id == group.id)
+            ),
+            UserAvailability.deleted_at.is_(None),
+        )
+        .values(deleted_at=_utcnow())
+    )
+    recount_group_slots(group.id)
+    return len(marks), len(rows)
+
+
+def _intervals_to_marks(group):
+    """Pasa los tramos del grupo a marcas. Devuelve (tramos, marcas, tramos sin celda)."""
+    block_starts = group.block_starts()
+    intervals = member_intervals(group.id)
+    group.availability_storage = STORAGE_MARKS
+    scheduler_db.session.flush()
+
+    total = dropped = saved = 0
+    for user_id, member in intervals.items():
+        for interval in member:
+            total += 1
+            if not intervals_to_cells(block_starts, group.block_minutes, [interval]):
+                dropped += 1
+        cells = intervals_to_cells(block_starts, group.block_minutes, member)
+        saved += save_member_availability(group, user_id, cells, range(7)).saved
+
+    scheduler_db.session.execute(
+        delete(AvailabilityInterval).where(AvailabilityInterval.group_id == group.id)
+    )
+    return total, saved, dropped
+
+
+def convert_availability_storage(group, mode):
+    """Convierte el grupo al modo `mode`. No commitea.
+
+    Devuelve un SimpleNamespace con `before` y `after` (filas en la tabla de
+    origen y en la de destino) y `dropped` (tramos sin celda en la grilla
+    actual, solo al volver a marcas). Convertir al modo que ya tiene no hace
+    nada.
+    """
+    if mode not in AVAILABILITY_STORAGE_MODES:
+        raise ValueError(f"Modo desconocido: {mode!r}.")
+    if group.availability_storage == mode:
+        return SimpleNamespace(before=0, after=0, dropped=0)
+
+    if mode == STORAGE_INTERVALS:
+        before, after = _marks_to_intervals(group)
+        group.availability_storage = STORAGE_INTERVALS
+        dropped = 0
+    else:
+        before, after, dropped = _intervals_to_marks(group)
+    scheduler_db.session.flush()
+    rebuild_group_bitmaps(group)
+    return SimpleNamespace(before=before, after=after, dropped=dropped)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("group_id", type=int, help="id del grupo a convertir")
+    parser.add_argument("mode", choices=AVAILABILITY_STORAGE_MODES, help="modo de destino")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    with scheduler_app.app_context():
+        target = scheduler_db.session.get(Group, args.group_id)
+        if target is None:
+            raise SystemExit(f"No existe el grupo {args.group_id}.")
+        print(f"Convirtiendo el grupo {target.id} a '{args.mode}'...")
+        result = convert_availability_storage(target, args.mode)
+        scheduler_db.session.commit()
+        print(f"Listo: {result.before} filas de origen, {result.after} de destino.")
+        if result.dropped:
+            print(f"{result.dropped} tramos no pisan la grilla actual y no se convirtieron.")
+        print()
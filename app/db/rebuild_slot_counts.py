@@ -0,0 +1,55 @@
+"""Recalcula `Availability.attendee_count` desde las marcas.
+
+El contador lo mantiene la app en la misma transacción que cada cambio (ver
+app/slot_counts.py), pero lo que la base borra por su cuenta —un `ON DELETE
+CASCADE` al eliminar un usuario, un arreglo a mano en SQL— no pasa por ahí.
+Este comando repara esa deriva. Es idempotente y se puede correr con la app
+andando: cada grupo se recuenta y commitea por separado, así que ningún lock
+dura más que el recuento de un grupo.
+
+    python -m app.db.rebuild_slot_counts
+"""
+
+from sqlalchemy import func, select
+
+# `scheduler_app` lo fabrica el __getattr__ (PEP 562) de app/__init__.py, que
+# pylint no puede inferir estaticamente.
+from app import scheduler_app  # pylint: disable=no-name-in-module
+from app.extensions import scheduler_db
+from app.models import Availability
+from app.slot_counts import attendee_count_expression, recount_group_slots
+
+
+def count_drifted_slots(group_id):
+    """Bloques del grupo cuyo contador no coincide con las marcas."""
+    return scheduler_db.session.execute(
+        select(func.count())
+        .select_from(Availability.__table__)
+        .where(
+            Availability.__table__.c.group_id == group_id,
+            Availability.__table__.c.attendee_count != attendee_count_expression(),
+        )
+    ).scalar_one()
+
+
+def rebuild_slot_counts():
+    """Recuenta todos los grupos. Devuelve cuántos bloques estaban desfasados."""
+    group_ids = [
+        group_id
+        for (group_id,) in scheduler_db.session.query(Availability.group_id).distinct().all()
+    ]
+    drifted = 0
+    for group_id in group_ids:
+        group_drift = count_drifted_slots(group_id)
+        if group_drift:
+            recount_group_slots(group_id)
+            drifted += group_drift
+        scheduler_db.session.commit()
+    return drifted
+
+
+if __name__ == "__main__":
+    with scheduler_app.app_context():
+        print("Recalculando contadores de asistentes por bloque...")
+        total = rebuild_slot_counts()
+        print(f"Listo: {total} bloques corregidos.\n")
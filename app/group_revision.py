@@ -0,0 +1,151 @@
+"""Revisión de cada grupo (`Group.revision`).
+
+Un entero que sube en la misma transacción que cualquier escritura que cambie
+lo que muestran las páginas del grupo: marcas y tramos de disponibilidad,
+miembros, categorías y sus asignaciones, concesiones de permisos, subgrupos y
+sus integrantes, los ajustes del propio grupo y el nombre o correo de un
+miembro. Mientras la revisión no cambie, `groups.show`, `groups.members`,
+`subgroups.index` y los JSON del grupo muestran lo mismo: de eso viven los
+ETag (app/http_cache.py) y todo lo que quiera cachearse por grupo.
+
+Se mantiene igual que el contador de asistentes (app/slot_counts.py):
+
+- un listener de flush (`install_group_revisions`) ve lo que escribe el ORM y
+  sube, con un solo UPDATE, la revisión de cada grupo que tocó;
+- las escrituras en bloque, que no pasan por el flush, llaman a
+  `bump_group_revision` explícitamente.
+
+Quien cachea por grupo lee el número con `get_group_revision`.
+
+Los jobs de división no cuentan: su estado no aparece en esas páginas, y
+confirmar o deshacer una división la sube por los subgrupos. Lo que cambie la
+base por su cuenta (un `ON DELETE CASCADE`) tampoco la mueve.
+
+Una revisión no identifica un estado para siempre: si la transacción que la
+subió hace rollback, la siguiente escritura vuelve a usar el mismo número.
+"""
+
+from sqlalchemy import event, or_, select, update
+
+from app.extensions import scheduler_db
+from app.models import (
+    Availability,
+    AvailabilityBitmap,
+    AvailabilityInterval,
+    Category,
+    Group,
+    GroupMember,
+    GroupMemberCategory,
+    GroupPermissionGrant,
+    SubGroup,
+    SubGroupMember,
+    User,
+    UserAvailability,
+)
+from app.models.mixins import _utcnow
+from app.slot_counts import _loaded
+from app.soft_delete import INCLUDE_DELETED
+
+_groups = Group.__table__
+
+# Quedan en `session.info` entre el flush y su postexec.
+_BUMPED = "group_revision_bumped"
+
+# Filas que llevan el id de su grupo en una columna.
+_DIRECT = {
+    GroupMember: "group_id",
+    Category: "group_id",
+    GroupPermissionGrant: "group_id",
+    AvailabilityBitmap: "group_id",
+    AvailabilityInterval: "group_id",
+    SubGroup: "parent_group_id",
+}
+
+# Filas que cuelgan de otra: (columna propia, grupo del padre, id del padre).
+_VIA_PARENT = {
+    SubGroupMember: ("subgroup_id", SubGroup.parent_group_id, SubGroup.id),
+    GroupMemberCategory: ("group_member_id", GroupMember.group_id, GroupMember.id),
+    UserAvailability: ("availability_id", Availability.group_id, Availability.id),
+    # El nombre y el correo de un usuario salen en todos sus grupos.
+    User: ("id", GroupMember.group_id, GroupMember.user_id),
+}
+
+
+def _bump(connection, where):
+    connection.execute(
+        update(_groups).where(where).values(revision=_groups.c.revision + 1, updated_at=_utcnow())
+    )
+
+
+def _expire_revisions(session):
+    """Lo cargado de `revision` y `updated_at` quedó viejo: se relee al pedirlo."""
+    for instance in list(session.identity_map.values()):
+        if isinstance(instance, Group):
+            session.expire(instance, ["revision", "updated_at"])
+
+
+def get_group_revision(group_id):
+    """Revisión del grupo (`Group.revision`), o None si no existe.
+
+    Es la clave para cachear lo que se arma del grupo: la usan `app.cache` y
+    la caché de datos del solver de subgrupos. Una sola consulta por id, sin
+    cargar el grupo.
+    """
+    return scheduler_db.session.execute(
+        select(Group.revision)
+        .where(Group.id == group_id)
+        .execution_options(**{INCLUDE_DELETED: True})
+    ).scalar()
+
+
+def bump_group_revision(group_id, connection=None):
+    """Sube la revisión del grupo. Para las escrituras en bloque, que no pasan por el flush."""
+    _bump(connection or scheduler_db.session.connection(), _groups.c.id == group_id)
+    _expire_revisions(scheduler_db.session)
+
+
+def _touched_by_flush(session):
+    """(ids de grupo, {modelo: ids de padre}) que el flush en curso cambió."""
+    group_ids = set()
+    parents = {model: set() for model in _VIA_PARENT}
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        model = type(instance)
+        dirty = instance in session.dirty
+        if dirty and not session.is_modified(instance, include_collections=False):
+            continue
+        if model in _DIRECT:
+            group_ids.add(_loaded(instance, _DIRECT[model]))
+        elif model in _VIA_PARENT and (dirty or model is not User):
+            parents[model].add(_loaded(instance, _VIA_PARENT[model][0]))
+        elif model is Group and dirty:
+            # Uno nuevo no tiene nada cacheado; uno borrado de verdad, nada que mostrar.
+            group_ids.add(_loaded(instance, "id"))
+    group_ids.discard(None)
+    return group_ids, {model: ids - {None} for model, ids in parents.items() if ids - {None}}
+
+
+def _after_flush(session, _flush_context):
+    group_ids, parents = _touched_by_flush(session)
+    if not group_ids and not parents:
+        return
+    conditions = [_groups.c.id.in_(group_ids)] if group_ids else []
+    for model, parent_ids in parents.items():
+        _, group_column, parent_id = _VIA_PARENT[model]
+        conditions.append(_groups.c.id.in_(select(group_column).where(parent_id.in_(parent_ids))))
+    _bump(session.connection(), or_(*conditions))
+    session.info[_BUMPED] = True
+
+
+def _after_flush_postexec(session, _flush_context):
+    if session.info.pop(_BUMPED, False):
+        _expire_revisions(session)
+
+
+def install_group_revisions():
+    """Registra los listeners. Idempotente: seguro de llamar más de una vez."""
+    for name, listener in (
+        ("after_flush", _after_flush),
+        ("after_flush_postexec", _after_flush_postexec),
+    ):
+        if not event.contains(scheduler_db.session, name, listener):
+            event.listen(scheduler_db.session, name, listener)
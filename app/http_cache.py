@@ -0,0 +1,103 @@
+"""ETag de las vistas de un grupo, armado con su revisión.
+
+La mayoría de las visitas a `groups.show` son la misma persona volviendo a un
+grupo que no cambió. Con un validador el navegador pregunta "¿sigue igual?"
+(`If-None-Match`) y la vista contesta 304 antes de consultar nada más que la
+membresía: no arma la grilla, ni el roster, ni renderiza.
+
+Lo que muestra una de esas vistas depende de más que el grupo, y todo eso
+entra en el ETag:
+
+- la revisión del grupo (`Group.revision`, ver app/group_revision.py);
+- quién mira: los permisos y el alcance cambian la página, y la barra lleva
+  su nombre (por eso entra también su `updated_at`);
+- el token CSRF de la sesión, que va en la página: se parte el tiempo en
+  tramos de media vida del token, así una página revalidada nunca lleva uno
+  vencido, y un token nuevo (otra sesión) invalida las viejas;
+- el proceso: un deploy puede cambiar las plantillas sin tocar ningún dato.
+
+No se manda Last-Modified: las fechas HTTP van en segundos, y dos cambios del
+grupo dentro del mismo segundo le darían un 304 con la página vieja a un
+cliente que solo revalide con `If-Modified-Since`. La frescura la decide solo
+el ETag.
+
+Una página que muestra mensajes flash no lleva validadores ni se contesta con
+304: el mensaje es de esa visita y no debe volver a salir.
+
+    cached = not_modified(group)
+    if cached is not None:
+        return cached
+    ...
+    return with_validators(render_template(...), group)
+"""
+
+import hashlib
+import secrets
+import time
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+# Los ETag de otro proceso (el anterior a un deploy) no se reconocen.
+_BOOT_TOKEN = secrets.token_hex(8)
+
+# Sin límite del token CSRF, los tramos son de un día.
+_DEFAULT_CSRF_WINDOW = 86400
+
+
+def _csrf_window():
+    """Número de tramo del reloj, en tramos de media vida del token CSRF."""
+    limit = current_app.config.get("WTF_CSRF_TIME_LIMIT", 3600)
+    span = max(1, limit // 2) if limit else _DEFAULT_CSRF_WINDOW
+    return int(time.time()) // span
+
+
+def _etag(group):
+    """ETag de la vista del grupo para quien pide."""
+    parts = (
+        _BOOT_TOKEN,
+        group.id,
+        group.revision,
+        current_user.id,
+        current_user.updated_at.isoformat(),
+        _csrf_window(),
+        session.get("csrf_token", ""),
+    )
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+
+def not_modified(group):
+    """Respuesta 304 si quien pide ya tiene esta versión de la vista; si no, None.
+
+    Va justo después de la autorización, antes de cualquier otra consulta.
+    """
+    # Se anota siempre: el test client comparte `g` entre requests.
+    g.http_cache_flashes = "_flashes" in session
+    if g.http_cache_flashes:
+        return None
+    etag = _etag(group)
+    # Sin `last_modified`: un `If-Modified-Since` solo no alcanza para un 304.
+    if is_resource_modified(request.environ, etag=etag):
+        return None
+    response = current_app.response_class(status=304)
+    _set_validators(response, etag)
+    return response
+
+
+def _set_validators(response, etag):
+    response.set_etag(etag, weak=True)
+    # Solo el navegador de quien pide la guarda, y siempre la revalida.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+
+def with_validators(response, group):
+    """`response` (o lo que devuelve una vista) con el ETag del grupo.
+
+    Se llama en la misma request que `not_modified`, que anota si hay flash.
+    """
+    response = make_response(response)
+    if not g.get("http_cache_flashes") and response.status_code == 200:
+        _set_validators(response, _etag(group))
+    return response
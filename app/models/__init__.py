@@ -1,5 +1,7 @@
 from app.models.audit_log import AuditLog
 from app.models.availability import Availability
+from app.models.availability_bitmap import AvailabilityBitmap
+from app.models.availability_interval import AvailabilityInterval
 from app.models.category import Category
 from app.models.group import Group
 from app.models.group_member import GroupMember, RoleEnum
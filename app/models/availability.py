@@ -16,10 +16,18 @@ class Availability(TimestampMixin, scheduler_db.Model):  # pylint: disable=too-f
     # minutos no tiene representación exacta en binario y 8.333… no calzaba con
     # el inicio guardado. El dato es discreto, así que se guarda discreto.
     start_minutes = scheduler_db.Column(scheduler_db.Integer, nullable=False)
+    # Marcas activas de miembros activos en este bloque. Derivado: lo mantiene
+    # app/slot_counts.py en la misma transacción que cada marca o cambio de
+    # membresía, y `python -m app.db.rebuild_slot_counts` lo repara.
+    attendee_count = scheduler_db.Column(
+        scheduler_db.Integer, nullable=False, default=0, server_default="0"
+    )
 
     # Sin borrado lógico en esta tabla: el unique es total, no parcial.
     __table_args__ = (
         scheduler_db.Index("ix_availability_group", "group_id"),
+        # El resumen "horarios más concurridos" es un ORDER BY … LIMIT sobre esto.
+        scheduler_db.Index("ix_availability_group_attendees", "group_id", "attendee_count"),
         scheduler_db.UniqueConstraint(
             "group_id", "weekday", "start_minutes", name="uq_availability_slot"
         ),
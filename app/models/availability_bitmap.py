@@ -0,0 +1,50 @@
+from app.extensions import scheduler_db
+from app.models.mixins import TimestampMixin
+
+
+class AvailabilityBitmap(TimestampMixin, scheduler_db.Model):  # pylint: disable=too-few-public-methods
+    """Disponibilidad de un miembro en un grupo, un bit por celda de la grilla.
+
+    Es un derivado de `user_availability`, no la fuente de verdad: se mantiene
+    al día desde el motor de disponibilidad y se puede reconstruir en cualquier
+    momento a partir de las marcas. El bit `weekday * len(block_starts) + i`
+    corresponde al bloque `i` de ese día; los siete días van siempre, estén o
+    no activos, para que apagar un día no invalide el bitmap.
+
+    `layout` fija la grilla con la que se armaron los bits ("inicio:fin:bloque"
+    en minutos). Si el admin cambia el formato, el bitmap queda desfasado y se
+    reconstruye: sin esa marca, un bit apuntaría a otro horario.
+    """
+
+    __tablename__ = "availability_bitmap"
+    id = scheduler_db.Column(scheduler_db.Integer, primary_key=True)
+    group_id = scheduler_db.Column(
+        scheduler_db.Integer,
+        scheduler_db.ForeignKey("group.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    user_id = scheduler_db.Column(
+        scheduler_db.Integer,
+        scheduler_db.ForeignKey("user.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    layout = scheduler_db.Column(scheduler_db.String(32), nullable=False)
+    # Entero little-endian: el byte 0 lleva las celdas 0-7 del lunes.
+    bits = scheduler_db.Column(scheduler_db.LargeBinary, nullable=False, default=b"")
+    # Versión de la grilla del miembro. La lleva el ORM (`version_id_col`): cada
+    # UPDATE la incrementa y exige que la fila siga en la versión leída, así
+    # que dos pestañas guardando a la vez no se pisan en silencio. El autosave
+    # delta la usa para detectar que el cliente trabaja sobre un estado viejo.
+    version = scheduler_db.Column(scheduler_db.Integer, nullable=False, server_default="1")
+
+    # Derivado puro: sin borrado lógico, el unique es total.
+    __table_args__ = (
+        scheduler_db.UniqueConstraint("group_id", "user_id", name="uq_availability_bitmap_member"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
+    def __repr__(self):
+        return (
+            f"<AvailabilityBitmap group_id={self.group_id} user_id={self.user_id} "
+            f"layout={self.layout}>"
+        )
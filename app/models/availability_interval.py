@@ -0,0 +1,47 @@
+from app.extensions import scheduler_db
+from app.models.mixins import TimestampMixin
+
+
+class AvailabilityInterval(TimestampMixin, scheduler_db.Model):  # pylint: disable=too-few-public-methods
+    """Tramo libre de un miembro: `[start_minutes, end_minutes)` de un día.
+
+    Es la fuente de verdad de los grupos con `availability_storage =
+    "intervals"`, en lugar de una fila de `user_availability` por bloque. Con
+    bloques de 5 minutos, alguien libre de 08:00 a 18:00 de lunes a viernes son
+    600 marcas o 5 tramos. Los tramos de un miembro en un día nunca se pisan
+    ni se tocan: al guardar se funden (ver `app/services/availability_intervals.py`).
+
+    Van en minutos y no en índices de bloque, así que cambiar el formato de la
+    grilla no los mueve: la grilla nueva los vuelve a proyectar en celdas.
+    """
+
+    __tablename__ = "availability_interval"
+    id = scheduler_db.Column(scheduler_db.Integer, primary_key=True)
+    group_id = scheduler_db.Column(
+        scheduler_db.Integer,
+        scheduler_db.ForeignKey("group.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    user_id = scheduler_db.Column(
+        scheduler_db.Integer,
+        scheduler_db.ForeignKey("user.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    weekday = scheduler_db.Column(scheduler_db.Integer, nullable=False)
+    start_minutes = scheduler_db.Column(scheduler_db.Integer, nullable=False)
+    end_minutes = scheduler_db.Column(scheduler_db.Integer, nullable=False)
+
+    # Sin borrado lógico: guardar reescribe los tramos del miembro, y lo que
+    # cae fuera de la grilla visible se conserva tal cual.
+    __table_args__ = (
+        scheduler_db.Index("ix_availability_interval_member", "group_id", "user_id", "weekday"),
+        scheduler_db.CheckConstraint(
+            "start_minutes < end_minutes", name="ck_availability_interval_span"
+        ),
+    )
+
+    def __repr__(self):
+        return (
+            f"<AvailabilityInterval group_id={self.group_id} user_id={self.user_id} "
+            f"weekday={self.weekday} {self.start_minutes}-{self.end_minutes}>"
+        )
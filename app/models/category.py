@@ -1,4 +1,4 @@
-from sqlalchemy import func
+from sqlalchemy import func, select
 
 from app.extensions import scheduler_db
 from app.models.mixins import ACTIVE_ROWS, SoftDeleteMixin, TimestampMixin
@@ -45,5 +45,20 @@ class Category(TimestampMixin, SoftDeleteMixin, scheduler_db.Model):  # pylint:
     def soft_delete_cascade(self):
         return [*self.assignments, *self.permission_grants]
 
+    @classmethod
+    def soft_delete_cascade_where(cls, criteria):
+        from app.models.group_member_category import (  # pylint: disable=import-outside-toplevel
+            GroupMemberCategory,
+        )
+        from app.models.permission_grant import (  # pylint: disable=import-outside-toplevel
+            GroupPermissionGrant,
+        )
+
+        category_ids = select(cls.id).where(*criteria)
+        return [
+            (GroupMemberCategory, [GroupMemberCategory.category_id.in_(category_ids)]),
+            (GroupPermissionGrant, [GroupPermissionGrant.category_id.in_(category_ids)]),
+        ]
+
     def __repr__(self):
         return f"<Category id={self.id} group_id={self.group_id} name={self.name}>"
@@ -1,5 +1,7 @@
 import secrets
 
+from sqlalchemy import select
+
 from app.extensions import scheduler_db
 from app.models.mixins import SoftDeleteMixin, TimestampMixin
 
@@ -15,6 +17,25 @@ def generate_join_token():
     return secrets.token_urlsafe(32)
 
 
+def grid_block_starts(start_minutes, end_minutes, block_minutes):
+    """Inicios de bloque de una grilla `[start_minutes, end_minutes)` de `block_minutes`.
+
+    Es `Group.block_starts` para valores que todavía no son los del grupo (la
+    vista previa de un cambio de formato).
+    """
+    if block_minutes <= 0 or end_minutes <= start_minutes:
+        return []
+    return list(range(start_minutes, end_minutes - block_minutes + 1, block_minutes))
+
+
+# Cómo se guarda la disponibilidad del grupo (`Group.availability_storage`).
+# "marks": una fila de `user_availability` por bloque marcado. "intervals": un
+# `availability_interval` por tramo seguido, pensado para grillas finas.
+STORAGE_MARKS = "marks"
+STORAGE_INTERVALS = "intervals"
+AVAILABILITY_STORAGE_MODES = (STORAGE_MARKS, STORAGE_INTERVALS)
+
+
 class Group(TimestampMixin, SoftDeleteMixin, scheduler_db.Model):  # pylint: disable=too-few-public-methods
     id = scheduler_db.Column(scheduler_db.Integer, primary_key=True)
     name = scheduler_db.Column(scheduler_db.String(150), nullable=False)
@@ -40,6 +61,21 @@ class Group(TimestampMixin, SoftDeleteMixin, scheduler_db.Model):  # pylint: dis
     active_weekdays = scheduler_db.Column(
         scheduler_db.String(20), nullable=False, default="0,1,2,3,4,5,6"
     )
+    # Se cambia con `python -m app.db.convert_availability_storage`, que migra
+    # los datos: cambiar la columna a mano deja las respuestas en la tabla vieja.
+    availability_storage = scheduler_db.Column(
+        scheduler_db.String(16),
+        nullable=False,
+        default=STORAGE_MARKS,
+        server_default=STORAGE_MARKS,
+    )
+    # Sube en la misma transacción que cualquier cambio que se vea en las
+    # páginas del grupo (marcas, miembros, categorías, permisos, subgrupos,
+    # ajustes): es la clave de los cachés y de los ETag. La mantiene
+    # app/group_revision.py; no se escribe a mano.
+    revision = scheduler_db.Column(
+        scheduler_db.Integer, nullable=False, default=0, server_default="0"
+    )
     members = scheduler_db.relationship(
         "GroupMember",
         back_populates="group",
@@ -69,6 +105,25 @@ class Group(TimestampMixin, SoftDeleteMixin, scheduler_db.Model):  # pylint: dis
         # después de borrar el grupo.
         return [*self.members, *self.categories, *self.subgroups, *self.division_jobs]
 
+    @classmethod
+    def soft_delete_cascade_where(cls, criteria):
+        from app.models.category import Category  # pylint: disable=import-outside-toplevel
+        from app.models.group_member import (  # pylint: disable=import-outside-toplevel
+            GroupMember,
+        )
+        from app.models.subgroup import (  # pylint: disable=import-outside-toplevel
+            DivisionJob,
+            SubGroup,
+        )
+
+        group_ids = select(cls.id).where(*criteria)
+        return [
+            (GroupMember, [GroupMember.group_id.in_(group_ids)]),
+            (Category, [Category.group_id.in_(group_ids)]),
+            (SubGroup, [SubGroup.parent_group_id.in_(group_ids)]),
+            (DivisionJob, [DivisionJob.parent_group_id.in_(group_ids)]),
+        ]
+
     def get_active_weekdays(self):
         """Devuelve la lista ordenada de índices de día (0=Lunes) activos para el grupo."""
         raw = (self.active_weekdays or "").strip()
@@ -86,8 +141,8 @@ class Group(TimestampMixin, SoftDeleteMixin, scheduler_db.Model):  # pylint: dis
         Los bloques se colocan seguidos desde `start_minutes`; el último que no
         cabe entero antes de `end_minutes` se descarta.
         """
-        if self.block_minutes <= 0 or self.end_minutes <= self.start_minutes:
-            return []
-        return list(
-            range(self.start_minutes, self.end_minutes - self.block_minutes + 1, self.block_minutes)
-        )
+        return grid_block_starts(self.start_minutes, self.end_minutes, self.block_minutes)
+
+    def uses_interval_storage(self):
+        """True si la disponibilidad del grupo se guarda como tramos y no como marcas."""
+        return self.availability_storage == STORAGE_INTERVALS
@@ -1,5 +1,7 @@
 import enum
 
+from sqlalchemy import select
+
 from app.extensions import scheduler_db
 from app.models.mixins import ACTIVE_ROWS, SoftDeleteMixin, TimestampMixin
 
@@ -77,3 +79,35 @@ class GroupMember(TimestampMixin, SoftDeleteMixin, scheduler_db.Model):  # pylin
             .all()
         )
         return [*self.categories, *self.permission_grants, *subgroup_memberships]
+
+    @classmethod
+    def soft_delete_cascade_where(cls, criteria):
+        from app.models.group_member_category import (  # pylint: disable=import-outside-toplevel
+            GroupMemberCategory,
+        )
+        from app.models.permission_grant import (  # pylint: disable=import-outside-toplevel
+            GroupPermissionGrant,
+        )
+        from app.models.subgroup import (  # pylint: disable=import-outside-toplevel
+            SubGroup,
+            SubGroupMember,
+        )
+
+        member_ids = select(cls.id).where(*criteria)
+        # Mismo acotamiento que arriba: el usuario sale de los subgrupos de
+        # este grupo, no de los de otros grupos.
+        in_group_subgroups = (
+            select(SubGroup.id)
+            .join(cls, cls.group_id == SubGroup.parent_group_id)
+            .where(
+                SubGroup.id == SubGroupMember.subgroup_id,
+                cls.user_id == SubGroupMember.user_id,
+                *criteria,
+            )
+            .exists()
+        )
+        return [
+            (GroupMemberCategory, [GroupMemberCategory.group_member_id.in_(member_ids)]),
+            (GroupPermissionGrant, [GroupPermissionGrant.group_member_id.in_(member_ids)]),
+            (SubGroupMember, [in_group_subgroups]),
+        ]
@@ -70,3 +70,14 @@ class SoftDeleteMixin:
     def soft_delete_cascade(self):
         """Hijos que deben marcarse como borrados junto a esta fila."""
         return []
+
+    @classmethod
+    def soft_delete_cascade_where(cls, criteria):
+        """La misma cascada que `soft_delete_cascade`, como condiciones SQL.
+
+        `criteria` selecciona filas activas de este modelo; devuelve pares
+        `(modelo_hijo, condiciones)` que seleccionan a sus hijos. Es lo que
+        recorre `soft_delete_where` (app/soft_delete.py) sin cargar objetos:
+        tiene que cubrir exactamente los mismos hijos que la versión ORM.
+        """
+        return []
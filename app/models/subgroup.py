@@ -2,9 +2,24 @@
 Modelos para subgrupos optimizados y división automática de grupos.
 """
 
+from sqlalchemy import select
+
 from app.extensions import scheduler_db
 from app.models.mixins import ACTIVE_ROWS, SoftDeleteMixin, _utcnow
 
+# Estados de un DivisionJob. Los tres primeros son del solver en segundo plano
+# (ver `app.services.division_jobs`); "pending" es un preview terminado que
+# espera confirmación.
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_PENDING = "pending"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_CONFIRMED = "confirmed"
+JOB_UNDONE = "undone"
+# Los que todavía pueden cambiar solos: se sondean, se cancelan y se retoman.
+UNFINISHED_JOB_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
 
 class SubGroup(SoftDeleteMixin, scheduler_db.Model):
     """
@@ -47,6 +62,11 @@ class SubGroup(SoftDeleteMixin, scheduler_db.Model):
     def soft_delete_cascade(self):
         return list(self.members)
 
+    @classmethod
+    def soft_delete_cascade_where(cls, criteria):
+        subgroup_ids = select(cls.id).where(*criteria)
+        return [(SubGroupMember, [SubGroupMember.subgroup_id.in_(subgroup_ids)])]
+
     def __repr__(self):
         return f"<SubGroup {self.name} (parent: {self.parent_group_id})>"
 
@@ -147,10 +167,19 @@ class DivisionJob(SoftDeleteMixin, scheduler_db.Model):
     )  # Configuración de entrada (num_groups, rules, etc.)
     result_json = scheduler_db.Column(
         scheduler_db.JSON, nullable=True
-    )  # Resultado completo (preview)
+    )  # Asignación y métricas (ver `compact_division_result`); mientras corre, la mejor
     status = scheduler_db.Column(
-        scheduler_db.String(50), default="pending", nullable=False
-    )  # pending, confirmed, undone
+        scheduler_db.String(50), default=JOB_PENDING, nullable=False
+    )  # queued, running, pending, failed, cancelled, confirmed, undone
+    progress = scheduler_db.Column(
+        scheduler_db.Integer, default=0, server_default="0", nullable=False
+    )  # 0-100 mientras el solver corre
+    error = scheduler_db.Column(scheduler_db.String(255), nullable=True)
+    started_at = scheduler_db.Column(scheduler_db.DateTime, nullable=True)
+    # Proceso que lo está corriendo y su último aviso de vida (ver
+    # `app.services.division_jobs`): solo se retoma si el aviso es viejo.
+    owner = scheduler_db.Column(scheduler_db.String(64), nullable=True)
+    heartbeat_at = scheduler_db.Column(scheduler_db.DateTime, nullable=True)
     timestamp = scheduler_db.Column(scheduler_db.DateTime, default=_utcnow, nullable=False)
 
     # Relaciones
@@ -183,5 +212,7 @@ class DivisionJob(SoftDeleteMixin, scheduler_db.Model):
             "config": self.config_json,
             "result": self.result_json,
             "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
             "timestamp": self.timestamp.isoformat() if self.timestamp else None,
         }
@@ -8,8 +8,10 @@ exclusivas de `require_group_admin_or_owner` (ver app/authz.py).
 
 from __future__ import annotations
 
+from app.cache import group_cached
 from app.extensions import scheduler_db
 from app.models import GroupPermissionGrant, RoleEnum
+from app.request_memo import request_memo
 
 PERM_VIEW_OWN = "subgroups.view_own"
 PERM_VIEW_ALL = "subgroups.view_all"
@@ -112,7 +114,13 @@ def effective_permissions(group, membership) -> set[str]:
         return set()
     if group.owner_id == membership.user_id or membership.role == RoleEnum.ADMIN:
         return set(ALL_PERMISSIONS)
+    # Copia: quien la recibe puede modificarla sin tocar lo memorizado.
+    return set(
+        request_memo("permissions", (group.id, membership.id), lambda: _granted(group, membership))
+    )
 
+
+def _granted(group, membership) -> set[str]:
     category_ids = [assoc.category_id for assoc in membership.categories]
     subject_filter = [GroupPermissionGrant.group_member_id == membership.id]
     if category_ids:
@@ -125,12 +133,13 @@ def effective_permissions(group, membership) -> set[str]:
     return expand(grant.permission for grant in grants)
 
 
+@group_cached("grant_sources")
 def grant_sources(group) -> dict:
     """Concesiones directas y vía categoría del grupo, agrupadas por sujeto.
 
     Devuelve {'members': {group_member_id: {permission, ...}}, 'categories':
     {category_id: {permission, ...}}}, para que la UI de administración pinte
-    la matriz sin una query por fila.
+    la matriz sin una query por fila. Se cachea por revisión del grupo.
     """
     grants = GroupPermissionGrant.query.filter_by(group_id=group.id).all()
     result = {"members": {}, "categories": {}}
@@ -0,0 +1,59 @@
+"""Memo por request de los hechos que se consultan varias veces por vista.
+
+Un solo render de `groups.show` pedía la membresía de quien mira, sus permisos
+efectivos (con sus categorías y las concesiones) y el conjunto de miembros
+activos del grupo varias veces: una en la autorización, otra en la vista y
+otra dentro de cada servicio que las necesita. Con `request_memo` cada uno se
+calcula a lo más una vez por request y el resto lo lee de `flask.g`.
+
+El memo vive solo dentro de una request. Fuera de ella (jobs en segundo
+plano, comandos de `app/db`, servicios llamados desde los tests) se calcula
+siempre, como antes. Se vacía:
+
+- al empezar cada request (`before_request`): el test client reutiliza el
+  app context, y con él `g`, entre requests;
+- ante cualquier escritura de la sesión (un flush, un INSERT/UPDATE/DELETE
+  por `session.execute`, un rollback): quien cambia una membresía o una
+  concesión a mitad de request ve el dato nuevo en la siguiente lectura.
+"""
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+from app.extensions import scheduler_db
+
+_MEMO_ATTR = "_request_memo"
+
+
+def request_memo(namespace, key, compute):
+    """`compute()` memorizado por (namespace, key) durante la request en curso."""
+    if not has_request_context():
+        return compute()
+    memo = g.setdefault(_MEMO_ATTR, {})
+    memo_key = (namespace, key)
+    if memo_key not in memo:
+        memo[memo_key] = compute()
+    return memo[memo_key]
+
+
+def clear_request_memo(*_args):
+    """Olvida todo lo memorizado en la request. Seguro de llamar fuera de una."""
+    if has_request_context():
+        g.pop(_MEMO_ATTR, None)
+
+
+def _clear_on_write(execute_state):
+    if not execute_state.is_select:
+        clear_request_memo()
+
+
+def install_request_memo(app):
+    """Registra la limpieza por request y por escritura. Idempotente en la sesión."""
+    app.before_request(clear_request_memo)
+    for name, listener in (
+        ("after_flush", clear_request_memo),
+        ("after_soft_rollback", clear_request_memo),
+        ("do_orm_execute", _clear_on_write),
+    ):
+        if not event.contains(scheduler_db.session, name, listener):
+            event.listen(scheduler_db.session, name, listener)
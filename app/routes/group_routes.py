@@ -17,6 +17,7 @@ from flask_login import current_user, login_required
 from flask_wtf.csrf import generate_csrf
 from markupsafe import Markup, escape
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 
 from app.authz import (
     can_see_member_emails,
@@ -27,6 +28,7 @@ from app.authz import (
     safe_remove_member,
 )
 from app.extensions import scheduler_db
+from app.http_cache import not_modified, with_validators
 from app.models import (
     Category,
     GroupMember,
@@ -45,22 +47,34 @@ from app.permissions import (
 )
 from app.ratelimit import rate_limit
 from app.services.availability_service import (
+    MEETING_WINDOWS_MAX_LIMIT,
+    active_member_ids_select,
     active_member_user_ids,
-    block_index_for,
-    clear_existing_availability,
-    count_out_of_range_marks,
+    apply_member_delta,
+    category_member_user_ids,
+    cell_user_ids,
+    cells_from_form,
+    find_meeting_windows,
     format_minutes,
     generate_time_blocks,
     get_availability_data,
+    grid_payload,
+    member_cells,
+    member_grid_state,
+    member_grid_version,
     parse_time_to_minutes,
-    process_posted_availability,
+    preview_grid_change,
     remap_availability_marks,
+    resolve_quorum,
+    save_member_availability,
+    subgroup_member_user_ids,
     subgroup_peer_user_ids,
 )
 from app.services.group_service import (
     apply_permission_level,
     counts_by_model,
     create_group,
+    delete_group,
     get_admin_group_ids,
     get_category,
     get_category_member_counts,
@@ -80,7 +94,6 @@ from app.services.group_service import (
     get_responded_user_ids,
     get_subgroups_for_show,
     get_trash_count,
-    get_user_availability_data,
     join_group,
     leave_group,
     revoke_all_permissions,
@@ -129,23 +142,6 @@ def _commit_or_flash_conflict(message, log_message, *log_args):
         return False
 
 
-COLORS = [
-    "bg-primary",
-    "bg-success",
-    "bg-warning",
-    "bg-danger",
-    "bg-info",
-    "bg-dark",
-    "bg-secondary",
-    "bg-pink",
-    "bg-teal",
-]
-
-
-def assign_colors_to_members(group_members):
-    return {member.user.id: COLORS[i % len(COLORS)] for i, member in enumerate(group_members)}
-
-
 @group_bp.route("/", methods=["GET"])
 @login_required
 def index():
@@ -169,11 +165,13 @@ def index():
 @login_required
 def show(group_id):
     group, membership = require_group_member(group_id)
+    cached = not_modified(group)
+    if cached is not None:
+        return cached
     blocks = [label for _, label in generate_time_blocks(group)]
     active_weekdays = group.get_active_weekdays()
 
     group_members = get_group_members(group.id, MEMBERS_LIST_LIMIT)
-    color_map = assign_colors_to_members(group_members)
     is_admin = membership and membership.role == RoleEnum.ADMIN
     perms = effective_permissions(group, membership)
     can_manage = (group.owner_id == current_user.id) or is_admin
@@ -204,34 +202,33 @@ def show(group_id):
         else:
             can_view_group_availability = False
 
+    # Todo el grupo va como subconsulta, no como lista de ids (ver
+    # `active_member_ids_select`); el alcance de subgrupo sí es una lista.
     visible_user_ids = (
-        active_member_user_ids(group.id) if scope_user_ids is None else scope_user_ids
+        active_member_ids_select(group.id) if scope_user_ids is None else scope_user_ids
     )
 
+    # Quien ve la grilla del grupo recibe el heatmap en compacto (conteos y un
+    # bitmap por miembro, ver `grid_payload`); quien no, solo sus propias
+    # celdas, que la plantilla pinta como tabla.
+    grid = None
+    selected = set()
     if can_view_group_availability:
-        user_availability_data = get_user_availability_data(group.id, visible_user_ids)
+        grid = grid_payload(group, visible_user_ids)
     else:
-        user_availability_data = get_user_availability_data(group.id, current_user.id)
-
-    # Se resuelve acá y no en la plantilla: indexar por hora dentro del Jinja
-    # daba índices negativos (y celdas pintadas en la fila equivocada) cuando la
-    # marca caía fuera del rango visible.
-    selected = set()
-    cell_users = {}
-    for user_id, weekday, hour in user_availability_data:
-        block_index = block_index_for(group, hour)
-        if block_index is None:
-            continue
-        selected.add((weekday, blocks[block_index]))
-        cell_users.setdefault((weekday, block_index), []).append(user_id)
+        selected = {
+            (weekday, blocks[block_index])
+            for weekday, block_index in member_cells(group, current_user.id)
+        }
 
-    availability_data = get_availability_data(group_id, user_ids=scope_user_ids)
+    availability_data = get_availability_data(group_id, user_ids=scope_user_ids, with_users=False)
 
     responded_user_ids = get_responded_user_ids(group.id, visible_user_ids)
     users_without_availability = [
         member.user
         for member in group_members
-        if member.user.id not in responded_user_ids and member.user.id in visible_user_ids
+        if member.user.id not in responded_user_ids
+        and (scope_user_ids is None or member.user.id in scope_user_ids)
     ]
     members_with_availability_count = len(responded_user_ids)
 
@@ -257,16 +254,14 @@ def show(group_id):
         group.id, scope_user_ids, current_user.id
     )
 
-    return render_template(
+    html = render_template(
         "groups/show.html",
         group=group,
-        availability=user_availability_data,
+        grid=grid,
         selected=selected,
-        cell_users=cell_users,
         blocks=blocks,
         format_minutes=format_minutes,
         availability_data=availability_data,
-        color_map=color_map,
         user_info_map=user_info_map,
         is_admin=is_admin,
         can_manage=can_manage,
@@ -286,6 +281,105 @@ def show(group_id):
         responded_user_ids=sorted(responded_user_ids),
         active_weekdays=active_weekdays,
     )
+    return with_validators(html, group)
+
+
+def _availability_scope(group, membership):
+    """Ids cuya disponibilidad puede ver quien pide; vacío si no puede ver la de nadie.
+
+    Mismo alcance que la grilla de `show`: todo el grupo con `PERM_VIEW_ALL`,
+    si no la gente de su(s) subgrupo(s).
+    """
+    perms = effective_permissions(group, membership)
+    if PERM_VIEW_AVAILABILITY not in perms:
+        return set()
+    if PERM_VIEW_ALL in perms:
+        return active_member_user_ids(group.id)
+    return subgroup_peer_user_ids(group.id, current_user.id)
+
+
+@group_bp.route("/<int:group_id>/availability/windows", methods=["GET"])
+@login_required
+def availability_windows(group_id):
+    """Mejores ventanas de N bloques seguidos en que puede al menos un quórum.
+
+    Query string:
+
+    - `blocks`: largo de la reunión en bloques de la grilla (obligatorio).
+    - `quorum`: mínimo de asistentes, absoluto ("3") o porcentaje ("60%") de
+      los miembros considerados. Por defecto, todos.
+    - `category_id` / `subgroup_id`: acotan los miembros considerados.
+    - `limit`: cuántas ventanas devolver (por defecto 10).
+
+    El alcance es el mismo que el de la grilla en `show`: quien solo ve su
+    subgrupo busca entre la gente de su subgrupo.
+    """
+    group, membership = require_group_member(group_id)
+    cached = not_modified(group)
+    if cached is not None:
+        return cached
+    user_ids = _availability_scope(group, membership)
+    if not user_ids:
+        return {"ok": False, "message": "No tienes permisos suficientes."}, 403
+
+    args = request.args
+    try:
+        length = int(args.get("blocks", ""))
+        limit = int(args.get("limit", 10))
+        category_id = args.get("category_id", type=int)
+        subgroup_id = args.get("subgroup_id", type=int)
+        if not 1 <= length <= len(group.block_starts()):
+            raise ValueError("blocks fuera de rango")
+        if not 1 <= limit <= MEETING_WINDOWS_MAX_LIMIT:
+            raise ValueError("limit fuera de rango")
+        if category_id is not None:
+            user_ids &= category_member_user_ids(group.id, category_id)
+        if subgroup_id is not None:
+            user_ids &= subgroup_member_user_ids(group.id, subgroup_id)
+        quorum = resolve_quorum(args.get("quorum", "100%"), len(user_ids))
+    except ValueError:
+        return {"ok": False, "message": "Parámetros inválidos."}, 400
+
+    windows = find_meeting_windows(group, user_ids, length, quorum, limit)
+    payload = {
+        "ok": True,
+        "blocks": length,
+        "quorum": quorum,
+        "member_count": len(user_ids),
+        "windows": windows,
+    }
+    return with_validators(payload, group)
+
+
+@group_bp.route("/<int:group_id>/availability/cell", methods=["GET"])
+@login_required
+def availability_cell(group_id):
+    """Quiénes marcaron una celda de la grilla (`weekday`, `block`).
+
+    Es lo que el heatmap de `show` pide al pasar el mouse por una celda: la
+    página ya no trae la lista de cada celda (ver `grid_payload`). Devuelve
+    solo ids; los nombres el cliente los tiene en el roster embebido.
+    """
+    group, membership = require_group_member(group_id)
+    cached = not_modified(group)
+    if cached is not None:
+        return cached
+    user_ids = _availability_scope(group, membership)
+    if not user_ids:
+        return {"ok": False, "message": "No tienes permisos suficientes."}, 403
+
+    weekday = request.args.get("weekday", type=int)
+    block_index = request.args.get("block", type=int)
+    if weekday is None or block_index is None:
+        return {"ok": False, "message": "Parámetros inválidos."}, 400
+
+    payload = {
+        "ok": True,
+        "weekday": weekday,
+        "block": block_index,
+        "user_ids": cell_user_ids(group, user_ids, weekday, block_index),
+    }
+    return with_validators(payload, group)
 
 
 @group_bp.route("/create", methods=["GET", "POST"])
@@ -408,11 +502,14 @@ def join(token):
 @login_required
 def members(group_id):
     group, membership = require_group_member(group_id)
+    cached = not_modified(group)
+    if cached is not None:
+        return cached
     group_members = get_group_members(group.id, MEMBERS_LIST_LIMIT)
     can_manage = (group.owner_id == current_user.id) or (membership.role == RoleEnum.ADMIN)
     can_see_emails = can_see_member_emails(group, membership)
     categories = get_group_categories(group.id)
-    responded_user_ids = get_responded_user_ids(group.id, active_member_user_ids(group.id))
+    responded_user_ids = get_responded_user_ids(group.id)
     # Quienes no han respondido primero: son los que necesitan seguimiento.
     group_members.sort(key=lambda gm: gm.user_id in responded_user_ids)
 
@@ -420,7 +517,7 @@ def members(group_id):
     if can_manage:
         removed_members = get_removed_members(group.id, MEMBERS_LIST_LIMIT)
 
-    return render_template(
+    html = render_template(
         "groups/members.html",
         group=group,
         members=group_members,
@@ -435,6 +532,7 @@ def members(group_id):
         responded_user_ids=responded_user_ids,
         removed_members=removed_members,
     )
+    return with_validators(html, group)
 
 
 @group_bp.route("/<int:group_id>/members/export.csv", methods=["GET"])
@@ -444,9 +542,7 @@ def export_members_csv(group_id):
     # resto de la administración de usuarios (antes cualquier miembro podía).
     group, _ = require_group_admin_or_owner(group_id)
     group_members = get_group_members_for_export(group.id)
-    availability_counts = get_member_availability_counts(
-        group.id, [member.user_id for member in group_members]
-    )
+    availability_counts = get_member_availability_counts(group.id)
 
     output = io.StringIO()
     writer = csv.writer(output)
@@ -483,13 +579,15 @@ def availability(group_id):
     active_weekdays = group.get_active_weekdays()
 
     if request.method == "POST":
-        # Borrado y reinserción son una sola operación lógica: commitear el
-        # borrado por separado perdería las respuestas si falla la reinserción.
+        # Ocultar, restaurar e insertar son una sola operación lógica: commitear
+        # a medias perdería las respuestas si falla el resto.
         try:
-            clear_existing_availability(group, current_user.id, active_weekdays)
-            saved_count = process_posted_availability(
-                group_id, request.form, group, current_user.id, active_weekdays
-            )
+            saved_count = save_member_availability(
+                group,
+                current_user.id,
+                cells_from_form(group, request.form, active_weekdays),
+                active_weekdays,
+            ).saved
             scheduler_db.session.commit()
         except Exception:  # pylint: disable=broad-except
             scheduler_db.session.rollback()
@@ -515,48 +613,87 @@ def availability(group_id):
         )
         return redirect(url_for(GROUP_SHOW_URL, group_id=group_id))
 
-    user_availability = get_user_availability_data(group_id, current_user.id)
-    selected = set()
-    for _, weekday, hour in user_availability:
-        block_index = block_index_for(group, hour)
-        if block_index is not None:
-            selected.add((weekday, block_index))
+    # La grilla sale del bitmap: es la misma versión que el autosave delta
+    # compara, así que lo que el cliente arranca mostrando y la versión que
+    # manda no pueden desfasarse.
+    grid_version, cells = member_grid_state(group, current_user.id, active_weekdays)
     return render_template(
         "groups/availability.html",
         group=group,
         group_id=group_id,
-        selected=selected,
+        selected=set(cells),
         blocks=blocks,
         active_weekdays=active_weekdays,
+        grid_version=grid_version,
     )
 
 
+def _slot_cells(slots):
+    """Celdas (weekday, block_index) de una lista de slots JSON; ignora lo mal formado."""
+    cells = set()
+    for slot in slots:
+        if not isinstance(slot, dict):
+            continue
+        weekday, block_index = slot.get("weekday"), slot.get("block_index")
+        if type(weekday) is int and type(block_index) is int:
+            cells.add((weekday, block_index))
+    return cells
+
+
+def _grid_conflict(group, active_weekdays):
+    """409 con el estado vigente, para que el cliente se resincronice."""
+    version, cells = member_grid_state(group, current_user.id, active_weekdays)
+    return {
+        "ok": False,
+        "message": "Tu disponibilidad cambió en otra pestaña.",
+        "version": version,
+        "slots": [{"weekday": weekday, "block_index": index} for weekday, index in cells],
+    }, 409
+
+
 @group_bp.route("/<int:group_id>/availability/autosave", methods=["POST"])
 @login_required
 def availability_autosave(group_id):
-    """Guarda la disponibilidad completa del usuario vía fetch, sin recargar la página."""
+    """Guarda la disponibilidad del usuario vía fetch, sin recargar la página.
+
+    Dos formatos:
+
+    - `{"slots": [...]}`: la semana completa (el cliente viejo).
+    - `{"added": [...], "removed": [...], "version": n}`: solo las celdas que
+      cambiaron, sobre la versión `n` de la grilla. Si la grilla ya va por otra
+      versión (otra pestaña, otro dispositivo) responde 409 con el estado
+      vigente y no aplica nada.
+    """
     group, _ = require_group_member(group_id)
     active_weekdays = group.get_active_weekdays()
 
     payload = request.get_json(silent=True) or {}
     slots = payload.get("slots")
-    if not isinstance(slots, list):
+    added, removed = payload.get("added"), payload.get("removed")
+    version = payload.get("version")
+    delta = slots is None
+    if delta:
+        if not isinstance(added, list) or not isinstance(removed, list) or type(version) is not int:
+            return {"ok": False, "message": "Formato inválido."}, 400
+        if version != member_grid_version(group, current_user.id):
+            return _grid_conflict(group, active_weekdays)
+    elif not isinstance(slots, list):
         return {"ok": False, "message": "Formato inválido."}, 400
 
-    # Reconstruye el form_data esperado por process_posted_availability a partir
-    # de la lista de slots [{weekday, block_index}, ...] enviada por el cliente.
-    form_data = {
-        f"day_{slot.get('weekday')}_hour_{slot.get('block_index')}": "on"
-        for slot in slots
-        if isinstance(slot, dict)
-    }
-
     try:
-        clear_existing_availability(group, current_user.id, active_weekdays)
-        saved_count = process_posted_availability(
-            group_id, form_data, group, current_user.id, active_weekdays
-        )
+        if delta:
+            saved_count = apply_member_delta(
+                group, current_user.id, _slot_cells(added), _slot_cells(removed), active_weekdays
+            ).saved
+        else:
+            saved_count = save_member_availability(
+                group, current_user.id, _slot_cells(slots), active_weekdays
+            ).saved
         scheduler_db.session.commit()
+    except StaleDataError:
+        # Otra request actualizó la grilla entre el chequeo y la escritura.
+        scheduler_db.session.rollback()
+        return _grid_conflict(group, active_weekdays)
     except Exception:  # pylint: disable=broad-except
         scheduler_db.session.rollback()
         current_app.logger.exception(
@@ -564,56 +701,99 @@ def availability_autosave(group_id):
         )
         return {"ok": False, "message": "No se pudo guardar la disponibilidad."}, 500
 
-    return {"ok": True, "saved_count": saved_count}
+    return {
+        "ok": True,
+        "saved_count": saved_count,
+        "version": member_grid_version(group, current_user.id),
+    }
 
 
-@group_bp.route("/<int:group_id>/availability/settings", methods=["POST"])
-@login_required
-def availability_settings(group_id):
-    """Permite a owner/admin ajustar horario, extensión del bloque y días visibles."""
-    group, _ = require_group_admin_or_owner(group_id)
+def _grid_settings_from(values, group):
+    """(inicio, fin, bloque, días) pedidos en `values`, validados.
 
+    Lo comparten el guardado y la vista previa, que reciben el mismo
+    formulario. Lanza ValueError con el mensaje para el usuario.
+    """
     try:
         start_minutes = parse_time_to_minutes(
-            request.form.get("start_time") or format_minutes(group.start_minutes)
+            values.get("start_time") or format_minutes(group.start_minutes)
         )
         end_minutes = parse_time_to_minutes(
-            request.form.get("end_time") or format_minutes(group.end_minutes)
+            values.get("end_time") or format_minutes(group.end_minutes)
         )
-        block_minutes = int(request.form.get("block_minutes", group.block_minutes))
-    except (TypeError, ValueError):
-        flash("❌ Rango horario inválido.", "danger")
-        return redirect(url_for(GROUP_SHOW_URL, group_id=group_id))
+        block_minutes = int(values.get("block_minutes", group.block_minutes))
+    except (TypeError, ValueError) as exc:
+        raise ValueError("Rango horario inválido.") from exc
 
     if not 0 <= start_minutes < end_minutes <= 24 * 60:
-        flash("❌ El rango horario no es válido: el inicio debe ser anterior al fin.", "danger")
-        return redirect(url_for(GROUP_SHOW_URL, group_id=group_id))
+        raise ValueError("El rango horario no es válido: el inicio debe ser anterior al fin.")
 
     if not 5 <= block_minutes <= end_minutes - start_minutes:
-        flash(
-            "❌ La extensión del bloque debe ser de al menos 5 minutos y caber dentro del rango.",
-            "danger",
+        raise ValueError(
+            "La extensión del bloque debe ser de al menos 5 minutos y caber dentro del rango."
         )
-        return redirect(url_for(GROUP_SHOW_URL, group_id=group_id))
 
-    weekdays = request.form.getlist("weekdays")
     try:
-        weekday_ints = sorted({int(d) for d in weekdays if 0 <= int(d) <= 6})
+        weekday_ints = sorted({int(d) for d in values.getlist("weekdays") if 0 <= int(d) <= 6})
     except ValueError:
         weekday_ints = []
     if not weekday_ints:
-        flash("❌ Selecciona al menos un día.", "danger")
+        raise ValueError("Selecciona al menos un día.")
+    return start_minutes, end_minutes, block_minutes, weekday_ints
+
+
+@group_bp.route("/<int:group_id>/availability/settings/preview", methods=["GET"])
+@login_required
+def availability_settings_preview(group_id):
+    """Impacto de un cambio de grilla sobre las marcas guardadas, sin aplicarlo.
+
+    Recibe los mismos campos que el formulario de configuración (por query
+    string) y responde cuántas marcas se reubicarían, cuántas quedarían ocultas
+    y cuántas siguen igual. No escribe nada.
+    """
+    group, _ = require_group_admin_or_owner(group_id)
+    cached = not_modified(group)
+    if cached is not None:
+        return cached
+    try:
+        start_minutes, end_minutes, block_minutes, weekday_ints = _grid_settings_from(
+            request.args, group
+        )
+    except ValueError as exc:
+        return {"ok": False, "message": str(exc)}, 400
+
+    preview = preview_grid_change(group, start_minutes, end_minutes, block_minutes, weekday_ints)
+    payload = {
+        "ok": True,
+        "grid_changed": preview.grid_changed,
+        "total": preview.total,
+        "remapped": preview.remapped,
+        "hidden": preview.hidden,
+        "untouched": preview.untouched,
+    }
+    return with_validators(payload, group)
+
+
+@group_bp.route("/<int:group_id>/availability/settings", methods=["POST"])
+@login_required
+def availability_settings(group_id):
+    """Permite a owner/admin ajustar horario, extensión del bloque y días visibles."""
+    group, _ = require_group_admin_or_owner(group_id)
+
+    try:
+        start_minutes, end_minutes, block_minutes, weekday_ints = _grid_settings_from(
+            request.form, group
+        )
+    except ValueError as exc:
+        flash(f"❌ {exc}", "danger")
         return redirect(url_for(GROUP_SHOW_URL, group_id=group_id))
 
     old_starts = group.block_starts()
     old_block_minutes = group.block_minutes
-    grid_changed = (
-        start_minutes != group.start_minutes
-        or end_minutes != group.end_minutes
-        or block_minutes != group.block_minutes
-    )
-
-    hidden_blocks = count_out_of_range_marks(group_id, start_minutes, end_minutes, weekday_ints)
+    # La misma cuenta que mostró la vista previa, para que el aviso coincida.
+    preview = preview_grid_change(group, start_minutes, end_minutes, block_minutes, weekday_ints)
+    grid_changed = preview.grid_changed
+    hidden_blocks = preview.hidden
 
     # La grilla nueva y el remapeo de las marcas viajan juntos: commitear la
     # grilla sola dejaría las marcas viejas colgando de bloques inexistentes.
@@ -644,8 +824,9 @@ def availability_settings(group_id):
         )
     if hidden_blocks:
         flash(
-            f"ℹ️ {hidden_blocks} bloques ya marcados quedan fuera del nuevo rango. "
-            "No se borraron: vuelven a aparecer si amplías el horario o los días.",
+            f"ℹ️ {hidden_blocks} bloques ya marcados quedan fuera de la nueva grilla. "
+            "No se borraron: vuelven a aparecer si amplías el horario o los días, "
+            "o si vuelves al formato anterior.",
             "info",
         )
     return redirect(url_for(GROUP_SHOW_URL, group_id=group_id))
@@ -659,7 +840,7 @@ def delete(group_id):
 
     # Nada se borra de la base: el grupo y sus miembros, categorías y subgrupos
     # quedan ocultos y recuperables desde la papelera.
-    group.soft_delete()
+    delete_group(group)
     scheduler_db.session.commit()
 
     # "Deshacer" restaura, así que es un POST con token, no un link.
@@ -2,6 +2,7 @@ from flask import Blueprint, current_app, jsonify, render_template
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 
+from app.cache import cache_stats
 from app.extensions import scheduler_db
 
 main_bp = Blueprint("main", __name__)
@@ -28,3 +29,13 @@ def health():
         current_app.logger.exception("health: la base de datos no responde")
         return jsonify({"status": "error", "database": "down"}), 503
     return jsonify({"status": "ok", "database": "up"}), 200
+
+
+@main_bp.route("/health/cache")
+def cache_health():
+    """Aciertos, fallos y saltos del caché por grupo en este proceso (`app.cache`).
+
+    Los contadores son del proceso que atiende: con varios workers cada uno
+    lleva los suyos, aunque compartan el backend "sqlite".
+    """
+    return jsonify({"backend": current_app.config["CACHE_BACKEND"], "stats": cache_stats()}), 200
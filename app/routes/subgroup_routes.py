@@ -27,22 +27,29 @@ from app.authz import (
     require_subgroup_access,
 )
 from app.extensions import scheduler_db
+from app.http_cache import not_modified, with_validators
+from app.models.subgroup import JOB_CONFIRMED, JOB_PENDING, JOB_UNDONE
 from app.permissions import PERM_EDIT_ALL, PERM_EDIT_OWN, PERM_VIEW_ALL, PERM_VIEW_OWN
+from app.services.division_jobs import (
+    cancel_division_job,
+    enqueue_division_job,
+    submit_division_job,
+)
 from app.services.group_service import get_group_categories, get_group_member
 from app.services.subgroup_service import (
-    SubGroupService,
     add_subgroup_member,
     confirm_division,
     create_manual_subgroup,
+    delete_subgroup,
     get_division_job,
     get_group_member_count,
     get_group_members_sorted,
     get_subgroup,
     get_subgroup_member,
     get_subgroups_with_members,
+    hydrate_division_result,
     move_subgroup_member,
     remove_subgroup_member,
-    save_division_job,
     undo_last_division,
 )
 
@@ -135,12 +142,14 @@ def new(group_id):
 @login_required
 def generate(group_id):
     """
-    Genera los subgrupos según la configuración recibida.
-    Devuelve un preview JSON sin persistir en BD.
+    Encola la división con la configuración recibida.
+
+    Valida y responde 202 con el job en "queued": el solver corre fuera de la
+    request (ver `app.services.division_jobs`) y el navegador sondea `status`
+    hasta tener el preview.
     """
     # Verificar permisos
-    group, membership, _ = require_group_permission(group_id, PERM_EDIT_ALL)
-    can_see_emails = can_see_member_emails(group, membership)
+    require_group_permission(group_id, PERM_EDIT_ALL)
 
     try:
         config = request.get_json()
@@ -173,30 +182,78 @@ def generate(group_id):
             if str(category).strip()
         ]
 
-        # Crear servicio y generar subgrupos
-        service = SubGroupService(group_id)
-        preview = service.generate_subgroups(config)
-
-        job = save_division_job(group_id, current_user.id, config, preview)
+        job = enqueue_division_job(group_id, current_user.id, config)
         scheduler_db.session.commit()
-        preview["job_id"] = job.id
+        job_id = job.id
 
-        # El preview persistido conserva el email (el export lo usa si el que
-        # descarga es owner/admin); el que se manda al navegador, no.
-        if not can_see_emails:
+    except SQLAlchemyError:
+        scheduler_db.session.rollback()
+        current_app.logger.exception("Error de BD al generar subgrupos del grupo %s", group_id)
+        return jsonify({"error": "No se pudo generar la división."}), 500
+
+    # El hilo del pool necesita la app de verdad, no el proxy de esta request.
+    app = current_app._get_current_object()  # pylint: disable=protected-access
+    submit_division_job(app, job_id)
+    return jsonify(
+        {
+            "job_id": job_id,
+            "status_url": url_for("subgroups.job_status", group_id=group_id, job_id=job_id),
+            "cancel_url": url_for("subgroups.cancel_job", group_id=group_id, job_id=job_id),
+        }
+    ), 202
+
+
+@subgroup_bp.route("/groups/<int:group_id>/subgroups/jobs/<int:job_id>", methods=["GET"])
+@login_required
+def job_status(group_id, job_id):
+    """
+    Estado de un job de división: avance, error y el mejor preview hasta ahora.
+
+    Mientras corre, `preview` es el mejor encontrado (None antes de que el
+    greedy termine); en "pending" es el definitivo, listo para confirmar.
+    """
+    group, membership, _ = require_group_permission(group_id, PERM_EDIT_ALL)
+    job = _get_active_job_or_404(group_id, job_id)
+
+    preview = hydrate_division_result(job)
+    if preview is not None:
+        # El export lleva el email si el que descarga es owner/admin; el
+        # preview que se manda al navegador, solo en ese mismo caso.
+        if not can_see_member_emails(group, membership):
             preview = _without_emails(preview)
+        preview = {**preview, "job_id": job.id}
 
-        return jsonify(preview), 200
+    return jsonify(
+        {
+            "job_id": job.id,
+            "status": job.status,
+            "progress": job.progress,
+            "error": job.error,
+            "preview": preview,
+        }
+    ), 200
 
-    except ValueError as e:
-        # Mensaje de validación del servicio, pensado para el usuario.
-        scheduler_db.session.rollback()
-        return jsonify({"error": str(e)}), 400
+
+@subgroup_bp.route("/groups/<int:group_id>/subgroups/jobs/<int:job_id>/cancel", methods=["POST"])
+@login_required
+def cancel_job(group_id, job_id):
+    """
+    Cancela un job que sigue en cola o corriendo. El solver se corta en su
+    próximo aviso de avance.
+    """
+    require_group_permission(group_id, PERM_EDIT_ALL)
+    job = _get_active_job_or_404(group_id, job_id)
+
+    try:
+        if not cancel_division_job(job):
+            return jsonify({"error": "Este job ya terminó"}), 400
+        scheduler_db.session.commit()
+        return jsonify({"success": True}), 200
 
     except SQLAlchemyError:
         scheduler_db.session.rollback()
-        current_app.logger.exception("Error de BD al generar subgrupos del grupo %s", group_id)
-        return jsonify({"error": "No se pudo generar la división."}), 500
+        current_app.logger.exception("Error de BD al cancelar el job de división %s", job_id)
+        return jsonify({"error": "No se pudo cancelar la división."}), 500
 
 
 @subgroup_bp.route("/groups/<int:group_id>/subgroups/confirm", methods=["POST"])
@@ -218,11 +275,13 @@ def confirm(group_id):
         # Buscar el job (vivo y de este grupo)
         job = _get_active_job_or_404(group_id, job_id)
 
-        if job.status == "confirmed":
+        if job.status == JOB_CONFIRMED:
             return jsonify({"error": "Este job ya fue confirmado"}), 400
+        # En cola, corriendo, fallido o cancelado: no hay división terminada.
+        if job.status not in (JOB_PENDING, JOB_UNDONE):
+            return jsonify({"error": "Este job no tiene una división lista"}), 400
 
-        preview = job.result_json
-        if not preview or "groups" not in preview:
+        if not job.result_json or "groups" not in job.result_json:
             return jsonify({"error": "Preview inválido"}), 400
 
         created_subgroups = confirm_division(job)
@@ -254,7 +313,7 @@ def undo(group_id):
     require_group_permission(group_id, PERM_EDIT_ALL)
 
     try:
-        last_job, subgroups = undo_last_division(group_id)
+        last_job, removed = undo_last_division(group_id)
 
         if not last_job:
             return jsonify({"error": "No hay divisiones confirmadas para deshacer"}), 400
@@ -262,9 +321,7 @@ def undo(group_id):
         scheduler_db.session.commit()
 
         flash("División revertida exitosamente.", "success")
-        return jsonify(
-            {"success": True, "message": f"Se eliminaron {len(subgroups)} subgrupos."}
-        ), 200
+        return jsonify({"success": True, "message": f"Se eliminaron {removed} subgrupos."}), 200
 
     except SQLAlchemyError:
         scheduler_db.session.rollback()
@@ -296,8 +353,8 @@ def export(group_id):
             # grupo se borró, la cascada lo ocultó y esta consulta ya no lo ve.
             job = _get_active_job_or_404(group_id, job_id)
 
-            preview = job.result_json
-            if not preview or "groups" not in preview:
+            preview = hydrate_division_result(job)
+            if preview is None:
                 abort(400)
 
             # Construir CSV del preview
@@ -390,6 +447,9 @@ def index(group_id):
     """
     # Verificar permisos
     group, membership, perms = require_group_permission(group_id, PERM_VIEW_OWN)
+    cached = not_modified(group)
+    if cached is not None:
+        return cached
     can_view_all = PERM_VIEW_ALL in perms
     can_edit_all = PERM_EDIT_ALL in perms
     # Los emails del roster son dato de administración: el permiso extra de
@@ -440,7 +500,7 @@ def index(group_id):
         else []
     )
 
-    return render_template(
+    html = render_template(
         "groups/subgroups/index.html",
         group=group,
         subgroups=subgroups,
@@ -455,6 +515,7 @@ def index(group_id):
         can_see_emails=can_see_emails,
         editable_subgroup_ids=editable_subgroup_ids,
     )
+    return with_validators(html, group)
 
 
 @subgroup_bp.route("/groups/<int:group_id>/subgroups/create_manual", methods=["POST"])
@@ -527,7 +588,7 @@ def delete(group_id, subgroup_id):
     subgroup_name = subgroup.name
 
     try:
-        subgroup.soft_delete()
+        delete_subgroup(subgroup)
         scheduler_db.session.commit()
         flash(f'Se eliminó el subgrupo "{subgroup_name}".', "success")
     except SQLAlchemyError:
@@ -0,0 +1,379 @@
+"""Disponibilidad como bitmap: un entero por miembro, un bit por celda.
+
+Las marcas (`user_availability` → `availability`) —o los tramos, en los
+grupos que guardan su disponibilidad como intervalos (ver
+`availability_intervals`)— siguen siendo la fuente de verdad; acá vive su
+copia compacta en `availability_bitmap`. Con ella las
+preguntas del dominio dejan de ser GROUP BY sobre una fila por marca:
+
+- "cuántos bloques marcó"        → `popcount(bits)`
+- "cuántos bloques comparten"    → `popcount(a & b)`
+- "en qué bloques pueden todos"  → `a & b & c ...`
+
+Con bloques de 5 minutos la grilla tiene 2016 celdas por miembro: como filas
+son miles por persona, como bitmap son 252 bytes.
+
+La celda `(weekday, block_index)` es el bit `weekday * blocks_per_day +
+block_index`, con `blocks_per_day = len(group.block_starts())`.
+
+Ninguna función acá commitea: la transacción la maneja la ruta que llama.
+"""
+
+from sqlalchemy import Select, bindparam, insert, select, update
+
+from app.extensions import scheduler_db
+from app.group_revision import bump_group_revision
+from app.models import Availability, AvailabilityBitmap, UserAvailability
+from app.services.availability_intervals import bits_from_intervals
+
+WEEKDAYS = 7
+
+
+def grid_layout(group):
+    """Firma de la grilla con la que se arman los bits ("inicio:fin:bloque")."""
+    return f"{group.start_minutes}:{group.end_minutes}:{group.block_minutes}"
+
+
+def cell_bit(blocks_per_day, weekday, block_index):
+    """Bit de la celda `(weekday, block_index)`."""
+    return 1 << (weekday * blocks_per_day + block_index)
+
+
+def day_mask(blocks_per_day, weekdays):
+    """Bits de todas las celdas de los días dados."""
+    full_day = (1 << blocks_per_day) - 1
+    mask = 0
+    for weekday in weekdays:
+        mask |= full_day << (weekday * blocks_per_day)
+    return mask
+
+
+def iter_cells(bits, blocks_per_day):
+    """(weekday, block_index) de cada bit encendido, en orden."""
+    while bits:
+        low = bits & -bits
+        index = low.bit_length() - 1
+        yield divmod(index, blocks_per_day)
+        bits ^= low
+
+
+def popcount(bits):
+    return bits.bit_count()
+
+
+def intersect(bitmaps):
+    """AND de todos los bitmaps; 0 si no hay ninguno."""
+    bitmaps = iter(bitmaps)
+    common = next(bitmaps, 0)
+    for bits in bitmaps:
+        common &= bits
+        if not common:
+            break
+    return common
+
+
+def encode_bits(bits, blocks_per_day):
+    size = (WEEKDAYS * blocks_per_day + 7) // 8
+    return bits.to_bytes(size, "little")
+
+
+def decode_bits(raw):
+    return int.from_bytes(raw or b"", "little")
+
+
+def bits_from_marks(group, user_ids=None):
+    """{user_id: bits} reconstruido desde las marcas activas, en una consulta.
+
+    Las marcas que la grilla actual no muestra (fuera del rango o con otro
+    formato de bloque) no tienen celda y quedan fuera del bitmap; siguen
+    guardadas como filas y vuelven a entrar al reconstruir si la grilla cambia.
+    """
+    starts = group.block_starts()
+    index_of = {start: i for i, start in enumerate(starts)}
+    blocks_per_day = len(starts)
+
+    query = (
+        scheduler_db.session.query(
+            UserAvailability.user_id, Availability.weekday, Availability.start_minutes
+        )
+        .join(Availability, UserAvailability.availability_id == Availability.id)
+        .filter(Availability.group_id == group.id)
+    )
+    if user_ids is not None:
+        query = query.filter(UserAvailability.user_id.in_(user_ids))
+
+    bitmaps = {}
+    for user_id, weekday, start_minutes in query.all():
+        block_index = index_of.get(start_minutes)
+        if block_index is None or not 0 <= weekday < WEEKDAYS:
+            continue
+        bitmaps[user_id] = bitmaps.get(user_id, 0) | cell_bit(blocks_per_day, weekday, block_index)
+    return bitmaps
+
+
+def bits_from_storage(group, user_ids=None):
+    """{user_id: bits} desde la fuente de verdad del grupo: marcas o tramos."""
+    if group.uses_interval_storage():
+        return bits_from_intervals(group, user_ids)
+    return bits_from_marks(group, user_ids)
+
+
+def _member_row(group, user_id):
+    """Fila del bitmap del miembro, al día con la grilla actual.
+
+    Si no existe (respuestas anteriores al bitmap) o se armó con otra grilla,
+    se reconstruye desde las marcas (o los tramos) antes de devolverla.
+    """
+    layout = grid_layout(group)
+    row = AvailabilityBitmap.query.filter_by(group_id=group.id, user_id=user_id).first()
+    if row is not None and row.layout == layout:
+        return row
+
+    bits = bits_from_storage(group, [user_id]).get(user_id, 0)
+    if row is None:
+        row = AvailabilityBitmap(group_id=group.id, user_id=user_id)
+        scheduler_db.session.add(row)
+    row.layout = layout
+    row.bits = encode_bits(bits, len(group.block_starts()))
+    return row
+
+
+def replace_member_days(group, user_id, weekdays, cells):
+    """Deja los días `weekdays` del miembro exactamente en `cells`, de una vez."""
+    blocks_per_day = len(group.block_starts())
+    row = _member_row(group, user_id)
+    bits = decode_bits(row.bits) & ~day_mask(blocks_per_day, weekdays)
+    for weekday, block_index in cells:
+        bits |= cell_bit(blocks_per_day, weekday, block_index)
+    row.bits = encode_bits(bits, blocks_per_day)
+
+
+def toggle_member_cells(group, user_id, added, removed):
+    """Enciende `added` y apaga `removed`; devuelve los bits resultantes."""
+    blocks_per_day = len(group.block_starts())
+    row = _member_row(group, user_id)
+    bits = decode_bits(row.bits)
+    for weekday, block_index in added:
+        bits |= cell_bit(blocks_per_day, weekday, block_index)
+    for weekday, block_index in removed:
+        bits &= ~cell_bit(blocks_per_day, weekday, block_index)
+    row.bits = encode_bits(bits, blocks_per_day)
+    return bits
+
+
+def member_grid_version(group, user_id):
+    """Versión de la grilla del miembro; 0 si todavía no guardó nada."""
+    version = (
+        scheduler_db.session.query(AvailabilityBitmap.version)
+        .filter_by(group_id=group.id, user_id=user_id)
+        .scalar()
+    )
+    return version or 0
+
+
+def rebuild_group_bitmaps(group):
+    """Reconstruye desde las marcas (o los tramos) los bitmaps de todo el grupo.
+
+    Es lo que corresponde cuando las marcas se movieron en bloque (remapeo) o
+    cambió la grilla: más barato que corregir bit por bit y sin riesgo de
+    arrastrar un desfase. Se escribe con un UPDATE y un INSERT en bloque, no
+    una sentencia por miembro; la versión de cada grilla sube igual que en un
+    guardado, así que un autosave en vuelo sobre la grilla vieja da conflicto.
+    """
+    layout = grid_layout(group)
+    blocks_per_day = len(group.block_starts())
+    fresh = bits_from_storage(group)
+    existing = dict(
+        scheduler_db.session.query(AvailabilityBitmap.user_id, AvailabilityBitmap.id)
+        .filter(AvailabilityBitmap.group_id == group.id)
+        .all()
+    )
+
+    table = AvailabilityBitmap.__table__
+    if existing:
+        scheduler_db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam("row_id"))
+            .values(
+                layout=bindparam("new_layout"),
+                bits=bindparam("new_bits"),
+                version=table.c.version + 1,
+            ),
+            [
+                {
+                    "row_id": row_id,
+                    "new_layout": layout,
+                    "new_bits": encode_bits(fresh.get(user_id, 0), blocks_per_day),
+                }
+                for user_id, row_id in existing.items()
+            ],
+        )
+    missing = fresh.keys() - existing.keys()
+    if missing:
+        scheduler_db.session.execute(
+            insert(table),
+            [
+                {
+                    "group_id": group.id,
+                    "user_id": user_id,
+                    "layout": layout,
+                    "bits": encode_bits(fresh[user_id], blocks_per_day),
+                }
+                for user_id in sorted(missing)
+            ],
+        )
+    # Las sentencias de arriba no pasan por el ORM: lo que la sesión tenga
+    # cargado de estas filas quedó viejo (bits y versión).
+    for instance in list(scheduler_db.session.identity_map.values()):
+        if isinstance(instance, AvailabilityBitmap):
+            scheduler_db.session.expire(instance)
+    bump_group_revision(group.id)
+
+
+def load_bitmaps(group, user_ids):
+    """{user_id: bits} de los usuarios dados, para lectura.
+
+    Los bitmaps guardados se leen en una consulta; los que faltan o quedaron
+    con otra grilla se calculan desde la fuente de verdad en una segunda, sin
+    persistirse: una lectura no escribe. Quien no tenga ninguna marca sale con
+    0, así que el dict cubre siempre a todos los `user_ids`.
+
+    `user_ids` puede ser un SELECT de ids (`active_member_ids_select`): el
+    filtro va como subconsulta, y los que faltan se reconstruyen filtrando por
+    otra (los del SELECT sin bitmap al día). En ese caso quien no marcó nada
+    puede no estar en el dict: vale 0.
+    """
+    as_query = isinstance(user_ids, Select)
+    if not as_query:
+        user_ids = set(user_ids)
+        if not user_ids:
+            return {}
+
+    layout = grid_layout(group)
+    bitmaps = {
+        user_id: decode_bits(raw)
+        for user_id, raw in scheduler_db.session.query(
+            AvailabilityBitmap.user_id, AvailabilityBitmap.bits
+        )
+        .filter(AvailabilityBitmap.group_id == group.id)
+        .filter(AvailabilityBitmap.layout == layout)
+        .filter(AvailabilityBitmap.user_id.in_(user_ids))
+        .all()
+    }
+
+    if as_query:
+        current = (
+            select(AvailabilityBitmap.id)
+            .where(
+                AvailabilityBitmap.group_id == group.id,
+                AvailabilityBitmap.layout == layout,
+                AvailabilityBitmap.user_id == user_ids.selected_columns[0],
+            )
+            .exists()
+        )
+        bitmaps.update(bits_from_storage(group, user_ids.where(~current)))
+        return bitmaps
+
+    missing = user_ids - bitmaps.keys()
+    if missing:
+        rebuilt = bits_from_storage(group, missing)
+        for user_id in missing:
+            bitmaps[user_id] = rebuilt.get(user_id, 0)
+    return bitmaps
+
+
+def window_starts(bits, length):
+    """Bits donde empieza una racha de al menos `length` celdas encendidas.
+
+    Se arma por duplicación (`racha de s` & `racha de s` corrida s lugares),
+    así que cuesta O(log length) operaciones sobre el entero, no `length`.
+    No sabe de días: quien llama enmascara los inicios que cruzarían de un día
+    al siguiente.
+    """
+    span = 1
+    while span < length:
+        step = min(span, length - span)
+        bits &= bits >> step
+        span += step
+    return bits
+
+
+def window_start_mask(blocks_per_day, weekdays, length):
+    """Inicios válidos para ventanas de `length` bloques que no cruzan de día."""
+    if not 0 < length <= blocks_per_day:
+        return 0
+    starts = (1 << (blocks_per_day - length + 1)) - 1
+    mask = 0
+    for weekday in weekdays:
+        mask |= starts << (weekday * blocks_per_day)
+    return mask
+
+
+def _add_to_counter(planes, bits):
+    """Suma 1 en cada posición de `bits` a un contador en rebanadas de bits.
+
+    `planes[i]` lleva el bit i del conteo de cada celda: sumar un miembro son
+    unas pocas operaciones sobre enteros (un sumador con acarreo) en lugar de
+    una por celda.
+    """
+    level = 0
+    while bits:
+        if level == len(planes):
+            planes.append(bits)
+            return
+        carry = planes[level] & bits
+        planes[level] ^= bits
+        bits = carry
+        level += 1
+
+
+def count_cells(bitmaps, mask):
+    """{celda: cuántos bitmaps la tienen encendida}, solo dentro de `mask`."""
+    planes = []
+    for bits in bitmaps:
+        _add_to_counter(planes, bits & mask)
+
+    counts = {}
+    for level, plane in enumerate(planes):
+        weight = 1 << level
+        while plane:
+            low = plane & -plane
+            index = low.bit_length() - 1
+            counts[index] = counts.get(index, 0) + weight
+            plane ^= low
+    return counts
+
+
+def best_windows(bitmaps, blocks_per_day, weekdays, length, quorum, limit):
+    """Las `limit` mejores ventanas de `length` bloques con al menos `quorum` miembros.
+
+    `bitmaps` es {user_id: bits}. Devuelve tuplas `(weekday, block_index,
+    user_ids)` de la más concurrida a la menos; a igual conteo gana la más
+    temprana. Las ventanas elegidas no se pisan entre sí: una franja libre de
+    tres horas es una propuesta, no treinta corridas de a un bloque.
+    """
+    mask = window_start_mask(blocks_per_day, weekdays, length)
+    if not mask or quorum < 1 or limit < 1:
+        return []
+
+    runs = {user_id: window_starts(bits, length) & mask for user_id, bits in bitmaps.items()}
+    counts = count_cells(runs.values(), mask)
+    ranked = sorted(
+        (index for index, count in counts.items() if count >= quorum),
+        key=lambda index: (-counts[index], index),
+    )
+
+    window = (1 << length) - 1
+    taken = 0
+    chosen = []
+    for index in ranked:
+        cells = window << index
+        if taken & cells:
+            continue
+        taken |= cells
+        weekday, block_index = divmod(index, blocks_per_day)
+        user_ids = sorted(user_id for user_id, bits in runs.items() if bits >> index & 1)
+        chosen.append((weekday, block_index, user_ids))
+        if len(chosen) == limit:
+            break
+    return chosen
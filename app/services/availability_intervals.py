@@ -0,0 +1,236 @@
+"""Disponibilidad como tramos: `(weekday, start_minutes, end_minutes)` por miembro.
+
+Es la fuente de verdad de los grupos con `availability_storage = "intervals"`
+(ver `AvailabilityInterval`). Con grillas finas las marcas por bloque son
+miles de filas por persona; como tramos son unas pocas por día.
+
+Nada acá lee la grilla como filas: los tramos se proyectan a celdas
+`(weekday, block_index)` cuando hace falta, con la misma regla de solape que
+usa el remapeo de marcas (`_overlapped_starts`): una celda cuenta si su bloque
+pisa el tramo. Un tramo guardado desde una grilla vuelve a esa misma grilla
+exacto; si el formato cambió, cae en los bloques nuevos que solapa.
+
+Las funciones puras trabajan con listas de tuplas `(weekday, inicio, fin)` en
+minutos, tramos semiabiertos `[inicio, fin)`. Ninguna función acá commitea: la
+transacción la maneja la ruta que llama.
+"""
+
+from bisect import bisect_left, bisect_right
+from itertools import groupby
+
+from sqlalchemy import delete, insert
+
+from app.extensions import scheduler_db
+from app.group_revision import bump_group_revision
+from app.models import AvailabilityInterval
+
+WEEKDAYS = 7
+
+
+def merge_intervals(intervals):
+    """Ordena y funde los tramos que se pisan o se tocan, día por día."""
+    merged = []
+    for weekday, start, end in sorted(intervals):
+        if start >= end:
+            continue
+        if merged and merged[-1][0] == weekday and start <= merged[-1][2]:
+            if end > merged[-1][2]:
+                merged[-1] = (weekday, merged[-1][1], end)
+            continue
+        merged.append((weekday, start, end))
+    return merged
+
+
+def intersect_intervals(left, right):
+    """Tramos comunes a dos listas de tramos (cada una ya fundida)."""
+    left, right = merge_intervals(left), merge_intervals(right)
+    common = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        a_day, a_start, a_end = left[i]
+        b_day, b_start, b_end = right[j]
+        if a_day == b_day:
+            start, end = max(a_start, b_start), min(a_end, b_end)
+            if start < end:
+                common.append((a_day, start, end))
+        if (a_day, a_end) < (b_day, b_end):
+            i += 1
+        else:
+            j += 1
+    return common
+
+
+def subtract_span(intervals, weekdays, span_start, span_end):
+    """Los tramos sin la franja `[span_start, span_end)` de los días `weekdays`."""
+    kept = []
+    for weekday, start, end in intervals:
+        if weekday not in weekdays or end <= span_start or start >= span_end:
+            kept.append((weekday, start, end))
+            continue
+        if start < span_start:
+            kept.append((weekday, start, span_start))
+        if end > span_end:
+            kept.append((weekday, span_end, end))
+    return kept
+
+
+def grid_windows(block_starts, block_minutes, weekdays):
+    """La franja que la grilla cubre en cada uno de `weekdays`, como tramos."""
+    if not block_starts:
+        return []
+    return [(weekday, block_starts[0], block_starts[-1] + block_minutes) for weekday in weekdays]
+
+
+def block_range(block_starts, block_minutes, start, end):
+    """(primero, fin) de los índices de bloque que pisan `[start, end)`.
+
+    Mismo criterio que `_overlapped_starts` del remapeo de marcas; como los
+    inicios están ordenados, es un tramo contiguo de índices.
+    """
+    return bisect_right(block_starts, start - block_minutes), bisect_left(block_starts, end)
+
+
+def cells_to_intervals(block_starts, block_minutes, cells):
+    """Celdas `(weekday, block_index)` a tramos: cada racha de bloques seguidos es uno."""
+    intervals = []
+    for weekday, group in groupby(sorted(cells), key=lambda cell: cell[0]):
+        indexes = [block_index for _, block_index in group]
+        run_start = previous = indexes[0]
+        for block_index in indexes[1:] + [None]:
+            if block_index == previous + 1:
+                previous = block_index
+                continue
+            intervals.append(
+                (weekday, block_starts[run_start], block_starts[previous] + block_minutes)
+            )
+            if block_index is not None:
+                run_start = previous = block_index
+    return merge_intervals(intervals)
+
+
+def intervals_to_cells(block_starts, block_minutes, intervals):
+    """Celdas `(weekday, block_index)` de la grilla que pisan los tramos."""
+    cells = set()
+    for weekday, start, end in intervals:
+        first, last = block_range(block_starts, block_minutes, start, end)
+        cells.update((weekday, block_index) for block_index in range(first, last))
+    return cells
+
+
+def intervals_to_bits(block_starts, block_minutes, intervals):
+    """Los tramos como bitmap (ver `availability_bitmap`): un corrimiento por tramo."""
+    blocks_per_day = len(block_starts)
+    bits = 0
+    for weekday, start, end in intervals:
+        if not 0 <= weekday < WEEKDAYS:
+            continue
+        first, last = block_range(block_starts, block_minutes, start, end)
+        if first < last:
+            bits |= ((1 << (last - first)) - 1) << (weekday * blocks_per_day + first)
+    return bits
+
+
+def member_intervals(group_id, user_ids=None):
+    """{user_id: [(weekday, inicio, fin)]} de los usuarios dados, en una consulta."""
+    query = scheduler_db.session.query(
+        AvailabilityInterval.user_id,
+        AvailabilityInterval.weekday,
+        AvailabilityInterval.start_minutes,
+        AvailabilityInterval.end_minutes,
+    ).filter(AvailabilityInterval.group_id == group_id)
+    if user_ids is not None:
+        query = query.filter(AvailabilityInterval.user_id.in_(user_ids))
+
+    intervals = {}
+    for user_id, weekday, start, end in query.order_by(
+        AvailabilityInterval.user_id,
+        AvailabilityInterval.weekday,
+        AvailabilityInterval.start_minutes,
+    ).all():
+        intervals.setdefault(user_id, []).append((weekday, start, end))
+    return intervals
+
+
+def responded_user_ids(group_id, user_ids):
+    """Ids de `user_ids` con al menos un tramo guardado en el grupo."""
+    return {
+        user_id
+        for (user_id,) in scheduler_db.session.query(AvailabilityInterval.user_id)
+        .filter(AvailabilityInterval.group_id == group_id)
+        .filter(AvailabilityInterval.user_id.in_(user_ids))
+        .distinct()
+        .all()
+    }
+
+
+def bits_from_intervals(group, user_ids=None):
+    """{user_id: bits} proyectado desde los tramos, en una consulta.
+
+    Espejo de `bits_from_marks`: quien no tiene ningún tramo que pise la grilla
+    actual no aparece en el dict.
+    """
+    block_starts = group.block_starts()
+    bitmaps = {}
+    for user_id, intervals in member_intervals(group.id, user_ids).items():
+        bits = intervals_to_bits(block_starts, group.block_minutes, intervals)
+        if bits:
+            bitmaps[user_id] = bits
+    return bitmaps
+
+
+def write_member_intervals(group, user_id, cells, visible_weekdays):
+    """Deja los tramos del miembro en `cells` dentro de la grilla visible.
+
+    La franja que la grilla muestra en cada día visible se reemplaza por los
+    tramos de `cells`; lo que cae fuera (otro horario, un día apagado) se
+    conserva, igual que las marcas ocultas por la grilla. Si no cambió nada no
+    se escribe; si cambió, se borran los tramos del miembro y se insertan los
+    nuevos ya fundidos: son pocos, dos sentencias. Devuelve cuántos tramos
+    quedaron.
+    """
+    block_starts = group.block_starts()
+    rows = (
+        scheduler_db.session.query(
+            AvailabilityInterval.id,
+            AvailabilityInterval.weekday,
+            AvailabilityInterval.start_minutes,
+            AvailabilityInterval.end_minutes,
+        )
+        .filter(AvailabilityInterval.group_id == group.id)
+        .filter(AvailabilityInterval.user_id == user_id)
+        .all()
+    )
+    current = [(weekday, start, end) for _, weekday, start, end in rows]
+
+    kept = current
+    if block_starts:
+        kept = subtract_span(
+            current, visible_weekdays, block_starts[0], block_starts[-1] + group.block_minutes
+        )
+    fresh = merge_intervals(kept + cells_to_intervals(block_starts, group.block_minutes, cells))
+    if fresh == sorted(current):
+        return len(fresh)
+
+    if rows:
+        scheduler_db.session.execute(
+            delete(AvailabilityInterval).where(
+                AvailabilityInterval.id.in_([row_id for row_id, *_ in rows])
+            )
+        )
+    if fresh:
+        scheduler_db.session.execute(
+            insert(AvailabilityInterval),
+            [
+                {
+                    "group_id": group.id,
+                    "user_id": user_id,
+                    "weekday": weekday,
+                    "start_minutes": start,
+                    "end_minutes": end,
+                }
+                for weekday, start, end in fresh
+            ],
+        )
+    # El DELETE y el INSERT no pasan por el flush que sube la revisión.
+    bump_group_revision(group.id)
+    return len(fresh)
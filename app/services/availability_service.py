@@ -12,18 +12,63 @@ que conviven en el dominio:
 Ninguna función acá commitea: la transacción la maneja la ruta que llama.
 """
 
+import math
+import re
+from base64 import b64encode
+from bisect import bisect_left, bisect_right
+from fractions import Fraction
 from types import SimpleNamespace
 
-from sqlalchemy import func
+from sqlalchemy import func, insert, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
 
+from app.cache import group_cached
 from app.extensions import scheduler_db
-from app.models import Availability, GroupMember, SubGroup, SubGroupMember, UserAvailability
-from app.soft_delete import find_soft_deleted
+from app.group_revision import bump_group_revision
+from app.models import (
+    Availability,
+    Group,
+    GroupMember,
+    GroupMemberCategory,
+    SubGroup,
+    SubGroupMember,
+    UserAvailability,
+)
+from app.models.group import grid_block_starts
+from app.models.mixins import ACTIVE_ROWS, _utcnow
+from app.request_memo import request_memo
+from app.services.availability_bitmap import (
+    best_windows,
+    count_cells,
+    day_mask,
+    encode_bits,
+    iter_cells,
+    load_bitmaps,
+    member_grid_version,
+    popcount,
+    rebuild_group_bitmaps,
+    replace_member_days,
+    toggle_member_cells,
+)
+from app.services.availability_intervals import (
+    grid_windows,
+    intersect_intervals,
+    member_intervals,
+    write_member_intervals,
+)
+from app.slot_counts import recount_slots
+from app.soft_delete import INCLUDE_DELETED
 
 # Cota del resumen "horarios en que pueden todos". No es paginación: es el techo
 # que evita que la vista se vuelva ilegible (y cara) cuando el grupo se dispara.
 AVAILABILITY_SUMMARY_LIMIT = 200
 
+# Techo de ventanas por consulta del buscador de horarios de reunión.
+MEETING_WINDOWS_MAX_LIMIT = 50
+
+# Lo único que `resolve_quorum` acepta antes del "%": un decimal simple.
+_PERCENT_RE = re.compile(r"\d+(\.\d+)?")
+
 
 def format_minutes(total_minutes):
     """Minutos desde medianoche a 'HH:MM'."""
@@ -64,98 +109,296 @@ def parse_time_to_minutes(value):
     return hours * 60 + minutes
 
 
-def _availability_by_minutes(group_id):
-    """Filas de Availability del grupo indexadas por (weekday, start_minutes)."""
+def cells_from_form(group, form_data, active_weekdays=None):
+    """Celdas `(weekday, block_index)` marcadas en el formulario, solo las visibles."""
+    blocks_per_day = len(group.block_starts())
     return {
-        (row.weekday, row.start_minutes): row
-        for row in Availability.query.filter_by(group_id=group_id).all()
+        (weekday, block_index)
+        for weekday in (active_weekdays if active_weekdays is not None else range(7))
+        for block_index in range(blocks_per_day)
+        if f"day_{weekday}_hour_{block_index}" in form_data
     }
 
 
-def _get_or_create_availability(group_id, weekday, minutes, known):
-    """Devuelve la fila del bloque, creándola si aún no existe. Actualiza `known`."""
-    existing = known.get((weekday, minutes))
-    if existing:
-        return existing
-    row = Availability(group_id=group_id, weekday=weekday, start_minutes=minutes)
-    scheduler_db.session.add(row)
-    scheduler_db.session.flush()
-    known[(weekday, minutes)] = row
-    return row
+def _insert_ignoring_conflicts(model, rows, index_elements, index_where=None):
+    """INSERT de varias filas que saltea las que ya existen.
+
+    `ON CONFLICT DO NOTHING` en Postgres y en SQLite (mismo SQL, distinto
+    constructor). Cubre la carrera entre dos guardados simultáneos: el segundo
+    no falla por el unique, simplemente no inserta lo que el primero ya dejó.
+    En otro motor cae a un INSERT simple y el unique queda como red.
+    """
+    if not rows:
+        return
+    dialect = scheduler_db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(model).on_conflict_do_nothing(
+            index_elements=index_elements, index_where=index_where
+        )
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(model).on_conflict_do_nothing(
+            index_elements=index_elements, index_where=index_where
+        )
+    else:
+        stmt = insert(model)
+    scheduler_db.session.execute(stmt, rows)
 
 
-def clear_existing_availability(group, user_id, active_weekdays):
-    """Oculta la disponibilidad previa del usuario dentro de la grilla visible.
+def _availability_ids(group_id):
+    """{(weekday, start_minutes): availability_id} del grupo, sin cargar objetos."""
+    return {
+        (weekday, minutes): availability_id
+        for availability_id, weekday, minutes in scheduler_db.session.query(
+            Availability.id, Availability.weekday, Availability.start_minutes
+        )
+        .filter(Availability.group_id == group_id)
+        .all()
+    }
 
-    Solo se limpian los bloques que el formulario pudo mostrar: lo que quedó
-    fuera del rango o en un día apagado no lo está desmarcando el usuario, así
-    que se conserva y reaparece si el admin vuelve a ampliar la grilla.
 
-    No borra filas: al volver a marcar el mismo bloque se restaura la fila
-    existente (ver mark_user_available).
+def _ensure_availability_rows(group, cells):
+    """{(weekday, block_index): availability_id} de las celdas, creando las que falten."""
+    block_starts = group.block_starts()
+    wanted = {
+        (weekday, block_starts[block_index]): (weekday, block_index)
+        for weekday, block_index in cells
+    }
+    known = _availability_ids(group.id)
+    missing = wanted.keys() - known.keys()
+    if missing:
+        _insert_ignoring_conflicts(
+            Availability,
+            [
+                {"group_id": group.id, "weekday": weekday, "start_minutes": minutes}
+                for weekday, minutes in sorted(missing)
+            ],
+            index_elements=["group_id", "weekday", "start_minutes"],
+        )
+        known = _availability_ids(group.id)
+    return {cell: known[key] for key, cell in wanted.items()}
+
+
+def _visible_cells(group, cells, visible_weekdays):
+    """Las celdas de `cells` que la grilla actual muestra."""
+    blocks_per_day = len(group.block_starts())
+    return {
+        (weekday, block_index)
+        for weekday, block_index in cells
+        if weekday in visible_weekdays and 0 <= block_index < blocks_per_day
+    }
+
+
+def _restore_marks(hidden_ids):
+    """Restaura las marcas ocultas `{clave: mark_id}`; devuelve las claves que ya no estaban.
+
+    Entre la lectura y este UPDATE la compactación de lápidas
+    (`python -m app.db.compact_tombstones`) pudo borrar alguna: quien llama
+    inserta esas de nuevo en vez de perder la marca en silencio.
     """
-    visible_starts = set(group.block_starts())
-    visible_weekdays = set(active_weekdays)
-    rows = (
+    if not hidden_ids:
+        return set()
+    result = scheduler_db.session.execute(
+        update(UserAvailability)
+        .where(UserAvailability.id.in_(hidden_ids.values()))
+        .values(deleted_at=None)
+    )
+    if result.rowcount == len(hidden_ids):
+        return set()
+    alive = {
+        mark_id
+        for (mark_id,) in scheduler_db.session.query(UserAvailability.id)
+        .filter(UserAvailability.id.in_(hidden_ids.values()))
+        .all()
+    }
+    return {key for key, mark_id in hidden_ids.items() if mark_id not in alive}
+
+
+def _apply_mark_diff(group, user_id, cells, visible_weekdays, scope=None):
+    """Lleva las marcas del miembro a `cells` dentro de `scope` con sentencias en bloque.
+
+    `scope` son las celdas que se revisan; None es toda la grilla visible. Lo
+    que queda fuera del alcance no se lee ni se escribe. Devuelve los conteos
+    (insertadas, restauradas, ocultadas).
+    """
+    block_starts = group.block_starts()
+    index_of = {start: i for i, start in enumerate(block_starts)}
+
+    query = (
         scheduler_db.session.query(
-            UserAvailability, Availability.weekday, Availability.start_minutes
+            UserAvailability.id,
+            UserAvailability.availability_id,
+            Availability.weekday,
+            Availability.start_minutes,
+            UserAvailability.deleted_at,
         )
+        .execution_options(**{INCLUDE_DELETED: True})
         .join(Availability, UserAvailability.availability_id == Availability.id)
         .filter(UserAvailability.user_id == user_id, Availability.group_id == group.id)
-        .all()
     )
-    for ua, weekday, start_minutes in rows:
-        if weekday in visible_weekdays and start_minutes in visible_starts:
-            ua.soft_delete()
-
-
-def mark_user_available(user_id, availability_id):
-    """Marca el bloque para el usuario. Devuelve True si hubo cambio real."""
-    existing = UserAvailability.query.filter_by(
-        user_id=user_id, availability_id=availability_id
-    ).first()
-    if existing:
-        return False
-
-    # Reutiliza la fila oculta si existe: evita duplicar
-    # (user_id, availability_id) en cada guardado.
-    hidden = find_soft_deleted(UserAvailability, user_id=user_id, availability_id=availability_id)
-    if hidden:
-        hidden.restore()
-    else:
-        scheduler_db.session.add(UserAvailability(user_id=user_id, availability_id=availability_id))
-    return True
+    if scope is not None:
+        if not scope:
+            return 0, 0, 0
+        query = query.filter(
+            tuple_(Availability.weekday, Availability.start_minutes).in_(
+                [(weekday, block_starts[block_index]) for weekday, block_index in scope]
+            )
+        )
 
+    active = {}
+    hidden = {}
+    slot_of = {}
+    for mark_id, availability_id, weekday, minutes, deleted_at in query.all():
+        block_index = index_of.get(minutes)
+        if weekday not in visible_weekdays or block_index is None:
+            continue
+        cell = (weekday, block_index)
+        slot_of[cell] = availability_id
+        if deleted_at is None:
+            active[cell] = mark_id
+        elif cell not in hidden or deleted_at > hidden[cell][1]:
+            hidden[cell] = (mark_id, deleted_at)
+
+    to_hide = [mark_id for cell, mark_id in active.items() if cell not in cells]
+    to_restore = {cell: hidden[cell][0] for cell in cells - active.keys() if cell in hidden}
+    to_insert = cells - active.keys() - hidden.keys()
+    touched = {slot_of[cell] for cell in active.keys() - cells}
+    touched.update(slot_of[cell] for cell in to_restore)
+
+    if not (to_hide or to_restore or to_insert):
+        return 0, 0, 0
+    # Las sentencias en bloque no pasan por el flush: la revisión del grupo y
+    # el contador de cada bloque tocado se actualizan acá, en la misma
+    # transacción. La revisión va primero: bloquea la fila del grupo antes que
+    # `recount_slots` bloquee los bloques, el mismo orden que el guardado de
+    # ajustes (ver app/slot_counts.py).
+    bump_group_revision(group.id)
+
+    now = _utcnow()
+    if to_hide:
+        scheduler_db.session.execute(
+            update(UserAvailability).where(UserAvailability.id.in_(to_hide)).values(deleted_at=now)
+        )
+    lost = _restore_marks(to_restore)
+    to_insert |= lost
+    if to_insert:
+        availability_ids = _ensure_availability_rows(group, to_insert)
+        _insert_ignoring_conflicts(
+            UserAvailability,
+            [
+                {"user_id": user_id, "availability_id": availability_ids[cell]}
+                for cell in sorted(to_insert)
+            ],
+            index_elements=["user_id", "availability_id"],
+            index_where=ACTIVE_ROWS,
+        )
+        touched.update(availability_ids.values())
+    recount_slots(touched)
+    return len(to_insert), len(to_restore) - len(lost), len(to_hide)
 
-def process_posted_availability(group_id, form_data, group, user_id, active_weekdays=None):
-    block_starts = group.block_starts()
-    known = _availability_by_minutes(group_id)
-    count = 0
-    for weekday in active_weekdays if active_weekdays is not None else range(7):
-        for block_index, start_minutes in enumerate(block_starts):
-            key = f"day_{weekday}_hour_{block_index}"
-            if key not in form_data:
-                continue
-            group_availability = _get_or_create_availability(
-                group_id, weekday, start_minutes, known
-            )
-            if mark_user_available(user_id, group_availability.id):
-                count += 1
-    return count
+
+def save_member_availability(group, user_id, cells, active_weekdays):
+    """Deja la disponibilidad visible del miembro exactamente en `cells`.
+
+    Hace una sola lectura de las marcas del miembro (incluidas las ocultas),
+    calcula la diferencia contra lo pedido y la aplica con un puñado de
+    sentencias en bloque:
+
+    - se ocultan las marcas visibles que ya no están en `cells`;
+    - se restauran las ocultas que vuelven a estar (una por bloque, la última
+      que se ocultó, como `find_soft_deleted`): no se duplican filas;
+    - se insertan las que nunca existieron, con `ON CONFLICT DO NOTHING`.
+
+    Lo que cae fuera de la grilla o en un día apagado no lo está desmarcando el
+    usuario: no se toca y reaparece si el admin vuelve a ampliar la grilla.
+    Devuelve un SimpleNamespace con `saved` (las celdas marcadas) y los conteos
+    `inserted`, `restored` y `hidden`.
+
+    En un grupo que guarda tramos (`Group.uses_interval_storage`) las celdas se
+    escriben como tramos (`write_member_intervals`) y el SimpleNamespace lleva
+    `saved` e `intervals`, los tramos que le quedaron al miembro.
+    """
+    visible_weekdays = set(active_weekdays)
+    cells = _visible_cells(group, cells, visible_weekdays)
+    if group.uses_interval_storage():
+        replace_member_days(group, user_id, visible_weekdays, cells)
+        intervals = write_member_intervals(group, user_id, cells, visible_weekdays)
+        return SimpleNamespace(saved=len(cells), intervals=intervals)
+
+    inserted, restored, hidden = _apply_mark_diff(group, user_id, cells, visible_weekdays)
+    replace_member_days(group, user_id, visible_weekdays, cells)
+
+    return SimpleNamespace(saved=len(cells), inserted=inserted, restored=restored, hidden=hidden)
+
+
+def apply_member_delta(group, user_id, added, removed, active_weekdays):
+    """Aplica solo los cambios `added` / `removed` a la disponibilidad del miembro.
+
+    Es el modo delta del autosave: en vez de reescribir la semana entera, se
+    leen y escriben únicamente las celdas que el usuario tocó. Si una celda
+    viene en las dos listas gana `removed`. El chequeo de versión lo hace quien
+    llama (ver `member_grid_version`); el bitmap lo vuelve a chequear al
+    escribir y una carrera entre dos pestañas termina en `StaleDataError`.
+
+    Devuelve el mismo SimpleNamespace que `save_member_availability`, con
+    `saved` = total de celdas visibles marcadas después del cambio.
+    """
+    visible_weekdays = set(active_weekdays)
+    removed = _visible_cells(group, removed, visible_weekdays)
+    added = _visible_cells(group, added, visible_weekdays) - removed
+    if group.uses_interval_storage():
+        # Los tramos del miembro son pocos: se reescriben desde el bitmap ya
+        # actualizado en vez de recortar tramo por tramo.
+        blocks_per_day = len(group.block_starts())
+        bits = toggle_member_cells(group, user_id, added, removed)
+        cells = set(iter_cells(bits & day_mask(blocks_per_day, visible_weekdays), blocks_per_day))
+        intervals = write_member_intervals(group, user_id, cells, visible_weekdays)
+        return SimpleNamespace(saved=len(cells), intervals=intervals)
+
+    inserted, restored, hidden = _apply_mark_diff(
+        group, user_id, added, visible_weekdays, scope=added | removed
+    )
+    bits = toggle_member_cells(group, user_id, added, removed)
+    saved = popcount(bits & day_mask(len(group.block_starts()), visible_weekdays))
+
+    return SimpleNamespace(saved=saved, inserted=inserted, restored=restored, hidden=hidden)
+
+
+def member_grid_state(group, user_id, active_weekdays):
+    """(versión, celdas visibles marcadas) de la grilla del miembro.
+
+    Es lo que el autosave devuelve ante un conflicto de versión para que el
+    cliente se resincronice sin recargar la página.
+    """
+    visible_weekdays = set(active_weekdays)
+    cells = [cell for cell in member_cells(group, user_id) if cell[0] in visible_weekdays]
+    return member_grid_version(group, user_id), cells
+
+
+def member_cells(group, user_id):
+    """Celdas `(weekday, block_index)` que el miembro tiene marcadas en la grilla actual."""
+    bits = load_bitmaps(group, [user_id])[user_id]
+    return list(iter_cells(bits, len(group.block_starts())))
 
 
 def active_member_user_ids(group_id):
     """Ids de usuarios que siguen siendo miembros del grupo.
 
     La disponibilidad de quien se fue no se borra, así que hay que excluirla
-    explícitamente de los agregados para no inflar los conteos.
+    explícitamente de los agregados para no inflar los conteos. Memorizado por
+    request (lo piden la vista y varios servicios); se devuelve una copia.
     """
-    return {
-        user_id
-        for (user_id,) in scheduler_db.session.query(GroupMember.user_id)
-        .filter(GroupMember.group_id == group_id)
-        .all()
-    }
+    return set(
+        request_memo(
+            "active_members",
+            group_id,
+            lambda: {
+                user_id
+                for (user_id,) in scheduler_db.session.query(GroupMember.user_id)
+                .filter(GroupMember.group_id == group_id)
+                .all()
+            },
+        )
+    )
 
 
 def subgroup_peer_user_ids(group_id, user_id):
@@ -164,7 +407,16 @@ def subgroup_peer_user_ids(group_id, user_id):
     Es el alcance de quien tiene `availability.view_all` sin ver todos los
     subgrupos: solo la gente de su(s) subgrupo(s), él incluido. Si no pertenece
     a ninguno el conjunto es vacío y la vista cae al modo "solo mi horario".
+    Memorizado por request; se devuelve una copia.
     """
+    return set(
+        request_memo(
+            "subgroup_peers", (group_id, user_id), lambda: _subgroup_peers(group_id, user_id)
+        )
+    )
+
+
+def _subgroup_peers(group_id, user_id):
     own_subgroup_ids = [
         subgroup_id
         for (subgroup_id,) in scheduler_db.session.query(SubGroupMember.subgroup_id)
@@ -185,25 +437,133 @@ def subgroup_peer_user_ids(group_id, user_id):
     return peers & active_member_user_ids(group_id)
 
 
-def count_out_of_range_marks(group_id, start_minutes, end_minutes, weekdays):
-    """Cuenta marcas de disponibilidad que el nuevo rango dejaría fuera de la grilla.
+def active_member_ids_select(group_id):
+    """SELECT de los user_id de miembros activos, para usar como subconsulta.
 
-    No se borra ninguna: solo dejan de mostrarse mientras el rango las excluya.
+    Es el alcance "todo el grupo" de las consultas que filtran por usuario: en
+    vez de traer los ids a Python y mandarlos de vuelta como un `IN (…)` de
+    miles de parámetros (que además topa con el límite de SQLite), el filtro
+    queda como `IN (SELECT …)`. Las listas explícitas quedan para los alcances
+    que de verdad son un subconjunto, como la gente del subgrupo de quien mira.
+
+    El filtro de borrado lógico va explícito y no por el filtro global: la
+    subconsulta también se usa dentro de UPDATEs, que el filtro no cubre.
     """
-    rows = (
-        scheduler_db.session.query(Availability.weekday, Availability.start_minutes)
+    return select(GroupMember.user_id).where(
+        GroupMember.group_id == group_id, GroupMember.deleted_at.is_(None)
+    )
+
+
+def _mark_counts_by_slot(group_id):
+    """[(weekday, start_minutes, marcas)] de miembros activos, en un GROUP BY."""
+    return (
+        scheduler_db.session.query(
+            Availability.weekday, Availability.start_minutes, func.count(UserAvailability.id)
+        )
         .join(UserAvailability, UserAvailability.availability_id == Availability.id)
         .filter(Availability.group_id == group_id)
-        .filter(UserAvailability.user_id.in_(active_member_user_ids(group_id)))
+        .filter(UserAvailability.user_id.in_(active_member_ids_select(group_id)))
+        .group_by(Availability.weekday, Availability.start_minutes)
         .all()
     )
+
+
+def count_out_of_range_marks(group_id, start_minutes, end_minutes, weekdays):
+    """Cuenta marcas de disponibilidad que el nuevo rango dejaría fuera de la grilla.
+
+    No se borra ninguna: solo dejan de mostrarse mientras el rango las excluya.
+    """
     return sum(
-        1
-        for weekday, avail_start in rows
+        marks
+        for weekday, avail_start, marks in _mark_counts_by_slot(group_id)
         if weekday not in weekdays or not start_minutes <= avail_start < end_minutes
     )
 
 
+def preview_grid_change(group, start_minutes, end_minutes, block_minutes, weekdays):
+    """Qué pasaría con las marcas si la grilla pasara a este formato. No escribe nada.
+
+    Cada marca activa de un miembro activo cae en una sola de tres cuentas:
+
+    - `remapped`: `remap_availability_marks` la copiaría a los bloques nuevos
+      que solapa su horario;
+    - `hidden`: queda sin celda (fuera del rango, en un día apagado o
+      desalineada con los bloques nuevos); no se borra, solo deja de verse;
+    - `untouched`: sigue visible en el mismo bloque.
+
+    Las marcas se leen ya agregadas por bloque (un GROUP BY), así que el costo
+    va con las celdas de la grilla y no con la cantidad de respuestas.
+
+    En un grupo que guarda tramos las cuentas son de tramos y nunca hay
+    `remapped`: la grilla nueva los proyecta sin moverlos. Un tramo queda
+    `hidden` si no pisa ninguna celda de la grilla nueva.
+    """
+    new_starts = grid_block_starts(start_minutes, end_minutes, block_minutes)
+    visible = set(new_starts)
+    weekdays = set(weekdays)
+    grid_changed = (start_minutes, end_minutes, block_minutes) != (
+        group.start_minutes,
+        group.end_minutes,
+        group.block_minutes,
+    )
+    if group.uses_interval_storage():
+        return _preview_interval_grid(group, new_starts, block_minutes, weekdays, grid_changed)
+    old_starts = set(group.block_starts())
+
+    hidden = remapped = untouched = 0
+    for weekday, minutes, marks in _mark_counts_by_slot(group.id):
+        if (
+            grid_changed
+            and weekday in weekdays
+            and minutes in old_starts
+            and _overlapped_starts(
+                new_starts, block_minutes, minutes, minutes + group.block_minutes
+            )
+            not in ([], [minutes])
+        ):
+            remapped += marks
+        elif weekday in weekdays and minutes in visible:
+            untouched += marks
+        else:
+            hidden += marks
+    return SimpleNamespace(
+        grid_changed=grid_changed,
+        hidden=hidden,
+        remapped=remapped,
+        untouched=untouched,
+        total=hidden + remapped + untouched,
+    )
+
+
+def _preview_interval_grid(group, new_starts, block_minutes, weekdays, grid_changed):
+    """`preview_grid_change` para un grupo que guarda tramos."""
+    windows = grid_windows(new_starts, block_minutes, sorted(weekdays))
+    hidden = untouched = 0
+    for intervals in member_intervals(group.id, active_member_ids_select(group.id)).values():
+        for interval in intervals:
+            if intersect_intervals([interval], windows):
+                untouched += 1
+            else:
+                hidden += 1
+    return SimpleNamespace(
+        grid_changed=grid_changed,
+        hidden=hidden,
+        remapped=0,
+        untouched=untouched,
+        total=hidden + untouched,
+    )
+
+
+def _overlapped_starts(new_starts, block_minutes, start, end):
+    """Inicios de los bloques nuevos que solapan `[start, end)`.
+
+    `new_starts` está ordenado, así que es un tramo contiguo de la lista.
+    """
+    first = bisect_right(new_starts, start - block_minutes)
+    last = bisect_left(new_starts, end)
+    return new_starts[first:last]
+
+
 def remap_availability_marks(group, old_starts, old_block_minutes, weekdays):
     """Reencaja las respuestas ya guardadas cuando cambia el formato de la grilla.
 
@@ -215,104 +575,251 @@ def remap_availability_marks(group, old_starts, old_block_minutes, weekdays):
     Lo que queda fuera del rango o en un día desactivado NO se toca: sigue
     oculto por la grilla y reaparece intacto si el admin vuelve a ampliar.
 
+    El mapeo bloque viejo → bloques nuevos se calcula una sola vez y las marcas
+    se mueven con un puñado de sentencias en bloque, sin importar cuántos
+    miembros ni cuántas celdas tenga el grupo (ver `_remap_targets`).
+
     Devuelve cuántas marcas se reubicaron.
     """
     new_starts = group.block_starts()
     if not new_starts:
         return 0
+    if group.uses_interval_storage():
+        # Los tramos están en minutos: no hay nada que mover, la grilla nueva
+        # los proyecta sola. Solo los bitmaps quedaron con el formato viejo.
+        rebuild_group_bitmaps(group)
+        return 0
 
-    old_starts = set(old_starts)
-    known = _availability_by_minutes(group.id)
+    known = _availability_ids(group.id)
+    targets = _remap_targets(group, known, set(old_starts), old_block_minutes, weekdays)
+    remapped = _move_marks(group, known, targets) if targets else 0
 
-    remapped = 0
-    for (weekday, minutes), row in list(known.items()):
-        # Solo se reencaja lo que pertenecía a la grilla anterior: una marca
-        # fuera de rango o de un día apagado se deja tal cual.
+    # La grilla cambió de formato: los bitmaps armados con la anterior ya no
+    # significan nada, se rehacen desde las marcas ya reubicadas.
+    rebuild_group_bitmaps(group)
+    return remapped
+
+
+def _remap_targets(group, known, old_starts, old_block_minutes, weekdays):
+    """{availability_id viejo: (weekday, [inicios nuevos que solapa])}.
+
+    Solo entra lo que pertenecía a la grilla anterior en un día visible y cuyo
+    tramo no coincide ya con un bloque nuevo: una marca fuera de rango o de un
+    día apagado se deja tal cual, y la que cae justo en un bloque igual no
+    tiene nada que mover. Un horario viejo que no solapa ningún bloque nuevo
+    (el rango se angostó) tampoco: la grilla ya no lo muestra, pero reaparece
+    tal cual si el admin vuelve a ampliar.
+    """
+    new_starts = group.block_starts()
+    remap = {}
+    for (weekday, minutes), availability_id in known.items():
         if weekday not in weekdays or minutes not in old_starts:
             continue
+        overlapped = _overlapped_starts(
+            new_starts, group.block_minutes, minutes, minutes + old_block_minutes
+        )
+        if overlapped and overlapped != [minutes]:
+            remap[availability_id] = (weekday, overlapped)
+    return remap
 
-        old_end = minutes + old_block_minutes
-        targets = [
-            start
-            for start in new_starts
-            if start < old_end and start + group.block_minutes > minutes
-        ]
-        if targets == [minutes]:
-            # El bloque nuevo cubre exactamente el mismo tramo: nada que mover.
-            continue
 
-        remapped += _move_marks(group, row, targets, known)
+def _move_marks(group, known, targets):
+    """Copia a los bloques nuevos las marcas activas de los viejos y oculta las viejas.
 
-    return remapped
+    `targets` sale de `_remap_targets`. Cada marca se copia a sus bloques
+    destino y se oculta si su horario ya no es un bloque, con sentencias en
+    bloque:
+
+    - una lectura de las marcas a mover (las activas de miembros activos);
+    - una de lo que esos usuarios ya tienen en los bloques destino, incluidas
+      las ocultas, para restaurar en vez de duplicar (la última que se ocultó,
+      como `find_soft_deleted`);
+    - un UPDATE que restaura, un INSERT de las que faltan y un UPDATE que
+      oculta las viejas, todas con el mismo `deleted_at`.
+
+    Devuelve cuántas marcas se reubicaron.
+    """
+    missing = {
+        (weekday, start)
+        for weekday, starts in targets.values()
+        for start in starts
+        if (weekday, start) not in known
+    }
+    if missing:
+        _insert_ignoring_conflicts(
+            Availability,
+            [
+                {"group_id": group.id, "weekday": weekday, "start_minutes": minutes}
+                for weekday, minutes in sorted(missing)
+            ],
+            index_elements=["group_id", "weekday", "start_minutes"],
+        )
+        known = _availability_ids(group.id)
 
+    destinations = {
+        availability_id: {known[(weekday, start)] for start in starts}
+        for availability_id, (weekday, starts) in targets.items()
+    }
+    # Si el horario viejo sigue siendo un bloque, la marca se queda donde está
+    # y solo se copia a los demás; si no, se copia y se oculta.
+    to_hide = {
+        availability_id
+        for availability_id, destination_ids in destinations.items()
+        if availability_id not in destination_ids
+    }
+    for availability_id, destination_ids in destinations.items():
+        destination_ids.discard(availability_id)
 
-def _move_marks(group, row, targets, known):
-    """Copia las marcas de `row` a los bloques nuevos que cubren su horario."""
-    minutes = row.start_minutes
-    moved = 0
-    if not targets:
-        # El horario viejo no cae en ningún bloque nuevo (el rango se angostó o
-        # el día se apagó). Las marcas se dejan intactas: la grilla ya no las
-        # muestra, pero reaparecen tal cual si el admin vuelve a ampliar.
+    member_ids = active_member_ids_select(group.id)
+    marks = (
+        scheduler_db.session.query(UserAvailability.user_id, UserAvailability.availability_id)
+        .filter(UserAvailability.availability_id.in_(targets.keys()))
+        .filter(UserAvailability.user_id.in_(member_ids))
+        .all()
+    )
+    if not marks:
         return 0
+    # Fila del grupo antes que los bloques (ver app/slot_counts.py).
+    bump_group_revision(group.id)
 
-    member_ids = active_member_user_ids(group.id)
-    for mark in (
-        UserAvailability.query.filter_by(availability_id=row.id)
+    wanted = {
+        (user_id, destination)
+        for user_id, availability_id in marks
+        for destination in destinations[availability_id]
+    }
+    target_ids = set().union(*destinations.values())
+    active = set()
+    hidden = {}
+    for mark_id, user_id, availability_id, deleted_at in (
+        scheduler_db.session.query(
+            UserAvailability.id,
+            UserAvailability.user_id,
+            UserAvailability.availability_id,
+            UserAvailability.deleted_at,
+        )
+        .execution_options(**{INCLUDE_DELETED: True})
+        .filter(UserAvailability.availability_id.in_(target_ids))
         .filter(UserAvailability.user_id.in_(member_ids))
         .all()
     ):
-        for start in targets:
-            if start == minutes:
-                continue
-            target_row = _get_or_create_availability(group.id, row.weekday, start, known)
-            mark_user_available(mark.user_id, target_row.id)
-        if minutes not in targets:
-            # La marca vieja se oculta, no se borra: si el admin revierte el
-            # formato, este mismo remapeo la reconstruye desde la grilla actual.
-            mark.soft_delete()
-        moved += 1
-    return moved
-
-
-def get_availability_data(group_id, limit=AVAILABILITY_SUMMARY_LIMIT, user_ids=None):
+        pair = (user_id, availability_id)
+        if deleted_at is None:
+            active.add(pair)
+        elif pair not in hidden or deleted_at > hidden[pair][1]:
+            hidden[pair] = (mark_id, deleted_at)
+
+    pending = wanted - active
+    lost = _restore_marks({pair: hidden[pair][0] for pair in pending if pair in hidden})
+    to_insert = sorted(pair for pair in pending if pair not in hidden or pair in lost)
+
+    if to_insert:
+        _insert_ignoring_conflicts(
+            UserAvailability,
+            [
+                {"user_id": user_id, "availability_id": availability_id}
+                for user_id, availability_id in to_insert
+            ],
+            index_elements=["user_id", "availability_id"],
+            index_where=ACTIVE_ROWS,
+        )
+    if to_hide:
+        # La marca vieja se oculta, no se borra: si el admin revierte el
+        # formato, este mismo remapeo la reconstruye desde la grilla actual.
+        scheduler_db.session.execute(
+            update(UserAvailability)
+            .where(UserAvailability.availability_id.in_(to_hide))
+            .where(UserAvailability.user_id.in_(member_ids))
+            .where(UserAvailability.deleted_at.is_(None))
+            .values(deleted_at=_utcnow())
+        )
+    recount_slots({availability_id for _, availability_id in pending} | to_hide)
+    return len(marks)
+
+
+@group_cached("availability_data")
+def get_availability_data(
+    group_id, limit=AVAILABILITY_SUMMARY_LIMIT, user_ids=None, with_users=True
+):
     """Bloques del grupo con sus asistentes, del más concurrido al menos.
 
     `user_ids` acota el agregado a un subconjunto de miembros (el alcance de
     subgrupo de quien mira). Si es None se agregan todos los miembros activos.
+    Con `with_users=False` cada entrada trae solo el conteo y `users` vacío:
+    es lo que usa `groups.show`, que ya no lista las personas de cada bloque.
 
     Se resuelve en dos pasos para no traer todas las marcas del grupo en cada
-    page view: primero un GROUP BY que ordena los bloques por concurrencia y se
-    queda con los `limit` primeros, y recién después las marcas de esos bloques.
+    page view: primero los `limit` bloques más concurridos —leídos del contador
+    `attendee_count` para el grupo entero, o con un GROUP BY para un alcance
+    parcial— y recién después las marcas de esos bloques.
     El corte es por la cola (los bloques con menos gente), así que "los horarios
     en que pueden todos" —que es lo que la vista destaca— nunca se pierde.
+
+    Se cachea por revisión del grupo (`group_cached`).
     """
     if not group_id:
         return {}
 
-    member_ids = active_member_user_ids(group_id) if user_ids is None else set(user_ids)
-    if not member_ids:
-        return {}
-
-    top_blocks = (
-        scheduler_db.session.query(
-            Availability.id,
-            Availability.weekday,
-            Availability.start_minutes,
-            func.count(UserAvailability.id).label("count_users"),
+    if user_ids is None:
+        member_ids = active_member_ids_select(group_id)
+    else:
+        member_ids = set(user_ids)
+        if not member_ids:
+            return {}
+
+    group = scheduler_db.session.get(Group, group_id)
+    if group is not None and group.uses_interval_storage():
+        return _availability_data_from_bitmaps(group, member_ids, limit, with_users)
+
+    if user_ids is None:
+        # Todo el grupo: el conteo ya está guardado en el bloque
+        # (app/slot_counts.py) y el corte es un ORDER BY … LIMIT sobre índice.
+        top_blocks = (
+            scheduler_db.session.query(
+                Availability.id,
+                Availability.weekday,
+                Availability.start_minutes,
+                Availability.attendee_count,
+            )
+            .filter(Availability.group_id == group_id, Availability.attendee_count > 0)
+            .order_by(Availability.attendee_count.desc(), Availability.id.asc())
+            .limit(limit)
+            .all()
+        )
+    else:
+        # Un alcance parcial (subgrupo) no tiene contador propio: GROUP BY.
+        top_blocks = (
+            scheduler_db.session.query(
+                Availability.id,
+                Availability.weekday,
+                Availability.start_minutes,
+                func.count(UserAvailability.id).label("count_users"),
+            )
+            .join(UserAvailability, UserAvailability.availability_id == Availability.id)
+            .filter(Availability.group_id == group_id)
+            .filter(UserAvailability.user_id.in_(member_ids))
+            .group_by(Availability.id, Availability.weekday, Availability.start_minutes)
+            # `Availability.id` desempata: sin orden total el LIMIT devuelve
+            # bloques distintos entre requests con los mismos datos.
+            .order_by(func.count(UserAvailability.id).desc(), Availability.id.asc())
+            .limit(limit)
+            .all()
         )
-        .join(UserAvailability, UserAvailability.availability_id == Availability.id)
-        .filter(Availability.group_id == group_id)
-        .filter(UserAvailability.user_id.in_(member_ids))
-        .group_by(Availability.id, Availability.weekday, Availability.start_minutes)
-        # `Availability.id` desempata: sin orden total el LIMIT devuelve
-        # bloques distintos entre requests con los mismos datos.
-        .order_by(func.count(UserAvailability.id).desc(), Availability.id.asc())
-        .limit(limit)
-        .all()
-    )
     if not top_blocks:
         return {}
+    if not with_users:
+        return {
+            availability_id: {
+                "availability": SimpleNamespace(
+                    id=availability_id,
+                    weekday=weekday,
+                    start_minutes=start_minutes,
+                    group_id=group_id,
+                ),
+                "users": [],
+                "count_users": count_users,
+            }
+            for availability_id, weekday, start_minutes, count_users in top_blocks
+        }
 
     data = {
         availability_id: {
@@ -338,3 +845,169 @@ def get_availability_data(group_id, limit=AVAILABILITY_SUMMARY_LIMIT, user_ids=N
         entry["count_users"] = len(entry["users"])
 
     return data
+
+
+def _availability_data_from_bitmaps(group, member_ids, limit, with_users=True):
+    """`get_availability_data` para un grupo que guarda tramos.
+
+    No hay bloques con contador: se cuentan las celdas sobre los bitmaps
+    (proyectados desde los tramos) y se arman las mismas entradas. La clave es
+    el índice de la celda; `availability.id` va en None porque no hay fila.
+    """
+    blocks = group.block_starts()
+    if not blocks:
+        return {}
+    blocks_per_day = len(blocks)
+    bitmaps = load_bitmaps(group, member_ids)
+    counts = count_cells(bitmaps.values(), day_mask(blocks_per_day, range(7)))
+    top = sorted(counts, key=lambda index: (-counts[index], index))[:limit]
+
+    data = {}
+    for index in top:
+        weekday, block_index = divmod(index, blocks_per_day)
+        data[index] = {
+            "availability": SimpleNamespace(
+                id=None, weekday=weekday, start_minutes=blocks[block_index], group_id=group.id
+            ),
+            "users": (
+                sorted(user_id for user_id, bits in bitmaps.items() if bits >> index & 1)
+                if with_users
+                else []
+            ),
+            "count_users": counts[index],
+        }
+    return data
+
+
+def grid_payload(group, user_ids):
+    """La grilla del grupo para el heatmap de `groups.show`, en compacto.
+
+    Antes la vista embebía una fila `[user_id, weekday, start_minutes]` por
+    marca y pintaba un chip por miembro en cada celda: con bloques de 5
+    minutos y mil miembros eran megas de JSON y de DOM. Ahora viaja:
+
+    - `counts`: cuántos miembros marcó cada celda, un uint16 little-endian por
+      celda en el orden de los bits (`weekday * bloques_por_día + bloque`), en
+      base64. Alcanza para pintar el heatmap sin decodificar nada más.
+    - `user_ids` / `bitmaps`: el bitmap de cada miembro que marcó algo, en la
+      misma codificación que `availability_bitmap` y en base64, para que los
+      filtros por categoría o subgrupo recuenten en el cliente.
+
+    Quién está en una celda no viaja: lo pide el cliente al pasar el mouse
+    (ver `cell_user_ids`).
+    """
+    bitmaps = load_bitmaps(group, user_ids)
+    blocks = group.block_starts()
+    blocks_per_day = len(blocks)
+    user_ids = sorted(user_id for user_id, bits in bitmaps.items() if bits)
+    counts = count_cells(
+        (bitmaps[user_id] for user_id in user_ids), day_mask(blocks_per_day, range(7))
+    )
+    raw_counts = b"".join(
+        min(counts.get(index, 0), 0xFFFF).to_bytes(2, "little")
+        for index in range(7 * blocks_per_day)
+    )
+    return {
+        "block_starts": blocks,
+        "block_minutes": group.block_minutes,
+        "weekdays": group.get_active_weekdays(),
+        "counts": b64encode(raw_counts).decode("ascii"),
+        "user_ids": user_ids,
+        "bitmaps": [
+            b64encode(encode_bits(bitmaps[user_id], blocks_per_day)).decode("ascii")
+            for user_id in user_ids
+        ],
+    }
+
+
+def cell_user_ids(group, user_ids, weekday, block_index):
+    """Ids de `user_ids` que marcaron la celda `(weekday, block_index)`, ordenados."""
+    blocks_per_day = len(group.block_starts())
+    if not 0 <= weekday < 7 or not 0 <= block_index < blocks_per_day:
+        return []
+    index = weekday * blocks_per_day + block_index
+    return sorted(
+        user_id for user_id, bits in load_bitmaps(group, user_ids).items() if bits >> index & 1
+    )
+
+
+def category_member_user_ids(group_id, category_id):
+    """Ids de miembros activos del grupo que tienen la categoría."""
+    return {
+        user_id
+        for (user_id,) in scheduler_db.session.query(GroupMember.user_id)
+        .join(GroupMemberCategory, GroupMemberCategory.group_member_id == GroupMember.id)
+        .filter(GroupMember.group_id == group_id)
+        .filter(GroupMemberCategory.category_id == category_id)
+        .all()
+    }
+
+
+def subgroup_member_user_ids(group_id, subgroup_id):
+    """Ids de miembros activos del grupo que pertenecen al subgrupo."""
+    members = {
+        user_id
+        for (user_id,) in scheduler_db.session.query(SubGroupMember.user_id)
+        .join(SubGroup, SubGroup.id == SubGroupMember.subgroup_id)
+        .filter(SubGroup.parent_group_id == group_id)
+        .filter(SubGroupMember.subgroup_id == subgroup_id)
+        .all()
+    }
+    return members & active_member_user_ids(group_id)
+
+
+def resolve_quorum(quorum, member_count):
+    """Cantidad mínima de asistentes a partir de "3" (absoluto) o "60%".
+
+    El porcentaje se redondea hacia arriba: 60% de 7 son 5, no 4. Solo se
+    acepta un decimal simple antes del "%" ("60", "33.5"): `Fraction` también
+    leería "1/0" y reventaría con ZeroDivisionError. Lanza ValueError si el
+    valor no es un entero positivo ni un porcentaje en (0, 100].
+    """
+    text = str(quorum).strip()
+    if text.endswith("%"):
+        if not _PERCENT_RE.fullmatch(text[:-1]):
+            raise ValueError("quorum inválido")
+        percent = Fraction(text[:-1])
+        if not 0 < percent <= 100:
+            raise ValueError("quorum fuera de rango")
+        return max(1, math.ceil(percent * member_count / 100))
+    value = int(text)
+    if value < 1:
+        raise ValueError("quorum fuera de rango")
+    return value
+
+
+def find_meeting_windows(group, user_ids, length, quorum, limit=10):
+    """Mejores ventanas de `length` bloques seguidos para reunir a `user_ids`.
+
+    Es lo que antes el admin buscaba a ojo en el resumen de 200 bloques: con
+    grillas de 5 minutos una reunión de una hora son 12 bloques que tienen que
+    coincidir. Trabaja sobre los bitmaps (`app/services/availability_bitmap.py`):
+    por miembro se calculan en O(log length) los inicios de sus rachas libres y
+    se suman todos con un contador en rebanadas de bits, así que el costo va
+    con los miembros, no con miembros × celdas.
+
+    `quorum` es el mínimo de asistentes ya resuelto (ver `resolve_quorum`).
+    Solo cuentan los días visibles y ninguna ventana cruza de un día a otro.
+    Devuelve una lista de dicts de la ventana más concurrida a la menos.
+    """
+    blocks = group.block_starts()
+    if not user_ids or not blocks:
+        return []
+
+    bitmaps = load_bitmaps(group, user_ids)
+    windows = best_windows(bitmaps, len(blocks), group.get_active_weekdays(), length, quorum, limit)
+    return [
+        {
+            "weekday": weekday,
+            "block_index": block_index,
+            "start_minutes": blocks[block_index],
+            "end_minutes": blocks[block_index] + length * group.block_minutes,
+            "start": format_minutes(blocks[block_index]),
+            "end": format_minutes(blocks[block_index] + length * group.block_minutes),
+            "count": len(attendees),
+            "user_ids": attendees,
+        }
+        for weekday, block_index, attendees in windows
+    ]
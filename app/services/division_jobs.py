@@ -0,0 +1,256 @@
+"""División automática en segundo plano: la cola de DivisionJob y quien la corre.
+
+`subgroups.generate` corría el solver entero dentro de la request, y gunicorn
+atiende con `--workers 1 --threads 4`: dos admins dividiendo grupos grandes
+dejaban al servidor con la mitad de sus hilos. Ahora la request solo deja el
+job en "queued" y un ThreadPoolExecutor del proceso (DIVISION_JOB_THREADS
+hilos) lo corre. El navegador sondea el job hasta que termina.
+
+El estado vive en la fila, no en memoria: cada transición es un UPDATE
+condicionado al estado esperado (`_move_job`). Así un job lo toma un solo hilo
+aunque se encole dos veces, y cancelar es pasar la fila a "cancelled": el
+solver se entera en su próximo aviso de avance, cuando su UPDATE no encuentra
+la fila en "running", y se corta con DivisionCancelled.
+
+Puede haber varios procesos web sobre la misma base (workers de gunicorn,
+reciclados, instancias). Quien toma un job anota su `owner` (`_OWNER`, único
+por proceso) y renueva `heartbeat_at` en cada aviso de avance; los UPDATE del
+avance van condicionados a ese dueño, así que si otro proceso le retoma el job
+el primero se corta como si lo hubieran cancelado. Al arrancar (lo llama
+run.py), `resume_division_jobs` vuelve a encolar solo los "running" cuyo
+último aviso tiene más de DIVISION_JOB_STALE_SECONDS: los de un proceso que
+murió, no los de uno que sigue vivo.
+
+Con DIVISION_JOBS_ASYNC apagado el job corre en el mismo hilo apenas se
+encola (lo usan los tests). Ninguna función acá commitea salvo las que corren
+el job, que manejan su propia sesión.
+"""
+
+import multiprocessing
+import os
+import secrets
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.extensions import scheduler_db
+from app.models.mixins import _utcnow
+from app.models.subgroup import (
+    JOB_CANCELLED,
+    JOB_FAILED,
+    JOB_PENDING,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    UNFINISHED_JOB_STATUSES,
+    DivisionJob,
+)
+from app.services.subgroup_service import (
+    SubGroupService,
+    compact_division_result,
+    prune_division_jobs,
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Dueño de los jobs que corre este proceso: host y pid, más un sufijo por si el
+# pid se reusa en otra instancia con el mismo nombre de host.
+_OWNER = f"{socket.gethostname()[:40]}:{os.getpid()}:{secrets.token_hex(4)}"
+
+
+class DivisionCancelled(Exception):
+    """El job dejó de estar en "running" mientras el solver corría."""
+
+
+def _get_executor(app):
+    global _executor  # pylint: disable=global-statement
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config["DIVISION_JOB_THREADS"],
+                thread_name_prefix="division-job",
+            )
+        return _executor
+
+
+def _move_job(job_id, expected, owned_by=None, **values):
+    """UPDATE del job solo si sigue en `expected` (uno o varios estados). True si lo tocó.
+
+    Con `owned_by`, además solo si lo sigue corriendo ese proceso.
+    """
+    expected = (expected,) if isinstance(expected, str) else expected
+    statement = update(DivisionJob).where(
+        DivisionJob.id == job_id, DivisionJob.status.in_(expected)
+    )
+    if owned_by is not None:
+        statement = statement.where(DivisionJob.owner == owned_by)
+    result = scheduler_db.session.execute(statement.values(**values))
+    return result.rowcount == 1
+
+
+def enqueue_division_job(group_id, user_id, config):
+    """Crea el job en "queued" y poda los viejos. No commitea.
+
+    El job recién existe para el hilo después del commit: ahí va
+    `submit_division_job`.
+    """
+    job = DivisionJob(
+        parent_group_id=group_id,
+        created_by=user_id,
+        config_json=config,
+        status=JOB_QUEUED,
+    )
+    scheduler_db.session.add(job)
+    scheduler_db.session.flush()
+    prune_division_jobs(group_id)
+    return job
+
+
+def submit_division_job(app, job_id):
+    """Manda el job al pool del proceso, o lo corre acá con DIVISION_JOBS_ASYNC apagado."""
+    if not app.config["DIVISION_JOBS_ASYNC"]:
+        run_division_job(app, job_id)
+        return
+    _get_executor(app).submit(run_division_job, app, job_id)
+
+
+def cancel_division_job(job):
+    """Pasa a "cancelled" un job que todavía no terminó. No commitea.
+
+    Devuelve False si ya había terminado (o lo estaba haciendo justo ahora).
+    """
+    return _move_job(job.id, UNFINISHED_JOB_STATUSES, status=JOB_CANCELLED)
+
+
+def run_division_job(app, job_id):
+    """Corre un job encolado con su propio app context y su propia sesión."""
+    with app.app_context():
+        try:
+            _run(app, job_id)
+        finally:
+            scheduler_db.session.remove()
+
+
+def _run(app, job_id):
+    job = scheduler_db.session.get(DivisionJob, job_id)
+    # Borrado (o podado) mientras esperaba, o ya lo tomó otro hilo u otro
+    # proceso: el UPDATE condicionado a "queued" lo gana uno solo.
+    now = _utcnow()
+    if job is None or not _move_job(
+        job_id,
+        JOB_QUEUED,
+        status=JOB_RUNNING,
+        progress=0,
+        started_at=now,
+        owner=_OWNER,
+        heartbeat_at=now,
+    ):
+        scheduler_db.session.rollback()
+        return
+    group_id, config = job.parent_group_id, dict(job.config_json)
+    scheduler_db.session.commit()
+
+    def progress(fraction, preview):
+        values = {"progress": min(99, max(0, int(fraction * 100))), "heartbeat_at": _utcnow()}
+        if preview is not None:
+            values["result_json"] = compact_division_result(preview)
+        # Cancelado, o retomado por otro proceso que lo dio por abandonado.
+        if not _move_job(job_id, JOB_RUNNING, owned_by=_OWNER, **values):
+            raise DivisionCancelled()
+        scheduler_db.session.commit()
+
+    try:
+        preview = SubGroupService(group_id).generate_subgroups(
+            config,
+            search_seconds=app.config["DIVISION_SEARCH_SECONDS"],
+            restarts=app.config["DIVISION_RESTARTS"],
+            workers=app.config["DIVISION_WORKERS"],
+            progress=progress,
+        )
+    except DivisionCancelled:
+        scheduler_db.session.rollback()
+        return
+    except ValueError as error:
+        # Mensaje de validación del servicio, pensado para el usuario.
+        scheduler_db.session.rollback()
+        _move_job(job_id, JOB_RUNNING, owned_by=_OWNER, status=JOB_FAILED, error=str(error)[:255])
+        scheduler_db.session.commit()
+        return
+    except Exception:  # pylint: disable=broad-except
+        # Nadie espera a este hilo: si no se marca, el job queda en "running"
+        # y el navegador sondeando para siempre.
+        scheduler_db.session.rollback()
+        app.logger.exception("Falló el job de división %s", job_id)
+        _move_job(
+            job_id,
+            JOB_RUNNING,
+            owned_by=_OWNER,
+            status=JOB_FAILED,
+            error="No se pudo generar la división.",
+        )
+        scheduler_db.session.commit()
+        return
+
+    _move_job(
+        job_id,
+        JOB_RUNNING,
+        owned_by=_OWNER,
+        status=JOB_PENDING,
+        progress=100,
+        result_json=compact_division_result(preview),
+    )
+    scheduler_db.session.commit()
+
+
+def resume_division_jobs(app):
+    """Vuelve a encolar los jobs que un proceso muerto dejó sin terminar.
+
+    Un "running" es de un proceso muerto si su último aviso (o su arranque,
+    si todavía no avisó) tiene más de DIVISION_JOB_STALE_SECONDS: vuelve a
+    "queued" y se manda al pool junto con los que ni habían arrancado, en el
+    orden en que se pidieron. Los "queued" pueden estar también en el pool de
+    otro proceso vivo; los corre el primero que los toma (ver `_run`).
+    Devuelve sus ids.
+    """
+    # Los procesos "spawn" del multi-arranque vuelven a importar el módulo
+    # principal (run.py si se levantó con `python run.py`): ahí no se retoma
+    # nada, o devolverían a la cola el job que su propio padre está corriendo.
+    if multiprocessing.parent_process() is not None:
+        return []
+
+    with app.app_context():
+        last_seen = func.coalesce(DivisionJob.heartbeat_at, DivisionJob.started_at)
+        cutoff = _utcnow() - timedelta(seconds=app.config["DIVISION_JOB_STALE_SECONDS"])
+        try:
+            scheduler_db.session.execute(
+                update(DivisionJob)
+                .where(
+                    DivisionJob.status == JOB_RUNNING,
+                    or_(last_seen.is_(None), last_seen < cutoff),
+                )
+                .values(
+                    status=JOB_QUEUED, progress=0, started_at=None, owner=None, heartbeat_at=None
+                )
+            )
+            job_ids = scheduler_db.session.scalars(
+                select(DivisionJob.id)
+                .where(DivisionJob.status == JOB_QUEUED)
+                .order_by(DivisionJob.id)
+            ).all()
+            scheduler_db.session.commit()
+        except SQLAlchemyError:
+            # Base sin migrar todavía (primer arranque en desarrollo): no hay
+            # nada que retomar y no es motivo para no levantar.
+            scheduler_db.session.rollback()
+            app.logger.warning("No se pudieron retomar los jobs de división pendientes.")
+            return []
+        finally:
+            scheduler_db.session.remove()
+
+    for job_id in job_ids:
+        submit_division_job(app, job_id)
+    return job_ids
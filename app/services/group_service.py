@@ -7,7 +7,9 @@ HTTP. Ninguna función commitea: la transacción la maneja la ruta que llama.
 from sqlalchemy import func
 from sqlalchemy.orm import selectinload
 
+from app.cache import group_cached
 from app.extensions import scheduler_db
+from app.group_revision import bump_group_revision
 from app.models import (
     Availability,
     Category,
@@ -30,7 +32,11 @@ from app.permissions import (
     LEVEL_PERMISSIONS,
     PERM_VIEW_AVAILABILITY,
 )
-from app.soft_delete import INCLUDE_DELETED, find_soft_deleted, restore_batch
+from app.services.availability_bitmap import load_bitmaps, popcount
+from app.services.availability_intervals import responded_user_ids
+from app.services.availability_service import active_member_ids_select
+from app.slot_counts import recount_group_slots
+from app.soft_delete import INCLUDE_DELETED, find_soft_deleted, restore_batch, soft_delete_where
 
 # ---------------------------------------------------------------------------
 # group lifecycle
@@ -91,6 +97,19 @@ def leave_group(group, user_id):
     return membership
 
 
+def delete_group(group):
+    """Manda el grupo a la papelera con toda su cascada. No commitea.
+
+    Miembros, categorías, subgrupos, jobs y sus hijos se ocultan con un UPDATE
+    por tabla (`soft_delete_where`), sin cargarlos. Como eso no pasa por el
+    flush, el contador de asistentes y la revisión se actualizan acá;
+    `restore_batch` los devuelve por el flush, miembro por miembro.
+    """
+    soft_delete_where(Group, Group.id == group.id)
+    recount_group_slots(group.id)
+    bump_group_revision(group.id)
+
+
 # ---------------------------------------------------------------------------
 # roles & permissions
 # ---------------------------------------------------------------------------
@@ -206,8 +225,25 @@ def counts_by_model(model, group_ids):
     )
 
 
-def get_responded_user_ids(group_id, visible_user_ids):
-    """IDs de usuarios con al menos una marca de disponibilidad activa en el grupo."""
+def _stores_intervals(group_id):
+    """True si el grupo guarda su disponibilidad como tramos.
+
+    `session.get` sale del identity map cuando la ruta ya cargó el grupo.
+    """
+    group = scheduler_db.session.get(Group, group_id)
+    return group is not None and group.uses_interval_storage()
+
+
+def get_responded_user_ids(group_id, visible_user_ids=None):
+    """IDs de usuarios con al menos una marca de disponibilidad activa en el grupo.
+
+    `visible_user_ids` acota a un subconjunto; None son todos los miembros
+    activos, filtrados por subconsulta (`active_member_ids_select`).
+    """
+    if visible_user_ids is None:
+        visible_user_ids = active_member_ids_select(group_id)
+    if _stores_intervals(group_id):
+        return responded_user_ids(group_id, visible_user_ids)
     return {
         user_id
         for (user_id,) in (
@@ -221,12 +257,23 @@ def get_responded_user_ids(group_id, visible_user_ids):
     }
 
 
-def get_member_availability_counts(group_id, user_ids):
+def get_member_availability_counts(group_id, user_ids=None):
     """Conteo de bloques disponibles por usuario. Usado en el CSV export.
 
     Un GROUP BY para todo el grupo en vez de un COUNT por miembro: antes el
-    export era O(miembros) consultas.
+    export era O(miembros) consultas. Si el grupo guarda tramos se cuentan las
+    celdas de la grilla actual que pisan (el popcount del bitmap). Con
+    `user_ids` None cuenta a todos los miembros activos, por subconsulta.
     """
+    if user_ids is None:
+        user_ids = active_member_ids_select(group_id)
+    if _stores_intervals(group_id):
+        group = scheduler_db.session.get(Group, group_id)
+        return {
+            user_id: popcount(bits)
+            for user_id, bits in load_bitmaps(group, user_ids).items()
+            if bits
+        }
     return dict(
         scheduler_db.session.query(UserAvailability.user_id, func.count(UserAvailability.id))
         .join(Availability, UserAvailability.availability_id == Availability.id)
@@ -289,23 +336,6 @@ def get_removed_members(group_id, limit=500):
     )
 
 
-def get_user_availability_data(group_id, user_ids):
-    """(user_id, weekday, start_minutes) para los usuarios dados.
-
-    user_ids puede ser un int (un solo usuario) o un iterable de ints.
-    """
-    q = (
-        scheduler_db.session.query(
-            UserAvailability.user_id, Availability.weekday, Availability.start_minutes
-        )
-        .join(Availability, UserAvailability.availability_id == Availability.id)
-        .filter(Availability.group_id == group_id)
-    )
-    if isinstance(user_ids, int):
-        return q.filter(UserAvailability.user_id == user_ids).all()
-    return q.filter(UserAvailability.user_id.in_(user_ids)).all()
-
-
 def get_group_categories(group_id):
     """Categorías activas del grupo."""
     return Category.query.filter_by(group_id=group_id).all()
@@ -400,7 +430,15 @@ def get_subgroups_for_show(group_id, scope_user_ids, current_user_id):
 
     Devuelve (group_subgroups, user_subgroup_map).
     Con scope_user_ids no None, filtra a los subgrupos que contienen al usuario.
+    Se cachea por revisión del grupo; sin alcance la respuesta es la misma para
+    todos, así que no se guarda una por persona.
     """
+    viewer_id = current_user_id if scope_user_ids is not None else None
+    return _subgroups_for_show(group_id, scope_user_ids, viewer_id)
+
+
+@group_cached("subgroups_for_show")
+def _subgroups_for_show(group_id, scope_user_ids, current_user_id):
     subgroups = (
         SubGroup.query.filter_by(parent_group_id=group_id)
         .options(selectinload(SubGroup.members))
@@ -3,18 +3,103 @@ Servicio para dividir grupos en subgrupos optimizados
 basados en compatibilidad horaria y reglas de categorías.
 """
 
-from collections import defaultdict
+import multiprocessing
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
-from sqlalchemy import func
-from sqlalchemy.orm import contains_eager, selectinload
+import numpy as np
+from sqlalchemy import func, insert
+from sqlalchemy.orm import selectinload
 
 from app.extensions import scheduler_db
+from app.group_revision import bump_group_revision, get_group_revision
 from app.models.availability import Availability
+from app.models.category import Category
+from app.models.group import Group
 from app.models.group_member import GroupMember
 from app.models.group_member_category import GroupMemberCategory
-from app.models.subgroup import DivisionJob, SubGroup, SubGroupMember
+from app.models.mixins import _utcnow
+from app.models.subgroup import (
+    JOB_CONFIRMED,
+    JOB_UNDONE,
+    UNFINISHED_JOB_STATUSES,
+    DivisionJob,
+    SubGroup,
+    SubGroupMember,
+)
+from app.models.user import User
 from app.models.user_availability import UserAvailability
-from app.soft_delete import find_soft_deleted
+from app.services.availability_bitmap import encode_bits, intersect, load_bitmaps, popcount
+from app.services.availability_service import active_member_ids_select
+from app.soft_delete import find_soft_deleted, soft_delete_where
+
+# Entradas de la caché de datos del solver (ver `SubGroupService.load_cached`):
+# una por grupo, las menos usadas salen primero.
+SNAPSHOT_CACHE_SIZE = 8
+_snapshot_cache = OrderedDict()
+_snapshot_cache_lock = threading.Lock()
+
+
+def reset_solver_cache():
+    """Vacía la caché de datos del solver (la usan los tests entre corridas)."""
+    with _snapshot_cache_lock:
+        _snapshot_cache.clear()
+
+
+class _GroupState:
+    """Un subgrupo en construcción con sus agregados al día.
+
+    Lleva la intersección de bloques de sus miembros y cuántos cumplen cada
+    condición de las reglas, así que probar una unidad más es un AND sobre el
+    bitmap y una suma por condición, sin recorrer a los miembros. Cada unidad
+    trae los suyos precalculados (`unit["blocks"]`, `unit["condition_counts"]`,
+    ver `SubGroupService._profile_units`).
+    """
+
+    def __init__(self, condition_count: int):
+        self.units = []
+        self.size = 0
+        # None mientras no tenga miembros: la intersección de nadie no es 0.
+        self.blocks = None
+        self.counts = [0] * condition_count
+
+    def blocks_with(self, unit: dict) -> int:
+        """Intersección de bloques que tendría el grupo con `unit` adentro."""
+        return unit["blocks"] if self.blocks is None else self.blocks & unit["blocks"]
+
+    def counts_with(self, unit: dict) -> list[int]:
+        """Cuántos cumplirían cada condición con `unit` adentro."""
+        return [
+            count + extra
+            for count, extra in zip(self.counts, unit["condition_counts"], strict=True)
+        ]
+
+    def holds(self, unit: dict) -> bool:
+        return any(current is unit for current in self.units)
+
+    def blocks_without(self, unit: dict) -> int | None:
+        """Intersección de bloques que quedaría al sacar `unit` (None si queda vacío)."""
+        others = [current["blocks"] for current in self.units if current is not unit]
+        return intersect(others) if others else None
+
+    def add(self, unit: dict) -> None:
+        self.blocks = self.blocks_with(unit)
+        self.counts = self.counts_with(unit)
+        self.size += len(unit["member_ids"])
+        self.units.append(unit)
+
+    def remove(self, unit: dict) -> None:
+        # El AND no se deshace: la intersección se rehace con las que quedan.
+        self.units.remove(unit)
+        self.size -= len(unit["member_ids"])
+        self.counts = [
+            count - extra
+            for count, extra in zip(self.counts, unit["condition_counts"], strict=True)
+        ]
+        self.blocks = intersect(u["blocks"] for u in self.units) if self.units else None
 
 
 class SubGroupService:
@@ -23,6 +108,28 @@ class SubGroupService:
     """
 
     NO_CATEGORY_TOKEN = "__NO_CATEGORY__"
+    # Semilla fija: la misma configuración con el mismo presupuesto explora lo mismo.
+    SEARCH_SEED = 0
+    # Movimientos al azar con los que se sacude un óptimo local para seguir buscando.
+    SEARCH_KICKS = 3
+    # Sacudidas seguidas sin superar a la mejor división tras las que la
+    # búsqueda local se da por terminada aunque le quede tiempo.
+    SEARCH_PATIENCE = 10
+    # Cada cuánto la búsqueda local informa su avance a `progress`.
+    PROGRESS_SECONDS = 0.5
+    # Lo que el solver necesita de la BD; es lo que viaja a los procesos del
+    # modo multi-arranque (la matriz de compatibilidad no: el solver no la lee).
+    SNAPSHOT_FIELDS = (
+        "parent_group_id",
+        "members",
+        "user_categories",
+        "category_bits",
+        "user_category_masks",
+        "user_availability_count",
+        "user_available_blocks",
+    )
+    # Lo que guarda la caché entre divisiones: el snapshot más la matriz.
+    CACHED_FIELDS = SNAPSHOT_FIELDS + ("compatibility_matrix", "user_index")
 
     def __init__(self, parent_group_id: int):
         """
@@ -33,9 +140,15 @@ class SubGroupService:
         """
         self.parent_group_id = parent_group_id
         self.members = []
-        self.compatibility_matrix = {}
+        self.compatibility_matrix = np.zeros((0, 0), dtype=np.int32)
+        self.user_index = {}
         self.user_categories = {}
+        # Cada nombre de categoría es un bit; quien no tiene ninguna lleva el de
+        # NO_CATEGORY_TOKEN. Las condiciones se evalúan sobre estas máscaras.
+        self.category_bits = {self.NO_CATEGORY_TOKEN: 1}
+        self.user_category_masks = {}
         self.user_availability_count = {}
+        self.user_available_blocks = {}
         self.manual_together_groups = []
 
     def load_members(self):
@@ -54,17 +167,18 @@ class SubGroupService:
         )
 
         # Conteo de bloques por usuario en una sola consulta: dentro del bucle
-        # era un SELECT por miembro.
-        avail_counts = dict(
-            scheduler_db.session.query(UserAvailability.user_id, func.count(UserAvailability.id))
-            .join(Availability, UserAvailability.availability_id == Availability.id)
-            .filter(
-                UserAvailability.user_id.in_([m.user_id for m in members]),
-                Availability.group_id == self.parent_group_id,
-            )
-            .group_by(UserAvailability.user_id)
-            .all()
-        )
+        # era un SELECT por miembro. Un grupo que guarda tramos no tiene filas
+        # por bloque: el conteo sale de las celdas que pisan (el bitmap). Los
+        # miembros son todos los activos: van por subconsulta, no como lista.
+        parent = scheduler_db.session.get(Group, self.parent_group_id)
+        member_ids = active_member_ids_select(self.parent_group_id)
+        if parent is not None and parent.uses_interval_storage():
+            avail_counts = {
+                user_id: popcount(bits)
+                for user_id, bits in load_bitmaps(parent, member_ids).items()
+            }
+        else:
+            avail_counts = self._mark_counts(member_ids)
 
         self.members = []
         for member in members:
@@ -73,6 +187,7 @@ class SubGroupService:
             category_names = {mc.category.name for mc in member.categories if mc.category}
 
             self.user_categories[member.user_id] = category_names
+            self.user_category_masks[member.user_id] = self._user_mask(category_names)
 
             # Disponibilidades del usuario en este grupo
             avail_count = avail_counts.get(member.user_id, 0)
@@ -90,53 +205,55 @@ class SubGroupService:
                 }
             )
 
-    def calculate_compatibility_matrix(self):
-        """
-        Calcula la matriz de compatibilidad horaria entre todos los usuarios.
-        La compatibilidad se mide ahora como el número de bloques en común
-        entre los usuarios.
-
-        Returns:
-            Dict con pares de usuarios y su compatibilidad (conteo de bloques comunes)
-        """
-        user_ids = [m["id"] for m in self.members]
-
-        # Cargar todas las disponibilidades de una vez. contains_eager reutiliza
-        # el join para poblar avail.availability y evita un SELECT por fila.
-        availabilities = (
-            UserAvailability.query.join(UserAvailability.availability)
-            .options(contains_eager(UserAvailability.availability))
+    def _mark_counts(self, member_ids):
+        """{user_id: marcas activas} de los miembros en el grupo, en un GROUP BY."""
+        return dict(
+            scheduler_db.session.query(UserAvailability.user_id, func.count(UserAvailability.id))
+            .join(Availability, UserAvailability.availability_id == Availability.id)
             .filter(
-                UserAvailability.user_id.in_(user_ids),
+                UserAvailability.user_id.in_(member_ids),
                 Availability.group_id == self.parent_group_id,
             )
+            .group_by(UserAvailability.user_id)
             .all()
         )
 
-        # Organizar por usuario
-        user_avails = defaultdict(set)
-        for avail in availabilities:
-            # Crear identificador único para el slot (día + hora)
-            slot_id = f"{avail.availability.weekday}_{avail.availability.start_minutes}"
-            user_avails[avail.user_id].add(slot_id)
+    def calculate_compatibility_matrix(self):
+        """
+        Calcula la matriz de compatibilidad horaria entre todos los usuarios.
+        La compatibilidad se mide como el número de bloques en común entre
+        cada par de usuarios.
 
-        # Calcular compatibilidad entre cada par
-        self.compatibility_matrix = {}
+        Los bitmaps se despliegan en una matriz usuarios × celdas de 0/1 y los
+        bloques comunes de todos los pares salen de un solo producto
+        `A @ A.T`. La fila y columna de cada usuario es `user_index[user_id]`.
 
-        for i, user1_id in enumerate(user_ids):
-            for user2_id in user_ids[i + 1 :]:
-                avails1 = user_avails[user1_id]
-                avails2 = user_avails[user2_id]
+        Returns:
+            Array n × n (int32) con el conteo de bloques comunes de cada par
+        """
+        user_ids = [m["id"] for m in self.members]
+        self.user_index = {user_id: index for index, user_id in enumerate(user_ids)}
 
-                if not avails1 or not avails2:
-                    common = 0
-                else:
-                    # Conteo de bloques comunes
-                    common = len(avails1 & avails2)
+        group = scheduler_db.session.get(Group, self.parent_group_id)
+        user_avails = (
+            load_bitmaps(group, active_member_ids_select(group.id)) if group is not None else {}
+        )
+        blocks_per_day = len(group.block_starts()) if group is not None else 0
 
-                # Guardar en ambas direcciones
-                self.compatibility_matrix[(user1_id, user2_id)] = common
-                self.compatibility_matrix[(user2_id, user1_id)] = common
+        # Un byte por cada 8 celdas, una fila por usuario; unpackbits lo deja
+        # en 0/1 con el bit i en la columna i (mismo orden que encode_bits).
+        row_size = (7 * blocks_per_day + 7) // 8
+        raw = b"".join(
+            encode_bits(user_avails.get(user_id, 0), blocks_per_day) for user_id in user_ids
+        )
+        cells = np.unpackbits(
+            np.frombuffer(raw, dtype=np.uint8).reshape(len(user_ids), row_size),
+            axis=1,
+            bitorder="little",
+        )
+        # Las celdas que nadie marcó no suman a ningún par: fuera del producto.
+        cells = cells[:, cells.any(axis=0)].astype(np.float32)
+        self.compatibility_matrix = (cells @ cells.T).astype(np.int32)
 
         # Guardar también los bloques disponibles de cada usuario para calcular
         # intersecciones globales
@@ -153,11 +270,75 @@ class SubGroupService:
             user2_id: ID del segundo usuario
 
         Returns:
-            Valor de compatibilidad (0.0 - 1.0)
+            Bloques en común del par (1.0 para un usuario consigo mismo)
         """
         if user1_id == user2_id:
             return 1.0
-        return self.compatibility_matrix.get((user1_id, user2_id), 0.0)
+        index1 = self.user_index.get(user1_id)
+        index2 = self.user_index.get(user2_id)
+        if index1 is None or index2 is None:
+            return 0.0
+        return int(self.compatibility_matrix[index1, index2])
+
+    def _matrix_indexes(self, user_ids: list[int]) -> list[int]:
+        """Filas de la matriz de los usuarios dados (los que no están, fuera)."""
+        return [self.user_index[u] for u in user_ids if u in self.user_index]
+
+    def _cross_compatibility(self, user_ids_a: list[int], user_ids_b: list[int]) -> int:
+        """Suma de la compatibilidad de cada usuario de `a` con cada uno de `b`."""
+        rows, cols = self._matrix_indexes(user_ids_a), self._matrix_indexes(user_ids_b)
+        if not rows or not cols:
+            return 0
+        return int(self.compatibility_matrix[np.ix_(rows, cols)].sum(dtype=np.int64))
+
+    def _internal_compatibility(self, user_ids: list[int]) -> int:
+        """Suma de la compatibilidad de cada par distinto dentro de `user_ids`."""
+        indexes = self._matrix_indexes(user_ids)
+        block = self.compatibility_matrix[np.ix_(indexes, indexes)]
+        # La submatriz cuenta cada par dos veces; la diagonal no es un par.
+        return int(block.sum(dtype=np.int64) - np.trace(block, dtype=np.int64)) // 2
+
+    def _category_mask(self, category_names) -> int:
+        """Máscara con el bit de cada categoría; las que no tenían bit reciben uno."""
+        mask = 0
+        for name in category_names:
+            bit = self.category_bits.get(name)
+            if bit is None:
+                bit = self.category_bits[name] = 1 << len(self.category_bits)
+            mask |= bit
+        return mask
+
+    def _user_mask(self, category_names) -> int:
+        """Máscara de un usuario: sus categorías, o NO_CATEGORY_TOKEN si no tiene."""
+        return self._category_mask(category_names or (self.NO_CATEGORY_TOKEN,))
+
+    def _member_mask(self, member: dict) -> int:
+        mask = self.user_category_masks.get(member["id"])
+        return mask if mask is not None else self._user_mask(member["categories"])
+
+    def compile_condition(self, condition: dict) -> tuple[int, str]:
+        """
+        Traduce una condición a (máscara de sus categorías, operador).
+
+        Con la condición compilada, evaluar a un usuario es una operación sobre
+        enteros (ver `_mask_matches`) en lugar de armar sets por llamada.
+        """
+        return (
+            self._category_mask(condition.get("categories", [])),
+            condition.get("operator", "AND"),
+        )
+
+    @staticmethod
+    def _mask_matches(user_mask: int, compiled: tuple[int, str]) -> bool:
+        mask, operator = compiled
+        if operator == "AND":
+            # El usuario debe tener TODAS las categorías
+            return user_mask & mask == mask
+        elif operator == "OR":
+            # El usuario debe tener AL MENOS una categoría
+            return bool(user_mask & mask)
+
+        return False
 
     def user_matches_condition(self, user_categories: set[str], condition: dict) -> bool:
         """
@@ -170,17 +351,9 @@ class SubGroupService:
         Returns:
             True si el usuario cumple la condición
         """
-        required_categories = set(condition["categories"])
-        operator = condition.get("operator", "AND")
-
-        if operator == "AND":
-            # El usuario debe tener TODAS las categorías
-            return required_categories.issubset(user_categories)
-        elif operator == "OR":
-            # El usuario debe tener AL MENOS una categoría
-            return len(required_categories & user_categories) > 0
-
-        return False
+        return self._mask_matches(
+            self._user_mask(user_categories), self.compile_condition(condition)
+        )
 
     def user_matches_rule(self, user_categories: set[str], rule: dict) -> bool:
         """
@@ -213,12 +386,13 @@ class SubGroupService:
         Returns:
             Número de miembros que cumplen la condición
         """
-        count = 0
-        for member in group_members:
-            user_cats = set(member["categories"])
-            if self.user_matches_condition(user_cats, condition):
-                count += 1
-        return count
+        return self._count_matches(group_members, self.compile_condition(condition))
+
+    def _count_matches(self, group_members: list[dict], compiled: tuple[int, str]) -> int:
+        """Cuántos miembros cumplen una condición ya compilada."""
+        return sum(
+            self._mask_matches(self._member_mask(member), compiled) for member in group_members
+        )
 
     def validate_group_rules(self, group_members: list[dict], rules: list[dict]) -> list:
         """
@@ -232,32 +406,12 @@ class SubGroupService:
         Returns:
             Lista con status por cada condición
         """
-        conditions_status = []
-        condition_idx = 0
-
-        for rule in rules:
-            conditions = rule.get("conditions", [])
-            for condition in conditions:
-                condition_idx += 1
-                count = self.count_condition_matches(group_members, condition)
-                min_required = condition.get("min", 0)
-                max_allowed = condition.get("max", float("inf"))
-
-                fulfilled = min_required <= count <= max_allowed
-
-                conditions_status.append(
-                    {
-                        "rule": condition_idx,
-                        "fulfilled": fulfilled,
-                        "count": count,
-                        "min": min_required,
-                        "max": max_allowed if max_allowed != float("inf") else None,
-                        "categories": condition.get("categories", []),
-                        "operator": condition.get("operator", "AND"),
-                    }
-                )
-
-        return conditions_status
+        return [
+            condition_status(
+                index, condition, self.count_condition_matches(group_members, condition)
+            )
+            for index, condition in enumerate(self._rule_conditions(rules), start=1)
+        ]
 
     def calculate_group_compatibility(self, group_members: list[dict]) -> float:
         """
@@ -272,16 +426,10 @@ class SubGroupService:
         if len(group_members) <= 1:
             return 1.0
 
-        total_compat = 0.0
-        pairs = 0
-
-        for i, member1 in enumerate(group_members):
-            for member2 in group_members[i + 1 :]:
-                compat = self.get_compatibility(member1["id"], member2["id"])
-                total_compat += compat
-                pairs += 1
+        total_compat = self._internal_compatibility([member["id"] for member in group_members])
+        pairs = len(group_members) * (len(group_members) - 1) // 2
 
-        return total_compat / pairs if pairs > 0 else 0.0
+        return total_compat / pairs
 
     def _calculate_group_blocks_intersection(self, group_units: list[dict]) -> int:
         """
@@ -297,19 +445,11 @@ class SubGroupService:
         group_members = self._flatten_units(group_units)
         if not group_members:
             return 0
-        if len(group_members) == 1:
-            # Si solo hay un miembro, retorna su disponibilidad
-            return len(self.user_available_blocks.get(group_members[0]["id"], set()))
-
-        # Comenzar con los bloques del primer miembro
-        common_blocks = self.user_available_blocks.get(group_members[0]["id"], set()).copy()
 
-        # Intersectar con los bloques de cada miembro subsecuente
-        for member in group_members[1:]:
-            member_blocks = self.user_available_blocks.get(member["id"], set())
-            common_blocks = common_blocks & member_blocks
-
-        return len(common_blocks)
+        # Con un solo miembro la intersección es su propia disponibilidad
+        return popcount(
+            intersect(self.user_available_blocks.get(member["id"], 0) for member in group_members)
+        )
 
     def _flatten_units(self, group_units: list[dict]) -> list[dict]:
         """Convierte una lista de unidades de asignación en una lista plana de miembros."""
@@ -318,67 +458,82 @@ class SubGroupService:
             members.extend(unit.get("members", []))
         return members
 
-    def _group_member_count(self, group_units: list[dict]) -> int:
-        """Cuenta cuántos usuarios contiene un grupo de unidades."""
-        return sum(len(unit.get("member_ids", [])) for unit in group_units)
+    def _collect_assigned_user_ids(self, groups: list[_GroupState]) -> set[int]:
+        """Obtiene el conjunto de usuarios ya asignados en la solución actual."""
+        return {
+            user_id for group in groups for unit in group.units for user_id in unit["member_ids"]
+        }
+
+    def _rule_conditions(self, rules: list[dict]) -> list[dict]:
+        """Todas las condiciones de todas las reglas, en orden."""
+        return [condition for rule in rules for condition in rule.get("conditions", [])]
 
-    def _group_size(self, group_units: list[dict]) -> int:
-        """Alias legible para contar usuarios en un grupo de unidades."""
-        return self._group_member_count(group_units)
+    def _profile_units(self, units: list[dict], conditions: list[dict]) -> None:
+        """Precalcula en cada unidad lo que `_GroupState` suma al agregarla.
 
-    def _collect_assigned_user_ids(self, groups: list[list[dict]]) -> set[int]:
-        """Obtiene el conjunto de usuarios ya asignados en la solución actual."""
-        assigned = set()
-        for group in groups:
-            for member in self._flatten_units(group):
-                assigned.add(member["id"])
-        return assigned
+        `blocks` es la intersección de bloques de sus miembros y
+        `condition_counts[i]` cuántos de ellos cumplen `conditions[i]`.
+        """
+        compiled = [self.compile_condition(condition) for condition in conditions]
+        for unit in units:
+            members = unit.get("members", [])
+            unit["blocks"] = intersect(
+                self.user_available_blocks.get(member["id"], 0) for member in members
+            )
+            unit["condition_counts"] = [self._count_matches(members, c) for c in compiled]
+
+    def _fits(self, group: _GroupState, unit: dict, max_group_size: int | None) -> bool:
+        """Si la unidad entra en el grupo sin pasar el tamaño máximo."""
+        return not max_group_size or group.size + len(unit["member_ids"]) <= max_group_size
+
+    def _evaluate_unit(
+        self, group: _GroupState, unit: dict, conditions: list[dict]
+    ) -> tuple[bool, int] | None:
+        """Qué pasaría al sumar la unidad al grupo, sin sumarla.
+
+        Devuelve (ayuda a cumplir algún mínimo, bloques comunes del grupo
+        resultante), o None si alguna condición pasaría su máximo.
+        """
+        counts = group.counts_with(unit)
+        for count, condition in zip(counts, conditions, strict=True):
+            max_allowed = condition.get("max")
+            if max_allowed is not None and count > max_allowed:
+                return None
+
+        helps_min = any(
+            0 < condition.get("min", 0) >= count
+            for count, condition in zip(counts, conditions, strict=True)
+        )
+        return helps_min, popcount(group.blocks_with(unit))
 
     def _get_required_user_ids_by_categories(self, required_category_names: set[str]) -> set[int]:
         """Retorna usuarios que pertenecen al menos a una categoría requerida."""
-        include_without_categories = self.NO_CATEGORY_TOKEN in required_category_names
-        real_categories = {
-            category_name
-            for category_name in required_category_names
-            if category_name != self.NO_CATEGORY_TOKEN
-        }
-
+        # Quien no tiene categorías lleva el bit de NO_CATEGORY_TOKEN en su máscara.
+        required_mask = self._category_mask(required_category_names)
         return {
-            user_id
-            for user_id, categories in self.user_categories.items()
-            if (real_categories and categories & real_categories)
-            or (include_without_categories and not categories)
+            user_id for user_id, mask in self.user_category_masks.items() if mask & required_mask
         }
 
     def _get_candidate_groups_for_required_unit(
         self,
-        groups: list[list[dict]],
+        groups: list[_GroupState],
         unit: dict,
-        rules: list[dict],
+        conditions: list[dict],
         max_group_size: int | None,
         threshold: int,
     ) -> list[tuple[bool, bool, int, int]]:
         """Retorna candidatos válidos para insertar una unidad requerida."""
-        unit_member_ids = unit.get("member_ids", [])
         candidates = []
 
         for idx, group in enumerate(groups):
-            if max_group_size and self._group_size(group) + len(unit_member_ids) > max_group_size:
+            if not self._fits(group, unit, max_group_size):
                 continue
 
-            temp_group = group + [unit]
-            temp_members = self._flatten_units(temp_group)
-            rules_status = self.validate_group_rules(temp_members, rules)
-            exceeds_max = any(
-                r["count"] > r.get("max", float("inf"))
-                and r.get("max", float("inf")) != float("inf")
-                for r in rules_status
-            )
-            if exceeds_max:
+            evaluation = self._evaluate_unit(group, unit, conditions)
+            if evaluation is None:
                 continue
 
-            helps_min = any(r["count"] <= r["min"] and r["min"] > 0 for r in rules_status)
-            common_blocks = self._calculate_group_blocks_intersection(temp_group)
+            helps_min, common_blocks = evaluation
             meets_threshold = common_blocks >= threshold
             candidates.append((meets_threshold, helps_min, common_blocks, idx))
 
@@ -386,17 +541,14 @@ class SubGroupService:
 
     def _fallback_assign_required_unit(
         self,
-        groups: list[list[dict]],
+        groups: list[_GroupState],
         unit: dict,
         max_group_size: int | None,
         required_category_names: set[str],
     ) -> int:
         """Asigna por fallback al grupo más pequeño con espacio."""
         viable_group_indexes = [
-            i
-            for i in range(len(groups))
-            if not max_group_size
-            or self._group_size(groups[i]) + len(unit.get("member_ids", [])) <= max_group_size
+            i for i, group in enumerate(groups) if self._fits(group, unit, max_group_size)
         ]
 
         if not viable_group_indexes:
@@ -406,15 +558,15 @@ class SubGroupService:
                 f"({categories_txt}) sin exceder el tamaño máximo."
             )
 
-        smallest_group_idx = min(viable_group_indexes, key=lambda i: self._group_size(groups[i]))
-        groups[smallest_group_idx].append(unit)
+        smallest_group_idx = min(viable_group_indexes, key=lambda i: groups[i].size)
+        groups[smallest_group_idx].add(unit)
         return smallest_group_idx
 
     def _assign_required_category_members(
         self,
-        groups: list[list[dict]],
+        groups: list[_GroupState],
         assignment_units: list[dict],
-        rules: list[dict],
+        conditions: list[dict],
         max_group_size: int | None,
         threshold: int,
         required_category_names: set[str],
@@ -443,7 +595,7 @@ class SubGroupService:
             candidate_groups = self._get_candidate_groups_for_required_unit(
                 groups=groups,
                 unit=unit,
-                rules=rules,
+                conditions=conditions,
                 max_group_size=max_group_size,
                 threshold=threshold,
             )
@@ -451,7 +603,7 @@ class SubGroupService:
             if candidate_groups:
                 candidate_groups.sort(reverse=True)
                 _, _, _, best_group_idx = candidate_groups[0]
-                groups[best_group_idx].append(unit)
+                groups[best_group_idx].add(unit)
                 assigned_user_ids.update(unit_member_ids)
                 continue
 
@@ -468,29 +620,27 @@ class SubGroupService:
         Calcula la compatibilidad promedio de una unidad con un grupo.
         Si la unidad contiene varios usuarios, también considera su compatibilidad interna.
         """
-        unit_members = unit.get("members", [])
-        group_members = self._flatten_units(group_units)
-        comparisons = []
-
-        if len(unit_members) > 1:
-            for index, member1 in enumerate(unit_members):
-                for member2 in unit_members[index + 1 :]:
-                    comparisons.append(self.get_compatibility(member1["id"], member2["id"]))
-
-        for unit_member in unit_members:
-            for group_member in group_members:
-                comparisons.append(self.get_compatibility(unit_member["id"], group_member["id"]))
+        unit_ids = [member["id"] for member in unit.get("members", [])]
+        group_ids = [member["id"] for member in self._flatten_units(group_units)]
+        comparisons = len(unit_ids) * (len(unit_ids) - 1) // 2 + len(unit_ids) * len(group_ids)
 
         if not comparisons:
             return 1.0
 
-        return sum(comparisons) / len(comparisons)
+        total = self._internal_compatibility(unit_ids) + self._cross_compatibility(
+            unit_ids, group_ids
+        )
+        return total / comparisons
 
     def _build_assignment_units(
-        self, together_groups: list[list[int]]
+        self, together_groups: list[list[int]], rng: random.Random | None = None
     ) -> tuple[list[dict], list[dict]]:
         """
         Convierte los grupos manuales en unidades de asignación atómicas.
+
+        Con `rng` el orden de los individuales deja de ser determinista: se
+        ordenan por disponibilidad con ruido, para que cada reinicio del modo
+        multi-arranque recorra otro orden sin abandonar la heurística.
         """
         member_map = {member["id"]: member for member in self.members}
         used_user_ids = set()
@@ -553,13 +703,27 @@ class SubGroupService:
                 / len(unit["members"]),
             )
         )
-        singleton_units.sort(
-            key=lambda unit: unit["members"][0]["availability_count"], reverse=True
-        )
+        if rng is None:
+            singleton_units.sort(
+                key=lambda unit: unit["members"][0]["availability_count"], reverse=True
+            )
+        else:
+            singleton_units.sort(
+                key=lambda unit: unit["members"][0]["availability_count"] * (0.5 + rng.random()),
+                reverse=True,
+            )
 
         return manual_units + singleton_units, manual_groups_preview
 
-    def generate_subgroups(self, config: dict) -> dict:
+    def generate_subgroups(
+        self,
+        config: dict,
+        search_seconds: float = 0.0,
+        seed: int | None = None,
+        restarts: int = 1,
+        workers: int = 1,
+        progress=None,
+    ) -> dict:
         """
         Genera subgrupos optimizados según la configuración.
 
@@ -567,10 +731,171 @@ class SubGroupService:
             config: Configuración con num_groups, max_group_size,
                     allow_multiple_membership, require_all_members,
                     compatibility_threshold, category_rules
+            search_seconds: Tiempo para la búsqueda local después del greedy,
+                    por corrida (0 la salta; ver `_optimize_groups`)
+            seed: Semilla de la búsqueda local (por defecto SEARCH_SEED)
+            restarts: Corridas del solver; con más de una es el modo
+                    multi-arranque (ver `_generate_multistart`)
+            workers: Procesos para repartir las corridas (1 = en este proceso)
+            progress: Opcional, `progress(fraccion, preview)` con el avance
+                    (0 a 1) y el mejor preview hasta ahora, o None si no
+                    mejoró desde el último aviso. Si levanta una excepción,
+                    la división se corta con ella.
 
         Returns:
             Dict con preview de los grupos generados
         """
+        # Cargar miembros y calcular compatibilidad
+        self.load_cached()
+
+        seed = self.SEARCH_SEED if seed is None else seed
+        if restarts <= 1:
+            return self.solve(config, search_seconds, seed, progress=progress)[1]
+        return self._generate_multistart(config, search_seconds, seed, restarts, workers, progress)
+
+    def snapshot(self) -> dict:
+        """Lo que el solver lee de la BD, en datos planos que se pueden serializar."""
+        return {field: getattr(self, field) for field in self.SNAPSHOT_FIELDS}
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "SubGroupService":
+        """Un servicio listo para `solve` sin tocar la BD."""
+        service = cls(snapshot["parent_group_id"])
+        service._apply_snapshot(snapshot, cls.SNAPSHOT_FIELDS)
+        return service
+
+    def _apply_snapshot(self, snapshot: dict, fields: tuple[str, ...]) -> None:
+        for field in fields:
+            setattr(self, field, snapshot[field])
+        # `_category_mask` le asigna bit a categorías nuevas: cada copia, el suyo.
+        self.category_bits = dict(snapshot["category_bits"])
+
+    def load_cached(self) -> None:
+        """
+        `load_members` + `calculate_compatibility_matrix`, salvo que la caché
+        ya tenga los datos del grupo en su revisión actual (`Group.revision`,
+        que sube con cualquier cambio de miembros, categorías o marcas, ver
+        app/group_revision.py).
+
+        Probar varias configuraciones seguidas (otro `num_groups`, otras
+        reglas) no cambia miembros, categorías ni marcas: la primera división
+        carga y las siguientes solo consultan la revisión. Lo
+        cacheado se comparte entre hilos y el solver solo lo lee; la matriz
+        queda de solo lectura para que nadie la pise sin querer.
+        """
+        key = (self.parent_group_id, get_group_revision(self.parent_group_id))
+        with _snapshot_cache_lock:
+            cached = _snapshot_cache.get(key)
+            if cached is not None:
+                _snapshot_cache.move_to_end(key)
+        if cached is not None:
+            self._apply_snapshot(cached, self.CACHED_FIELDS)
+            return
+
+        self.load_members()
+        self.calculate_compatibility_matrix()
+        self.compatibility_matrix.flags.writeable = False
+        entry = {field: getattr(self, field) for field in self.CACHED_FIELDS}
+        with _snapshot_cache_lock:
+            # Las revisiones anteriores del grupo ya no las va a pedir nadie.
+            for stale in [k for k in _snapshot_cache if k[0] == self.parent_group_id]:
+                del _snapshot_cache[stale]
+            _snapshot_cache[key] = entry
+            while len(_snapshot_cache) > SNAPSHOT_CACHE_SIZE:
+                _snapshot_cache.popitem(last=False)
+
+    def _generate_multistart(
+        self,
+        config: dict,
+        search_seconds: float,
+        seed: int,
+        restarts: int,
+        workers: int,
+        progress=None,
+    ) -> dict:
+        """
+        Corre `restarts` veces el solver y devuelve el preview de la mejor.
+
+        La corrida 0 usa el orden determinista de siempre, así que el resultado
+        nunca es peor que el de una sola; las demás ordenan al azar (semilla
+        `seed + i`). Con `workers > 1` las corridas se reparten en un
+        ProcessPoolExecutor: cada proceso recibe una sola vez, al arrancar, el
+        `snapshot` de miembros, bitmaps y categorías, y solo lo lee. Se usa
+        "spawn" para no heredar por fork las conexiones ni los hilos del
+        proceso web.
+
+        Si una corrida no encuentra lugar para alguien (ValueError) se
+        descarta; si fallan todas se propaga el error de la primera. `progress`
+        se llama al terminar cada corrida.
+        """
+        tasks = [
+            (config, search_seconds, seed + restart, restart > 0) for restart in range(restarts)
+        ]
+        outcomes = []
+        leader = None
+
+        def finished(outcome):
+            nonlocal leader
+            outcomes.append(outcome)
+            if progress is None:
+                return
+            improved = not isinstance(outcome, ValueError) and (
+                leader is None or outcome[0] < leader[0]
+            )
+            if improved:
+                leader = outcome
+            progress(len(outcomes) / restarts, outcome[1] if improved else None)
+
+        if workers <= 1:
+            for task in tasks:
+                try:
+                    finished(self.solve(*task))
+                except ValueError as error:
+                    finished(error)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=min(workers, restarts),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_division_worker,
+                initargs=(self.snapshot(),),
+            ) as pool:
+                futures = [pool.submit(_run_division_restart, *task) for task in tasks]
+                try:
+                    for future in futures:
+                        try:
+                            finished(future.result())
+                        except ValueError as error:
+                            finished(error)
+                except BaseException:
+                    # Cortada desde `progress`: las corridas que no arrancaron no se corren.
+                    pool.shutdown(cancel_futures=True)
+                    raise
+
+        solved = [outcome for outcome in outcomes if not isinstance(outcome, ValueError)]
+        if not solved:
+            raise outcomes[0]
+        # min es estable: a igual puntaje gana la corrida de menor índice.
+        return min(solved, key=lambda outcome: outcome[0])[1]
+
+    def solve(
+        self,
+        config: dict,
+        search_seconds: float,
+        seed: int,
+        randomize: bool = False,
+        progress=None,
+    ) -> tuple[tuple, dict]:
+        """
+        Corre el solver sobre los miembros ya cargados (`load_members` y
+        `calculate_compatibility_matrix`, o `from_snapshot`). No toca la BD.
+
+        Devuelve (puntaje, preview). El puntaje compara corridas: menor es
+        mejor, con el orden de `_division_objective` salvo que, después de
+        las violaciones, pesa cuántos miembros quedaron sin grupo.
+
+        Con `progress` (ver `generate_subgroups`) se informa el preview del
+        greedy apenas está y después el avance de la búsqueda local.
+        """
         # Extraer configuración
         num_groups = config.get("num_groups", 2)
         max_group_size = config.get("max_group_size")
@@ -581,12 +906,10 @@ class SubGroupService:
         required_membership_categories = set(config.get("required_membership_categories", []))
         together_groups = config.get("together_groups", [])
 
-        # Cargar miembros y calcular compatibilidad
-        self.load_members()
-        self.calculate_compatibility_matrix()
-
         # Construir unidades atómicas de asignación a partir de los grupos manuales
-        assignment_units, manual_groups_preview = self._build_assignment_units(together_groups)
+        assignment_units, manual_groups_preview = self._build_assignment_units(
+            together_groups, random.Random(seed) if randomize else None
+        )
 
         if max_group_size is not None:
             for unit in assignment_units:
@@ -596,8 +919,11 @@ class SubGroupService:
                         "que el tamaño máximo permitido."
                     )
 
-        # Inicializar grupos vacíos
-        groups = [[] for _ in range(num_groups)]
+        # Cada grupo lleva sus agregados al día: probar una unidad no recorre
+        # a sus miembros (ver `_GroupState`).
+        conditions = self._rule_conditions(rules)
+        self._profile_units(assignment_units, conditions)
+        groups = [_GroupState(len(conditions)) for _ in range(num_groups)]
         assigned_users = set()
 
         # Asignación greedy: primero grupos manuales y luego usuarios individuales
@@ -609,31 +935,16 @@ class SubGroupService:
             # Buscar grupo donde el usuario ayude a cumplir mínimos y no exceda máximos
             candidate_groups = []
             for idx, group in enumerate(groups):
-                if (
-                    max_group_size
-                    and self._group_size(group) + len(unit_member_ids) > max_group_size
-                ):
+                if not self._fits(group, unit, max_group_size):
                     continue
 
-                temp_group = group + [unit]
-                temp_members = self._flatten_units(temp_group)
-                rules_status = self.validate_group_rules(temp_members, rules)
-
-                # Verificar que no se exceda ningún máximo
-                exceeds_max = any(
-                    r["count"] > r.get("max", float("inf"))
-                    and r.get("max", float("inf")) != float("inf")
-                    for r in rules_status
-                )
-                if exceeds_max:
+                # None si se excede algún máximo
+                evaluation = self._evaluate_unit(group, unit, conditions)
+                if evaluation is None:
                     continue
 
-                # Verificar si ayuda a cumplir algún mínimo
-                helps_min = any(r["count"] <= r["min"] and r["min"] > 0 for r in rules_status)
-
-                # Calcular bloques comunes (intersección global del grupo propuesto)
-                common_blocks = self._calculate_group_blocks_intersection(temp_group)
-
+                # Ayuda a cumplir algún mínimo / intersección global del grupo propuesto
+                helps_min, common_blocks = evaluation
                 if common_blocks < threshold:
                     continue
 
@@ -643,17 +954,14 @@ class SubGroupService:
             candidate_groups.sort(reverse=True)
             if candidate_groups:
                 _, _, best_group_idx = candidate_groups[0]
-                groups[best_group_idx].append(unit)
+                groups[best_group_idx].add(unit)
                 if not allow_multiple:
                     assigned_users.update(unit_member_ids)
             elif require_all:
                 # Si require_all está activado y no encontramos grupo válido,
                 # asignar al grupo más pequeño respetando el tamaño máximo cuando sea posible.
                 viable_group_indexes = [
-                    i
-                    for i in range(len(groups))
-                    if not max_group_size
-                    or self._group_size(groups[i]) + len(unit_member_ids) <= max_group_size
+                    i for i, group in enumerate(groups) if self._fits(group, unit, max_group_size)
                 ]
 
                 if not viable_group_indexes:
@@ -662,10 +970,8 @@ class SubGroupService:
                         f"'{unit['label']}' sin exceder el tamaño máximo."
                     )
 
-                smallest_group_idx = min(
-                    viable_group_indexes, key=lambda i: self._group_size(groups[i])
-                )
-                groups[smallest_group_idx].append(unit)
+                smallest_group_idx = min(viable_group_indexes, key=lambda i: groups[i].size)
+                groups[smallest_group_idx].add(unit)
                 if not allow_multiple:
                     assigned_users.update(unit_member_ids)
 
@@ -674,96 +980,280 @@ class SubGroupService:
             self._assign_required_category_members(
                 groups=groups,
                 assignment_units=assignment_units,
-                rules=rules,
+                conditions=conditions,
                 max_group_size=max_group_size,
                 threshold=threshold,
                 required_category_names=required_membership_categories,
             )
 
-        groups = self._repair_groups(groups, rules, max_group_size)
+        groups = self._repair_groups(groups, conditions, max_group_size)
+
+        report = None
+        if progress is not None:
+            progress(
+                0.0,
+                self._build_preview(
+                    [group.units for group in groups], rules, manual_groups_preview
+                ),
+            )
+
+            def report(fraction, layout):
+                if layout is not None:
+                    layout = self._build_preview(layout, rules, manual_groups_preview)
+                progress(fraction, layout)
+
+        groups = self._optimize_groups(
+            groups,
+            conditions,
+            max_group_size,
+            search_seconds,
+            seed,
+            report,
+        )
+
+        objective = self._division_objective(
+            [self._group_stats(group, conditions) for group in groups]
+        )
+        unassigned = len(self.members) - len(self._collect_assigned_user_ids(groups))
 
         # Construir preview
-        preview = self._build_preview(groups, rules, manual_groups_preview)
+        preview = self._build_preview(
+            [group.units for group in groups], rules, manual_groups_preview
+        )
 
-        return preview
+        return (objective[0], unassigned, *objective[1:]), preview
 
     def _repair_groups(
-        self, groups: list[list[dict]], rules: list[dict], max_size: int | None
-    ) -> list[list[dict]]:
+        self, groups: list[_GroupState], conditions: list[dict], max_size: int | None
+    ) -> list[_GroupState]:
         """
         Intenta reparar grupos que no cumplen condiciones mediante intercambios.
-        Ahora trabaja con condiciones individuales (cada una con su min/max).
+        Trabaja con condiciones individuales (cada una con su min/max) y lee los
+        conteos que cada grupo ya lleva al día.
 
         Args:
-            groups: Lista de grupos actuales
-            rules: Reglas a cumplir (cada una con condiciones)
+            groups: Grupos actuales
+            conditions: Condiciones de todas las reglas, en orden
             max_size: Tamaño máximo por grupo
 
         Returns:
             Lista de grupos reparados
         """
         max_iterations = 50
-        iteration = 0
-
-        # Extraer todas las condiciones de todas las reglas
-        all_conditions = []
-        for rule in rules:
-            all_conditions.extend(rule.get("conditions", []))
-
-        while iteration < max_iterations:
-            iteration += 1
-            made_swap = False
-
-            for condition in all_conditions:
-                min_required = condition.get("min", 0)
-
-                for group_idx, group in enumerate(groups):
-                    group_members = self._flatten_units(group)
-                    count = self.count_condition_matches(group_members, condition)
-                    group_member_count = self._group_member_count(group)
-
-                    # Si no cumple el mínimo, buscar un miembro compatible en otros grupos
-                    if count < min_required:
-                        # Buscar en otros grupos
-                        for other_idx, other_group in enumerate(groups):
-                            if other_idx == group_idx:
-                                continue
-
-                            # Buscar un miembro que cumpla la condición
-                            for unit in other_group:
-                                unit_members = unit.get("members", [])
-                                if any(
-                                    self.user_matches_condition(
-                                        set(member["categories"]), condition
-                                    )
-                                    for member in unit_members
-                                ):
-                                    # Intentar mover o intercambiar
-                                    if (
-                                        not max_size
-                                        or group_member_count + len(unit.get("member_ids", []))
-                                        <= max_size
-                                    ):
-                                        # Mover directamente
-                                        other_group.remove(unit)
-                                        group.append(unit)
-                                        made_swap = True
-                                        break
-
-                            if made_swap:
-                                break
-
-                    if made_swap:
-                        break
-
-                if made_swap:
-                    break
 
-            if not made_swap:
+        for _ in range(max_iterations):
+            if not self._repair_once(groups, conditions, max_size):
                 break
 
         return groups
 
+    def _repair_once(
+        self, groups: list[_GroupState], conditions: list[dict], max_size: int | None
+    ) -> bool:
+        """Hace el primer movimiento que acerque un grupo a un mínimo. True si movió."""
+        for condition_idx, condition in enumerate(conditions):
+            min_required = condition.get("min", 0)
+
+            for group_idx, group in enumerate(groups):
+                # Si no cumple el mínimo, buscar un miembro compatible en otros grupos
+                if group.counts[condition_idx] >= min_required:
+                    continue
+
+                for other_idx, other_group in enumerate(groups):
+                    if other_idx == group_idx:
+                        continue
+
+                    # Una unidad con algún miembro que cumpla la condición y que entre
+                    for unit in other_group.units:
+                        if unit["condition_counts"][condition_idx] and self._fits(
+                            group, unit, max_size
+                        ):
+                            other_group.remove(unit)
+                            group.add(unit)
+                            return True
+
+        return False
+
+    def _group_stats(
+        self,
+        group: _GroupState,
+        conditions: list[dict],
+        removed: dict | None = None,
+        added: dict | None = None,
+    ) -> tuple[int, int | None, int]:
+        """
+        (violaciones, bloques comunes, tamaño) del grupo, o del que quedaría
+        al sacarle `removed` y sumarle `added`, sin tocarlo.
+
+        Las violaciones son cuánto le falta a cada condición para su mínimo más
+        cuánto se pasa de su máximo. Los bloques comunes son None si el grupo
+        queda vacío.
+        """
+        blocks, counts, size = group.blocks, group.counts, group.size
+        if removed is not None:
+            blocks = group.blocks_without(removed)
+            counts = [c - r for c, r in zip(counts, removed["condition_counts"], strict=True)]
+            size -= len(removed["member_ids"])
+        if added is not None:
+            blocks = added["blocks"] if blocks is None else blocks & added["blocks"]
+            counts = [c + a for c, a in zip(counts, added["condition_counts"], strict=True)]
+            size += len(added["member_ids"])
+
+        violations = 0
+        for count, condition in zip(counts, conditions, strict=True):
+            violations += max(0, condition.get("min", 0) - count)
+            max_allowed = condition.get("max")
+            if max_allowed is not None:
+                violations += max(0, count - max_allowed)
+
+        return violations, (None if blocks is None else popcount(blocks)), size
+
+    @staticmethod
+    def _division_objective(stats: list[tuple[int, int | None, int]]) -> tuple[int, int, int, int]:
+        """
+        Qué tan buena es una división; menor es mejor, en orden:
+
+        1. violaciones de reglas, sumadas sobre todos los grupos;
+        2. bloques comunes del peor grupo (negado: se maximiza);
+        3. desbalance: suma de los cuadrados de los tamaños;
+        4. bloques comunes totales (negado), para desempatar.
+        """
+        commons = [common for _, common, _ in stats if common is not None]
+        return (
+            sum(violations for violations, _, _ in stats),
+            -min(commons, default=0),
+            sum(size * size for _, _, size in stats),
+            -sum(commons),
+        )
+
+    def _random_step(
+        self, groups: list[_GroupState], rng: random.Random, max_size: int | None
+    ) -> tuple[int, dict, int, dict | None] | None:
+        """
+        Un vecino al azar de la división: mover una unidad a otro grupo o
+        intercambiarla con una unidad de ese grupo.
+
+        Devuelve (origen, unidad, destino, unidad que vuelve o None), o None si
+        el vecino sorteado no respeta el tamaño máximo o repetiría una unidad.
+        """
+        source = rng.choice([i for i, group in enumerate(groups) if group.units])
+        target = rng.choice([i for i in range(len(groups)) if i != source])
+        unit = rng.choice(groups[source].units)
+        other = None
+        if groups[target].units and rng.random() < 0.5:
+            other = rng.choice(groups[target].units)
+
+        unit_size = len(unit["member_ids"])
+        other_size = len(other["member_ids"]) if other is not None else 0
+        if groups[target].holds(unit) or (other is not None and groups[source].holds(other)):
+            return None
+        if max_size and (
+            groups[target].size - other_size + unit_size > max_size
+            or groups[source].size - unit_size + other_size > max_size
+        ):
+            return None
+        return source, unit, target, other
+
+    def _apply_step(self, groups: list[_GroupState], step: tuple) -> None:
+        source, unit, target, other = step
+        groups[source].remove(unit)
+        groups[target].add(unit)
+        if other is not None:
+            groups[target].remove(other)
+            groups[source].add(other)
+
+    def _optimize_groups(
+        self,
+        groups: list[_GroupState],
+        conditions: list[dict],
+        max_size: int | None,
+        search_seconds: float,
+        seed: int,
+        report=None,
+    ) -> list[_GroupState]:
+        """
+        Búsqueda local sobre la división del greedy, con presupuesto de tiempo.
+
+        Prueba vecinos al azar (mover o intercambiar unidades, ver
+        `_random_step`) y se queda con los que mejoran `_division_objective`.
+        Cuando pasan muchos intentos sin mejora se está en un óptimo local: se
+        guarda si es el mejor visto y se sacude con SEARCH_KICKS movimientos
+        al azar. Termina cuando SEARCH_PATIENCE sacudidas seguidas no
+        superan a la mejor división, o al agotarse `search_seconds`, que es
+        solo el tope: un grupo chico converge en milisegundos y no tiene por
+        qué gastar el segundo entero (ni tener ocupado al hilo de divisiones).
+        Devuelve la mejor división encontrada. Con `rng` sembrado con `seed`,
+        dos corridas iguales recorren los mismos vecinos.
+
+        Cada PROGRESS_SECONDS llama a `report(fraccion, unidades por grupo)`
+        con la mejor división vista, o None en vez de las unidades si no
+        mejoró desde el aviso anterior.
+        """
+        if search_seconds <= 0 or len(groups) < 2 or not any(group.units for group in groups):
+            return groups
+
+        rng = random.Random(seed)
+        deadline = time.monotonic() + search_seconds
+        stall_limit = 20 * sum(len(group.units) for group in groups)
+
+        stats = [self._group_stats(group, conditions) for group in groups]
+        current = self._division_objective(stats)
+        best, best_layout = current, [list(group.units) for group in groups]
+        stalled = fruitless_kicks = 0
+        reported, next_report = current, time.monotonic() + self.PROGRESS_SECONDS
+
+        while time.monotonic() < deadline:
+            if report is not None and time.monotonic() >= next_report:
+                layout = None
+                if min(current, best) < reported:
+                    if best <= current:
+                        layout = best_layout
+                    else:
+                        layout = [list(group.units) for group in groups]
+                    reported = min(current, best)
+                report(1 - (deadline - time.monotonic()) / search_seconds, layout)
+                next_report = time.monotonic() + self.PROGRESS_SECONDS
+
+            if stalled >= stall_limit:
+                if current < best:
+                    best, best_layout = current, [list(group.units) for group in groups]
+                    fruitless_kicks = 0
+                else:
+                    fruitless_kicks += 1
+                if fruitless_kicks >= self.SEARCH_PATIENCE:
+                    break
+                for _ in range(self.SEARCH_KICKS):
+                    step = self._random_step(groups, rng, max_size)
+                    if step is not None:
+                        self._apply_step(groups, step)
+                stats = [self._group_stats(group, conditions) for group in groups]
+                current = self._division_objective(stats)
+                stalled = 0
+                continue
+
+            stalled += 1
+            step = self._random_step(groups, rng, max_size)
+            if step is None:
+                continue
+
+            source, unit, target, other = step
+            trial = list(stats)
+            trial[source] = self._group_stats(groups[source], conditions, unit, other)
+            trial[target] = self._group_stats(groups[target], conditions, other, unit)
+            objective = self._division_objective(trial)
+            if objective < current:
+                self._apply_step(groups, step)
+                stats, current, stalled = trial, objective, 0
+
+        if current <= best:
+            return groups
+
+        restored = [_GroupState(len(conditions)) for _ in best_layout]
+        for group, units in zip(restored, best_layout, strict=True):
+            for unit in units:
+                group.add(unit)
+        return restored
+
     def _build_preview(
         self,
         groups: list[list[dict]],
@@ -793,7 +1283,7 @@ class SubGroupService:
             # compatibility_avg ahora es la intersección global de bloques (normalizada a 0-1)
             common_blocks = self._calculate_group_blocks_intersection(group)
             max_blocks = (
-                max(len(blocks) for blocks in self.user_available_blocks.values())
+                max(popcount(blocks) for blocks in self.user_available_blocks.values())
                 if self.user_available_blocks
                 else 1
             )
@@ -825,6 +1315,38 @@ class SubGroupService:
         }
 
 
+# Snapshot de solo lectura de cada proceso del modo multi-arranque; lo deja
+# `_init_division_worker` al arrancar el proceso.
+_worker_snapshot = None
+
+
+def _init_division_worker(snapshot: dict) -> None:
+    global _worker_snapshot  # pylint: disable=global-statement
+    _worker_snapshot = snapshot
+
+
+def _run_division_restart(config: dict, search_seconds: float, seed: int, randomize: bool):
+    """Una corrida del solver en un proceso del pool, sobre el snapshot compartido."""
+    return SubGroupService.from_snapshot(_worker_snapshot).solve(
+        config, search_seconds, seed, randomize
+    )
+
+
+def condition_status(index: int, condition: dict, count: int) -> dict:
+    """Estado de la condición número `index` para un subgrupo con `count` coincidencias."""
+    min_required = condition.get("min", 0)
+    max_allowed = condition.get("max")
+    return {
+        "rule": index,
+        "fulfilled": min_required <= count and (max_allowed is None or count <= max_allowed),
+        "count": count,
+        "min": min_required,
+        "max": max_allowed,
+        "categories": condition.get("categories", []),
+        "operator": condition.get("operator", "AND"),
+    }
+
+
 def user_matches_rule(user_categories: set[str], rule: dict) -> bool:
     """
     Función auxiliar standalone para evaluar si un usuario cumple una regla.
@@ -862,9 +1384,12 @@ def add_subgroup_member(subgroup_id, user_id):
     return membership
 
 
-# Cada click en "Generar" escribe un DivisionJob con el preview completo (una
-# fila JSON gorda con nombres y correos). Se conservan los más recientes; el
-# resto se oculta.
+# Cada click en "Generar" escribe un DivisionJob (ver `division_jobs`). Su
+# resultado es compacto (ids por subgrupo y métricas, ver
+# `compact_division_result`), pero los clicks no tienen techo: probar
+# configuraciones deja una fila por intento, y `prune_division_jobs` carga
+# todos los del grupo. Para deshacer solo sirve el último confirmado, así que
+# se conservan los más recientes y el resto se oculta.
 RETAINED_JOBS_PER_GROUP = 10
 
 
@@ -872,7 +1397,8 @@ def prune_division_jobs(group_id, retained=RETAINED_JOBS_PER_GROUP):
     """Oculta los jobs viejos del grupo, conservando el último confirmado.
 
     El confirmado más reciente se preserva siempre: es el que `undo` necesita
-    para revertir la división vigente.
+    para revertir la división vigente. Los que siguen en cola o corriendo
+    también: alguien los está esperando.
     """
     jobs = (
         DivisionJob.query.filter_by(parent_group_id=group_id)
@@ -880,58 +1406,200 @@ def prune_division_jobs(group_id, retained=RETAINED_JOBS_PER_GROUP):
         .all()
     )
     keep = {job.id for job in jobs[:retained]}
-    last_confirmed = next((job for job in jobs if job.status == "confirmed"), None)
+    last_confirmed = next((job for job in jobs if job.status == JOB_CONFIRMED), None)
     if last_confirmed is not None:
         keep.add(last_confirmed.id)
+    keep.update(job.id for job in jobs if job.status in UNFINISHED_JOB_STATUSES)
     for job in jobs:
         if job.id not in keep:
             job.soft_delete()
 
 
-def save_division_job(group_id, user_id, config, preview):
-    """Persiste un DivisionJob con estado 'pending' y poda los jobs viejos.
+# `result_json` guarda la división, no a las personas: ids por subgrupo, los
+# conteos de cada condición y las métricas. Nombres, correos y categorías se
+# leen de la BD al mostrarlo (`hydrate_division_result`), y `rules_status` se
+# rearma con las reglas de `config_json`.
+RESULT_FORMAT = 2
+
+
+def compact_division_result(preview):
+    """El preview del solver en la forma que lo guarda el DivisionJob."""
+    return {
+        "format": RESULT_FORMAT,
+        "groups": [
+            {
+                "id": group["id"],
+                "name": group["name"],
+                "member_ids": [member["id"] for member in group["members"]],
+                "compatibility_avg": group["compatibility_avg"],
+                "rule_counts": [status["count"] for status in group["rules_status"]],
+            }
+            for group in preview["groups"]
+        ],
+        "unfulfilled_rules": preview["unfulfilled_rules"],
+        "total_members_available": preview["total_members_available"],
+        "together_groups": [group["member_ids"] for group in preview["together_groups"]],
+    }
+
 
-    Hace flush para obtener el id antes de la poda. No commitea.
-    """
-    job = DivisionJob(
-        parent_group_id=group_id,
-        created_by=user_id,
-        config_json=config,
-        result_json=preview,
-        status="pending",
+def _rules_status(job, rule_counts):
+    conditions = [
+        condition
+        for rule in (job.config_json or {}).get("category_rules", [])
+        for condition in rule.get("conditions", [])
+    ]
+    return [
+        condition_status(index, condition, count)
+        for index, (condition, count) in enumerate(
+            zip(conditions, rule_counts, strict=True), start=1
+        )
+    ]
+
+
+def _division_people(group_id, user_ids):
+    """{user_id: {id, name, email, categories}} de los ids de una división, en dos consultas."""
+    people = {
+        user_id: {"id": user_id, "name": name, "email": email, "categories": []}
+        for user_id, name, email in scheduler_db.session.query(User.id, User.name, User.email)
+        .filter(User.id.in_(user_ids))
+        .all()
+    }
+    categories = (
+        scheduler_db.session.query(GroupMember.user_id, Category.name)
+        .join(GroupMemberCategory, GroupMemberCategory.group_member_id == GroupMember.id)
+        .join(Category, Category.id == GroupMemberCategory.category_id)
+        .filter(GroupMember.group_id == group_id, GroupMember.user_id.in_(user_ids))
+        .order_by(Category.name)
+        .all()
     )
-    scheduler_db.session.add(job)
-    scheduler_db.session.flush()
-    prune_division_jobs(group_id)
-    return job
+    for user_id, category_name in categories:
+        if user_id in people:
+            people[user_id]["categories"].append(category_name)
+    return people
+
+
+def hydrate_division_result(job):
+    """El resultado del job con la forma del preview del solver, o None si no tiene.
+
+    Las personas salen como están hoy: quien dejó el grupo sale sin
+    categorías, y quien borró su cuenta, como "Usuario desconocido".
+    """
+    result = job.result_json
+    if not result or "groups" not in result:
+        return None
+
+    user_ids = {user_id for group in result["groups"] for user_id in group["member_ids"]}
+    user_ids.update(user_id for member_ids in result["together_groups"] for user_id in member_ids)
+    people = _division_people(job.parent_group_id, user_ids)
+
+    def person(user_id):
+        return people.get(user_id) or {
+            "id": user_id,
+            "name": "Usuario desconocido",
+            "email": "",
+            "categories": [],
+        }
+
+    preview = {
+        "groups": [
+            {
+                "id": group["id"],
+                "name": group["name"],
+                "members": [person(user_id) for user_id in group["member_ids"]],
+                "compatibility_avg": group["compatibility_avg"],
+                "rules_status": _rules_status(job, group["rule_counts"]),
+            }
+            for group in result["groups"]
+        ],
+        "unfulfilled_rules": result["unfulfilled_rules"],
+        "total_members_assigned": sum(len(group["member_ids"]) for group in result["groups"]),
+        "total_members_available": result["total_members_available"],
+        "together_groups": [
+            {
+                "member_ids": member_ids,
+                "member_names": [person(user_id)["name"] for user_id in member_ids],
+            }
+            for member_ids in result["together_groups"]
+        ],
+    }
+    if "created_subgroup_ids" in result:
+        preview["created_subgroup_ids"] = result["created_subgroup_ids"]
+    return preview
+
+
+def _insert_subgroups(rows):
+    """Inserta los subgrupos en una sentencia y devuelve sus ids en el orden de `rows`.
+
+    No se usa `sort_by_parameter_order`: SQLite no tiene columna centinela
+    implícita y SQLAlchemy caería a un INSERT por fila. Los ids
+    autoincrementales de un mismo INSERT de varias filas salen en el orden de
+    los VALUES, así que basta con ordenar lo que devuelve RETURNING. En un
+    motor sin RETURNING (MySQL) va un INSERT por subgrupo y el id sale de cada
+    uno: buscarlos después por `created_at` no sirve donde el DATETIME trunca
+    la precisión, y una división tiene a lo más unas decenas de subgrupos.
+    """
+    session = scheduler_db.session
+    if session.get_bind().dialect.insert_returning:
+        return sorted(session.scalars(insert(SubGroup).returning(SubGroup.id), rows).all())
+    return [session.execute(insert(SubGroup).values(**row)).inserted_primary_key[0] for row in rows]
 
 
 def confirm_division(job):
     """Crea los SubGroup y SubGroupMember del job y lo marca como 'confirmed'.
 
-    Devuelve la lista de dicts de los subgrupos creados. No commitea.
+    Son dos sentencias, no una por subgrupo y otra por integrante: los
+    subgrupos entran en un INSERT de varias filas con RETURNING de los ids
+    (`_insert_subgroups`) y las membresías en otro. No se pasa por
+    `add_subgroup_member`: los subgrupos son nuevos, así que no puede haber
+    membresías ocultas que restaurar.
+
+    Devuelve la lista de dicts de los subgrupos creados (como
+    `SubGroup.to_dict`). No commitea.
     """
-    preview = job.result_json
-    created_subgroups = []
-    for group_data in preview["groups"]:
-        subgroup = SubGroup(
-            parent_group_id=job.parent_group_id,
-            name=group_data["name"],
-            auto_generated=True,
-            meta={
+    result = job.result_json
+    created_at = _utcnow()
+    rows = [
+        {
+            "parent_group_id": job.parent_group_id,
+            "name": group_data["name"],
+            "auto_generated": True,
+            "meta": {
                 "compatibility_avg": group_data["compatibility_avg"],
-                "rules_status": group_data["rules_status"],
+                "rules_status": _rules_status(job, group_data["rule_counts"]),
             },
-        )
-        scheduler_db.session.add(subgroup)
-        scheduler_db.session.flush()
-        for member_data in group_data["members"]:
-            add_subgroup_member(subgroup.id, member_data["id"])
-        created_subgroups.append(subgroup.to_dict())
+            "created_at": created_at,
+        }
+        for group_data in result["groups"]
+    ]
+    subgroup_ids = _insert_subgroups(rows) if rows else []
+
+    # Un usuario aparece a lo más una vez por subgrupo (unique parcial).
+    member_ids = [list(dict.fromkeys(group_data["member_ids"])) for group_data in result["groups"]]
+    memberships = [
+        {"subgroup_id": subgroup_id, "user_id": user_id, "added_at": created_at}
+        for subgroup_id, user_ids in zip(subgroup_ids, member_ids, strict=True)
+        for user_id in user_ids
+    ]
+    if memberships:
+        scheduler_db.session.execute(insert(SubGroupMember), memberships)
+    bump_group_revision(job.parent_group_id)
+
+    created_subgroups = [
+        {
+            "id": subgroup_id,
+            "parent_group_id": job.parent_group_id,
+            "name": row["name"],
+            "auto_generated": True,
+            "meta": row["meta"],
+            "created_at": created_at.isoformat(),
+            "member_count": len(user_ids),
+        }
+        for subgroup_id, row, user_ids in zip(subgroup_ids, rows, member_ids, strict=True)
+    ]
 
-    job.status = "confirmed"
+    job.status = JOB_CONFIRMED
     job.result_json = {
-        **preview,
+        **result,
         "created_subgroup_ids": [sg["id"] for sg in created_subgroups],
     }
     return created_subgroups
@@ -940,36 +1608,30 @@ def confirm_division(job):
 def undo_last_division(group_id):
     """Revierte la última división confirmada del grupo.
 
-    Elimina los subgrupos creados por ese job y lo marca como 'undone'.
-    Devuelve (job, subgroups) o (None, []) si no hay job confirmado.
-    No commitea.
+    Elimina los subgrupos creados por ese job y lo marca como 'undone'. Los
+    subgrupos y sus integrantes se ocultan con dos UPDATE (`soft_delete_where`),
+    sin cargarlos. Devuelve (job, cantidad de subgrupos eliminados) o (None, 0)
+    si no hay job confirmado. No commitea.
     """
     last_job = (
-        DivisionJob.query.filter_by(parent_group_id=group_id, status="confirmed")
+        DivisionJob.query.filter_by(parent_group_id=group_id, status=JOB_CONFIRMED)
         .order_by(DivisionJob.timestamp.desc())
         .first()
     )
     if not last_job:
-        return None, []
+        return None, 0
 
     result_json = last_job.result_json or {}
     if "created_subgroup_ids" in result_json:
         created_ids = result_json.get("created_subgroup_ids") or []
-        subgroups = SubGroup.query.filter(
-            SubGroup.parent_group_id == group_id,
-            SubGroup.id.in_(created_ids),
-        ).all()
+        which = SubGroup.id.in_(created_ids)
     else:
-        subgroups = SubGroup.query.filter_by(
-            parent_group_id=group_id,
-            auto_generated=True,
-        ).all()
+        which = SubGroup.auto_generated.is_(True)
+    removed = soft_delete_where(SubGroup, SubGroup.parent_group_id == group_id, which)
+    bump_group_revision(group_id)
 
-    for subgroup in subgroups:
-        subgroup.soft_delete()
-
-    last_job.status = "undone"
-    return last_job, subgroups
+    last_job.status = JOB_UNDONE
+    return last_job, removed
 
 
 def create_manual_subgroup(group_id, name):
@@ -984,6 +1646,12 @@ def create_manual_subgroup(group_id, name):
     return subgroup
 
 
+def delete_subgroup(subgroup):
+    """Oculta el subgrupo y sus integrantes en bloque (`soft_delete_where`). No commitea."""
+    soft_delete_where(SubGroup, SubGroup.id == subgroup.id)
+    bump_group_revision(subgroup.parent_group_id)
+
+
 def get_subgroup_member(subgroup_id, user_id):
     """Busca la membresía activa de un usuario en un subgrupo."""
     return SubGroupMember.query.filter_by(subgroup_id=subgroup_id, user_id=user_id).first()
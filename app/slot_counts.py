@@ -0,0 +1,177 @@
+"""Contador de asistentes por bloque (`Availability.attendee_count`).
+
+Es la cantidad de marcas activas del bloque cuyos dueños siguen siendo
+miembros activos del grupo: el mismo número que el resumen "horarios más
+concurridos" calculaba con un GROUP BY en cada render de `groups.show`. Con el
+contador guardado, ese resumen es un ORDER BY … LIMIT sobre un índice.
+
+El contador nunca se suma ni se resta a ciegas: cada vez que algo lo puede
+mover se recuenta el bloque afectado con una sola sentencia, así que un
+cambio repetido o fuera de orden no acumula deriva. Antes de recontar se
+bloquean las filas de los bloques (`_recount`): dos transacciones que marcan
+el mismo bloque a la vez recuentan por turno, y la segunda ve lo que la
+primera ya confirmó. Se mantiene en la misma transacción que el cambio, por
+dos vías:
+
+- un listener de flush (`install_slot_counters`) ve toda marca, desmarca y
+  cambio de membresía hecho por el ORM —`soft_delete`, `restore_batch`,
+  `leave_group`, `safe_remove_member`, el remapeo— y recuenta lo que tocó;
+- las escrituras en bloque, que no pasan por el flush, llaman a
+  `recount_slots` explícitamente.
+
+Orden de bloqueos: primero la fila del grupo y después las de sus bloques.
+Todo camino que recuenta dentro de una escritura del grupo ya subió su
+revisión (`bump_group_revision`, o el listener de app/group_revision.py, que
+se registra antes que este), igual que el guardado de ajustes, que actualiza
+el grupo antes de remapear. Con el orden al revés, un autosave y un cambio de
+ajustes simultáneos se bloquean en cruz en Postgres.
+
+Por eso los guardados de un mismo grupo se atienden de a uno: cada uno tiene
+tomada la fila del grupo desde que sube la revisión hasta su commit. Es a
+propósito: la revisión tiene que cambiar en la misma transacción que las
+marcas, o un caché por revisión guardaría datos viejos con el número nuevo. Lo
+que queda de un autosave después de ese UPDATE son unas pocas sentencias en
+bloque y el commit, y los grupos distintos no se esperan entre sí.
+
+Lo que borra la base por su cuenta (un `ON DELETE CASCADE` al eliminar un
+usuario) no lo ve nadie: para eso está `python -m app.db.rebuild_slot_counts`.
+"""
+
+from sqlalchemy import and_, event, func, inspect, select, true, update
+from sqlalchemy.orm.base import NO_VALUE
+
+from app.extensions import scheduler_db
+from app.models import Availability, GroupMember, UserAvailability
+
+_availability = Availability.__table__
+_marks = UserAvailability.__table__
+_members = GroupMember.__table__
+
+
+def attendee_count_expression():
+    """Subconsulta correlacionada: asistentes activos del bloque de la fila."""
+    return (
+        select(func.count())
+        .select_from(
+            _marks.join(
+                _members,
+                and_(
+                    _members.c.user_id == _marks.c.user_id,
+                    _members.c.deleted_at.is_(None),
+                ),
+            )
+        )
+        .where(
+            _marks.c.availability_id == _availability.c.id,
+            _marks.c.deleted_at.is_(None),
+            _members.c.group_id == _availability.c.group_id,
+        )
+        .scalar_subquery()
+    )
+
+
+def lock_slots_statement(where):
+    """SELECT … FOR NO KEY UPDATE de los bloques, en orden de id.
+
+    Es el mismo bloqueo que toma el UPDATE, pero antes de contar: en Postgres
+    (READ COMMITTED) la subconsulta de `attendee_count_expression` usa la foto
+    del inicio de la sentencia, así que sin esto dos transacciones que marcan
+    el mismo bloque cuentan cada una sin la marca de la otra y la que confirma
+    última deja el contador uno abajo. Con el bloqueo tomado en una sentencia
+    aparte, el recuento arranca con una foto que ya incluye a la otra. El
+    orden por id evita que dos recuentos de varios bloques se bloqueen en
+    cruz. En SQLite (una sola escritura a la vez) no se emite nada.
+    """
+    return (
+        select(_availability.c.id)
+        .where(where)
+        .order_by(_availability.c.id)
+        .with_for_update(key_share=True)
+    )
+
+
+def _recount(connection, where):
+    connection.execute(lock_slots_statement(where))
+    connection.execute(
+        update(_availability).where(where).values(attendee_count=attendee_count_expression())
+    )
+
+
+def recount_slots(availability_ids, connection=None):
+    """Recuenta los bloques dados."""
+    availability_ids = set(availability_ids)
+    if availability_ids:
+        _recount(
+            connection or scheduler_db.session.connection(),
+            _availability.c.id.in_(availability_ids),
+        )
+
+
+def recount_member_slots(group_id, user_id, connection=None):
+    """Recuenta los bloques que el usuario tiene marcados en el grupo.
+
+    Es lo que cambia cuando entra, sale o vuelve un miembro: sus marcas no se
+    tocan, pero dejan (o vuelven a) contar.
+    """
+    marked = select(_marks.c.availability_id).where(
+        _marks.c.user_id == user_id, _marks.c.deleted_at.is_(None)
+    )
+    _recount(
+        connection or scheduler_db.session.connection(),
+        and_(_availability.c.group_id == group_id, _availability.c.id.in_(marked)),
+    )
+
+
+def recount_group_slots(group_id=None, connection=None):
+    """Recuenta todos los bloques de un grupo, o de toda la base si es None."""
+    where = _availability.c.group_id == group_id if group_id is not None else true()
+    _recount(connection or scheduler_db.session.connection(), where)
+
+
+def _changed(instance, *attributes):
+    state = inspect(instance)
+    return any(state.attrs[name].history.has_changes() for name in attributes)
+
+
+def _loaded(instance, attribute):
+    """Valor ya cargado del atributo, sin emitir SQL (estamos dentro de un flush)."""
+    value = inspect(instance).attrs[attribute].loaded_value
+    return None if value is NO_VALUE else value
+
+
+def _touched_by_flush(session):
+    """(bloques, (grupo, usuario)) que el flush en curso pudo mover."""
+    slots = set()
+    members = set()
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, UserAvailability):
+            if instance in session.dirty and not _changed(
+                instance, "deleted_at", "availability_id", "user_id"
+            ):
+                continue
+            # Si la marca cambió de bloque cuentan los dos: el viejo y el nuevo.
+            history = inspect(instance).attrs.availability_id.history
+            slots.update((*history.added, *history.deleted, _loaded(instance, "availability_id")))
+        elif isinstance(instance, GroupMember):
+            if instance in session.dirty and not _changed(instance, "deleted_at", "user_id"):
+                continue
+            members.add((_loaded(instance, "group_id"), _loaded(instance, "user_id")))
+    slots.discard(None)
+    members = {(group_id, user_id) for group_id, user_id in members if group_id and user_id}
+    return slots, members
+
+
+def _after_flush(session, _flush_context):
+    slots, members = _touched_by_flush(session)
+    if not slots and not members:
+        return
+    connection = session.connection()
+    recount_slots(slots, connection)
+    for group_id, user_id in members:
+        recount_member_slots(group_id, user_id, connection)
+
+
+def install_slot_counters():
+    """Registra el listener. Idempotente: seguro de llamar más de una vez."""
+    if not event.contains(scheduler_db.session, "after_flush", _after_flush):
+        event.listen(scheduler_db.session, "after_flush", _after_flush)
@@ -9,11 +9,11 @@ seteado. Para incluirlas (papelera, restauración) se usa:
 import contextvars
 from contextlib import contextmanager
 
-from sqlalchemy import event
+from sqlalchemy import event, update
 from sqlalchemy.orm import with_loader_criteria
 
 from app.extensions import scheduler_db
-from app.models.mixins import SoftDeleteMixin
+from app.models.mixins import SoftDeleteMixin, _utcnow
 
 INCLUDE_DELETED = "include_deleted"
 
@@ -70,6 +70,38 @@ def active_or_404(instance):
     return instance
 
 
+def soft_delete_where(model, *criteria, at=None):
+    """`soft_delete` en bloque: oculta las filas de `model` que cumplen `criteria`.
+
+    Hace la misma cascada que `soft_delete`, con el mismo `deleted_at` para
+    todo el lote (así `restore_batch` la revierte igual), pero con un UPDATE
+    por modelo y camino de la cascada (`soft_delete_cascade_where`) en vez de
+    cargar cada hijo y marcarlo en el flush. Solo toca filas activas.
+
+    Va de las hojas a la raíz: cada nivel encuentra a sus hijos por padres
+    que todavía no se marcaron. Las subconsultas son sobre otra tabla, no la
+    que se actualiza (MySQL no deja leer la tabla destino en el UPDATE).
+
+    Los objetos ya cargados en la sesión quedan sincronizados. No pasa por el
+    flush: quien oculte membresías de un grupo tiene que recontar sus bloques
+    (app/slot_counts.py). Devuelve cuántas filas de `model` ocultó. No commitea.
+    """
+    return _soft_delete_tree(model, criteria, at or _utcnow())
+
+
+def _soft_delete_tree(model, criteria, deleted_at):
+    criteria = (*criteria, model.deleted_at.is_(None))
+    for child, child_criteria in model.soft_delete_cascade_where(criteria):
+        _soft_delete_tree(child, child_criteria, deleted_at)
+    result = scheduler_db.session.execute(
+        update(model)
+        .where(*criteria)
+        .values(deleted_at=deleted_at)
+        .execution_options(synchronize_session="fetch")
+    )
+    return result.rowcount
+
+
 def restore_batch(root):
     """Restaura `root` y todo lo que se ocultó en la misma operación.
 
@@ -1,7 +1,9 @@
 document.addEventListener('DOMContentLoaded', () => {
-  const { group_id: GROUP_ID, active_weekdays: ACTIVE_WEEKDAYS } = JSON.parse(
-    document.getElementById('availability-embed-data').textContent
-  );
+  const {
+    group_id: GROUP_ID,
+    active_weekdays: ACTIVE_WEEKDAYS,
+    grid_version: INITIAL_GRID_VERSION,
+  } = JSON.parse(document.getElementById('availability-embed-data').textContent);
 
   const checkboxes = document.querySelectorAll('.availability-checkbox');
   const toggleButtons = document.querySelectorAll('.availability-toggle');
@@ -58,7 +60,22 @@ document.addEventListener('DOMContentLoaded', () => {
   }
   updateCounters();
 
-  // ------- Autoguardado (debounced) -------
+  // ------- Autoguardado (debounced, por diferencias) -------
+  // Se manda solo lo que cambió desde el último guardado confirmado, junto con
+  // la versión de la grilla sobre la que se hizo el cambio. Si el servidor ya
+  // va por otra versión (otra pestaña), responde 409 con su estado: se adopta
+  // y se vuelve a mandar encima lo que esta pestaña todavía no guardó.
+  const cellKey = (checkbox) => `${checkbox.dataset.day}:${checkbox.dataset.blockIndex}`;
+  const toSlot = (key) => {
+    const [weekday, blockIndex] = key.split(':');
+    return { weekday: Number.parseInt(weekday), block_index: Number.parseInt(blockIndex) };
+  };
+  const checkboxByCell = new Map(Array.from(checkboxes).map((checkbox) => [cellKey(checkbox), checkbox]));
+
+  let gridVersion = INITIAL_GRID_VERSION;
+  let savedCells = new Set(
+    Array.from(checkboxes).filter((checkbox) => checkbox.checked).map(cellKey)
+  );
   let saveTimer = null;
   let saveInFlight = false;
   let pendingResave = false;
@@ -70,28 +87,65 @@ document.addEventListener('DOMContentLoaded', () => {
     saveTimer = setTimeout(persistAvailability, 600);
   }
 
+  function pendingDelta() {
+    const added = [];
+    const removed = [];
+    for (const [key, checkbox] of checkboxByCell) {
+      if (checkbox.checked && !savedCells.has(key)) added.push(key);
+      if (!checkbox.checked && savedCells.has(key)) removed.push(key);
+    }
+    return { added, removed };
+  }
+
+  function adoptServerState(version, slots) {
+    // Las celdas que esta pestaña cambió y aún no guardó se conservan: son la
+    // última intención del usuario. El resto toma el estado del servidor.
+    const { added, removed } = pendingDelta();
+    const localChanges = new Set([...added, ...removed]);
+    gridVersion = version;
+    savedCells = new Set(slots.map((slot) => `${slot.weekday}:${slot.block_index}`));
+    for (const [key, checkbox] of checkboxByCell) {
+      if (localChanges.has(key)) continue;
+      setChecked(checkbox, savedCells.has(key), { skipSave: true });
+    }
+    updateCounters();
+    return localChanges.size > 0;
+  }
+
   async function persistAvailability() {
     if (saveInFlight) {
       pendingResave = true;
       return;
     }
+    const { added, removed } = pendingDelta();
+    if (added.length === 0 && removed.length === 0) {
+      if (saveStatus) saveStatus.textContent = 'Guardado ✓';
+      return;
+    }
     saveInFlight = true;
     if (saveStatus) saveStatus.textContent = 'Guardando…';
 
-    const slots = Array.from(checkboxes)
-      .filter((checkbox) => checkbox.checked)
-      .map((checkbox) => ({
-        weekday: Number.parseInt(checkbox.dataset.day),
-        block_index: Number.parseInt(checkbox.dataset.blockIndex),
-      }));
-
     try {
       const response = await fetch(`/groups/${GROUP_ID}/availability/autosave`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ slots }),
+        body: JSON.stringify({
+          added: added.map(toSlot),
+          removed: removed.map(toSlot),
+          version: gridVersion,
+        }),
       });
+      if (response.status === 409) {
+        const current = await response.json();
+        if (adoptServerState(current.version, current.slots)) pendingResave = true;
+        if (saveStatus) saveStatus.textContent = 'Sincronizado con otra pestaña.';
+        return;
+      }
       if (!response.ok) throw new Error('save failed');
+      const result = await response.json();
+      gridVersion = result.version;
+      for (const key of added) savedCells.add(key);
+      for (const key of removed) savedCells.delete(key);
       if (saveStatus) saveStatus.textContent = 'Guardado ✓';
     } catch (error) {
       console.error('autosave error:', error);
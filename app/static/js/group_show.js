@@ -4,8 +4,192 @@
   globalThis.CAN_VIEW_AVAILABILITY = !!globalThis.__EMBED__.can_view_availability;
   globalThis.__GROUP_MEMBERS__ = globalThis.__EMBED__.members || [];
 
+  // Grilla del grupo en compacto (ver `grid_payload` en availability_service):
+  // conteos por celda y un bitmap por miembro, ambos en base64. El bit de la
+  // celda (día, bloque) es `día * bloques_por_día + bloque`, igual que en el
+  // servidor.
+  const decodeBase64 = (value) => Uint8Array.from(atob(value || ''), (char) => char.codePointAt(0));
+
+  const gridData = globalThis.__EMBED__.grid || null;
+  const gridBitmaps = new Map();
+  if (gridData) {
+    gridData.user_ids.forEach((userId, i) => gridBitmaps.set(userId, decodeBase64(gridData.bitmaps[i])));
+  }
+
+  const gridCellCount = () => 7 * (gridData ? gridData.block_starts.length : 0);
+
+  const baseGridCounts = () => {
+    const raw = decodeBase64(gridData?.counts);
+    const counts = new Uint16Array(gridCellCount());
+    for (let i = 0; i < counts.length; i++) counts[i] = raw[2 * i] | (raw[2 * i + 1] << 8);
+    return counts;
+  };
+
+  // Llama a `visit(índice)` por cada bit encendido del bitmap, salteando bytes en cero.
+  const forEachSetBit = (bytes, limit, visit) => {
+    for (let byteIndex = 0; byteIndex < bytes.length; byteIndex++) {
+      const byte = bytes[byteIndex];
+      if (!byte) continue;
+      for (let bit = 0; bit < 8; bit++) {
+        const index = byteIndex * 8 + bit;
+        if ((byte >> bit) & 1 && index < limit) visit(index);
+      }
+    }
+  };
+
+  // Techo de tarjetas del resumen, igual que AVAILABILITY_SUMMARY_LIMIT.
+  const SUMMARY_LIMIT = 200;
+
+  const minutesToTime = (total) => `${String(Math.floor(total / 60)).padStart(2, '0')}:${String(total % 60).padStart(2, '0')}`;
+
+  // Heatmap en canvas. `draw(counts, total)` repinta con los conteos dados
+  // (total = personas consideradas, lo que sería el 100%); `userFilter` decide
+  // qué nombres muestra el tooltip cuando hay filtros activos.
+  let heatmap = null;
+  const setupHeatmap = () => {
+    const canvas = document.getElementById('availabilityHeatmap');
+    const tooltip = document.getElementById('availabilityHeatmapTooltip');
+    if (!canvas || !gridData || gridData.block_starts.length === 0) return;
+
+    const weekdayNames = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo'];
+    const blockStarts = gridData.block_starts;
+    const blocksPerDay = blockStarts.length;
+    const weekdays = gridData.weekdays;
+    const labelWidth = 56;
+    const headerHeight = 24;
+    const rowHeight = blocksPerDay > 48 ? 6 : 20;
+    const memberByUserId = new Map(
+      (globalThis.__GROUP_MEMBERS__ || []).map((member) => [Number.parseInt(member.user_id), member])
+    );
+    const cellUsers = new Map();
+    let counts = baseGridCounts();
+    let total = Math.max(1, gridData.user_ids.length);
+    let userFilter = () => true;
+    let hovered = null;
+    let hoverTimer = null;
+
+    const layout = () => {
+      const width = canvas.parentElement.clientWidth;
+      return { width, colWidth: (width - labelWidth) / weekdays.length, height: headerHeight + blocksPerDay * rowHeight };
+    };
+
+    const draw = () => {
+      const { width, colWidth, height } = layout();
+      const ratio = globalThis.devicePixelRatio || 1;
+      canvas.width = Math.round(width * ratio);
+      canvas.height = Math.round(height * ratio);
+      canvas.style.height = `${height}px`;
+      const ctx = canvas.getContext('2d');
+      ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+      ctx.clearRect(0, 0, width, height);
+      ctx.font = '11px sans-serif';
+      ctx.fillStyle = getComputedStyle(canvas).color;
+      ctx.textBaseline = 'middle';
+
+      weekdays.forEach((weekday, col) => {
+        ctx.fillText(weekdayNames[weekday], labelWidth + col * colWidth + 4, headerHeight / 2);
+      });
+      for (let block = 0; block < blocksPerDay; block++) {
+        // Con filas finas se rotula solo cada hora en punto.
+        if (rowHeight >= 16 || blockStarts[block] % 60 === 0) {
+          ctx.fillText(minutesToTime(blockStarts[block]), 0, headerHeight + block * rowHeight + Math.min(rowHeight, 12) / 2);
+        }
+      }
+
+      weekdays.forEach((weekday, col) => {
+        for (let block = 0; block < blocksPerDay; block++) {
+          const count = counts[weekday * blocksPerDay + block];
+          if (!count) continue;
+          ctx.fillStyle = `rgba(37, 99, 235, ${Math.min(1, 0.15 + 0.85 * count / total)})`;
+          ctx.fillRect(labelWidth + col * colWidth + 1, headerHeight + block * rowHeight, colWidth - 2, rowHeight - (rowHeight > 8 ? 1 : 0));
+        }
+      });
+    };
+
+    const fetchCellUsers = (weekday, block) => {
+      const key = `${weekday}|${block}`;
+      if (!cellUsers.has(key)) {
+        const url = `${canvas.dataset.cellUrl}?weekday=${weekday}&block=${block}`;
+        cellUsers.set(key, fetch(url, { headers: { 'Accept': 'application/json' } })
+          .then((res) => res.json())
+          .then((data) => (data.ok ? data.user_ids : []))
+          .catch((err) => {
+            console.error('Error loading cell users:', err);
+            cellUsers.delete(key);
+            return [];
+          }));
+      }
+      return cellUsers.get(key);
+    };
+
+    const cellAt = (event) => {
+      const rect = canvas.getBoundingClientRect();
+      const x = event.clientX - rect.left;
+      const y = event.clientY - rect.top;
+      const { colWidth } = layout();
+      const col = Math.floor((x - labelWidth) / colWidth);
+      const block = Math.floor((y - headerHeight) / rowHeight);
+      if (x < labelWidth || y < headerHeight || col >= weekdays.length || block >= blocksPerDay) return null;
+      return { weekday: weekdays[col], block, x, y };
+    };
+
+    const showTooltip = (cell, text) => {
+      tooltip.textContent = text;
+      tooltip.style.left = `${cell.x + 12}px`;
+      tooltip.style.top = `${cell.y + 12}px`;
+      tooltip.classList.remove('hidden');
+    };
+
+    canvas.addEventListener('mousemove', (event) => {
+      const cell = cellAt(event);
+      if (!cell) {
+        hovered = null;
+        tooltip.classList.add('hidden');
+        return;
+      }
+      const start = blockStarts[cell.block];
+      const label = `${weekdayNames[cell.weekday]} ${minutesToTime(start)} – ${minutesToTime(start + gridData.block_minutes)}`;
+      const count = counts[cell.weekday * blocksPerDay + cell.block];
+      const key = `${cell.weekday}|${cell.block}`;
+      showTooltip(cell, `${label} · ${count} ${count === 1 ? 'persona' : 'personas'}`);
+      if (hovered === key || !count) {
+        hovered = key;
+        return;
+      }
+      hovered = key;
+      clearTimeout(hoverTimer);
+      hoverTimer = setTimeout(async () => {
+        const userIds = await fetchCellUsers(cell.weekday, cell.block);
+        if (hovered !== key) return;
+        const names = userIds
+          .filter((userId) => userFilter(userId))
+          .map((userId) => memberByUserId.get(userId)?.name || `Usuario ${userId}`);
+        showTooltip(cell, `${label} · ${names.join(', ')}`);
+      }, 150);
+    });
+    canvas.addEventListener('mouseleave', () => {
+      hovered = null;
+      tooltip.classList.add('hidden');
+    });
+
+    let resizeTimer = null;
+    globalThis.addEventListener('resize', () => {
+      clearTimeout(resizeTimer);
+      resizeTimer = setTimeout(draw, 150);
+    });
+
+    heatmap = {
+      draw: (newCounts, newTotal, filter) => {
+        counts = newCounts;
+        total = Math.max(1, newTotal);
+        userFilter = filter || (() => true);
+        draw();
+      },
+    };
+    draw();
+  };
+
   const setupScheduleFiltering = () => {
-    const chips = Array.from(document.querySelectorAll('.availability-user-chip'));
     const missingUserItems = Array.from(document.querySelectorAll('.availability-missing-user'));
     const filterButtons = Array.from(document.querySelectorAll('.schedule-filter-chip'));
     for (const button of filterButtons) button.setAttribute('aria-pressed', 'false');
@@ -21,7 +205,6 @@
     const userToGroupMember = globalThis.__EMBED__.user_gm_map || {};
     const memberToCategories = globalThis.__EMBED__.member_category_map || {};
     const userToSubgroups = globalThis.__EMBED__.user_subgroup_map || {};
-    const availabilityRows = Array.isArray(globalThis.__EMBED__.availability) ? globalThis.__EMBED__.availability : [];
     const respondedUserIds = new Set(
       (Array.isArray(globalThis.__EMBED__.responded_user_ids) ? globalThis.__EMBED__.responded_user_ids : [])
         .map((value) => Number.parseInt(value))
@@ -157,29 +340,29 @@
       button.setAttribute('aria-pressed', 'false');
     };
 
+    // Recorre los bitmaps de los usuarios filtrados una sola vez: de ahí salen
+    // las listas de los resúmenes y los conteos del heatmap.
     const buildFilteredAvailability = (filteredUsers) => {
       const availabilityBySlot = new Map();
-
-      for (const [userId, weekday, startMinutes] of availabilityRows) {
-        const parsedUserId = Number.parseInt(userId);
-        const parsedWeekday = Number.parseInt(weekday);
-        const parsedMinutes = Number.parseInt(startMinutes);
-        if (!Number.isInteger(parsedUserId) || !Number.isInteger(parsedWeekday) || !Number.isInteger(parsedMinutes)) {
-          continue;
-        }
-
-        if (!filteredUsers.has(parsedUserId)) {
-          continue;
-        }
-
-        const key = `${parsedWeekday}|${parsedMinutes}`;
-        if (!availabilityBySlot.has(key)) {
-          availabilityBySlot.set(key, new Set());
-        }
-        availabilityBySlot.get(key).add(parsedUserId);
+      const counts = new Uint16Array(gridCellCount());
+      const blocksPerDay = gridData ? gridData.block_starts.length : 0;
+
+      for (const userId of filteredUsers) {
+        const bytes = gridBitmaps.get(userId);
+        if (!bytes) continue;
+        forEachSetBit(bytes, counts.length, (index) => {
+          counts[index] += 1;
+          const weekday = Math.floor(index / blocksPerDay);
+          const startMinutes = gridData.block_starts[index % blocksPerDay];
+          const key = `${weekday}|${startMinutes}`;
+          if (!availabilityBySlot.has(key)) {
+            availabilityBySlot.set(key, new Set());
+          }
+          availabilityBySlot.get(key).add(userId);
+        });
       }
 
-      return availabilityBySlot;
+      return { availabilityBySlot, counts };
     };
 
     const renderAllSection = (availabilityBySlot, filteredCount) => {
@@ -242,7 +425,10 @@
         return;
       }
 
-      for (const slot of partialSlots) {
+      // Mismo techo que el resumen del servidor (AVAILABILITY_SUMMARY_LIMIT), y
+      // la lista de personas de cada tarjeta se arma recién al abrirla: con
+      // grillas finas y mil miembros son cientos de miles de nodos.
+      for (const slot of partialSlots.slice(0, SUMMARY_LIMIT)) {
         const details = document.createElement('details');
         details.className = 'bg-light-surface dark:bg-dark-surface border border-light-border dark:border-dark-border rounded p-3';
 
@@ -252,48 +438,31 @@
         summary.textContent = `${weekdayNames[slot.weekday]} ${toTimeString(slot.startMinutes)} — ${count} ${count === 1 ? 'persona disponible' : 'personas disponibles'}`;
         details.appendChild(summary);
 
-        const ul = document.createElement('ul');
-        ul.className = 'mt-2 grid grid-cols-1 sm:grid-cols-2 gap-2';
-        for (const userId of slot.users) {
-          const li = document.createElement('li');
-          const member = memberByUserId.get(Number.parseInt(userId));
-          const label = document.createElement('span');
-          label.className = 'inline-block text-xs px-2 py-1 rounded bg-light-muted/40 dark:bg-dark-muted/40';
-          label.textContent = member ? `${member.name} ${member.email || ''}`.trim() : `Usuario ${userId}`;
-          li.appendChild(label);
-          ul.appendChild(li);
-        }
-        details.appendChild(ul);
+        details.addEventListener('toggle', () => {
+          if (!details.open || details.querySelector('ul')) return;
+          const ul = document.createElement('ul');
+          ul.className = 'mt-2 grid grid-cols-1 sm:grid-cols-2 gap-2';
+          for (const userId of slot.users) {
+            const li = document.createElement('li');
+            const member = memberByUserId.get(Number.parseInt(userId));
+            const label = document.createElement('span');
+            label.className = 'inline-block text-xs px-2 py-1 rounded bg-light-muted/40 dark:bg-dark-muted/40';
+            label.textContent = member ? `${member.name} ${member.email || ''}`.trim() : `Usuario ${userId}`;
+            li.appendChild(label);
+            ul.appendChild(li);
+          }
+          details.appendChild(ul);
+        });
         partialList.appendChild(details);
       }
     };
 
-    const resetTableCellVisuals = () => {
-      for (const cell of document.querySelectorAll('td .schedule-cell-body')) {
-        cell.classList.remove('hidden');
-        const wrapper = cell.closest('td');
-        if (wrapper) {
-          wrapper.classList.remove('bg-light-muted/20', 'dark:bg-dark-muted/20');
-        }
-      }
-    };
-
-    const updateVisibleScheduleUsers = (visibilityByUser) => {
+    const collectFilteredUsers = (visibilityByUser) => {
       const filteredUsers = new Set();
-      let visibleChips = 0;
-
-      for (const chip of chips) {
-        const userId = Number.parseInt(chip.dataset.userId);
-        const show = visibilityByUser.get(userId) === true;
-        chip.style.display = show ? '' : 'none';
-
-        if (show && Number.isInteger(userId)) {
-          filteredUsers.add(userId);
-          visibleChips += 1;
-        }
+      for (const [userId, visible] of visibilityByUser.entries()) {
+        if (visible) filteredUsers.add(userId);
       }
-
-      return { filteredUsers, visibleChips };
+      return filteredUsers;
     };
 
     const updateVisibleMissingUsers = () => {
@@ -315,7 +484,7 @@
       return visibleMissingUsers;
     };
 
-    const updateFilterStats = (visibleChips, visibleMissingUsers) => {
+    const updateFilterStats = (visibleUsers, visibleMissingUsers) => {
       if (!stats) {
         return;
       }
@@ -324,23 +493,21 @@
       const subgroupCount = selectedSubgroupIds.size + (includeNoSubgroup ? 1 : 0);
       const totalActiveCount = categoryCount + subgroupCount;
       stats.textContent = totalActiveCount > 0
-        ? `${visibleChips} coincidencia(s) en horarios y ${visibleMissingUsers} sin horario con ${totalActiveCount} filtro(s) en modo ${filterMode.toUpperCase()}`
+        ? `${visibleUsers} coincidencia(s) en horarios y ${visibleMissingUsers} sin horario con ${totalActiveCount} filtro(s) en modo ${filterMode.toUpperCase()}`
         : 'Sin filtros activos';
     };
 
     const applyFilters = () => {
       const visibilityByUser = buildUserVisibilityMap();
-      const { filteredUsers, visibleChips } = updateVisibleScheduleUsers(visibilityByUser);
+      const filteredUsers = collectFilteredUsers(visibilityByUser);
       const visibleMissingUsers = updateVisibleMissingUsers();
 
-      // En la grilla solo ocultamos nombres que no cumplen filtro, sin cambiar fondo de celdas.
-      resetTableCellVisuals();
-
-      const availabilityBySlot = buildFilteredAvailability(filteredUsers);
+      const { availabilityBySlot, counts } = buildFilteredAvailability(filteredUsers);
       renderAllSection(availabilityBySlot, filteredUsers.size);
       renderPartialSection(availabilityBySlot, filteredUsers);
+      heatmap?.draw(counts, filteredUsers.size, (userId) => filteredUsers.has(userId));
 
-      updateFilterStats(visibleChips, visibleMissingUsers);
+      updateFilterStats(filteredUsers.size, visibleMissingUsers);
     };
 
     filterModeSelect?.addEventListener('change', () => {
@@ -561,9 +728,56 @@
     });
   }
 
+  // Vista previa del cambio de grilla: antes de guardar, el admin ve cuántas
+  // marcas se reubicarían u ocultarían. El endpoint no escribe nada.
+  let previewTimer = null;
+  let previewRequest = 0;
+  const setupSettingsPreview = () => {
+    const form = document.getElementById('availabilitySettingsForm');
+    const output = document.getElementById('availabilitySettingsPreview');
+    if (!form || !output || !form.dataset.previewUrl) return;
+
+    const render = (data) => {
+      if (!data.ok) {
+        output.textContent = data.message || '';
+        return;
+      }
+      if (!data.total) {
+        output.textContent = 'No hay respuestas guardadas que se vean afectadas.';
+        return;
+      }
+      const parts = [];
+      if (data.remapped) parts.push(`${data.remapped} se reubican en los bloques nuevos`);
+      if (data.hidden) parts.push(`${data.hidden} quedan ocultas (no se borran)`);
+      if (data.untouched) parts.push(`${data.untouched} siguen igual`);
+      output.textContent = `De ${data.total} marcas guardadas: ${parts.join(', ')}.`;
+    };
+
+    const refresh = async () => {
+      const params = new URLSearchParams(new FormData(form));
+      params.delete('csrf_token');
+      const current = ++previewRequest;
+      try {
+        const res = await fetch(`${form.dataset.previewUrl}?${params}`, { headers: { 'Accept': 'application/json' } });
+        const data = await res.json();
+        // Si el admin siguió cambiando campos, solo vale la última respuesta.
+        if (current === previewRequest) render(data);
+      } catch (err) {
+        console.error('Error previewing availability settings:', err);
+      }
+    };
+
+    form.addEventListener('change', () => {
+      clearTimeout(previewTimer);
+      previewTimer = setTimeout(refresh, 300);
+    });
+  };
+
   document.addEventListener('DOMContentLoaded', () => {
     // Las categorías ya vienen renderizadas por el servidor; loadCategories()
     // solo se usa para refrescar tras crear/eliminar.
     setupCategoryCreate();
+    setupHeatmap();
     setupScheduleFiltering();
+    setupSettingsPreview();
   });
@@ -5,8 +5,13 @@
 (function () {
   "use strict";
 
+  // Cada cuánto se consulta el estado de una división encolada
+  const JOB_POLL_MS = 1000;
+
   let ruleCounter = 0;
   let currentJobId = null;
+  // URL de cancelación del job que se está sondeando (null si no hay ninguno)
+  let pendingCancelUrl = null;
   let manualGroupCounter = 0;
   let manualGroups = [];
 
@@ -32,6 +37,8 @@
   const previewPanel = document.getElementById("preview-panel");
   const previewContent = document.getElementById("preview-content");
   const loadingOverlay = document.getElementById("loading-overlay");
+  const loadingMessage = document.getElementById("loading-message");
+  const cancelGenerationBtn = document.getElementById("cancel-generation-btn");
   const compatibilityThresholdInput = document.getElementById(
     "compatibility_threshold",
   );
@@ -113,6 +120,7 @@
     closeTogetherMemberDropdown();
 
     confirmBtn.addEventListener("click", confirmDivision);
+    cancelGenerationBtn.addEventListener("click", cancelGeneration);
     redoBtn.addEventListener("click", redoDivision);
     exportBtn.addEventListener("click", exportResults);
     undoBtn.addEventListener("click", undoLastDivision);
@@ -518,11 +526,22 @@
         throw new Error(data.error || "Error al generar subgrupos");
       }
 
+      // El servidor solo encola la división: se sondea hasta que termine
+      const job = await waitForJob(data);
+
+      if (job.status === "cancelled") {
+        showInlineAlert("División cancelada.", "info");
+        return;
+      }
+      if (job.status !== "pending") {
+        throw new Error(job.error || "Error al generar subgrupos");
+      }
+
       // Guardar job_id
-      currentJobId = data.job_id;
+      currentJobId = job.job_id;
 
       // Renderizar preview
-      renderPreview(data);
+      renderPreview(job.preview);
     } catch (error) {
       showInlineAlert(`Error: ${error.message}`, "danger");
       console.error(error);
@@ -531,6 +550,62 @@
     }
   }
 
+  /**
+   * Sondea el job encolado hasta que deja de estar en cola o corriendo.
+   * Mientras tanto muestra el avance y permite cancelarlo.
+   */
+  async function waitForJob(queued) {
+    pendingCancelUrl = queued.cancel_url;
+    cancelGenerationBtn.classList.remove("hidden");
+
+    try {
+      for (;;) {
+        const response = await fetch(queued.status_url);
+        const job = await response.json();
+
+        if (!response.ok) {
+          throw new Error(job.error || "Error al consultar la división");
+        }
+        if (job.status !== "queued" && job.status !== "running") {
+          return job;
+        }
+
+        loadingMessage.textContent =
+          job.status === "queued"
+            ? "División en cola..."
+            : `Generando subgrupos optimizados... ${job.progress}%`;
+
+        await new Promise((resolve) => setTimeout(resolve, JOB_POLL_MS));
+      }
+    } finally {
+      pendingCancelUrl = null;
+      cancelGenerationBtn.classList.add("hidden");
+    }
+  }
+
+  /**
+   * Pide cancelar el job que se está sondeando. El sondeo se entera solo
+   * cuando el job pasa a "cancelled".
+   */
+  async function cancelGeneration() {
+    if (!pendingCancelUrl) {
+      return;
+    }
+
+    cancelGenerationBtn.disabled = true;
+    try {
+      const response = await fetch(pendingCancelUrl, { method: "POST" });
+      if (!response.ok) {
+        const data = await response.json();
+        showInlineAlert(data.error || "No se pudo cancelar la división.", "warning");
+      }
+    } catch (error) {
+      console.error(error);
+    } finally {
+      cancelGenerationBtn.disabled = false;
+    }
+  }
+
   /**
    * Renderiza el preview de subgrupos
    */
@@ -804,6 +879,7 @@
    */
   function hideLoading() {
     loadingOverlay.style.display = "none";
+    loadingMessage.textContent = "Generando subgrupos optimizados...";
   }
 
   // Inicializar cuando el DOM esté listo
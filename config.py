@@ -48,3 +48,33 @@ class Config:  # pylint: disable=too-few-public-methods
     SESSION_COOKIE_SECURE = not DEBUG
 
     URL = os.getenv("URL")
+
+    # Antigüedad mínima de una marca de disponibilidad oculta para que
+    # `python -m app.db.compact_tombstones` la borre de verdad.
+    TOMBSTONE_MAX_AGE_DAYS = int(os.getenv("TOMBSTONE_MAX_AGE_DAYS", "30"))
+
+    # Segundos de búsqueda local que se dan a cada división automática después
+    # del greedy (ver `SubGroupService._optimize_groups`). 0 la apaga.
+    DIVISION_SEARCH_SECONDS = float(os.getenv("DIVISION_SEARCH_SECONDS", "1.0"))
+
+    # Modo multi-arranque de la división automática: corridas del solver con
+    # distinto orden (1 lo apaga) y procesos entre los que se reparten.
+    DIVISION_RESTARTS = int(os.getenv("DIVISION_RESTARTS", "1"))
+    DIVISION_WORKERS = int(os.getenv("DIVISION_WORKERS", str(os.cpu_count() or 1)))
+
+    # Las divisiones corren fuera de la request, en hilos del proceso web (ver
+    # `app.services.division_jobs`); las que no entran esperan en cola. Con
+    # DIVISION_JOBS_ASYNC apagado corren dentro de la request que las encola.
+    DIVISION_JOB_THREADS = int(os.getenv("DIVISION_JOB_THREADS", "1"))
+    DIVISION_JOBS_ASYNC = os.getenv("DIVISION_JOBS_ASYNC", "True").lower() in ("true", "1", "t")
+    # Un job en "running" sin aviso de avance hace más de esto se da por
+    # abandonado (su proceso murió) y el próximo proceso que arranca lo retoma.
+    DIVISION_JOB_STALE_SECONDS = int(os.getenv("DIVISION_JOB_STALE_SECONDS", "300"))
+
+    # Caché de lecturas por grupo y revisión (ver `app.cache`): "memory" por
+    # proceso, "sqlite" en un archivo que comparten los workers, "none" apagado.
+    CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+    # Sin valor, `scheduler-cache.sqlite` en la carpeta instance de la app.
+    CACHE_PATH = os.getenv("CACHE_PATH")
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+    CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "300"))
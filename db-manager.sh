@@ -42,7 +42,9 @@ show_menu() {
     echo "  4) 🔄 Reset - Eliminar todo y recrear con datos"
     echo "  5) 🗑️  Drop - Eliminar todas las tablas"
     echo "  6) 📊 Status - Ver estado de la base de datos"
-    echo "  7) 🚪 Exit - Salir"
+    echo "  7) 🧮 Recount - Recalcular contadores de asistentes por bloque"
+    echo "  8) 🧹 Compact - Borrar marcas de disponibilidad ocultas hace tiempo"
+    echo "  9) 🚪 Exit - Salir"
     echo ""
     read -p "Opción: " choice
     echo ""
@@ -128,11 +130,21 @@ while true; do
             show_status
             ;;
         7)
+            echo "🧮 Recalculando contadores..."
+            run_db_command "rebuild_slot_counts"
+            echo "✅ Contadores al día!"
+            ;;
+        8)
+            echo "🧹 Compactando marcas ocultas..."
+            run_db_command "compact_tombstones"
+            echo "✅ Compactación terminada!"
+            ;;
+        9)
             echo "👋 ¡Hasta luego!"
             exit 0
             ;;
         *)
-            echo "❌ Opción inválida. Por favor selecciona 1-7."
+            echo "❌ Opción inválida. Por favor selecciona 1-9."
             ;;
     esac
     
@@ -27,16 +27,23 @@ os.environ["GOOGLE_CLIENT_SECRET"] = "test-client-secret"
 
 # pylint: disable=wrong-import-position
 from app import scheduler_app  # noqa: E402  # pylint: disable=no-name-in-module
+from app.cache import reset as reset_cache  # noqa: E402
 from app.extensions import scheduler_db  # noqa: E402
+from app.services.subgroup_service import reset_solver_cache  # noqa: E402
 
 
 @pytest.fixture(scope="session")
 def app():
     # El rate limit va apagado por default (como CSRF): el contador es por
     # proceso y varios tests pegan al mismo endpoint. `test_hardening.py` lo
-    # enciende a propósito.
+    # enciende a propósito. Las divisiones corren dentro de la request que las
+    # encola: así el test ve el job terminado sin esperar al hilo.
     scheduler_app.config.update(
-        TESTING=True, DEBUG=False, WTF_CSRF_ENABLED=False, RATELIMIT_ENABLED=False
+        TESTING=True,
+        DEBUG=False,
+        WTF_CSRF_ENABLED=False,
+        RATELIMIT_ENABLED=False,
+        DIVISION_JOBS_ASYNC=False,
     )
     with scheduler_app.app_context():
         scheduler_db.create_all()
@@ -60,3 +67,6 @@ def db_session(app):  # pylint: disable=redefined-outer-name
             scheduler_db.session.execute(table.delete())
         scheduler_db.session.commit()
         scheduler_db.session.remove()
+        # Los ids y las revisiones se reusan en el próximo test: el caché no.
+        reset_cache()
+        reset_solver_cache()
@@ -0,0 +1,115 @@
+"""Autosave de disponibilidad: semana completa y modo delta con versión."""
+
+# pylint: disable=redefined-outer-name
+import pytest
+
+from app.models import Availability, Group, GroupMember, User, UserAvailability
+from app.services.availability_bitmap import member_grid_version
+
+
+@pytest.fixture()
+def grupo(db_session):
+    """08:00-10:00 en bloques de 60, lunes y martes."""
+    user = User(email="autosave@example.com", name="A")
+    db_session.add(user)
+    db_session.flush()
+    group = Group(
+        name="Autosave",
+        join_token="tok-autosave",
+        owner_id=user.id,
+        start_minutes=480,
+        end_minutes=600,
+        block_minutes=60,
+        active_weekdays="0,1",
+    )
+    db_session.add(group)
+    db_session.flush()
+    db_session.add(GroupMember(group_id=group.id, user_id=user.id))
+    db_session.commit()
+    return {"group": group, "user": user}
+
+
+@pytest.fixture()
+def como_usuario(client, grupo):
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(grupo["user"].id)
+        sess["_fresh"] = True
+    return client
+
+
+def _url(grupo):
+    return f"/groups/{grupo['group'].id}/availability/autosave"
+
+
+def _marcas(grupo):
+    return sorted(
+        (a.weekday, a.start_minutes)
+        for _, a in UserAvailability.query.join(Availability)
+        .add_entity(Availability)
+        .filter(UserAvailability.user_id == grupo["user"].id)
+        .all()
+    )
+
+
+def _slot(weekday, block_index):
+    return {"weekday": weekday, "block_index": block_index}
+
+
+def test_autosave_completo_sigue_funcionando(como_usuario, grupo):
+    resp = como_usuario.post(_url(grupo), json={"slots": [_slot(0, 0), _slot(1, 1)]})
+
+    assert resp.status_code == 200
+    assert resp.get_json()["saved_count"] == 2
+    assert resp.get_json()["version"] == 1
+    assert _marcas(grupo) == [(0, 480), (1, 540)]
+
+
+def test_delta_aplica_solo_los_cambios(como_usuario, grupo):
+    primero = como_usuario.post(
+        _url(grupo), json={"added": [_slot(0, 0), _slot(0, 1)], "removed": [], "version": 0}
+    )
+    assert primero.status_code == 200
+    version = primero.get_json()["version"]
+
+    segundo = como_usuario.post(
+        _url(grupo),
+        json={"added": [_slot(1, 0)], "removed": [_slot(0, 1)], "version": version},
+    )
+
+    assert segundo.status_code == 200
+    assert segundo.get_json()["saved_count"] == 2
+    assert segundo.get_json()["version"] == version + 1
+    assert _marcas(grupo) == [(0, 480), (1, 480)]
+
+
+def test_delta_con_version_vieja_responde_409_con_el_estado(como_usuario, grupo):
+    como_usuario.post(_url(grupo), json={"added": [_slot(0, 0)], "removed": [], "version": 0})
+
+    resp = como_usuario.post(
+        _url(grupo), json={"added": [_slot(1, 1)], "removed": [], "version": 0}
+    )
+
+    assert resp.status_code == 409
+    body = resp.get_json()
+    assert body["version"] == member_grid_version(grupo["group"], grupo["user"].id)
+    assert body["slots"] == [_slot(0, 0)]
+    assert _marcas(grupo) == [(0, 480)]
+
+
+def test_delta_ignora_celdas_fuera_de_la_grilla(como_usuario, grupo):
+    resp = como_usuario.post(
+        _url(grupo),
+        json={"added": [_slot(5, 0), _slot(0, 9), {"weekday": "0"}], "removed": [], "version": 0},
+    )
+
+    assert resp.status_code == 200
+    assert resp.get_json()["saved_count"] == 0
+    assert _marcas(grupo) == []
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [{}, {"added": [], "removed": []}, {"added": {}, "removed": [], "version": 0}],
+)
+def test_delta_mal_formado_es_400(como_usuario, grupo, payload):
+    assert como_usuario.post(_url(grupo), json=payload).status_code == 400
@@ -0,0 +1,208 @@
+"""El bitmap de disponibilidad y su sincronía con las marcas."""
+
+# pylint: disable=redefined-outer-name
+import pytest
+
+from app.models import (
+    Availability,
+    AvailabilityBitmap,
+    Group,
+    GroupMember,
+    RoleEnum,
+    UserAvailability,
+)
+from app.models.user import User
+from app.services import availability_bitmap as bm
+from app.services import availability_service as svc
+from app.services.subgroup_service import SubGroupService
+
+
+@pytest.fixture()
+def group(db_session):
+    """08:00-10:00 en bloques de 60 → dos bloques por día, bits `2 * weekday + i`."""
+    owner = User(name="Dueño bits", email="owner-bits@example.com")
+    db_session.add(owner)
+    db_session.commit()
+    grupo = Group(
+        name="Grupo bits",
+        owner_id=owner.id,
+        join_token="tok-bits",
+        start_minutes=480,
+        end_minutes=600,
+        block_minutes=60,
+        active_weekdays="0,1",
+    )
+    db_session.add(grupo)
+    db_session.commit()
+    db_session.add(GroupMember(group_id=grupo.id, user_id=owner.id, role=RoleEnum.ADMIN))
+    db_session.commit()
+    return grupo
+
+
+def _add_member(db_session, group, email):
+    user = User(name=email, email=email)
+    db_session.add(user)
+    db_session.commit()
+    db_session.add(GroupMember(group_id=group.id, user_id=user.id, role=RoleEnum.MEMBER))
+    db_session.commit()
+    return user
+
+
+def _mark(db_session, group, user, weekday, minutes):
+    row = Availability.query.filter_by(
+        group_id=group.id, weekday=weekday, start_minutes=minutes
+    ).first()
+    if row is None:
+        row = Availability(group_id=group.id, weekday=weekday, start_minutes=minutes)
+        db_session.add(row)
+        db_session.flush()
+    db_session.add(UserAvailability(user_id=user.id, availability_id=row.id))
+    db_session.commit()
+    return row
+
+
+def _save_form(group, user, form):
+    return svc.save_member_availability(
+        group, user.id, svc.cells_from_form(group, form, [0, 1]), [0, 1]
+    )
+
+
+def _stored_bits(group, user):
+    row = AvailabilityBitmap.query.filter_by(group_id=group.id, user_id=user.id).one()
+    return bm.decode_bits(row.bits)
+
+
+# --- operaciones puras ------------------------------------------------------
+
+
+def test_cell_bit_y_iter_cells_son_inversas():
+    bits = bm.cell_bit(2, 0, 1) | bm.cell_bit(2, 3, 0)
+    assert list(bm.iter_cells(bits, 2)) == [(0, 1), (3, 0)]
+
+
+def test_encode_decode_ida_y_vuelta():
+    bits = bm.cell_bit(288, 6, 287) | bm.cell_bit(288, 0, 0)
+    raw = bm.encode_bits(bits, 288)
+    assert len(raw) == 252  # 2016 celdas de 5 minutos
+    assert bm.decode_bits(raw) == bits
+
+
+def test_intersect_y_popcount():
+    assert bm.popcount(bm.intersect([0b1110, 0b0111, 0b0110])) == 2
+    assert bm.intersect([]) == 0
+
+
+# --- sincronía con el motor de disponibilidad -------------------------------
+
+
+def test_guardar_enciende_los_bits_marcados(db_session, group):
+    user = _add_member(db_session, group, "guarda@example.com")
+
+    _save_form(group, user, {"day_0_hour_1": "on", "day_1_hour_0": "on"})
+    db_session.commit()
+
+    assert _stored_bits(group, user) == bm.cell_bit(2, 0, 1) | bm.cell_bit(2, 1, 0)
+
+
+def test_limpiar_solo_apaga_los_dias_visibles(db_session, group):
+    user = _add_member(db_session, group, "apaga@example.com")
+    _mark(db_session, group, user, 0, 480)
+    _mark(db_session, group, user, 5, 480)  # sábado, día apagado
+
+    _save_form(group, user, {})
+    db_session.commit()
+
+    assert _stored_bits(group, user) == bm.cell_bit(2, 5, 0)
+    assert _stored_bits(group, user) == bm.bits_from_marks(group, [user.id])[user.id]
+
+
+def test_load_bitmaps_reconstruye_lo_que_falta_sin_escribir(db_session, group):
+    user = _add_member(db_session, group, "legacy@example.com")
+    _mark(db_session, group, user, 1, 540)
+
+    bitmaps = bm.load_bitmaps(group, [user.id, group.owner_id])
+
+    assert bitmaps == {user.id: bm.cell_bit(2, 1, 1), group.owner_id: 0}
+    assert AvailabilityBitmap.query.count() == 0
+
+
+def test_load_bitmaps_ignora_los_armados_con_otra_grilla(db_session, group):
+    user = _add_member(db_session, group, "desfase@example.com")
+    _save_form(group, user, {"day_0_hour_0": "on"})
+    db_session.commit()
+
+    # La grilla empieza una hora después: la marca de 08:00 ya no tiene celda.
+    group.start_minutes = 540
+    db_session.commit()
+
+    assert bm.load_bitmaps(group, [user.id]) == {user.id: 0}
+
+
+def test_remap_rehace_los_bitmaps_del_grupo(db_session, group):
+    user = _add_member(db_session, group, "remap-bits@example.com")
+    _save_form(group, user, {"day_0_hour_0": "on"})
+    db_session.commit()
+    old_starts = group.block_starts()
+
+    group.block_minutes = 30
+    db_session.flush()
+    svc.remap_availability_marks(group, old_starts, 60, {0, 1})
+    db_session.commit()
+
+    # Bloques de 30 → cuatro por día; 08:00-09:00 pasa a 08:00 y 08:30.
+    row = AvailabilityBitmap.query.filter_by(group_id=group.id, user_id=user.id).one()
+    assert row.layout == bm.grid_layout(group)
+    assert bm.decode_bits(row.bits) == bm.cell_bit(4, 0, 0) | bm.cell_bit(4, 0, 1)
+
+
+# --- divisor ----------------------------------------------------------------
+
+
+def test_matriz_de_compatibilidad_cuenta_bloques_comunes(db_session, group):
+    ana = _add_member(db_session, group, "ana-bits@example.com")
+    beto = _add_member(db_session, group, "beto-bits@example.com")
+    for user, form in (
+        (ana, {"day_0_hour_0": "on", "day_0_hour_1": "on", "day_1_hour_0": "on"}),
+        (beto, {"day_0_hour_1": "on", "day_1_hour_0": "on"}),
+    ):
+        _save_form(group, user, form)
+    db_session.commit()
+
+    service = SubGroupService(group.id)
+    service.load_members()
+    service.calculate_compatibility_matrix()
+
+    assert service.get_compatibility(ana.id, beto.id) == 2
+    assert service.get_compatibility(beto.id, ana.id) == 2
+    assert service.get_compatibility(ana.id, group.owner_id) == 0
+    assert (
+        service._calculate_group_blocks_intersection(  # pylint: disable=protected-access
+            [{"members": [{"id": ana.id}, {"id": beto.id}]}]
+        )
+        == 2
+    )
+
+
+def test_compatibilidad_promedio_sale_de_la_matriz(db_session, group):
+    ana = _add_member(db_session, group, "ana-prom@example.com")
+    beto = _add_member(db_session, group, "beto-prom@example.com")
+    cata = _add_member(db_session, group, "cata-prom@example.com")
+    for user, form in (
+        (ana, {"day_0_hour_0": "on", "day_0_hour_1": "on", "day_1_hour_0": "on"}),
+        (beto, {"day_0_hour_1": "on", "day_1_hour_0": "on"}),
+        (cata, {"day_0_hour_0": "on", "day_0_hour_1": "on"}),
+    ):
+        _save_form(group, user, form)
+    db_session.commit()
+
+    service = SubGroupService(group.id)
+    service.load_members()
+    service.calculate_compatibility_matrix()
+    ana_m, beto_m, cata_m = ({"id": user.id} for user in (ana, beto, cata))
+
+    # Pares: ana-beto 2, ana-cata 2, beto-cata 1.
+    assert service.calculate_group_compatibility([ana_m, beto_m, cata_m]) == 5 / 3
+    score = service._unit_compatibility_score(  # pylint: disable=protected-access
+        {"members": [ana_m, beto_m]}, [{"members": [cata_m]}]
+    )
+    assert score == 5 / 3
@@ -0,0 +1,124 @@
+"""Heatmap de `groups.show`: grilla compacta embebida y celdas bajo demanda."""
+
+# pylint: disable=redefined-outer-name
+import json
+import re
+from base64 import b64decode
+
+import pytest
+
+from app.models import Group, GroupMember, RoleEnum, User
+from app.services import availability_service as svc
+from app.services.availability_bitmap import decode_bits
+
+EMBED_RE = re.compile(
+    r'<script type="application/json" id="embed-data"[^>]*>(.*?)</script>', re.DOTALL
+)
+
+
+@pytest.fixture()
+def grupo(db_session):
+    """08:00-10:00 en bloques de 60 (dos por día), lunes y martes."""
+    owner = User(name="Dueño heatmap", email="owner-heat@example.com")
+    db_session.add(owner)
+    db_session.flush()
+    group = Group(
+        name="Heatmap",
+        owner_id=owner.id,
+        join_token="tok-heat",
+        start_minutes=480,
+        end_minutes=600,
+        block_minutes=60,
+        active_weekdays="0,1",
+    )
+    db_session.add(group)
+    db_session.flush()
+    db_session.add(GroupMember(group_id=group.id, user_id=owner.id, role=RoleEnum.ADMIN))
+    db_session.commit()
+    return group
+
+
+def _miembro(db_session, group, email, cells):
+    user = User(name=email, email=email)
+    db_session.add(user)
+    db_session.flush()
+    db_session.add(GroupMember(group_id=group.id, user_id=user.id, role=RoleEnum.MEMBER))
+    db_session.flush()
+    svc.save_member_availability(group, user.id, set(cells), [0, 1])
+    db_session.commit()
+    return user
+
+
+def _login(client, user_id):
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user_id)
+        sess["_fresh"] = True
+
+
+def _counts(grid):
+    raw = b64decode(grid["counts"])
+    return [int.from_bytes(raw[i : i + 2], "little") for i in range(0, len(raw), 2)]
+
+
+def test_grilla_compacta_cuenta_por_celda(db_session, grupo):
+    ana = _miembro(db_session, grupo, "ana-heat@example.com", [(0, 0), (0, 1)])
+    beto = _miembro(db_session, grupo, "beto-heat@example.com", [(0, 1), (1, 0)])
+    ids = {ana.id, beto.id, grupo.owner_id}
+
+    grid = svc.grid_payload(grupo, ids)
+
+    # Dos bloques por día, siete días: índice = weekday * 2 + bloque.
+    assert _counts(grid) == [1, 2, 1, 0] + [0] * 10
+    assert grid["user_ids"] == sorted([ana.id, beto.id])
+    bitmaps = dict(zip(grid["user_ids"], grid["bitmaps"], strict=True))
+    assert decode_bits(b64decode(bitmaps[ana.id])) == 0b0011
+    assert decode_bits(b64decode(bitmaps[beto.id])) == 0b0110
+    assert grid["block_starts"] == [480, 540]
+
+
+def test_celda_devuelve_quienes_la_marcaron(client, db_session, grupo):
+    ana = _miembro(db_session, grupo, "cel-a-heat@example.com", [(0, 1)])
+    beto = _miembro(db_session, grupo, "cel-b-heat@example.com", [(0, 1), (1, 1)])
+    _login(client, grupo.owner_id)
+
+    resp = client.get(f"/groups/{grupo.id}/availability/cell?weekday=0&block=1")
+    fuera = client.get(f"/groups/{grupo.id}/availability/cell?weekday=0&block=9")
+    sin_bloque = client.get(f"/groups/{grupo.id}/availability/cell?weekday=0")
+
+    assert resp.status_code == 200
+    assert resp.get_json()["user_ids"] == sorted([ana.id, beto.id])
+    assert fuera.get_json()["user_ids"] == []
+    assert sin_bloque.status_code == 400
+
+
+def test_celda_exige_ver_disponibilidad(client, db_session, grupo):
+    ana = _miembro(db_session, grupo, "sin-heat@example.com", [(0, 0)])
+    _login(client, ana.id)
+
+    resp = client.get(f"/groups/{grupo.id}/availability/cell?weekday=0&block=0")
+
+    assert resp.status_code == 403
+
+
+def test_show_pinta_canvas_sin_listas_por_celda(client, db_session, grupo):
+    ana = _miembro(db_session, grupo, "show-heat@example.com", [(0, 0)])
+    _login(client, grupo.owner_id)
+
+    body = client.get(f"/groups/{grupo.id}").get_data(as_text=True)
+    payload = json.loads(EMBED_RE.search(body).group(1))
+
+    assert 'id="availabilityHeatmap"' in body
+    assert f'data-cell-url="/groups/{grupo.id}/availability/cell"' in body
+    assert payload["grid"]["user_ids"] == [ana.id]
+    assert f'data-user-id="{ana.id}"' not in body
+
+
+def test_show_sin_permiso_no_embebe_la_grilla(client, db_session, grupo):
+    ana = _miembro(db_session, grupo, "propia-heat@example.com", [(0, 0)])
+    _login(client, ana.id)
+
+    body = client.get(f"/groups/{grupo.id}").get_data(as_text=True)
+    payload = json.loads(EMBED_RE.search(body).group(1))
+
+    assert payload["grid"] is None
+    assert 'id="availabilityHeatmap"' not in body
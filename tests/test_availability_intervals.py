@@ -0,0 +1,204 @@
+"""Disponibilidad guardada como tramos en vez de una marca por bloque."""
+
+# pylint: disable=redefined-outer-name
+import pytest
+
+from app.db.convert_availability_storage import convert_availability_storage
+from app.models import AvailabilityInterval, Group, GroupMember, RoleEnum, User, UserAvailability
+from app.models.group import STORAGE_INTERVALS, STORAGE_MARKS
+from app.services import availability_intervals as iv
+from app.services import availability_service as svc
+from app.services import group_service
+from app.services.availability_bitmap import load_bitmaps
+from app.services.subgroup_service import SubGroupService
+
+
+@pytest.fixture()
+def grupo(db_session):
+    """08:00-10:00 en bloques de 30 (cuatro por día), lunes y martes, como tramos."""
+    owner = User(name="Dueño tramos", email="owner-iv@example.com")
+    db_session.add(owner)
+    db_session.flush()
+    group = Group(
+        name="Tramos",
+        owner_id=owner.id,
+        join_token="tok-iv",
+        start_minutes=480,
+        end_minutes=600,
+        block_minutes=30,
+        active_weekdays="0,1",
+        availability_storage=STORAGE_INTERVALS,
+    )
+    db_session.add(group)
+    db_session.flush()
+    db_session.add(GroupMember(group_id=group.id, user_id=owner.id, role=RoleEnum.ADMIN))
+    db_session.commit()
+    return group
+
+
+def _miembro(db_session, group, email, cells):
+    user = User(name=email, email=email)
+    db_session.add(user)
+    db_session.flush()
+    db_session.add(GroupMember(group_id=group.id, user_id=user.id, role=RoleEnum.MEMBER))
+    db_session.flush()
+    svc.save_member_availability(group, user.id, set(cells), [0, 1])
+    db_session.commit()
+    return user
+
+
+def _tramos(group, user):
+    return iv.member_intervals(group.id, [user.id]).get(user.id, [])
+
+
+# --- operaciones puras ------------------------------------------------------
+
+
+def test_celdas_a_tramos_y_de_vuelta():
+    starts = [480, 510, 540, 570]
+    cells = {(0, 0), (0, 1), (0, 3), (1, 2)}
+
+    intervals = iv.cells_to_intervals(starts, 30, cells)
+
+    assert intervals == [(0, 480, 540), (0, 570, 600), (1, 540, 570)]
+    assert iv.intervals_to_cells(starts, 30, intervals) == cells
+
+
+def test_tramo_cae_en_los_bloques_que_pisa():
+    # Guardado con bloques de 30, leído con bloques de 60: 08:30-09:00 pisa el
+    # bloque 08:00-09:00, igual que al remapear marcas.
+    assert iv.intervals_to_cells([480, 540], 60, [(0, 510, 540)]) == {(0, 0)}
+    assert iv.intervals_to_bits([480, 540], 60, [(1, 480, 600)]) == 0b1100
+
+
+def test_interseccion_y_fusion():
+    assert iv.merge_intervals([(0, 60, 90), (0, 30, 60), (1, 0, 10)]) == [
+        (0, 30, 90),
+        (1, 0, 10),
+    ]
+    assert iv.intersect_intervals([(0, 0, 100), (1, 0, 50)], [(0, 50, 150), (1, 50, 60)]) == [
+        (0, 50, 100)
+    ]
+    assert iv.subtract_span([(0, 400, 700), (1, 400, 700)], {0}, 480, 600) == [
+        (0, 400, 480),
+        (0, 600, 700),
+        (1, 400, 700),
+    ]
+
+
+# --- guardado ---------------------------------------------------------------
+
+
+def test_guardar_escribe_tramos_y_no_marcas(db_session, grupo):
+    ana = _miembro(db_session, grupo, "ana-iv@example.com", [(0, 0), (0, 1), (0, 2), (1, 3)])
+
+    assert _tramos(grupo, ana) == [(0, 480, 570), (1, 570, 600)]
+    assert UserAvailability.query.count() == 0
+    assert load_bitmaps(grupo, [ana.id])[ana.id] == 0b1000_0111
+
+
+def test_guardar_conserva_lo_que_la_grilla_no_muestra(db_session, grupo):
+    ana = _miembro(db_session, grupo, "fuera-iv@example.com", [])
+    db_session.add_all(
+        [
+            AvailabilityInterval(
+                group_id=grupo.id, user_id=ana.id, weekday=0, start_minutes=420, end_minutes=540
+            ),
+            AvailabilityInterval(
+                group_id=grupo.id, user_id=ana.id, weekday=4, start_minutes=480, end_minutes=600
+            ),
+        ]
+    )
+    db_session.commit()
+
+    svc.save_member_availability(grupo, ana.id, {(0, 3)}, [0, 1])
+    db_session.commit()
+
+    assert _tramos(grupo, ana) == [(0, 420, 480), (0, 570, 600), (4, 480, 600)]
+
+
+def test_autosave_delta_sobre_tramos(db_session, grupo):
+    ana = _miembro(db_session, grupo, "delta-iv@example.com", [(0, 0), (0, 1)])
+
+    result = svc.apply_member_delta(grupo, ana.id, {(0, 2)}, {(0, 0)}, [0, 1])
+    db_session.commit()
+
+    assert result.saved == 2
+    assert _tramos(grupo, ana) == [(0, 510, 570)]
+
+
+def test_cambio_de_grilla_reproyecta_sin_mover_nada(db_session, grupo):
+    ana = _miembro(db_session, grupo, "grilla-iv@example.com", [(0, 1), (0, 2)])
+    old_starts = grupo.block_starts()
+    preview = svc.preview_grid_change(grupo, 480, 600, 60, [0])
+
+    grupo.block_minutes = 60
+    db_session.flush()
+    assert svc.remap_availability_marks(grupo, old_starts, 30, {0}) == 0
+    db_session.commit()
+
+    assert (preview.remapped, preview.untouched, preview.hidden) == (0, 1, 0)
+    assert _tramos(grupo, ana) == [(0, 510, 570)]
+    assert load_bitmaps(grupo, [ana.id])[ana.id] == 0b11
+
+
+# --- lecturas: show, CSV y divisor ------------------------------------------
+
+
+def test_lecturas_del_grupo_salen_de_los_tramos(db_session, grupo):
+    ana = _miembro(db_session, grupo, "show-iv@example.com", [(0, 0), (0, 1)])
+    beto = _miembro(db_session, grupo, "show2-iv@example.com", [(0, 1)])
+    ids = {ana.id, beto.id, grupo.owner_id}
+
+    assert group_service.get_responded_user_ids(grupo.id, ids) == {ana.id, beto.id}
+    assert group_service.get_member_availability_counts(grupo.id, ids) == {ana.id: 2, beto.id: 1}
+
+    data = list(svc.get_availability_data(grupo.id).values())
+    assert [(d["availability"].start_minutes, d["count_users"]) for d in data] == [
+        (510, 2),
+        (480, 1),
+    ]
+    assert data[0]["users"] == sorted([ana.id, beto.id])
+
+    service = SubGroupService(grupo.id)
+    service.load_members()
+    assert service.user_availability_count[ana.id] == 2
+
+
+# --- conversión -------------------------------------------------------------
+
+
+def test_conversion_ida_y_vuelta(db_session, grupo):
+    grupo.availability_storage = STORAGE_MARKS
+    db_session.commit()
+    ana = _miembro(db_session, grupo, "conv-iv@example.com", [(0, 0), (0, 1), (1, 3)])
+
+    result = convert_availability_storage(grupo, STORAGE_INTERVALS)
+    db_session.commit()
+
+    assert (result.before, result.after) == (3, 2)
+    assert UserAvailability.query.count() == 0
+    assert _tramos(grupo, ana) == [(0, 480, 540), (1, 570, 600)]
+    assert load_bitmaps(grupo, [ana.id])[ana.id] == 0b1000_0011
+
+    result = convert_availability_storage(grupo, STORAGE_MARKS)
+    db_session.commit()
+
+    assert (result.before, result.after, result.dropped) == (2, 3, 0)
+    assert AvailabilityInterval.query.count() == 0
+    assert UserAvailability.query.count() == 3
+    assert group_service.get_member_availability_counts(grupo.id, [ana.id]) == {ana.id: 3}
+
+
+def test_show_y_csv_con_tramos(client, db_session, grupo):
+    _miembro(db_session, grupo, "ruta-iv@example.com", [(0, 0), (0, 1)])
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(grupo.owner_id)
+        sess["_fresh"] = True
+
+    show = client.get(f"/groups/{grupo.id}")
+    csv = client.get(f"/groups/{grupo.id}/members/export.csv")
+
+    assert show.status_code == 200
+    assert 'data-start-minutes="510"' in show.get_data(as_text=True)
+    assert "ruta-iv@example.com,,2" in csv.get_data(as_text=True)
@@ -2,6 +2,7 @@
 
 # pylint: disable=redefined-outer-name
 import pytest
+from sqlalchemy import event
 
 from app.extensions import scheduler_db
 from app.models import Availability, Group, GroupMember, RoleEnum, UserAvailability
@@ -91,19 +92,20 @@ def test_block_index_for(group):
 # --- guardado ---------------------------------------------------------------
 
 
-def test_process_posted_availability_crea_bloques_y_marcas(db_session, group):
+def _save_form(group, user, form):
+    """Guarda como lo hace la ruta: celdas del formulario sobre los días activos."""
+    return svc.save_member_availability(
+        group, user.id, svc.cells_from_form(group, form, [0, 1]), [0, 1]
+    )
+
+
+def test_guardar_el_formulario_crea_bloques_y_marcas(db_session, group):
     user = _add_member(db_session, group, "guarda@example.com")
 
-    guardados = svc.process_posted_availability(
-        group.id,
-        {"day_0_hour_0": "on", "day_1_hour_1": "on"},
-        group,
-        user.id,
-        [0, 1],
-    )
+    resultado = _save_form(group, user, {"day_0_hour_0": "on", "day_1_hour_1": "on"})
     db_session.commit()
 
-    assert guardados == 2
+    assert (resultado.saved, resultado.inserted) == (2, 2)
     marcas = {
         (a.weekday, a.start_minutes) for a in Availability.query.filter_by(group_id=group.id).all()
     }
@@ -111,41 +113,36 @@ def test_process_posted_availability_crea_bloques_y_marcas(db_session, group):
     assert UserAvailability.query.filter_by(user_id=user.id).count() == 2
 
 
-def test_process_posted_availability_ignora_claves_fuera_de_la_grilla(db_session, group):
+def test_guardar_el_formulario_ignora_claves_fuera_de_la_grilla(db_session, group):
     user = _add_member(db_session, group, "fuera@example.com")
 
-    guardados = svc.process_posted_availability(
-        group.id,
-        {"day_0_hour_9": "on", "day_5_hour_0": "on"},
-        group,
-        user.id,
-        [0, 1],
-    )
+    resultado = _save_form(group, user, {"day_0_hour_9": "on", "day_5_hour_0": "on"})
     db_session.commit()
 
-    assert guardados == 0
+    assert resultado.saved == 0
     assert Availability.query.filter_by(group_id=group.id).count() == 0
 
 
-def test_process_posted_availability_es_idempotente(db_session, group):
+def test_guardar_el_formulario_es_idempotente(db_session, group):
     user = _add_member(db_session, group, "idem@example.com")
     form = {"day_0_hour_0": "on"}
 
-    assert svc.process_posted_availability(group.id, form, group, user.id, [0, 1]) == 1
+    assert _save_form(group, user, form).inserted == 1
     db_session.commit()
     # La segunda vez no hay cambio real: la marca ya existe.
-    assert svc.process_posted_availability(group.id, form, group, user.id, [0, 1]) == 0
+    segundo = _save_form(group, user, form)
     db_session.commit()
+    assert (segundo.inserted, segundo.restored, segundo.hidden) == (0, 0, 0)
     assert UserAvailability.query.filter_by(user_id=user.id).count() == 1
 
 
-def test_clear_existing_availability_solo_toca_lo_visible(db_session, group):
+def test_guardar_vacio_solo_oculta_lo_visible(db_session, group):
     user = _add_member(db_session, group, "limpia@example.com")
     visible = _mark(db_session, group, user, 0, 480)
     fuera_de_rango = _mark(db_session, group, user, 0, 660)  # 11:00, fuera de la grilla
     dia_apagado = _mark(db_session, group, user, 5, 480)  # sábado, no está activo
 
-    svc.clear_existing_availability(group, user.id, [0, 1])
+    _save_form(group, user, {})
     db_session.commit()
 
     activos = {ua.availability_id for ua in UserAvailability.query.filter_by(user_id=user.id).all()}
@@ -158,8 +155,9 @@ def test_marcar_de_nuevo_reusa_la_fila_oculta(db_session, group):
     user = _add_member(db_session, group, "reusa@example.com")
     _mark(db_session, group, user, 0, 480)
 
-    svc.clear_existing_availability(group, user.id, [0, 1])
-    svc.process_posted_availability(group.id, {"day_0_hour_0": "on"}, group, user.id, [0, 1])
+    _save_form(group, user, {})
+    db_session.commit()
+    _save_form(group, user, {"day_0_hour_0": "on"})
     db_session.commit()
 
     todas = (
@@ -171,6 +169,102 @@ def test_marcar_de_nuevo_reusa_la_fila_oculta(db_session, group):
     assert todas[0].deleted_at is None
 
 
+# --- guardado en bloque -----------------------------------------------------
+
+
+def _active_marks(group, user):
+    return {
+        (a.weekday, a.start_minutes)
+        for ua, a in scheduler_db.session.query(UserAvailability, Availability)
+        .join(Availability, UserAvailability.availability_id == Availability.id)
+        .filter(UserAvailability.user_id == user.id, Availability.group_id == group.id)
+        .all()
+    }
+
+
+def test_save_member_availability_inserta_oculta_y_restaura(db_session, group):
+    user = _add_member(db_session, group, "bulk@example.com")
+    fuera_de_rango = _mark(db_session, group, user, 0, 660)
+
+    primero = svc.save_member_availability(group, user.id, {(0, 0), (1, 1)}, [0, 1])
+    db_session.commit()
+    assert (primero.saved, primero.inserted, primero.restored, primero.hidden) == (2, 2, 0, 0)
+    assert _active_marks(group, user) == {(0, 480), (1, 540), (0, 660)}
+
+    segundo = svc.save_member_availability(group, user.id, {(0, 0)}, [0, 1])
+    db_session.commit()
+    assert (segundo.inserted, segundo.restored, segundo.hidden) == (0, 0, 1)
+
+    tercero = svc.save_member_availability(group, user.id, {(0, 0), (1, 1)}, [0, 1])
+    db_session.commit()
+    assert (tercero.inserted, tercero.restored, tercero.hidden) == (0, 1, 0)
+
+    # Lo fuera de la grilla sigue intacto y el reingreso no duplicó filas.
+    assert _active_marks(group, user) == {(0, 480), (1, 540), (0, 660)}
+    assert UserAvailability.query.filter_by(availability_id=fuera_de_rango.id).count() == 1
+    todas = (
+        UserAvailability.query.execution_options(include_deleted=True)
+        .filter_by(user_id=user.id)
+        .count()
+    )
+    assert todas == 3
+
+
+def test_save_member_availability_reemplaza_lo_visible_y_conserva_lo_apagado(db_session, group):
+    user = _add_member(db_session, group, "engine@example.com")
+    _mark(db_session, group, user, 0, 480)
+    _mark(db_session, group, user, 5, 480)  # día apagado
+
+    _save_form(group, user, {"day_1_hour_0": "on", "day_1_hour_1": "on", "day_3_hour_0": "on"})
+    db_session.commit()
+
+    assert _active_marks(group, user) == {(1, 480), (1, 540), (5, 480)}
+
+
+def test_save_member_availability_no_escala_en_consultas(db_session):
+    """Marcar toda la semana cuesta las mismas sentencias que marcar una celda."""
+    owner = User(name="Fino", email="fino@example.com")
+    db_session.add(owner)
+    db_session.commit()
+    grupo = Group(
+        name="Grilla fina",
+        owner_id=owner.id,
+        join_token="tok-fino",
+        start_minutes=480,
+        end_minutes=720,
+        block_minutes=5,
+        active_weekdays="0,1,2,3,4,5,6",
+    )
+    db_session.add(grupo)
+    db_session.commit()
+    weekdays = grupo.get_active_weekdays()
+    todas = {(w, i) for w in weekdays for i in range(len(grupo.block_starts()))}
+
+    statements = []
+
+    def _count(*_args):
+        statements.append(1)
+
+    def _save(cells):
+        statements.clear()
+        event.listen(scheduler_db.engine, "before_cursor_execute", _count)
+        try:
+            svc.save_member_availability(grupo, owner.id, cells, weekdays)
+            db_session.flush()
+        finally:
+            event.remove(scheduler_db.engine, "before_cursor_execute", _count)
+        db_session.commit()
+        return len(statements)
+
+    una = _save({(0, 0)})
+    semana = _save(todas)
+    ninguna = _save(set())
+
+    assert semana <= una + 2
+    assert ninguna <= una + 2
+    assert len(_active_marks(grupo, owner)) == 0
+
+
 # --- cambios de grilla ------------------------------------------------------
 
 
@@ -240,6 +334,58 @@ def test_remap_sin_bloques_nuevos_no_hace_nada(db_session, group):
     assert svc.remap_availability_marks(group, old_starts, 60, {0}) == 0
 
 
+def test_remap_restaura_la_marca_oculta_en_vez_de_duplicarla(db_session, group):
+    user = _add_member(db_session, group, "remap-oculta@example.com")
+    _mark(db_session, group, user, 0, 480)
+    vieja = _mark(db_session, group, user, 0, 510)
+    marca = UserAvailability.query.filter_by(availability_id=vieja.id).one()
+    marca.soft_delete()
+    db_session.commit()
+    old_starts = group.block_starts()
+
+    group.block_minutes = 30
+    db_session.flush()
+    svc.remap_availability_marks(group, old_starts, 60, {0})
+    db_session.commit()
+
+    filas = (
+        UserAvailability.query.execution_options(include_deleted=True)
+        .filter_by(availability_id=vieja.id, user_id=user.id)
+        .all()
+    )
+    assert [fila.id for fila in filas] == [marca.id]
+    assert filas[0].deleted_at is None
+
+
+def test_remap_no_escala_en_consultas_con_los_miembros(db_session, group):
+    def _remap_statements(members):
+        for i in range(members):
+            user = _add_member(db_session, group, f"remap-{members}-{i}@example.com")
+            svc.save_member_availability(group, user.id, {(0, 0), (0, 1), (1, 0)}, [0, 1])
+        db_session.commit()
+        old_starts = group.block_starts()
+        group.block_minutes = group.block_minutes // 2
+
+        statements = []
+
+        def _count(*_args):
+            statements.append(1)
+
+        event.listen(scheduler_db.engine, "before_cursor_execute", _count)
+        try:
+            svc.remap_availability_marks(group, old_starts, group.block_minutes * 2, {0, 1})
+            db_session.flush()
+        finally:
+            event.remove(scheduler_db.engine, "before_cursor_execute", _count)
+        db_session.commit()
+        return len(statements)
+
+    pocos = _remap_statements(1)
+    muchos = _remap_statements(10)
+
+    assert muchos <= pocos + 2
+
+
 # --- resumen ----------------------------------------------------------------
 
 
@@ -282,7 +428,7 @@ def test_el_servicio_no_commitea_solo(db_session, group):
     """La transacción la maneja la ruta: un rollback debe deshacer todo."""
     user = _add_member(db_session, group, "tx@example.com")
 
-    svc.process_posted_availability(group.id, {"day_0_hour_0": "on"}, group, user.id, [0, 1])
+    _save_form(group, user, {"day_0_hour_0": "on"})
     scheduler_db.session.rollback()
 
     assert Availability.query.filter_by(group_id=group.id).count() == 0
@@ -0,0 +1,122 @@
+"""Vista previa de un cambio de grilla: cuenta sin escribir nada."""
+
+# pylint: disable=redefined-outer-name
+import pytest
+from sqlalchemy import event
+
+from app.extensions import scheduler_db
+from app.models import Availability, Group, GroupMember, RoleEnum, User, UserAvailability
+from app.services import availability_service as svc
+
+
+@pytest.fixture()
+def grupo(db_session):
+    """08:00-10:00 en bloques de 60 (inicios 480 y 540), lunes y martes."""
+    owner = User(name="Dueño preview", email="owner-preview@example.com")
+    db_session.add(owner)
+    db_session.flush()
+    group = Group(
+        name="Preview",
+        owner_id=owner.id,
+        join_token="tok-preview",
+        start_minutes=480,
+        end_minutes=600,
+        block_minutes=60,
+        active_weekdays="0,1",
+    )
+    db_session.add(group)
+    db_session.flush()
+    db_session.add(GroupMember(group_id=group.id, user_id=owner.id, role=RoleEnum.ADMIN))
+    db_session.commit()
+    return group
+
+
+def _con_marcas(db_session, group, email, cells):
+    user = User(name=email, email=email)
+    db_session.add(user)
+    db_session.flush()
+    db_session.add(GroupMember(group_id=group.id, user_id=user.id, role=RoleEnum.MEMBER))
+    db_session.flush()
+    svc.save_member_availability(group, user.id, set(cells), [0, 1])
+    db_session.commit()
+    return user
+
+
+def _url(group, query):
+    return f"/groups/{group.id}/availability/settings/preview?{query}"
+
+
+def test_preview_coincide_con_lo_que_hace_el_remapeo(db_session, grupo):
+    _con_marcas(db_session, grupo, "a-prev@example.com", [(0, 0), (0, 1), (1, 0)])
+    _con_marcas(db_session, grupo, "b-prev@example.com", [(0, 1), (1, 1)])
+
+    # Bloques de 30 entre 08:30 y 10:00, solo lunes: el 08:00-09:00 del lunes
+    # solapa el bloque de 08:30 y el de 09:00 se parte en dos; ambos se reubican.
+    preview = svc.preview_grid_change(grupo, 510, 600, 30, [0])
+
+    old_starts = grupo.block_starts()
+    grupo.start_minutes, grupo.block_minutes = 510, 30
+    db_session.flush()
+    remapped = svc.remap_availability_marks(grupo, old_starts, 60, {0})
+    db_session.commit()
+
+    assert preview.grid_changed
+    assert preview.remapped == remapped == 3
+    assert preview.hidden == 2  # las del martes, día apagado
+    assert preview.untouched == 0
+    assert preview.total == 5
+
+
+def test_preview_sin_cambio_de_formato_no_reubica(db_session, grupo):
+    _con_marcas(db_session, grupo, "c-prev@example.com", [(0, 0), (1, 1)])
+
+    preview = svc.preview_grid_change(grupo, 480, 600, 60, [0])
+
+    assert not preview.grid_changed
+    assert (preview.remapped, preview.hidden, preview.untouched) == (0, 1, 1)
+
+
+def test_preview_ignora_a_los_que_ya_no_son_miembros(db_session, grupo):
+    ex = _con_marcas(db_session, grupo, "ex-prev@example.com", [(0, 0)])
+    GroupMember.query.filter_by(group_id=grupo.id, user_id=ex.id).one().soft_delete()
+    db_session.commit()
+
+    assert svc.preview_grid_change(grupo, 480, 600, 30, [0, 1]).total == 0
+
+
+def test_endpoint_responde_sin_escribir(client, db_session, grupo):
+    _con_marcas(db_session, grupo, "d-prev@example.com", [(0, 0), (1, 0)])
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(grupo.owner_id)
+        sess["_fresh"] = True
+
+    statements = []
+
+    def _capture(_conn, _cursor, statement, *_args):
+        statements.append(statement.lstrip().split()[0].upper())
+
+    event.listen(scheduler_db.engine, "before_cursor_execute", _capture)
+    try:
+        resp = client.get(
+            _url(grupo, "start_time=08:00&end_time=10:00&block_minutes=30&weekdays=0&weekdays=1")
+        )
+    finally:
+        event.remove(scheduler_db.engine, "before_cursor_execute", _capture)
+
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert (body["remapped"], body["hidden"], body["untouched"]) == (2, 0, 0)
+    assert set(statements) <= {"SELECT", "BEGIN", "ROLLBACK", "COMMIT"}
+    assert UserAvailability.query.count() == 2
+    assert Availability.query.count() == 2
+
+
+def test_endpoint_valida_como_el_formulario(client, grupo):
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(grupo.owner_id)
+        sess["_fresh"] = True
+
+    resp = client.get(_url(grupo, "start_time=10:00&end_time=08:00&weekdays=0"))
+
+    assert resp.status_code == 400
+    assert "inicio debe ser anterior" in resp.get_json()["message"]
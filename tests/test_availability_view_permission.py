@@ -262,7 +262,8 @@ def test_permiso_con_subgroups_view_all_ve_todo_el_grupo(app, db_session):
 
     assert payload["can_view_availability"] is True
     assert {m["user_id"] for m in payload["members"]} == {owner.id, member_a.id, member_b.id}
-    assert f'data-user-id="{owner.id}"' in body
+    # Las listas por celda se piden al pasar el cursor: el alcance se ve en el embed.
+    assert owner.id in payload["responded_user_ids"]
 
 
 def test_permiso_de_horarios_implica_ver_su_subgrupo(app, db_session):
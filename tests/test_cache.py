@@ -0,0 +1,272 @@
+"""Caché por grupo y revisión: aciertos, invalidación y los dos backends."""
+
+# pylint: disable=redefined-outer-name
+import os
+import pickle
+import threading
+import time
+
+import pytest
+
+from app import cache
+from app.extensions import scheduler_db
+from app.models import Group, GroupMember, RoleEnum
+from app.models.user import User
+from app.permissions import grant_sources
+from app.services import availability_service as svc
+from app.services import group_service
+from app.services.subgroup_service import add_subgroup_member, create_manual_subgroup
+
+
+@pytest.fixture()
+def group(db_session):
+    """08:00-10:00 en bloques de 60, lunes y martes, con dueño y un miembro."""
+    owner = User(name="Dueño caché", email="owner-cache@example.com")
+    ana = User(name="Ana caché", email="ana-cache@example.com")
+    db_session.add_all([owner, ana])
+    db_session.commit()
+    grupo = Group(
+        name="Grupo caché",
+        owner_id=owner.id,
+        join_token="tok-cache",
+        start_minutes=480,
+        end_minutes=600,
+        block_minutes=60,
+        active_weekdays="0,1",
+    )
+    db_session.add(grupo)
+    db_session.commit()
+    db_session.add_all(
+        [
+            GroupMember(group_id=grupo.id, user_id=owner.id, role=RoleEnum.ADMIN),
+            GroupMember(group_id=grupo.id, user_id=ana.id, role=RoleEnum.MEMBER),
+        ]
+    )
+    db_session.commit()
+    svc.save_member_availability(grupo, ana.id, {(0, 0)}, [0, 1])
+    db_session.commit()
+    return grupo
+
+
+def _stats(namespace):
+    return cache.cache_stats().get(
+        namespace, {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0}
+    )
+
+
+def _counts(data):
+    return {entry["availability"].start_minutes: entry["count_users"] for entry in data.values()}
+
+
+def test_la_segunda_lectura_sale_del_cache_hasta_que_cambia_el_grupo(db_session, group):
+    assert _counts(svc.get_availability_data(group.id)) == {480: 1}
+    assert _counts(svc.get_availability_data(group.id)) == {480: 1}
+    assert _stats("availability_data") == {"hits": 1, "misses": 1, "coalesced": 0, "bypassed": 0}
+
+    svc.save_member_availability(group, group.owner_id, {(0, 0)}, [0, 1])
+    db_session.commit()
+
+    assert _counts(svc.get_availability_data(group.id)) == {480: 2}
+    assert _stats("availability_data")["misses"] == 2
+
+
+def test_los_argumentos_entran_en_la_clave(db_session, group):
+    ana_id = GroupMember.query.filter_by(group_id=group.id, role=RoleEnum.MEMBER).one().user_id
+
+    assert _counts(svc.get_availability_data(group.id, user_ids={ana_id})) == {480: 1}
+    assert svc.get_availability_data(group.id, user_ids={group.owner_id}) == {}
+    assert _stats("availability_data")["misses"] == 2
+
+
+def test_con_escrituras_sin_commitear_no_se_usa(db_session, group):
+    svc.get_availability_data(group.id)
+    svc.save_member_availability(group, group.owner_id, {(0, 0)}, [0, 1])
+
+    # Dentro de la transacción se ve lo propio, no lo cacheado.
+    assert _counts(svc.get_availability_data(group.id)) == {480: 2}
+    db_session.rollback()
+
+    assert _counts(svc.get_availability_data(group.id)) == {480: 1}
+    assert _stats("availability_data") == {"hits": 1, "misses": 1, "coalesced": 0, "bypassed": 1}
+
+
+def test_cada_lectura_recibe_su_copia(db_session, group):
+    primera = grant_sources(group)
+    primera["members"][999] = {"intruso"}
+
+    assert 999 not in grant_sources(group)["members"]
+    assert _stats("grant_sources")["hits"] == 1
+
+
+def test_subgrupos_sin_alcance_se_comparten_entre_personas(db_session, group):
+    subgroup = create_manual_subgroup(group.id, "Equipo")
+    db_session.flush()
+    add_subgroup_member(subgroup.id, group.owner_id)
+    db_session.commit()
+
+    owner_view = group_service.get_subgroups_for_show(group.id, None, group.owner_id)
+    other_view = group_service.get_subgroups_for_show(group.id, None, group.owner_id + 1)
+
+    assert owner_view == other_view
+    assert _stats("subgroups_for_show") == {"hits": 1, "misses": 1, "coalesced": 0, "bypassed": 0}
+
+
+def test_backend_sqlite_se_comparte_entre_procesos(app, db_session, group, tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite")
+    monkeypatch.setitem(app.config, "CACHE_BACKEND", cache.BACKEND_SQLITE)
+    monkeypatch.setitem(app.config, "CACHE_PATH", path)
+
+    svc.get_availability_data(group.id)
+    # Otro proceso abre el mismo archivo: ve lo que este guardó.
+    otro = cache.SQLiteBackend(path, max_entries=10, ttl_seconds=60)
+    with otro._connect() as connection:  # pylint: disable=protected-access
+        (guardadas,) = connection.execute("SELECT COUNT(*) FROM app_cache").fetchone()
+    assert guardadas == 1
+
+    assert _counts(svc.get_availability_data(group.id)) == {480: 1}
+    assert _stats("availability_data") == {"hits": 1, "misses": 1, "coalesced": 0, "bypassed": 0}
+
+
+def test_backend_sqlite_vence_y_se_acota(tmp_path):
+    backend = cache.SQLiteBackend(str(tmp_path / "cache.sqlite"), max_entries=2, ttl_seconds=60)
+    backend.set("vencida", b"x")
+    with backend._connect() as connection:  # pylint: disable=protected-access
+        connection.execute("UPDATE app_cache SET expires_at = 0")
+        for index in range(3):
+            backend.set(f"k{index}", b"v")
+        backend._prune(connection, now=1)  # pylint: disable=protected-access
+
+    assert backend.get("vencida") is None
+    assert backend.get("k0") is None
+    assert backend.get("k2") == b"v"
+
+
+def test_backend_sqlite_por_defecto_en_instance_y_privado(app, db_session, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "CACHE_BACKEND", cache.BACKEND_SQLITE)
+    monkeypatch.setitem(app.config, "CACHE_PATH", None)
+    monkeypatch.setattr(app, "instance_path", str(tmp_path / "instance"))
+
+    backend = cache.get_backend()
+
+    assert backend.path == str(tmp_path / "instance" / "scheduler-cache.sqlite")
+    assert os.stat(backend.path).st_mode & 0o777 == 0o600
+
+
+def test_backend_sqlite_rechaza_un_archivo_que_otros_escriben(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    path.touch()
+    path.chmod(0o666)
+
+    with pytest.raises(RuntimeError):
+        cache.SQLiteBackend(str(path), max_entries=2, ttl_seconds=60)
+
+
+def test_apagado_siempre_calcula(app, db_session, group, monkeypatch):
+    monkeypatch.setitem(app.config, "CACHE_BACKEND", cache.BACKEND_NONE)
+
+    svc.get_availability_data(group.id)
+    svc.get_availability_data(group.id)
+
+    assert "availability_data" not in cache.cache_stats()
+
+
+def test_health_cache_publica_los_contadores(client, db_session, group):
+    svc.get_availability_data(group.id)
+
+    body = client.get("/health/cache").get_json()
+
+    assert body["backend"] == cache.BACKEND_MEMORY
+    assert body["stats"]["availability_data"]["misses"] == 1
+
+
+_calculos = []
+
+
+@cache.group_cached("lento")
+def _lento(group_id):
+    """Un agregado caro: cuenta cuántas veces se calculó de verdad."""
+    _calculos.append(group_id)
+    time.sleep(0.2)
+    return {"grupo": group_id}
+
+
+def test_pedidos_simultaneos_calculan_una_sola_vez(app, db_session, group):
+    _calculos.clear()
+    group_id = group.id
+    largada = threading.Barrier(5)
+    resultados = []
+
+    def visita():
+        with app.app_context():
+            largada.wait()
+            resultados.append(_lento(group_id))
+            scheduler_db.session.remove()
+
+    threads = [threading.Thread(target=visita) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert _calculos == [group_id]
+    assert resultados == [{"grupo": group_id}] * 5
+    stats = _stats("lento")
+    assert stats["misses"] == 1
+    assert stats["coalesced"] + stats["hits"] == 4
+
+
+def test_otro_proceso_calculando_se_espera(app, db_session, group, tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite")
+    monkeypatch.setitem(app.config, "CACHE_BACKEND", cache.BACKEND_SQLITE)
+    monkeypatch.setitem(app.config, "CACHE_PATH", path)
+    _calculos.clear()
+    key = cache._key("lento", group.id, group.revision, (), {})  # pylint: disable=protected-access
+
+    # Otro proceso tomó el cálculo y lo guarda un rato después.
+    otro = cache.SQLiteBackend(path, max_entries=10, ttl_seconds=60)
+    assert otro.acquire(key, lease_seconds=5)
+    guardar = threading.Timer(0.2, otro.set, args=(key, pickle.dumps({"grupo": "otro"})))
+    guardar.start()
+    try:
+        assert _lento(group.id) == {"grupo": "otro"}
+    finally:
+        guardar.join()
+        otro.release(key)
+
+    assert not _calculos
+    assert _stats("lento")["coalesced"] == 1
+
+
+def test_backend_sqlite_reserva_con_vencimiento(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    uno = cache.SQLiteBackend(path, max_entries=2, ttl_seconds=60)
+    otro = cache.SQLiteBackend(path, max_entries=2, ttl_seconds=60)
+
+    assert uno.acquire("k", lease_seconds=60)
+    assert not otro.acquire("k", lease_seconds=60)
+    uno.release("k")
+    assert otro.acquire("k", lease_seconds=60)
+
+    # Un proceso que murió con la reserva tomada no la retiene para siempre.
+    with otro._connect() as connection:  # pylint: disable=protected-access
+        connection.execute("UPDATE app_cache_flights SET expires_at = 0")
+    assert uno.acquire("k", lease_seconds=60)
+
+
+def test_backend_sqlite_barre_cada_tantas_escrituras_entre_threads(tmp_path, monkeypatch):
+    backend = cache.SQLiteBackend(str(tmp_path / "cache.sqlite"), max_entries=1000, ttl_seconds=60)
+    barridos = []
+    monkeypatch.setattr(backend, "_prune", lambda connection, now: barridos.append(now))
+
+    def escribe(prefijo):
+        for index in range(backend._PRUNE_EVERY):  # pylint: disable=protected-access
+            backend.set(f"{prefijo}{index}", b"v")
+
+    threads = [threading.Thread(target=escribe, args=(prefijo,)) for prefijo in "abcd"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Ninguna escritura se pierde en el contador: cuatro tandas, cuatro barridos.
+    assert len(barridos) == 4
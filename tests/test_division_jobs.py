@@ -1,16 +1,22 @@
-"""Cascada y retención de DivisionJob."""
+"""DivisionJob: cascada, retención y ejecución en segundo plano."""
 
 # pylint: disable=redefined-outer-name
+import json
 from datetime import UTC, datetime, timedelta
 
 import pytest
+from sqlalchemy import update
 from werkzeug.exceptions import NotFound
 
-from app.models import Group, User
-from app.models.subgroup import DivisionJob
+from app.extensions import scheduler_db
+from app.models import Group, GroupMember, RoleEnum, User
+from app.models.subgroup import JOB_CANCELLED, JOB_QUEUED, JOB_RUNNING, DivisionJob
 from app.routes.subgroup_routes import _get_active_job_or_404
+from app.services.division_jobs import resume_division_jobs, run_division_job
 from app.services.subgroup_service import (
     RETAINED_JOBS_PER_GROUP,
+    SubGroupService,
+    hydrate_division_result,
 )
 from app.services.subgroup_service import (
     prune_division_jobs as _prune_division_jobs,
@@ -72,3 +78,220 @@ def test_la_retencion_acota_los_jobs_por_grupo(db_session, group_with_jobs):
     # Los más recientes, más el confirmado más viejo que `undo` necesita.
     esperado = {job.id for job in jobs[-RETAINED_JOBS_PER_GROUP:]} | {jobs[0].id}
     assert ids_activos == esperado
+
+
+# --- jobs en segundo plano --------------------------------------------------
+
+
+@pytest.fixture()
+def grupo(db_session, app, monkeypatch):
+    """Dueño y tres miembros sin disponibilidad; la división no busca después del greedy."""
+    monkeypatch.setitem(app.config, "DIVISION_SEARCH_SECONDS", 0)
+    owner = User(name="Dueño jobs", email="owner-job@example.com")
+    db_session.add(owner)
+    db_session.flush()
+    group = Group(name="Jobs", owner_id=owner.id, join_token="tok-job")
+    db_session.add(group)
+    db_session.flush()
+    db_session.add(GroupMember(group_id=group.id, user_id=owner.id, role=RoleEnum.ADMIN))
+    for index in range(3):
+        user = User(name=f"M{index}", email=f"m{index}-job@example.com")
+        db_session.add(user)
+        db_session.flush()
+        db_session.add(GroupMember(group_id=group.id, user_id=user.id, role=RoleEnum.MEMBER))
+    db_session.commit()
+    return group
+
+
+def _login(client, user_id):
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user_id)
+        sess["_fresh"] = True
+
+
+def _job(db_session, group, status, config=None):
+    job = DivisionJob(
+        parent_group_id=group.id,
+        created_by=group.owner_id,
+        config_json=config or {"num_groups": 2, "compatibility_threshold": 0},
+        status=status,
+    )
+    db_session.add(job)
+    db_session.commit()
+    return job
+
+
+def test_generar_encola_y_el_estado_trae_el_preview(client, db_session, grupo):
+    _login(client, grupo.owner_id)
+
+    resp = client.post(
+        f"/groups/{grupo.id}/subgroups/generate",
+        json={"num_groups": 2, "compatibility_threshold": 0},
+    )
+    estado = client.get(resp.get_json()["status_url"]).get_json()
+    confirmado = client.post(
+        f"/groups/{grupo.id}/subgroups/confirm", json={"job_id": estado["job_id"]}
+    )
+
+    assert resp.status_code == 202
+    assert (estado["status"], estado["progress"], estado["error"]) == ("pending", 100, None)
+    assert estado["preview"]["total_members_assigned"] == 4
+    assert confirmado.status_code == 200
+
+
+def test_error_del_solver_queda_en_el_job(client, db_session, grupo):
+    _login(client, grupo.owner_id)
+    miembros = [member.user_id for member in grupo.members]
+
+    resp = client.post(
+        f"/groups/{grupo.id}/subgroups/generate",
+        json={
+            "num_groups": 2,
+            "max_group_size": 2,
+            "together_groups": [miembros],
+        },
+    )
+    estado = client.get(resp.get_json()["status_url"]).get_json()
+    confirmar = client.post(
+        f"/groups/{grupo.id}/subgroups/confirm", json={"job_id": estado["job_id"]}
+    )
+
+    assert estado["status"] == "failed"
+    assert "Grupo manual 1" in estado["error"]
+    assert confirmar.status_code == 400
+
+
+def test_cancelar_un_job_en_cola(client, app, db_session, grupo):
+    job = _job(db_session, grupo, JOB_QUEUED)
+    terminado = _job(db_session, grupo, "pending")
+    _login(client, grupo.owner_id)
+
+    resp = client.post(f"/groups/{grupo.id}/subgroups/jobs/{job.id}/cancel")
+    run_division_job(app, job.id)
+    tarde = client.post(f"/groups/{grupo.id}/subgroups/jobs/{terminado.id}/cancel")
+
+    assert resp.status_code == 200
+    assert tarde.status_code == 400
+    db_session.refresh(job)
+    assert (job.status, job.result_json) == ("cancelled", None)
+
+
+def test_cancelar_mientras_corre_corta_el_solver(app, db_session, grupo, monkeypatch):
+    job = _job(db_session, grupo, JOB_QUEUED)
+    original = SubGroupService.solve
+
+    def solve_y_cancelar(self, *args, **kwargs):
+        # Alguien cancela desde otra request apenas el greedy avisa.
+        progress = kwargs["progress"]
+
+        def cancelar_y_avisar(fraction, preview):
+            with app.app_context():
+                scheduler_db.session.execute(
+                    update(DivisionJob).where(DivisionJob.id == job.id).values(status="cancelled")
+                )
+                scheduler_db.session.commit()
+                scheduler_db.session.remove()
+            progress(fraction, preview)
+
+        kwargs["progress"] = cancelar_y_avisar
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(SubGroupService, "solve", solve_y_cancelar)
+    run_division_job(app, job.id)
+
+    db_session.refresh(job)
+    assert (job.status, job.result_json) == ("cancelled", None)
+
+
+def test_el_solver_avisa_el_greedy_antes_de_buscar(db_session, grupo):
+    avisos = []
+
+    preview = SubGroupService(grupo.id).generate_subgroups(
+        {"num_groups": 2, "compatibility_threshold": 0},
+        progress=lambda fraction, best: avisos.append((fraction, best)),
+    )
+
+    assert avisos == [(0.0, preview)]
+
+
+def test_al_arrancar_se_retoman_los_jobs_a_medias(app, db_session, grupo):
+    colgado = _job(db_session, grupo, JOB_RUNNING)
+    en_cola = _job(db_session, grupo, JOB_QUEUED)
+    _job(db_session, grupo, JOB_CANCELLED)
+
+    retomados = resume_division_jobs(app)
+
+    assert retomados == [colgado.id, en_cola.id]
+    for job in (colgado, en_cola):
+        db_session.refresh(job)
+        assert job.status == "pending"
+        assert hydrate_division_result(job)["total_members_assigned"] == 4
+
+
+def test_no_se_retoman_los_jobs_de_un_proceso_vivo(app, db_session, grupo):
+    ahora = datetime.now(UTC).replace(tzinfo=None)
+    vivo = _job(db_session, grupo, JOB_RUNNING)
+    muerto = _job(db_session, grupo, JOB_RUNNING)
+    vivo.owner, vivo.heartbeat_at = "otro:1:vivo", ahora
+    muerto.owner, muerto.started_at = "otro:2:muerto", ahora - timedelta(hours=1)
+    db_session.commit()
+
+    retomados = resume_division_jobs(app)
+
+    assert retomados == [muerto.id]
+    db_session.refresh(vivo)
+    assert (vivo.status, vivo.owner) == (JOB_RUNNING, "otro:1:vivo")
+
+
+def test_un_job_retomado_por_otro_proceso_corta_al_primero(app, db_session, grupo, monkeypatch):
+    job = _job(db_session, grupo, JOB_QUEUED)
+    original = SubGroupService.solve
+
+    def solve_y_perder_el_job(self, *args, **kwargs):
+        # Otro proceso lo dio por abandonado y lo tomó mientras el greedy corría.
+        progress = kwargs["progress"]
+
+        def retomar_y_avisar(fraction, preview):
+            with app.app_context():
+                scheduler_db.session.execute(
+                    update(DivisionJob).where(DivisionJob.id == job.id).values(owner="otro:3:x")
+                )
+                scheduler_db.session.commit()
+                scheduler_db.session.remove()
+            progress(fraction, preview)
+
+        kwargs["progress"] = retomar_y_avisar
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(SubGroupService, "solve", solve_y_perder_el_job)
+    run_division_job(app, job.id)
+
+    db_session.refresh(job)
+    assert (job.status, job.owner, job.result_json) == (JOB_RUNNING, "otro:3:x", None)
+
+
+def test_el_job_guarda_ids_y_se_hidrata_al_leer(client, db_session, grupo):
+    _login(client, grupo.owner_id)
+    config = {
+        "num_groups": 2,
+        "compatibility_threshold": 0,
+        "category_rules": [{"conditions": [{"categories": ["A"], "operator": "OR", "min": 1}]}],
+    }
+
+    resp = client.post(f"/groups/{grupo.id}/subgroups/generate", json=config)
+    job = db_session.get(DivisionJob, resp.get_json()["job_id"])
+    miembro = User.query.filter_by(email="m0-job@example.com").one()
+    miembro.name = "Renombrada"
+    db_session.commit()
+    estado = client.get(resp.get_json()["status_url"]).get_json()
+    csv = client.get(f"/groups/{grupo.id}/subgroups/export?job_id={job.id}")
+
+    guardado = json.dumps(job.result_json)
+    assert "@example.com" not in guardado and "M0" not in guardado
+    assert sorted(i for group in job.result_json["groups"] for i in group["member_ids"]) == sorted(
+        member.user_id for member in grupo.members
+    )
+    nombres = {m["name"] for group in estado["preview"]["groups"] for m in group["members"]}
+    assert "Renombrada" in nombres
+    assert estado["preview"]["groups"][0]["rules_status"][0]["min"] == 1
+    assert "Renombrada" in csv.get_data(as_text=True)
@@ -31,7 +31,7 @@ CLAVES_ESPERADAS = {
     "member_category_map",
     "user_subgroup_map",
     "user_gm_map",
-    "availability",
+    "grid",
     "responded_user_ids",
 }
 
@@ -0,0 +1,184 @@
+"""La revisión del grupo sigue a lo que sus páginas muestran, y los ETag a ella."""
+
+# pylint: disable=redefined-outer-name
+import flask
+import pytest
+
+from app.group_revision import get_group_revision
+from app.models import Category, Group, GroupMember, GroupMemberCategory, RoleEnum, SubGroup
+from app.models.user import User
+from app.services import availability_service as svc
+from app.services import group_service
+from app.services.subgroup_service import (
+    add_subgroup_member,
+    create_manual_subgroup,
+    delete_subgroup,
+)
+
+
+@pytest.fixture()
+def group(db_session):
+    """08:00-10:00 en bloques de 60, lunes y martes, con su dueño como admin."""
+    owner = User(name="Dueño rev", email="owner-rev@example.com")
+    db_session.add(owner)
+    db_session.commit()
+    grupo = Group(
+        name="Grupo rev",
+        owner_id=owner.id,
+        join_token="tok-rev",
+        start_minutes=480,
+        end_minutes=600,
+        block_minutes=60,
+        active_weekdays="0,1",
+    )
+    db_session.add(grupo)
+    db_session.commit()
+    db_session.add(GroupMember(group_id=grupo.id, user_id=owner.id, role=RoleEnum.ADMIN))
+    db_session.commit()
+    return grupo
+
+
+def _user(db_session, email):
+    user = User(name=email, email=email)
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def test_cada_escritura_visible_sube_la_revision(db_session, group):
+    ana = _user(db_session, "ana-rev@example.com")
+    revisions = [get_group_revision(group.id)]
+
+    def cambia(write):
+        write()
+        db_session.commit()
+        revisions.append(get_group_revision(group.id))
+        assert revisions[-1] > revisions[-2], write.__name__
+
+    def entra():
+        group_service.join_group(group, ana.id)
+
+    def marca():
+        svc.save_member_availability(group, ana.id, {(0, 0)}, [0, 1])
+
+    def categoriza():
+        category = Category(group_id=group.id, name="A")
+        db_session.add(category)
+        db_session.flush()
+        member = GroupMember.query.filter_by(group_id=group.id, user_id=ana.id).one()
+        db_session.add(GroupMemberCategory(group_member_id=member.id, category_id=category.id))
+
+    def arma_subgrupo():
+        subgroup = create_manual_subgroup(group.id, "Equipo")
+        db_session.flush()
+        add_subgroup_member(subgroup.id, ana.id)
+
+    def borra_subgrupo():
+        # Va en bloque, sin flush: lo sube el servicio.
+        delete_subgroup(SubGroup.query.filter_by(parent_group_id=group.id).one())
+
+    def renombra_grupo():
+        group.name = "Grupo rev 2"
+
+    def renombra_miembro():
+        ana.name = "Ana"
+
+    for write in (
+        entra,
+        marca,
+        categoriza,
+        arma_subgrupo,
+        borra_subgrupo,
+        renombra_grupo,
+        renombra_miembro,
+    ):
+        cambia(write)
+    # El objeto cargado no queda con la revisión vieja.
+    assert group.revision == revisions[-1]
+
+
+def test_leer_o_deshacer_no_mueve_la_revision(db_session, group):
+    antes = get_group_revision(group.id)
+
+    svc.get_availability_data(group.id)
+    group.name = "Cambio que no se guarda"
+    db_session.flush()
+    db_session.rollback()
+
+    assert get_group_revision(group.id) == antes
+
+
+def _login(client, user_id):
+    flask.g.pop("_login_user", None)
+    with client.session_transaction() as flask_session:
+        flask_session["_user_id"] = str(user_id)
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/groups/{id}",
+        "/groups/{id}/members",
+        "/groups/{id}/subgroups",
+        "/groups/{id}/availability/cell?weekday=0&block=0",
+    ],
+)
+def test_304_mientras_el_grupo_no_cambia(client, db_session, group, path):
+    path = path.format(id=group.id)
+    _login(client, group.owner_id)
+
+    primera = client.get(path)
+    etag = primera.headers["ETag"]
+    assert primera.status_code == 200
+    assert "Last-Modified" not in primera.headers
+    assert "no-cache" in primera.headers["Cache-Control"]
+
+    repetida = client.get(path, headers={"If-None-Match": etag})
+    assert repetida.status_code == 304
+    assert repetida.data == b""
+    # La página guardada sigue con su CSP: un nonce nuevo bloquearía sus scripts.
+    assert "Content-Security-Policy" not in repetida.headers
+
+    svc.save_member_availability(group, group.owner_id, {(0, 0)}, [0, 1])
+    db_session.commit()
+    despues = client.get(path, headers={"If-None-Match": etag})
+    assert despues.status_code == 200
+    assert despues.headers["ETag"] != etag
+
+
+def test_el_etag_es_de_quien_mira(client, db_session, group):
+    otro = _user(db_session, "otro-rev@example.com")
+    group_service.join_group(group, otro.id)
+    db_session.commit()
+    path = f"/groups/{group.id}"
+
+    _login(client, group.owner_id)
+    etag = client.get(path).headers["ETag"]
+    _login(client, otro.id)
+
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_una_pagina_con_flash_no_se_revalida(client, group):
+    path = f"/groups/{group.id}"
+    _login(client, group.owner_id)
+    etag = client.get(path).headers["ETag"]
+    with client.session_transaction() as flask_session:
+        flask_session["_flashes"] = [("success", "Guardado")]
+
+    response = client.get(path, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert b"Guardado" in response.data
+    assert "ETag" not in response.headers
+
+
+def test_if_modified_since_solo_no_da_304(client, group):
+    path = f"/groups/{group.id}"
+    _login(client, group.owner_id)
+    client.get(path)
+
+    # Las fechas HTTP van en segundos: la frescura la decide el ETag.
+    response = client.get(path, headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+
+    assert response.status_code == 200
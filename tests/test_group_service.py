@@ -6,16 +6,21 @@ import pytest
 from app.extensions import scheduler_db
 from app.models import (
     Availability,
+    Category,
     Group,
     GroupMember,
+    GroupMemberCategory,
     GroupPermissionGrant,
     RoleEnum,
+    SubGroup,
+    SubGroupMember,
     UserAvailability,
 )
 from app.models.user import User
 from app.permissions import LEVEL_NONE, PERM_VIEW_AVAILABILITY, PERM_VIEW_OWN
 from app.services import group_service as svc
 from app.services.availability_service import active_member_user_ids
+from app.soft_delete import including_deleted, restore_batch
 
 # ---------------------------------------------------------------------------
 # fixtures
@@ -193,6 +198,57 @@ def test_leave_group_borra_grupo_si_era_el_ultimo(db_session, group, owner):
     assert group.is_deleted
 
 
+# ---------------------------------------------------------------------------
+# delete_group
+# ---------------------------------------------------------------------------
+
+
+def test_delete_group_oculta_la_cascada_en_bloque_y_se_restaura(db_session, group, owner):
+    ana = _add_member(db_session, group, "ana-del@example.com")
+    beto = _add_member(db_session, group, "beto-del@example.com")
+    slot = _mark(db_session, group, ana, 0, 480)
+    category = Category(group_id=group.id, name="Cat del")
+    subgroup = SubGroup(parent_group_id=group.id, name="Sub del")
+    db_session.add_all([category, subgroup])
+    db_session.flush()
+    ana_member = GroupMember.query.filter_by(group_id=group.id, user_id=ana.id).one()
+    db_session.add_all(
+        [
+            GroupMemberCategory(group_member_id=ana_member.id, category_id=category.id),
+            SubGroupMember(subgroup_id=subgroup.id, user_id=ana.id),
+        ]
+    )
+    # Beto ya había salido: no es parte del lote y la restauración no lo revive.
+    GroupMember.query.filter_by(group_id=group.id, user_id=beto.id).one().soft_delete()
+    db_session.commit()
+    assert db_session.get(Availability, slot.id).attendee_count == 1
+
+    svc.delete_group(group)
+    db_session.commit()
+
+    assert group.is_deleted
+    with including_deleted():
+        ocultos = [
+            *GroupMember.query.filter_by(group_id=group.id, user_id=owner.id),
+            ana_member,
+            category,
+            subgroup,
+            *GroupMemberCategory.query.filter_by(category_id=category.id),
+            *SubGroupMember.query.filter_by(subgroup_id=subgroup.id),
+        ]
+        beto_member = GroupMember.query.filter_by(group_id=group.id, user_id=beto.id).one()
+    assert {row.deleted_at for row in ocultos} == {group.deleted_at}
+    assert beto_member.deleted_at != group.deleted_at
+    assert db_session.get(Availability, slot.id).attendee_count == 0
+
+    restore_batch(group)
+    db_session.commit()
+
+    assert not any(row.is_deleted for row in ocultos)
+    assert beto_member.is_deleted
+    assert db_session.get(Availability, slot.id).attendee_count == 1
+
+
 # ---------------------------------------------------------------------------
 # update_member_role
 # ---------------------------------------------------------------------------
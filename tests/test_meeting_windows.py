@@ -0,0 +1,156 @@
+"""Buscador de ventanas de reunión: N bloques seguidos con quórum."""
+
+# pylint: disable=redefined-outer-name
+import random
+
+import pytest
+
+from app.models import Category, Group, GroupMember, GroupMemberCategory, RoleEnum, User
+from app.services import availability_bitmap as bm
+from app.services import availability_service as svc
+
+
+@pytest.fixture()
+def grupo(db_session):
+    """08:00-12:00 en bloques de 60 (cuatro por día), lunes y martes."""
+    owner = User(name="Dueño ventanas", email="owner-win@example.com")
+    db_session.add(owner)
+    db_session.flush()
+    group = Group(
+        name="Ventanas",
+        owner_id=owner.id,
+        join_token="tok-win",
+        start_minutes=480,
+        end_minutes=720,
+        block_minutes=60,
+        active_weekdays="0,1",
+    )
+    db_session.add(group)
+    db_session.flush()
+    db_session.add(GroupMember(group_id=group.id, user_id=owner.id, role=RoleEnum.ADMIN))
+    db_session.commit()
+    return group
+
+
+def _miembro(db_session, group, email, cells):
+    user = User(name=email, email=email)
+    db_session.add(user)
+    db_session.flush()
+    db_session.add(GroupMember(group_id=group.id, user_id=user.id, role=RoleEnum.MEMBER))
+    db_session.flush()
+    svc.save_member_availability(group, user.id, set(cells), [0, 1])
+    db_session.commit()
+    return user
+
+
+def _login(client, user):
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user.id)
+        sess["_fresh"] = True
+    return client
+
+
+# --- operaciones puras ------------------------------------------------------
+
+
+def test_window_starts_exige_la_racha_completa():
+    assert bm.window_starts(0b0111_0110, 3) == 0b0001_0000
+    assert bm.window_starts(0b1111, 1) == 0b1111
+    assert bm.window_starts(0b1111, 4) == 0b0001
+
+
+def test_count_cells_coincide_con_contar_celda_por_celda():
+    rng = random.Random(7)
+    bitmaps = [rng.getrandbits(96) for _ in range(300)]
+    mask = (1 << 96) - 1
+
+    counts = bm.count_cells(bitmaps, mask)
+
+    for index in range(96):
+        expected = sum(bits >> index & 1 for bits in bitmaps)
+        assert counts.get(index, 0) == expected
+
+
+def test_best_windows_no_cruza_de_dia_ni_se_pisa():
+    # Cuatro bloques por día: el miembro 1 tiene libre lunes 2-3 y martes 0-1,
+    # que en bits son contiguos pero no forman una ventana.
+    bitmaps = {1: 0b0011_1100, 2: 0b0000_1100}
+
+    assert bm.best_windows(bitmaps, 4, [0, 1], 3, 1, 5) == []
+    assert bm.best_windows(bitmaps, 4, [0, 1], 2, 1, 5) == [(0, 2, [1, 2]), (1, 0, [1])]
+    assert bm.best_windows(bitmaps, 4, [0, 1], 2, 2, 5) == [(0, 2, [1, 2])]
+
+
+# --- servicio y endpoint ----------------------------------------------------
+
+
+def test_quorum_absoluto_o_porcentaje():
+    assert svc.resolve_quorum("3", 10) == 3
+    assert svc.resolve_quorum("60%", 7) == 5
+    assert svc.resolve_quorum("1%", 3) == 1
+    assert svc.resolve_quorum("33.5%", 10) == 4
+    for invalido in ("0", "0%", "150%", "x", "1/0%", "1/2%", "nan%", "1e2%"):
+        with pytest.raises(ValueError):
+            svc.resolve_quorum(invalido, 10)
+
+
+def test_find_meeting_windows_ordena_por_asistentes(db_session, grupo):
+    ana = _miembro(db_session, grupo, "ana-win@example.com", [(0, 0), (0, 1), (0, 2)])
+    beto = _miembro(db_session, grupo, "beto-win@example.com", [(0, 1), (0, 2), (1, 3)])
+
+    windows = svc.find_meeting_windows(grupo, {ana.id, beto.id}, 2, 1)
+
+    assert [(w["weekday"], w["start"], w["end"], w["user_ids"]) for w in windows] == [
+        (0, "09:00", "11:00", sorted([ana.id, beto.id])),
+    ]
+
+
+def test_endpoint_filtra_por_categoria(client, db_session, grupo):
+    ana = _miembro(db_session, grupo, "ana-cat@example.com", [(1, 0), (1, 1)])
+    _miembro(db_session, grupo, "beto-cat@example.com", [(0, 0), (0, 1)])
+    category = Category(group_id=grupo.id, name="Docentes")
+    db_session.add(category)
+    db_session.flush()
+    membership = GroupMember.query.filter_by(group_id=grupo.id, user_id=ana.id).one()
+    db_session.add(GroupMemberCategory(group_member_id=membership.id, category_id=category.id))
+    db_session.commit()
+    owner = db_session.get(User, grupo.owner_id)
+
+    resp = _login(client, owner).get(
+        f"/groups/{grupo.id}/availability/windows?blocks=2&category_id={category.id}"
+    )
+
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["member_count"] == 1 and body["quorum"] == 1
+    assert [(w["weekday"], w["block_index"]) for w in body["windows"]] == [(1, 0)]
+
+
+def test_endpoint_quorum_porcentual(client, db_session, grupo):
+    _miembro(db_session, grupo, "a-pct@example.com", [(0, 0), (0, 1)])
+    _miembro(db_session, grupo, "b-pct@example.com", [(0, 0), (0, 1)])
+    owner = db_session.get(User, grupo.owner_id)
+
+    url = f"/groups/{grupo.id}/availability/windows?blocks=2"
+    todos = _login(client, owner).get(url).get_json()
+    mayoria = client.get(url + "&quorum=60%25").get_json()
+
+    # El owner no marcó nada: con todos no hay ventana, con el 60% (2 de 3) sí.
+    assert todos["windows"] == []
+    assert mayoria["quorum"] == 2
+    assert [w["count"] for w in mayoria["windows"]] == [2]
+
+
+@pytest.mark.parametrize(
+    "query", ["", "blocks=0", "blocks=5", "blocks=2&quorum=0", "blocks=x", "blocks=2&quorum=1/0%25"]
+)
+def test_endpoint_parametros_invalidos_es_400(client, db_session, grupo, query):
+    owner = db_session.get(User, grupo.owner_id)
+    resp = _login(client, owner).get(f"/groups/{grupo.id}/availability/windows?{query}")
+    assert resp.status_code == 400
+
+
+def test_endpoint_sin_permiso_es_403(client, db_session, grupo):
+    beto = _miembro(db_session, grupo, "sin-permiso@example.com", [(0, 0)])
+    resp = _login(client, beto).get(f"/groups/{grupo.id}/availability/windows?blocks=1")
+    assert resp.status_code == 403
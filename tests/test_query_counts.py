@@ -8,10 +8,13 @@ Para medir a escala real, ver `tests/bench_queries.py`.
 """
 
 # pylint: disable=redefined-outer-name
+import re
+
 import flask
 import pytest
 from sqlalchemy import event
 
+from app.authz import get_membership
 from app.extensions import scheduler_db
 from app.models import (
     Availability,
@@ -25,15 +28,29 @@ from app.models import (
     SubGroupMember,
     UserAvailability,
 )
+from app.models.subgroup import JOB_PENDING, DivisionJob
 from app.models.user import User
-from app.permissions import PERM_VIEW_ALL
+from app.permissions import PERM_VIEW_ALL, PERM_VIEW_AVAILABILITY, effective_permissions
+from app.services.availability_service import active_member_user_ids, subgroup_peer_user_ids
+from app.services.subgroup_service import (
+    RESULT_FORMAT,
+    SubGroupService,
+    confirm_division,
+    undo_last_division,
+)
+
+USER_ID_LIST_RE = re.compile(r"\.user_id IN \(((?:\?,?\s*)+)\)")
 
 
 class QueryCounter:
-    """Cuenta las sentencias SQL ejecutadas dentro del bloque."""
+    """Cuenta las sentencias SQL ejecutadas dentro del bloque.
+
+    `statements` guarda el SQL de cada una, para contar las de una tabla.
+    """
 
     def __init__(self):
         self.count = 0
+        self.statements = []
 
     def __enter__(self):
         event.listen(scheduler_db.engine, "before_cursor_execute", self._on_execute)
@@ -43,8 +60,23 @@ class QueryCounter:
         event.remove(scheduler_db.engine, "before_cursor_execute", self._on_execute)
         return False
 
-    def _on_execute(self, *_args):
+    def _on_execute(self, _conn, _cursor, statement, *_args):
         self.count += 1
+        self.statements.append(statement)
+
+    def matching(self, fragment):
+        return sum(fragment in statement for statement in self.statements)
+
+    def user_id_lists(self):
+        """Largo de cada `<tabla>.user_id IN (?, ?, …)`: ids de usuario mandados como lista.
+
+        Los `IN` de los selectinload (por clave primaria del padre) no cuentan.
+        """
+        return [
+            match.group(1).count("?")
+            for statement in self.statements
+            for match in USER_ID_LIST_RE.finditer(statement)
+        ]
 
 
 def _seed_group(db_session, n_members, token):
@@ -108,7 +140,7 @@ def _seed_group(db_session, n_members, token):
     return group.id, users[0].id
 
 
-def _count_queries(client, owner_id, path):
+def _measure(client, owner_id, path):
     # El fixture `db_session` deja un app context empujado, así que las
     # requests del test client lo reutilizan en vez de crear uno nuevo: sin
     # limpiar el usuario que flask_login cachea en `g`, la segunda medición
@@ -126,7 +158,11 @@ def _count_queries(client, owner_id, path):
     with QueryCounter() as counter:
         response = client.get(path)
     assert response.status_code == 200, f"{path} devolvió {response.status_code}"
-    return counter.count
+    return counter
+
+
+def _count_queries(client, owner_id, path):
+    return _measure(client, owner_id, path).count
 
 
 @pytest.mark.parametrize(
@@ -185,3 +221,209 @@ def test_export_csv_subgrupos_no_escala_en_queries(app, db_session):
         f"/subgroups/export: {chico} queries con 3 miembros y {grande} con 30 "
         "→ N+1 en get_confirmed_subgroups"
     )
+
+
+def _confirmar_division(db_session, n_members, n_subgroups, token):
+    group_id, owner_id = _seed_group(db_session, n_members, token)
+    user_ids = [m.user_id for m in GroupMember.query.filter_by(group_id=group_id)]
+    job = DivisionJob(
+        parent_group_id=group_id,
+        created_by=owner_id,
+        config_json={"num_groups": n_subgroups},
+        result_json={
+            "format": RESULT_FORMAT,
+            "groups": [
+                {
+                    "id": index + 1,
+                    "name": f"Grupo {index + 1}",
+                    "member_ids": user_ids[index::n_subgroups],
+                    "compatibility_avg": 0,
+                    "rule_counts": [],
+                }
+                for index in range(n_subgroups)
+            ],
+            "unfulfilled_rules": [],
+            "total_members_available": len(user_ids),
+            "together_groups": [],
+        },
+        status=JOB_PENDING,
+    )
+    db_session.add(job)
+    db_session.commit()
+
+    with QueryCounter() as counter:
+        created = confirm_division(job)
+        db_session.flush()
+    db_session.commit()
+    return counter.count, group_id, created
+
+
+def test_confirmar_division_no_escala_en_queries(app, db_session):
+    """Los subgrupos y sus integrantes entran en un INSERT cada uno, no uno por fila."""
+    chico, _, _ = _confirmar_division(db_session, 4, 2, "perf-confirm-chico")
+    grande, group_id, created = _confirmar_division(db_session, 40, 8, "perf-confirm-grande")
+
+    assert grande == chico, (
+        f"confirm_division: {chico} queries con 2 subgrupos y {grande} con 8 → hay un N+1"
+    )
+    subgroups = SubGroup.query.filter_by(parent_group_id=group_id).order_by(SubGroup.id).all()
+    assert [subgroup.id for subgroup in subgroups] == [item["id"] for item in created]
+    assert [len(subgroup.members) for subgroup in subgroups] == [5] * 8
+    assert [item["member_count"] for item in created] == [5] * 8
+    assert all(subgroup.auto_generated for subgroup in subgroups)
+
+
+def test_deshacer_division_no_escala_en_queries(app, db_session):
+    """Los subgrupos y sus integrantes se ocultan con un UPDATE por tabla."""
+    conteos = []
+    for n_members, n_subgroups, token in ((4, 2, "perf-undo-chico"), (40, 8, "perf-undo-grande")):
+        _, group_id, created = _confirmar_division(db_session, n_members, n_subgroups, token)
+        with QueryCounter() as counter:
+            _, removed = undo_last_division(group_id)
+            db_session.flush()
+        db_session.commit()
+        conteos.append(counter.count)
+        assert removed == len(created)
+        assert SubGroup.query.filter_by(parent_group_id=group_id).count() == 0
+        assert SubGroupMember.query.join(SubGroup).filter_by(parent_group_id=group_id).count() == 0
+
+    chico, grande = conteos
+    assert grande == chico, (
+        f"undo_last_division: {chico} queries con 2 subgrupos y {grande} con 8 → hay un N+1"
+    )
+
+
+# --- memo por request -------------------------------------------------------
+
+ACTIVE_MEMBERS_SQL = "SELECT group_member.user_id AS group_member_user_id"
+
+
+def _viewer_con_subgrupo(db_session, group_id):
+    """Miembro sin view_all que ve la disponibilidad de su subgrupo (y una categoría)."""
+    members = GroupMember.query.filter_by(group_id=group_id).order_by(GroupMember.id).all()
+    viewer = members[1]
+    GroupPermissionGrant.query.filter_by(group_id=group_id).delete()
+    db_session.add(
+        GroupPermissionGrant(
+            group_id=group_id, group_member_id=viewer.id, permission=PERM_VIEW_AVAILABILITY
+        )
+    )
+    subgroup = SubGroup(parent_group_id=group_id, name="Sub memo")
+    db_session.add(subgroup)
+    db_session.flush()
+    for member in members[1:3]:
+        db_session.add(SubGroupMember(subgroup_id=subgroup.id, user_id=member.user_id))
+    db_session.commit()
+    return viewer.user_id, subgroup.id
+
+
+def test_memo_por_request_no_repite_consultas(app, db_session):
+    group_id, owner_id = _seed_group(db_session, 4, "perf-memo")
+    viewer_id, _ = _viewer_con_subgrupo(db_session, group_id)
+    group = db_session.get(Group, group_id)
+
+    def consultar():
+        membership = get_membership(group_id, viewer_id)
+        return (
+            effective_permissions(group, membership),
+            active_member_user_ids(group_id),
+            subgroup_peer_user_ids(group_id, viewer_id),
+        )
+
+    with app.test_request_context():
+        scheduler_db.session.expunge_all()
+        group = db_session.get(Group, group_id)
+        with QueryCounter() as primera:
+            esperado = consultar()
+        with QueryCounter() as segunda:
+            assert consultar() == esperado
+        assert primera.count > 0
+        assert segunda.count == 0
+
+        # Una escritura vacía el memo: el miembro nuevo aparece en la misma request.
+        user = User(email="memo-nuevo@test.local", name="Nuevo")
+        db_session.add(user)
+        db_session.flush()
+        db_session.add(GroupMember(group_id=group_id, user_id=user.id, role=RoleEnum.MEMBER))
+        db_session.flush()
+        assert user.id in active_member_user_ids(group_id)
+    db_session.rollback()
+
+    # Fuera de una request no hay memo: los servicios siguen consultando.
+    with QueryCounter() as sin_request:
+        active_member_user_ids(group_id)
+        active_member_user_ids(group_id)
+    assert sin_request.count == 2
+
+
+@pytest.mark.parametrize(
+    "path_template",
+    [
+        "/groups/{group_id}",
+        "/groups/{group_id}/availability/cell?weekday=0&block=0",
+        "/groups/{group_id}/availability/windows?blocks=1&subgroup_id={subgroup_id}",
+    ],
+)
+def test_vista_consulta_permisos_y_miembros_una_vez(app, db_session, path_template):
+    group_id, owner_id = _seed_group(db_session, 4, "perf-memo-vista")
+    viewer_id, subgroup_id = _viewer_con_subgrupo(db_session, group_id)
+    path = path_template.format(group_id=group_id, subgroup_id=subgroup_id)
+
+    for user_id in (owner_id, viewer_id):
+        counter = _measure(app.test_client(), user_id, path)
+        assert counter.matching("FROM group_permission_grant") <= 1, path
+        assert counter.matching("FROM group_member_category") <= 1, path
+        assert counter.matching(ACTIVE_MEMBERS_SQL) <= 1, path
+        assert counter.matching("FROM subgroup_members") <= 3, path
+
+
+# --- miembros por subconsulta -------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    "path_template",
+    [
+        "/groups/{group_id}",
+        "/groups/{group_id}/members",
+        "/groups/{group_id}/members/export.csv",
+    ],
+)
+def test_todo_el_grupo_no_viaja_como_lista_de_ids(app, db_session, path_template):
+    """El alcance "todos los miembros activos" va como subconsulta, no como `IN (…)`."""
+    grupo_chico, owner_chico = _seed_group(db_session, 3, "perf-in-chico")
+    grupo_grande, owner_grande = _seed_group(db_session, 30, "perf-in-grande")
+
+    chico = _measure(app.test_client(), owner_chico, path_template.format(group_id=grupo_chico))
+    grande = _measure(app.test_client(), owner_grande, path_template.format(group_id=grupo_grande))
+
+    assert chico.user_id_lists() == grande.user_id_lists() == [], (
+        f"{path_template}: ids de miembros como lista ({grande.user_id_lists()} con 30)"
+    )
+
+
+def test_cargar_miembros_de_la_division_no_lista_ids(app, db_session):
+    """`load_members` y la matriz de compatibilidad filtran por subconsulta."""
+    conteos = []
+    for n_members, token in ((3, "perf-div-chico"), (30, "perf-div-grande")):
+        group_id, _ = _seed_group(db_session, n_members, token)
+        service = SubGroupService(group_id)
+        with QueryCounter() as counter:
+            service.load_members()
+            service.calculate_compatibility_matrix()
+        assert len(service.members) == n_members
+        conteos.append(counter.user_id_lists())
+
+    assert conteos == [[], []], f"load_members: ids de miembros como lista ({conteos})"
+
+
+def test_confirmar_division_sin_returning(app, db_session, monkeypatch):
+    """En un motor sin RETURNING los ids salen de cada INSERT, no de buscar por fecha."""
+    dialect = db_session.get_bind().dialect
+    monkeypatch.setattr(dialect, "insert_returning", False)
+
+    _, group_id, created = _confirmar_division(db_session, 6, 3, "perf-confirm-mysql")
+
+    subgroups = SubGroup.query.filter_by(parent_group_id=group_id).order_by(SubGroup.id).all()
+    assert [subgroup.id for subgroup in subgroups] == [item["id"] for item in created]
+    assert [subgroup.name for subgroup in subgroups] == ["Grupo 1", "Grupo 2", "Grupo 3"]
+    assert [len(subgroup.members) for subgroup in subgroups] == [2] * 3
@@ -0,0 +1,215 @@
+"""El contador de asistentes por bloque sigue a las marcas y a las membresías."""
+
+# pylint: disable=redefined-outer-name
+import pytest
+from sqlalchemy import event, update
+from sqlalchemy.dialects import postgresql
+
+from app.db.rebuild_slot_counts import count_drifted_slots, rebuild_slot_counts
+from app.models import Availability, Group, GroupMember, RoleEnum, UserAvailability
+from app.models.user import User
+from app.services import availability_service as svc
+from app.services import group_service
+from app.slot_counts import lock_slots_statement
+
+
+@pytest.fixture()
+def group(db_session):
+    """08:00-10:00 en bloques de 60, lunes y martes."""
+    owner = User(name="Dueño cont", email="owner-cont@example.com")
+    db_session.add(owner)
+    db_session.commit()
+    grupo = Group(
+        name="Grupo cont",
+        owner_id=owner.id,
+        join_token="tok-cont",
+        start_minutes=480,
+        end_minutes=600,
+        block_minutes=60,
+        active_weekdays="0,1",
+    )
+    db_session.add(grupo)
+    db_session.commit()
+    db_session.add(GroupMember(group_id=grupo.id, user_id=owner.id, role=RoleEnum.ADMIN))
+    db_session.commit()
+    return grupo
+
+
+def _add_member(db_session, group, email):
+    user = User(name=email, email=email)
+    db_session.add(user)
+    db_session.commit()
+    db_session.add(GroupMember(group_id=group.id, user_id=user.id, role=RoleEnum.MEMBER))
+    db_session.commit()
+    return user
+
+
+def _counts(group):
+    return {
+        (a.weekday, a.start_minutes): a.attendee_count
+        for a in Availability.query.filter_by(group_id=group.id).all()
+    }
+
+
+def test_el_guardado_en_bloque_mantiene_el_contador(db_session, group):
+    ana = _add_member(db_session, group, "ana-cont@example.com")
+    beto = _add_member(db_session, group, "beto-cont@example.com")
+
+    svc.save_member_availability(group, ana.id, {(0, 0), (0, 1)}, [0, 1])
+    svc.save_member_availability(group, beto.id, {(0, 0)}, [0, 1])
+    db_session.commit()
+    assert _counts(group) == {(0, 480): 2, (0, 540): 1}
+
+    svc.save_member_availability(group, ana.id, {(0, 1)}, [0, 1])
+    db_session.commit()
+    assert _counts(group) == {(0, 480): 1, (0, 540): 1}
+
+
+def test_las_marcas_del_orm_tambien_cuentan(db_session, group):
+    user = _add_member(db_session, group, "orm-cont@example.com")
+    row = Availability(group_id=group.id, weekday=1, start_minutes=480)
+    db_session.add(row)
+    db_session.flush()
+    mark = UserAvailability(user_id=user.id, availability_id=row.id)
+    db_session.add(mark)
+    db_session.commit()
+    assert _counts(group) == {(1, 480): 1}
+
+    mark.soft_delete()
+    db_session.commit()
+    assert _counts(group) == {(1, 480): 0}
+
+    mark.restore()
+    db_session.commit()
+    assert _counts(group) == {(1, 480): 1}
+
+
+def test_salir_y_volver_al_grupo_mueve_el_contador(db_session, group):
+    user = _add_member(db_session, group, "vuelve-cont@example.com")
+    svc.save_member_availability(group, user.id, {(0, 0)}, [0, 1])
+    db_session.commit()
+
+    group_service.leave_group(group, user.id)
+    db_session.commit()
+    assert _counts(group) == {(0, 480): 0}
+
+    group_service.join_group(group, user.id)
+    db_session.commit()
+    assert _counts(group) == {(0, 480): 1}
+
+
+def test_el_remapeo_recuenta_los_bloques_nuevos(db_session, group):
+    user = _add_member(db_session, group, "remap-cont@example.com")
+    svc.save_member_availability(group, user.id, {(0, 0)}, [0, 1])
+    db_session.commit()
+    old_starts = group.block_starts()
+
+    group.block_minutes = 30
+    db_session.flush()
+    svc.remap_availability_marks(group, old_starts, 60, {0, 1})
+    db_session.commit()
+
+    assert _counts(group) == {(0, 480): 1, (0, 510): 1}
+
+
+def test_el_resumen_lee_el_contador(db_session, group):
+    ana = _add_member(db_session, group, "ana-res@example.com")
+    beto = _add_member(db_session, group, "beto-res@example.com")
+    svc.save_member_availability(group, ana.id, {(0, 0), (1, 1)}, [0, 1])
+    svc.save_member_availability(group, beto.id, {(1, 1)}, [0, 1])
+    db_session.commit()
+
+    data = svc.get_availability_data(group.id, limit=1)
+
+    (entry,) = data.values()
+    assert (entry["availability"].weekday, entry["availability"].start_minutes) == (1, 540)
+    assert sorted(entry["users"]) == sorted([ana.id, beto.id])
+
+
+def test_rebuild_repara_la_deriva(db_session, group):
+    user = _add_member(db_session, group, "deriva@example.com")
+    svc.save_member_availability(group, user.id, {(0, 0), (0, 1)}, [0, 1])
+    db_session.commit()
+
+    # Lo que la app no ve: alguien tocó el contador (o las marcas) por fuera.
+    db_session.execute(
+        update(Availability).where(Availability.group_id == group.id).values(attendee_count=7)
+    )
+    db_session.commit()
+    assert count_drifted_slots(group.id) == 2
+
+    assert rebuild_slot_counts() == 2
+    assert _counts(group) == {(0, 480): 1, (0, 540): 1}
+    assert rebuild_slot_counts() == 0
+
+
+def test_marcas_ocultas_no_cuentan(db_session, group):
+    user = _add_member(db_session, group, "oculta@example.com")
+    row = Availability(group_id=group.id, weekday=0, start_minutes=480)
+    db_session.add(row)
+    db_session.flush()
+    mark = UserAvailability(user_id=user.id, availability_id=row.id)
+    db_session.add(mark)
+    db_session.commit()
+    assert _counts(group) == {(0, 480): 1}
+
+    mark.soft_delete()
+    db_session.commit()
+    assert _counts(group) == {(0, 480): 0}
+
+
+def test_el_recuento_bloquea_los_bloques_antes_de_contar(db_session, group):
+    user = _add_member(db_session, group, "lock-cont@example.com")
+    sentencias = []
+
+    def anota(_conn, _cursor, statement, *_args):
+        sentencias.append(" ".join(statement.split()))
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", anota)
+    try:
+        svc.save_member_availability(group, user.id, {(0, 0)}, [0, 1])
+    finally:
+        event.remove(engine, "before_cursor_execute", anota)
+    db_session.commit()
+
+    # El SELECT que bloquea va justo antes del UPDATE que recuenta.
+    recuento = next(i for i, sql in enumerate(sentencias) if "SET attendee_count=" in sql)
+    assert sentencias[recuento - 1].startswith("SELECT availability.id FROM availability")
+    sql = str(
+        lock_slots_statement(Availability.__table__.c.group_id == group.id).compile(
+            dialect=postgresql.dialect()
+        )
+    )
+    assert sql.endswith("ORDER BY availability.id FOR NO KEY UPDATE")
+    assert _counts(group) == {(0, 480): 1}
+
+
+@pytest.mark.parametrize("camino", ["guardado", "salida"])
+def test_la_fila_del_grupo_se_bloquea_antes_que_los_bloques(db_session, group, camino):
+    user = _add_member(db_session, group, f"orden-{camino}@example.com")
+    svc.save_member_availability(group, user.id, {(0, 0)}, [0, 1])
+    db_session.commit()
+    sentencias = []
+
+    def anota(_conn, _cursor, statement, *_args):
+        sentencias.append(" ".join(statement.split()))
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", anota)
+    try:
+        if camino == "guardado":
+            svc.save_member_availability(group, user.id, {(0, 1)}, [0, 1])
+        else:
+            group_service.leave_group(group, user.id)
+        db_session.flush()
+    finally:
+        event.remove(engine, "before_cursor_execute", anota)
+    db_session.commit()
+
+    # Mismo orden que el guardado de ajustes: grupo primero, bloques después.
+    grupo = next(i for i, sql in enumerate(sentencias) if sql.startswith('UPDATE "group"'))
+    bloques = next(
+        i for i, sql in enumerate(sentencias) if sql.startswith("SELECT availability.id FROM")
+    )
+    assert grupo < bloques
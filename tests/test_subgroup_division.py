@@ -0,0 +1,253 @@
+"""División automática en subgrupos: estado incremental y reglas compiladas."""
+
+# pylint: disable=redefined-outer-name,protected-access
+import time
+
+import pytest
+
+from app.models import Category, Group, GroupMember, GroupMemberCategory, RoleEnum, User
+from app.services import availability_service as svc
+from app.services.subgroup_service import SubGroupService, _GroupState
+
+
+@pytest.fixture()
+def grupo(db_session):
+    """08:00-10:00 en bloques de 60 (dos por día), lunes y martes, con categorías A y B."""
+    owner = User(name="Dueño división", email="owner-div@example.com")
+    db_session.add(owner)
+    db_session.flush()
+    group = Group(
+        name="División",
+        owner_id=owner.id,
+        join_token="tok-div",
+        start_minutes=480,
+        end_minutes=600,
+        block_minutes=60,
+        active_weekdays="0,1",
+    )
+    db_session.add(group)
+    db_session.flush()
+    db_session.add(GroupMember(group_id=group.id, user_id=owner.id, role=RoleEnum.ADMIN))
+    db_session.add_all([Category(group_id=group.id, name=name) for name in ("A", "B")])
+    db_session.commit()
+    return group
+
+
+def _miembro(db_session, group, email, cells, categories=()):
+    user = User(name=email, email=email)
+    db_session.add(user)
+    db_session.flush()
+    member = GroupMember(group_id=group.id, user_id=user.id, role=RoleEnum.MEMBER)
+    db_session.add(member)
+    db_session.flush()
+    for category in Category.query.filter(
+        Category.group_id == group.id, Category.name.in_(categories)
+    ):
+        db_session.add(GroupMemberCategory(group_member_id=member.id, category_id=category.id))
+    svc.save_member_availability(group, user.id, set(cells), [0, 1])
+    db_session.commit()
+    return user
+
+
+def _unit(user_id, blocks, counts):
+    return {"member_ids": [user_id], "blocks": blocks, "condition_counts": counts}
+
+
+def test_estado_del_grupo_se_mantiene_al_sumar_y_sacar():
+    state = _GroupState(condition_count=2)
+    ana, beto = _unit(1, 0b0111, [1, 0]), _unit(2, 0b1110, [1, 1])
+
+    assert state.blocks_with(ana) == 0b0111
+    state.add(ana)
+    state.add(beto)
+    assert (state.size, state.blocks, state.counts) == (2, 0b0110, [2, 1])
+
+    state.remove(ana)
+    assert (state.size, state.blocks, state.counts) == (1, 0b1110, [1, 1])
+    state.remove(beto)
+    assert state.blocks is None
+
+
+def test_reglas_de_la_division_se_cumplen(db_session, grupo):
+    todo = [(0, 0), (0, 1), (1, 0), (1, 1)]
+    for index in range(4):
+        _miembro(db_session, grupo, f"a{index}-div@example.com", todo, categories=("A",))
+    for index in range(2):
+        _miembro(db_session, grupo, f"b{index}-div@example.com", todo, categories=("B",))
+
+    preview = SubGroupService(grupo.id).generate_subgroups(
+        {
+            "num_groups": 2,
+            "compatibility_threshold": 0,
+            "category_rules": [
+                {
+                    "conditions": [
+                        {"categories": ["A"], "operator": "OR", "min": 2, "max": 2},
+                        # Sin máximo: el cliente no lo manda si el campo quedó vacío.
+                        {"categories": ["B"], "operator": "OR", "min": 1},
+                    ]
+                }
+            ],
+        }
+    )
+
+    assert preview["unfulfilled_rules"] == []
+    assert preview["total_members_assigned"] == 7
+    for group in preview["groups"]:
+        assert [status["count"] for status in group["rules_status"]] in ([2, 1], [2, 2])
+
+
+def test_umbral_usa_la_interseccion_del_grupo(db_session, grupo):
+    manana = _miembro(db_session, grupo, "m-div@example.com", [(0, 0), (1, 0)])
+    tarde = _miembro(db_session, grupo, "t-div@example.com", [(0, 1), (1, 1)])
+    manana2 = _miembro(db_session, grupo, "m2-div@example.com", [(0, 0), (1, 0)])
+
+    preview = SubGroupService(grupo.id).generate_subgroups(
+        {"num_groups": 2, "compatibility_threshold": 2, "require_all_members": False}
+    )
+
+    grupos = [{member["id"] for member in group["members"]} for group in preview["groups"]]
+    assert {manana.id, manana2.id} in grupos
+    assert all(tarde.id not in ids or ids == {tarde.id} for ids in grupos)
+
+
+def test_condiciones_compiladas_a_mascaras():
+    service = SubGroupService(parent_group_id=None)
+    and_ab = {"categories": ["A", "B"], "operator": "AND"}
+    or_ab = {"categories": ["A", "B"], "operator": "OR"}
+    sin_categoria = {"categories": [SubGroupService.NO_CATEGORY_TOKEN], "operator": "OR"}
+
+    assert service.user_matches_condition({"A", "B", "C"}, and_ab)
+    assert not service.user_matches_condition({"A"}, and_ab)
+    assert service.user_matches_condition({"B"}, or_ab)
+    assert not service.user_matches_condition({"C"}, or_ab)
+    assert not service.user_matches_condition({"A"}, {"categories": ["A"], "operator": "XOR"})
+    # El token de "sin categoría" tiene su propio bit: lo llevan quienes no tienen ninguna.
+    assert service.user_matches_condition(set(), sin_categoria)
+    assert not service.user_matches_condition({"A"}, sin_categoria)
+
+    members = [{"id": 1, "categories": ["A"]}, {"id": 2, "categories": []}]
+    assert service.count_condition_matches(members, or_ab) == 1
+    assert service.count_condition_matches(members, sin_categoria) == 1
+
+
+def test_busqueda_local_mejora_al_greedy(db_session, grupo):
+    # El greedy junta a los dos que más bloques comparten (dueño y Q) y deja a
+    # R y S, que no comparten ninguno, en el otro grupo. Intercambiando Q con R
+    # los dos grupos quedan con dos bloques comunes.
+    svc.save_member_availability(grupo, grupo.owner_id, {(0, 0), (0, 1), (1, 0), (1, 1)}, [0, 1])
+    db_session.commit()
+    _miembro(db_session, grupo, "q-ls@example.com", [(0, 0), (0, 1), (1, 0)])
+    _miembro(db_session, grupo, "r-ls@example.com", [(0, 0), (1, 1)])
+    _miembro(db_session, grupo, "s-ls@example.com", [(0, 1), (1, 0)])
+    config = {"num_groups": 2, "max_group_size": 2, "compatibility_threshold": 0}
+
+    greedy = SubGroupService(grupo.id).generate_subgroups(dict(config))
+    buscado = SubGroupService(grupo.id).generate_subgroups(dict(config), search_seconds=0.1)
+
+    assert min(group["compatibility_avg"] for group in greedy["groups"]) == 0
+    assert [group["compatibility_avg"] for group in buscado["groups"]] == [0.5, 0.5]
+
+
+def test_objetivo_ordena_violaciones_bloques_y_balance():
+    objective = SubGroupService._division_objective
+
+    sin_violaciones = objective([(0, 1, 3), (0, 1, 3)])
+    assert objective([(1, 5, 3), (0, 5, 3)]) > sin_violaciones
+    assert objective([(0, 2, 4), (0, 1, 2)]) > objective([(0, 2, 3), (0, 2, 3)])
+    assert objective([(0, 1, 4), (0, 1, 2)]) > sin_violaciones
+
+
+def _division_chica(db_session, grupo):
+    svc.save_member_availability(grupo, grupo.owner_id, {(0, 0), (0, 1), (1, 0), (1, 1)}, [0, 1])
+    db_session.commit()
+    _miembro(db_session, grupo, "q-ms@example.com", [(0, 0), (0, 1), (1, 0)])
+    _miembro(db_session, grupo, "r-ms@example.com", [(0, 0), (1, 1)])
+    _miembro(db_session, grupo, "s-ms@example.com", [(0, 1), (1, 0)])
+    return {"num_groups": 2, "max_group_size": 2, "compatibility_threshold": 0}
+
+
+def test_busqueda_local_termina_antes_del_tope_si_no_mejora(db_session, grupo):
+    config = _division_chica(db_session, grupo)
+
+    started = time.monotonic()
+    preview = SubGroupService(grupo.id).generate_subgroups(dict(config), search_seconds=5)
+
+    assert time.monotonic() - started < 1
+    assert [group["compatibility_avg"] for group in preview["groups"]] == [0.5, 0.5]
+
+
+def test_multiarranque_se_queda_con_la_mejor_corrida(db_session, grupo):
+    config = _division_chica(db_session, grupo)
+
+    preview = SubGroupService(grupo.id).generate_subgroups(dict(config), restarts=8)
+
+    assert [group["compatibility_avg"] for group in preview["groups"]] == [0.5, 0.5]
+
+
+def test_multiarranque_en_procesos_da_lo_mismo(db_session, grupo):
+    config = _division_chica(db_session, grupo)
+
+    local = SubGroupService(grupo.id).generate_subgroups(dict(config), restarts=4)
+    en_pool = SubGroupService(grupo.id).generate_subgroups(dict(config), restarts=4, workers=2)
+
+    assert en_pool == local
+
+
+def test_snapshot_alcanza_para_resolver_sin_bd(db_session, grupo):
+    config = _division_chica(db_session, grupo)
+    service = SubGroupService(grupo.id)
+    service.load_members()
+    service.calculate_compatibility_matrix()
+
+    copia = SubGroupService.from_snapshot(service.snapshot())
+
+    assert copia.solve(dict(config), 0, 0) == service.solve(dict(config), 0, 0)
+
+
+def test_varias_configuraciones_cargan_una_vez(db_session, grupo, monkeypatch):
+    ana = _miembro(db_session, grupo, "ana-cache@example.com", [(0, 0), (0, 1)])
+    _miembro(db_session, grupo, "beto-cache@example.com", [(0, 1)], categories=("A",))
+    cargas = []
+    original = SubGroupService.load_members
+
+    def contar(self):
+        cargas.append(self.parent_group_id)
+        original(self)
+
+    monkeypatch.setattr(SubGroupService, "load_members", contar)
+
+    def dividir(num_groups):
+        return SubGroupService(grupo.id).generate_subgroups(
+            {"num_groups": num_groups, "compatibility_threshold": 0}
+        )
+
+    for num_groups in (1, 2, 3, 2, 1):
+        dividir(num_groups)
+    assert len(cargas) == 1
+
+    # Cambian las marcas de alguien: la versión cambia y se vuelve a cargar.
+    svc.save_member_availability(grupo, ana.id, {(1, 0)}, [0, 1])
+    db_session.commit()
+    preview = dividir(1)
+    assert len(cargas) == 2
+    miembros = {member["id"]: member for member in preview["groups"][0]["members"]}
+    assert miembros[ana.id]["availability_count"] == 1
+
+    # Y también si cambian las categorías de un miembro.
+    member = GroupMember.query.filter_by(group_id=grupo.id, user_id=ana.id).one()
+    categoria = Category.query.filter_by(group_id=grupo.id, name="B").one()
+    db_session.add(GroupMemberCategory(group_member_id=member.id, category_id=categoria.id))
+    db_session.commit()
+    preview = dividir(1)
+    assert len(cargas) == 3
+    miembros = {member["id"]: member for member in preview["groups"][0]["members"]}
+    assert miembros[ana.id]["categories"] == ["B"]
+
+    # Un cambio que no mueve ningún conteo (el nombre) también: la clave es la revisión.
+    ana.name = "Ana renombrada"
+    db_session.commit()
+    preview = dividir(1)
+    assert len(cargas) == 4
+    miembros = {member["id"]: member for member in preview["groups"][0]["members"]}
+    assert miembros[ana.id]["name"] == "Ana renombrada"